@@ -0,0 +1,255 @@
+"""Blob store content-addressed (SHA-256) per i file caricati, con refcount in SQLite.
+
+Layout: ``UPLOAD_DIR/blobs/ab/cd/<sha256>``. La tabella ``blobs`` tiene un
+refcount aggiornato dai trigger su ``documents.file_sha256``.
+
+Regola di concorrenza: i path dei blob si creano o rimuovono solo mentre la
+transazione di scrittura e' aperta (il lock di SQLite serializza anche gli
+altri worker). Un delete sposta il blob nel cestino prima del commit e lo
+elimina dopo, cosi' un upload concorrente dello stesso contenuto non lo perde.
+
+CLI: ``python -m backend.blobs migrate|gc|stats``.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import uuid
+
+from backend import config, rows, storage
+
+BLOB_MODE = 0o644
+
+
+def blob_dir() -> str:
+    return os.path.join(config.UPLOAD_DIR, "blobs")
+
+
+def trash_dir() -> str:
+    return os.path.join(blob_dir(), ".trash")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(blob_dir(), sha256[:2], sha256[2:4], sha256)
+
+
+def legacy_path(doc_id: int, file_name: str) -> str:
+    """Vecchio layout piatto ``UPLOAD_DIR/{id}_{nome}``, precedente al blob store."""
+    return os.path.join(config.UPLOAD_DIR, f"{doc_id}_{file_name}")
+
+
+def resolve(doc_id: int, file_name: str, sha256: str | None) -> str | None:
+    """Path su disco del file di un documento: blob se presente, altrimenti legacy."""
+    if sha256:
+        path = blob_path(sha256)
+        if os.path.exists(path):
+            return path
+    path = legacy_path(doc_id, file_name)
+    return path if os.path.exists(path) else None
+
+
+def register(conn: sqlite3.Connection, sha256: str, size: int):
+    """Crea la riga del blob (refcount 0) se manca; i trigger la incrementano poi."""
+    conn.execute(
+        "INSERT INTO blobs (sha256, size) VALUES (?, ?) ON CONFLICT(sha256) DO NOTHING",
+        (sha256, size),
+    )
+
+
+def put(tmp_path: str, sha256: str, sync: bool = True) -> bool:
+    """Porta ``tmp_path`` nel blob store; False se il contenuto c'era gia' (dedup)."""
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        storage.discard(tmp_path)
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # mkstemp crea 0600: il blob deve essere leggibile anche da nginx (X-Accel-Redirect)
+    os.chmod(tmp_path, BLOB_MODE)
+    storage.place(tmp_path, path, sync=sync)
+    return True
+
+
+def release(conn: sqlite3.Connection, sha256: str | None) -> str | None:
+    """Se il blob non ha piu' riferimenti lo rimuove dalla tabella e lo sposta nel cestino.
+
+    Da chiamare nella transazione che ha tolto l'ultimo riferimento: restituisce
+    il path nel cestino da passare a purge() dopo il commit (o a restore() se
+    il commit fallisce).
+    """
+    if not sha256:
+        return None
+    row = conn.execute(
+        "DELETE FROM blobs WHERE sha256 = ? AND refcount <= 0 RETURNING sha256", (sha256,)
+    ).fetchone()
+    if not row or not os.path.exists(blob_path(sha256)):
+        return None
+    os.makedirs(trash_dir(), exist_ok=True)
+    trash = os.path.join(trash_dir(), f"{sha256}.{uuid.uuid4().hex}")
+    os.replace(blob_path(sha256), trash)
+    return trash
+
+
+def restore(trash: str | None, sha256: str):
+    if trash:
+        os.replace(trash, blob_path(sha256))
+
+
+def purge(trash: str | None):
+    if trash:
+        storage.discard(trash)
+
+
+def dedup_stats(conn: sqlite3.Connection) -> dict:
+    row = conn.execute(
+        "SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS stored, "
+        "COALESCE(SUM(size * refcount), 0) AS logical FROM blobs WHERE refcount > 0"
+    ).fetchone()
+    legacy = conn.execute(
+        "SELECT COUNT(*) FROM documents d WHERE d.file_name IS NOT NULL AND NOT EXISTS "
+        "(SELECT 1 FROM blobs b WHERE b.sha256 = d.file_sha256)"
+    ).fetchone()[0]
+    stored, logical = row["stored"], row["logical"]
+    return {
+        "blobs": row["blobs"],
+        "stored_mb": round(stored / (1024 * 1024), 2),
+        "logical_mb": round(logical / (1024 * 1024), 2),
+        "saved_mb": round((logical - stored) / (1024 * 1024), 2),
+        "dedup_ratio": round(logical / stored, 2) if stored else 1.0,
+        "legacy_files": legacy,
+    }
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(storage.CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stage(path: str) -> str:
+    """Copia a costo zero (hard link, o copia a chunk) accanto al blob store."""
+    os.makedirs(blob_dir(), exist_ok=True)
+    tmp = os.path.join(blob_dir(), f".migrate-{uuid.uuid4().hex}.part")
+    try:
+        os.link(path, tmp)
+    except OSError:
+        with open(path, "rb") as src:
+            staged, _, _ = storage.stream_to_temp(src, blob_dir(), max_size=2**62)
+        os.replace(staged, tmp)
+    return tmp
+
+
+def migrate_document(write_db, doc_id: int, file_name: str) -> bool:
+    """Sposta online un file ``{id}_{nome}`` nel blob store, una transazione breve per file."""
+    path = legacy_path(doc_id, file_name)
+    if not os.path.exists(path):
+        return False
+    sha256 = _hash_file(path)
+    size = os.path.getsize(path)
+    tmp = _stage(path)
+    try:
+        with write_db() as conn:
+            row = conn.execute(
+                "SELECT file_name FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if not row or row["file_name"] != file_name:
+                return False
+            register(conn, sha256, size)
+            conn.execute(
+                "UPDATE documents SET file_sha256 = ?, file_size = ? WHERE id = ?",
+                (sha256, size, doc_id),
+            )
+            # Ricalcolo esatto: copre anche le righe che avevano gia' lo sha256
+            conn.execute(
+                "UPDATE blobs SET refcount = "
+                "(SELECT COUNT(*) FROM documents WHERE file_sha256 = ?) WHERE sha256 = ?",
+                (sha256, sha256),
+            )
+            placed = put(tmp, sha256)
+            try:
+                conn.commit()
+            except BaseException:
+                if placed:
+                    storage.discard(blob_path(sha256))
+                raise
+    finally:
+        storage.discard(tmp)
+    storage.discard(path)
+    return True
+
+
+def migrate(batch: int = 500) -> int:
+    from backend.database import read_db, write_db
+
+    migrated, last_id = 0, 0
+    while True:
+        with read_db() as conn:
+            rows = conn.execute(
+                "SELECT id, file_name FROM documents WHERE file_name IS NOT NULL AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (last_id, batch),
+            ).fetchall()
+        if not rows:
+            return migrated
+        for row in rows:
+            if migrate_document(write_db, row["id"], row["file_name"]):
+                migrated += 1
+        last_id = rows[-1]["id"]
+
+
+def gc() -> int:
+    """Rimuove righe senza riferimenti, file orfani (anche i CSV di rows) e il cestino.
+
+    Il giro sui file avviene con il lock di scrittura di SQLite preso: un
+    upload di un altro processo mette il blob al suo posto prima del commit,
+    quindi o ha gia' fatto commit (ed e' in ``known``) o aspetta.
+    """
+    from backend.database import write_db
+
+    removed = 0
+    with write_db() as conn:
+        for row in conn.execute("SELECT sha256 FROM blobs WHERE refcount <= 0").fetchall():
+            trash = release(conn, row["sha256"])
+            conn.commit()
+            purge(trash)
+            removed += 1
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            known = {r["sha256"] for r in conn.execute("SELECT sha256 FROM blobs").fetchall()}
+            removed += rows.gc(conn)
+            for root, dirs, files in os.walk(blob_dir()):
+                if root == blob_dir():
+                    dirs[:] = [d for d in dirs if d != ".trash"]
+                for name in files:
+                    if len(name) == 64 and name not in known:
+                        os.unlink(os.path.join(root, name))
+                        removed += 1
+            if os.path.isdir(trash_dir()):
+                for name in os.listdir(trash_dir()):
+                    storage.discard(os.path.join(trash_dir(), name))
+        finally:
+            conn.rollback()
+    return removed
+
+
+def main(argv=None):
+    from backend.database import init_db, read_db
+
+    parser = argparse.ArgumentParser(prog="python -m backend.blobs")
+    parser.add_argument("command", choices=["migrate", "gc", "stats"])
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.command == "migrate":
+        print(f"Migrated {migrate(args.batch)} files into {blob_dir()}")
+    elif args.command == "gc":
+        print(f"Removed {gc()} orphaned blobs")
+    with read_db() as conn:
+        print(dedup_stats(conn))
+
+
+if __name__ == "__main__":
+    main()
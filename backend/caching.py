@@ -0,0 +1,49 @@
+"""ETag e richieste condizionali (If-None-Match, If-Match) per documenti e file allegati."""
+
+import hashlib
+import os
+
+from fastapi import Response
+
+# Contenuto privato: mai in cache condivise, sempre rivalidato (costa un 304)
+CACHE_CONTROL = "private, no-cache"
+# URL che cambia con il contenuto (anteprime con ?v=sha256): nessuna rivalidazione
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+def document_etag(row) -> str:
+    """ETag forte di un documento.
+
+    ``version`` cambia a ogni modifica anche entro lo stesso secondo di
+    ``updated_at``; ``created_at`` distingue un id riusato dopo un delete.
+    """
+    created = hashlib.blake2b(str(row["created_at"]).encode(), digest_size=4).hexdigest()
+    return f'"{row["id"]}-{row["version"]}-{created}"'
+
+
+def file_etag(sha256: str | None, stat: os.stat_result) -> str:
+    """ETag forte dal contenuto (blob store); per i file legacy da mtime e dimensione."""
+    if sha256:
+        return f'"{sha256}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Confronto debole come da RFC 9110 per If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in tags
+
+
+def if_match(header: str, etag: str) -> bool:
+    """Confronto forte come da RFC 9110 per If-Match: un ETag debole non combacia mai."""
+    if header.strip() == "*":
+        return True
+    return etag in (t.strip() for t in header.split(","))
+
+
+def not_modified(etag: str, cache_control: str = CACHE_CONTROL) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
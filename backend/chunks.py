@@ -0,0 +1,271 @@
+"""Documenti grandi divisi in sezioni (document_chunks), indicizzate una per una.
+
+Sopra config.CHUNK_THRESHOLD caratteri il content di un documento non entra
+nella sua riga di documents_fts (restano titolo, project e tag): lo
+indicizzano le righe dei chunk, con rowid da CHUNK_BASE in su (vedi
+fts.SOURCE). I tagli cadono
+prima dei titoli markdown e, nei tratti lunghi senza titoli, dopo le righe
+scelte dal loro contenuto: un edit sposta solo i tagli vicini, quindi
+sync() reindicizza solo i chunk il cui testo e' cambiato.
+"""
+
+import bisect
+import hashlib
+import re
+import sqlite3
+import zlib
+from collections.abc import Iterable
+
+from backend import compression, config, fts, textdiff
+
+# id dei chunk e loro rowid in documents_fts: sopra qualsiasi id di documento
+CHUNK_BASE = 1 << 40
+_HEADING = re.compile(rb" {0,3}#{1,6}[ \t]+(.*?)[ \t#]*$")
+_FENCES = (b"```", b"~~~")
+MAX_HEADING = 200
+# Lo split riletto dopo un edit codifica il testo a finestre di questi caratteri
+_WINDOW = 65536
+
+
+def enabled(conn: sqlite3.Connection) -> bool:
+    """Se l'indice attivo legge i chunk: un vault non ancora migrato indicizza tutto intero."""
+    return fts.active_options(conn).get("content") == fts.SOURCE
+
+
+def needed(conn: sqlite3.Connection, content: str | None) -> bool:
+    return len(content or "") > config.CHUNK_THRESHOLD and enabled(conn)
+
+
+def _pieces(line: bytes, high: int):
+    """Una riga piu' lunga di ``high`` byte a pezzi, tagliati su un confine UTF-8."""
+    while len(line) > high:
+        cut = high
+        while cut > 0 and line[cut] & 0xC0 == 0x80:
+            cut -= 1
+        yield line[:cut]
+        line = line[cut:]
+    yield line
+
+
+def _lines(text: str, pos: int = 0):
+    """Righe di ``text`` da ``pos`` in UTF-8, codificate a finestre che finiscono a capo."""
+    while pos < len(text):
+        cut = text.find("\n", pos + _WINDOW)
+        cut = len(text) if cut < 0 else cut + 1
+        yield from text[pos:cut].encode().splitlines(keepends=True)
+        pos = cut
+
+
+def _split(text: str, size: int, offset: int = 0, section=None, fenced: bool = False):
+    """Chunk di ``text`` da ``offset`` caratteri in poi, uno alla volta.
+
+    Ogni chunk e' (offset, titolo, testo, sezione, dentro un blocco ```),
+    con lo stato all'inizio del rigo in cui comincia: da un chunk che inizia
+    con un rigo lo split riparte uguale senza rileggere il testo precedente.
+    """
+    low, high = size // 4, size * 4
+    lines: list[bytes] = []
+    length = 0
+    heading = None
+    state = (section, fenced)
+
+    def take():
+        nonlocal lines, length, offset
+        text = b"".join(lines).decode()
+        chunk = (offset, heading, text, state[0], int(state[1]))
+        offset += len(text)
+        lines, length = [], 0
+        return chunk
+
+    for line in _lines(text, offset):
+        line_state = (section, fenced)
+        title = None
+        if line.lstrip().startswith(_FENCES):
+            fenced = not fenced
+        elif not fenced and line.lstrip(b" ").startswith(b"#"):
+            match = _HEADING.match(line.rstrip(b"\r\n"))
+            if match:
+                title = match.group(1).decode(errors="replace")[:MAX_HEADING]
+        for piece in _pieces(line, high) if len(line) > high else (line,):
+            if lines and (title is not None and length >= low or length + len(piece) > high):
+                yield take()
+            if not lines:
+                heading, state = section, line_state
+            if title is not None:
+                # Un titolo che non ha aperto un chunk nuovo lo nomina se e' in testa
+                section, title = title, None
+                heading = section if length < low else heading
+            lines.append(piece)
+            length += len(piece)
+            # Punto di taglio deciso dal contenuto: stabile se cambia il testo prima
+            if length >= low and zlib.crc32(piece) % size < len(piece):
+                yield take()
+    if lines:
+        yield take()
+
+
+def split(content: str, size: int | None = None) -> list[tuple[int, str | None, str]]:
+    """Chunk di ``content``: (offset in caratteri, titolo della sezione, testo).
+
+    Un chunk misura da ``size / 4`` a ``4 * size`` byte (salvo l'ultimo) e in
+    media circa ``size``: dopo il minimo, un titolo apre un chunk nuovo e
+    ogni riga chiude quello corrente con probabilita' lunghezza / ``size``,
+    decisa dal CRC della riga stessa. Il titolo di un chunk e' quello della
+    sezione in cui inizia, o del primo titolo entro il minimo; le righe dentro
+    un blocco ``` non sono titoli.
+    """
+    return [chunk[:3] for chunk in _split(content, size or config.CHUNK_SIZE)]
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(text.encode(), digest_size=8).digest(), "big", signed=True
+    )
+
+
+def _resumable(text: str, row: sqlite3.Row, start: int) -> bool:
+    """Se lo split di ``text`` puo' ripartire da ``row`` senza toccare i chunk precedenti.
+
+    Serve lo stato salvato e un chunk che inizia con un rigo intero finito
+    prima di ``start``: il taglio prima di lui dipende da quel rigo.
+    """
+    pos = row["start"]
+    end = text.find("\n", pos)
+    return row["fenced"] is not None and text[pos - 1] in "\r\n" and 0 <= end < start
+
+
+def _resplit(content: str, previous: str, rows: list, size: int):
+    """Chunk da rifare dopo un edit: (primo rifatto, primo riusato in coda, chunk nuovi).
+
+    Lo split riparte dall'ultimo chunk prima del tratto cambiato da cui si
+    puo' riprendere e si ferma al primo taglio, dopo il tratto, che coincide
+    con uno vecchio con lo stesso stato: da li' in poi i chunk sono quelli
+    di prima, spostati della differenza di lunghezza.
+    """
+    start, end = textdiff.changed_span(previous, content)
+    shift = len(content) - len(previous)
+    head = bisect.bisect_right([r["start"] for r in rows], start) - 1
+    while head > 0 and not _resumable(previous, rows[head], start):
+        head -= 1
+    pos, section, fenced = 0, None, False
+    if head > 0:
+        pos, section, fenced = rows[head]["start"], rows[head]["section"], rows[head]["fenced"]
+    after = {r["start"]: i for i, r in enumerate(rows) if i > head}
+    fresh: list[tuple] = []
+    for chunk in _split(content, size, pos, section, bool(fenced)):
+        cut = chunk[0]
+        if cut > len(content) - end and content[cut - 1] in "\r\n":
+            i = after.get(cut - shift)
+            if i is not None and (rows[i]["section"], rows[i]["fenced"]) == chunk[3:]:
+                return head, i, fresh
+        fresh.append(chunk)
+    return head, len(rows), fresh
+
+
+def sync(
+    conn: sqlite3.Connection, doc_id: int, content: str | None, previous: str | None = None
+) -> int:
+    """Allinea i chunk di ``doc_id`` a ``content`` (None: nessun chunk); niente commit.
+
+    I chunk con lo stesso testo restano (al piu' cambiano posizione, offset o
+    titolo, senza toccare l'indice); gli altri si eliminano o si inseriscono
+    e i trigger aggiornano documents_fts. Con ``previous``, il testo diviso
+    dai chunk salvati, si ridivide solo attorno al tratto cambiato. Il testo
+    si salva nel formato del vault (backend.compression). Restituisce i
+    chunk reindicizzati.
+    """
+    rows = conn.execute(
+        "SELECT id, seq, start, heading, hash, section, fenced FROM document_chunks "
+        "WHERE doc_id = ? ORDER BY seq",
+        (doc_id,),
+    ).fetchall()
+    head, tail, shift = 0, len(rows), 0
+    fresh: Iterable[tuple] = []
+    if content is not None and previous is not None and rows:
+        head, tail, fresh = _resplit(content, previous, rows, config.CHUNK_SIZE)
+        shift = len(content) - len(previous)
+    elif content is not None:
+        fresh = _split(content, config.CHUNK_SIZE)
+    old: dict[int, list] = {}
+    for row in rows[head:tail]:
+        old.setdefault(row["hash"], []).append(row)
+    moves: list[tuple] = []
+    inserts: list[tuple] = []
+    seq = head
+    for start, heading, body, section, fenced in fresh:
+        digest = _digest(body)
+        same = old.get(digest)
+        if same:
+            row = same.pop()
+            position = (seq, start, heading, section, fenced)
+            if (
+                row["seq"],
+                row["start"],
+                row["heading"],
+                row["section"],
+                row["fenced"],
+            ) != position:
+                moves.append((*position, row["id"]))
+        else:
+            inserts.append((doc_id, seq, start, len(body), heading, section, fenced, digest, body))
+        seq += 1
+    for row in rows[tail:]:
+        if shift or row["seq"] != seq:
+            moves.append(
+                (
+                    seq,
+                    row["start"] + shift,
+                    row["heading"],
+                    row["section"],
+                    row["fenced"],
+                    row["id"],
+                )
+            )
+        seq += 1
+    deletes = [(row["id"],) for same in old.values() for row in same]
+    conn.executemany("DELETE FROM document_chunks WHERE id = ?", deletes)
+    conn.executemany(
+        "UPDATE document_chunks SET seq = ?, start = ?, heading = ?, section = ?, fenced = ? "
+        "WHERE id = ?",
+        moves,
+    )
+    if inserts:
+        enc = compression.encoder(conn)
+        inserts = [(*chunk[:-1], compression.encode(chunk[-1], enc)) for chunk in inserts]
+        last = conn.execute("SELECT MAX(id) FROM document_chunks").fetchone()[0]
+        first = max(last or 0, CHUNK_BASE - 1) + 1
+        conn.executemany(
+            "INSERT INTO document_chunks "
+            "(id, doc_id, seq, start, length, heading, section, fenced, hash, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(first + i, *chunk) for i, chunk in enumerate(inserts)],
+        )
+    return len(deletes) + len(inserts)
+
+
+def rechunk(conn: sqlite3.Connection) -> int:
+    """Divide o riunisce i documenti secondo CHUNK_THRESHOLD, una volta per soglia; con commit.
+
+    Serve quando un vault passa all'indice sui chunk o cambia la soglia; le
+    scritture normali passano da store, che chiama sync().
+    """
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'chunk_threshold'").fetchone()
+    if not enabled(conn) or (row and int(row[0]) == config.CHUNK_THRESHOLD):
+        return 0
+    ids = conn.execute(
+        "SELECT id FROM documents WHERE chunked != (length(content_text(content)) > ?)",
+        (config.CHUNK_THRESHOLD,),
+    ).fetchall()
+    for (doc_id,) in ids:
+        row = conn.execute("SELECT content FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        content = compression.text(row[0])
+        chunked = needed(conn, content)
+        conn.execute("UPDATE documents SET chunked = ? WHERE id = ?", (chunked, doc_id))
+        sync(conn, doc_id, content if chunked else None)
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES ('chunk_threshold', ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (config.CHUNK_THRESHOLD,),
+    )
+    conn.commit()
+    return len(ids)
@@ -0,0 +1,386 @@
+"""Content dei documenti e dei chunk compresso nel database, in chiaro solo quando serve.
+
+Con config.CONTENT_COMPRESSION = "zlib" ``documents.content`` e
+``document_chunks.body`` si salvano come BLOB: un byte di metodo, l'id del
+dizionario (4 byte) e i dati deflate. I testi corti, e quelli che compressi
+non diventano piu' piccoli, restano TEXT; ``text()`` accetta entrambi. Le
+note piccole si comprimono poco da sole: il dizionario (content_dicts) e'
+testo frequente nel vault, addestrato da ``train()``, che deflate usa come
+se precedesse ogni nota.
+
+Gli indici FTS restano external content, ma sulle viste fts.SOURCE e
+fts.TRIGRAM_SOURCE che leggono il testo con la funzione SQL
+``content_text`` (registrata dal pool): si decomprime solo per get_document,
+per gli snippet e per i delete dell'indice. Un vault non compresso ha viste
+e trigger senza la funzione, usabili anche da fuori (sqlite3, backup).
+
+Il passaggio tra i due modi riscrive le righe a blocchi, in background
+all'avvio o con ``python -m backend.compression compress|decompress``, e
+riprende da dove si era fermato. Lo spazio liberato torna al filesystem solo
+dopo un VACUUM (``--vacuum``).
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+from backend import config, fts
+
+logger = logging.getLogger(__name__)
+
+DEFLATE = 1
+DEFLATE_DICT = 2
+_HEADER = 5
+# deflate vede al massimo 32 KB indietro: oltre, il dizionario non serve
+MAX_DICT_SIZE = 32 * 1024
+# Note campionate per il dizionario (le piu' grandi si comprimono bene da sole)
+TRAIN_SAMPLES = 2000
+TRAIN_MAX_CHARS = 16 * 1024
+TRAIN_MIN_DOCS = 20
+_TOKEN = re.compile(r"\w{4,}")
+
+_dicts: dict[int, bytes] = {}
+_dicts_lock = threading.Lock()
+
+
+def _dictionary(dict_id: int, conn: sqlite3.Connection | None = None) -> bytes:
+    """Dati del dizionario ``dict_id``; gli id sono hash dei dati, validi in ogni vault."""
+    with _dicts_lock:
+        data = _dicts.get(dict_id)
+    if data is not None:
+        return data
+    if conn is None:
+        # Chiamata da content_text() dentro una query: connessione a parte
+        conn = sqlite3.connect(f"file:{config.DB_PATH}?mode=ro", uri=True)
+        try:
+            row = conn.execute(
+                "SELECT data FROM content_dicts WHERE id = ?", (dict_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+    else:
+        row = conn.execute("SELECT data FROM content_dicts WHERE id = ?", (dict_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"Unknown compression dictionary {dict_id}")
+    with _dicts_lock:
+        _dicts[dict_id] = row[0]
+    return row[0]
+
+
+def text(value):
+    """Il testo di un valore di content o body: BLOB compresso o TEXT (anche None)."""
+    if not isinstance(value, bytes):
+        return value
+    method, dict_id = value[0], int.from_bytes(value[1:_HEADER], "big")
+    if method == DEFLATE_DICT:
+        inflater = zlib.decompressobj(-15, zdict=_dictionary(dict_id))
+    elif method == DEFLATE:
+        inflater = zlib.decompressobj(-15)
+    else:
+        raise ValueError(f"Unknown compression method {method}")
+    return (inflater.decompress(value[_HEADER:]) + inflater.flush()).decode()
+
+
+def mode(conn: sqlite3.Connection) -> str:
+    """Formato delle nuove scritture nel vault: "zlib" o "none"."""
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'content_compression'").fetchone()
+    return row[0] if row else "none"
+
+
+def encoder(conn: sqlite3.Connection) -> tuple[int, bytes] | None:
+    """(id, dati) del dizionario corrente, (0, b"") senza; None se il vault non comprime."""
+    meta = dict(
+        conn.execute(
+            "SELECT key, value FROM vault_meta "
+            "WHERE key IN ('content_compression', 'content_dict')"
+        ).fetchall()
+    )
+    if meta.get("content_compression") != "zlib":
+        return None
+    dict_id = int(meta.get("content_dict") or 0)
+    return dict_id, _dictionary(dict_id, conn) if dict_id else b""
+
+
+def encode(value: str | None, enc: tuple[int, bytes] | None) -> str | bytes | None:
+    """``value`` come va salvato: compresso con ``enc`` se conviene, altrimenti com'e'."""
+    if enc is None or value is None or len(value) < config.CONTENT_COMPRESS_MIN:
+        return value
+    raw = value.encode()
+    dict_id, zdict = enc
+    if zdict:
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=zdict)
+        head = bytes([DEFLATE_DICT]) + dict_id.to_bytes(4, "big")
+    else:
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15)
+        head = bytes([DEFLATE]) + bytes(4)
+    packed = head + deflater.compress(raw) + deflater.flush()
+    return packed if len(packed) < len(raw) else value
+
+
+def train(conn: sqlite3.Connection, size: int | None = None) -> int | None:
+    """Addestra un dizionario sulle note piccole e lo rende quello corrente; con commit.
+
+    deflate non ha un addestramento vero: il dizionario e' testo che le note
+    probabilmente contengono. Righe e parole presenti in piu' note, pesate
+    per lunghezza, le piu' utili in fondo (piu' vicine al testo, distanze piu'
+    brevi). Le righe gia' compresse tengono il loro dizionario. None se le
+    note sono troppo poche.
+    """
+    size = min(size or config.CONTENT_DICT_SIZE, MAX_DICT_SIZE)
+    samples = [
+        text(r[0])
+        for r in conn.execute(
+            "SELECT content FROM documents WHERE id IN (SELECT id FROM documents "
+            "WHERE NOT chunked AND length(content) BETWEEN ? AND ? ORDER BY random() LIMIT ?)",
+            (config.CONTENT_COMPRESS_MIN, TRAIN_MAX_CHARS, TRAIN_SAMPLES),
+        )
+    ]
+    if len(samples) < TRAIN_MIN_DOCS:
+        return None
+    counts: Counter = Counter()
+    for sample in samples:
+        lines = {line.strip() for line in sample.splitlines()}
+        counts.update(f"{line}\n" for line in lines if 4 <= len(line) <= 200)
+        counts.update(f" {word}" for word in set(_TOKEN.findall(sample)))
+    picked, used = [], 0
+    for piece, n in sorted(counts.items(), key=lambda item: -item[1] * len(item[0])):
+        if n < 2:
+            break
+        piece_bytes = piece.encode()
+        if used + len(piece_bytes) <= size:
+            picked.append(piece_bytes)
+            used += len(piece_bytes)
+    if not picked:
+        return None
+    data = b"".join(reversed(picked))
+    dict_id = int.from_bytes(hashlib.blake2b(data, digest_size=4).digest(), "big") or 1
+    conn.execute(
+        "INSERT INTO content_dicts (id, data) VALUES (?, ?) ON CONFLICT(id) DO NOTHING",
+        (dict_id, data),
+    )
+    _set_meta(conn, "content_dict", dict_id)
+    conn.commit()
+    with _dicts_lock:
+        _dicts[dict_id] = data
+    return dict_id
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value):
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+
+def _migration(conn: sqlite3.Connection) -> dict | None:
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'content_migration'").fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def pending(conn: sqlite3.Connection) -> bool:
+    """Se il vault va portato a config.CONTENT_COMPRESSION (o manca il dizionario)."""
+    current = mode(conn)
+    if current != config.CONTENT_COMPRESSION or _migration(conn):
+        return True
+    return current == "zlib" and not _meta_int(conn, "content_dict")
+
+
+def _meta_int(conn: sqlite3.Connection, key: str) -> int:
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = ?", (key,)).fetchone()
+    return int(row[0]) if row and row[0] else 0
+
+
+# Colonne riscritte, in quest'ordine; il cursore e' l'id
+_COLUMNS = (
+    ("documents", "content"),
+    ("document_chunks", "body"),
+    ("document_revisions", "data"),
+)
+
+
+def _start(conn: sqlite3.Connection, target: str) -> dict:
+    """Fissa il formato delle scritture e, verso zlib, le viste che decomprimono; con commit."""
+    state = _migration(conn)
+    if state and state["mode"] == target:
+        return state
+    state = {"mode": target, "table": 0, "pos": 0}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _set_meta(conn, "content_compression", target)
+        _set_meta(conn, "content_migration", json.dumps(state))
+        if target == "zlib":
+            fts.install_text(conn, fts.TEXT_FUNCTION)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return state
+
+
+def _recode_batch(conn: sqlite3.Connection, state: dict, batch: int) -> int:
+    """Riscrive nel formato di ``state`` il blocco di righe successivo; con commit.
+
+    Il marker content_recode ferma i trigger di change log e indici per la
+    durata della transazione: il testo non cambia.
+    """
+    table, column = _COLUMNS[state["table"]]
+    _set_meta(conn, "content_recode", "1")
+    rows = conn.execute(
+        f"SELECT id, {column} FROM {table} WHERE id > ? AND typeof({column}) = ? "  # noqa: S608
+        "ORDER BY id LIMIT ?",
+        (state["pos"], "text" if state["mode"] == "zlib" else "blob", batch),
+    ).fetchall()
+    enc = encoder(conn) if state["mode"] == "zlib" else None
+    updates = []
+    for row_id, value in rows:
+        new = encode(value, enc) if enc else text(value)
+        if new is not value:
+            updates.append((new, row_id))
+    conn.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)  # noqa: S608
+    conn.execute("DELETE FROM vault_meta WHERE key = 'content_recode'")
+    if rows:
+        state["pos"] = rows[-1][0]
+    else:
+        state["table"], state["pos"] = state["table"] + 1, 0
+    _set_meta(conn, "content_migration", json.dumps(state))
+    conn.commit()
+    return len(updates)
+
+
+def _finish(conn: sqlite3.Connection, state: dict) -> bool:
+    """Chiude la migrazione; verso "none" rimette viste e trigger in chiaro."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if state["mode"] == "none":
+            left = any(
+                conn.execute(
+                    f"SELECT 1 FROM {table} WHERE typeof({column}) = 'blob' LIMIT 1"  # noqa: S608
+                ).fetchone()
+                for table, column in _COLUMNS
+            )
+            if left:
+                # Un altro processo ha scritto col vecchio formato: si ripassa
+                _set_meta(conn, "content_migration", json.dumps({**state, "table": 0, "pos": 0}))
+                conn.commit()
+                return False
+            fts.install_text(conn, "")
+        conn.execute("DELETE FROM vault_meta WHERE key = 'content_migration'")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+def migrate(target: str | None = None, batch: int | None = None, progress=None) -> bool:
+    """Porta il content del vault al formato ``target`` (default: config.CONTENT_COMPRESSION).
+
+    Ogni blocco e' una transazione breve: le letture e le scritture normali
+    continuano, e queste ultime usano gia' il formato nuovo. False se non
+    c'era niente da fare. ``progress(riscritte)`` dopo ogni blocco.
+    """
+    from backend.database import write_db
+
+    target = target or config.CONTENT_COMPRESSION
+    batch = batch or config.CONTENT_MIGRATE_BATCH
+    with write_db() as conn:
+        state = _migration(conn)
+        if target == "zlib" and fts.active_options(conn).get("content") != fts.SOURCE:
+            # Un indice di prima della vista legge content da documents: prima il rebuild FTS
+            logger.warning("Content compression waits for the FTS index rebuild")
+            return False
+        if mode(conn) == target and state is None:
+            if target == "zlib" and not _meta_int(conn, "content_dict"):
+                return train(conn) is not None
+            return False
+        state = _start(conn, target)
+        if target == "zlib" and not _meta_int(conn, "content_dict"):
+            train(conn)
+    recoded = 0
+    started = time.perf_counter()
+    while True:
+        with write_db() as conn:
+            if state["table"] == len(_COLUMNS):
+                if _finish(conn, state):
+                    break
+                state = _migration(conn)
+                continue
+            recoded += _recode_batch(conn, state, batch)
+        if progress:
+            progress(recoded)
+    logger.info(
+        "Content storage converted to %s (%d rows in %.1fs)",
+        target,
+        recoded,
+        time.perf_counter() - started,
+    )
+    return True
+
+
+def status(conn: sqlite3.Connection, sizes: bool = False) -> dict:
+    """Formato del vault e dizionario; con ``sizes`` anche righe e byte (scorre le tabelle)."""
+    dict_id = _meta_int(conn, "content_dict")
+    result: dict = {
+        "mode": mode(conn),
+        "configured": config.CONTENT_COMPRESSION,
+        "migrating": _migration(conn) is not None,
+        "dictionary": None,
+    }
+    if dict_id:
+        row = conn.execute(
+            "SELECT length(data) FROM content_dicts WHERE id = ?", (dict_id,)
+        ).fetchone()
+        result["dictionary"] = {"id": dict_id, "bytes": row[0] if row else None}
+    if sizes:
+        for table, column in _COLUMNS:
+            row = conn.execute(
+                f"SELECT COUNT(*), SUM(typeof({column}) = 'blob'), "  # noqa: S608
+                f"SUM(length(CAST({column} AS BLOB))), "
+                f"SUM(length(CAST(content_text({column}) AS BLOB))) FROM {table}"
+            ).fetchone()
+            stored, plain = row[2] or 0, row[3] or 0
+            result[table] = {
+                "rows": row[0],
+                "compressed": row[1] or 0,
+                "stored_bytes": stored,
+                "text_bytes": plain,
+                "ratio": round(stored / plain, 3) if plain else None,
+            }
+    return result
+
+
+def main():
+    from backend.database import init_db, read_db, write_db
+
+    parser = argparse.ArgumentParser(prog="python -m backend.compression")
+    parser.add_argument("command", choices=("status", "compress", "decompress", "train"))
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM dopo la migrazione")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    init_db()
+    if args.command in ("compress", "decompress"):
+        target = "zlib" if args.command == "compress" else "none"
+        migrate(target, progress=lambda n: print(f"\r{n} rows recoded", end="", flush=True))
+        print()
+        if args.vacuum:
+            with write_db() as conn:
+                conn.execute("VACUUM")
+    elif args.command == "train":
+        with write_db() as conn:
+            dict_id = train(conn)
+        print(f"dictionary {dict_id}" if dict_id else "not enough notes to train a dictionary")
+    with read_db() as conn:
+        print(json.dumps(status(conn, sizes=True), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,142 @@ DB_PATH = os.environ.get("DB_PATH", "/data/vault.db")
 JWT_EXPIRY_HOURS = int(os.environ.get("JWT_EXPIRY_HOURS", "24"))
 UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "/data/uploads")
 SENTRY_DSN = os.environ.get("SENTRY_DSN", "")
+CHANGES_RETENTION_DAYS = int(os.environ.get("CHANGES_RETENTION_DAYS", "30"))
+# Download via nginx (X-Accel-Redirect): prefisso della location internal che
+# serve UPLOAD_DIR; vuoto = i file passano da FileResponse
+FILE_ACCEL_PREFIX = os.environ.get("FILE_ACCEL_PREFIX", "")
+
+# Import massivo POST /api/docs/import
+IMPORT_MAX_ITEMS = int(os.environ.get("IMPORT_MAX_ITEMS", "20000"))
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", str(1024 * 1024 * 1024)))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "2000"))
+IMPORT_WORKERS = int(os.environ.get("IMPORT_WORKERS", "4"))
+
+# Stream SSE /api/events
+EVENTS_POLL_INTERVAL = float(os.environ.get("EVENTS_POLL_INTERVAL", "1.0"))
+EVENTS_HEARTBEAT = float(os.environ.get("EVENTS_HEARTBEAT", "15"))
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "256"))
+
+# Cache in-process dei risultati di /api/search (0 byte = disattivata)
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "300"))
+# Profili dell'indice full-text: tokenizer, detail e prefix richiedono un
+# rebuild (online, in background all'avvio o con python -m backend.fts rebuild);
+# i pesi bm25 di title, content, project e tags valgono da subito.
+# FTS5 ha solo lo stemmer porter (inglese): per l'italiano "stemmed" toglie i
+# diacritici (perche' = perché) ma non riduce le parole alla radice.
+FTS_PROFILES = {
+    # L'indice creato fin qui: unicode61, posizioni complete, prefissi da 2 e 3
+    "default": {
+        "tokenize": "unicode61",
+        "detail": "full",
+        "prefix": "2 3",
+        "weights": (1.0, 1.0, 1.0, 1.0),
+    },
+    # Stemming inglese, diacritici rimossi anche nelle forme composte, titoli e tag pesano di piu'
+    "stemmed": {
+        "tokenize": "porter unicode61 remove_diacritics 2",
+        "detail": "full",
+        "prefix": "2 3",
+        "weights": (5.0, 1.0, 1.0, 2.0),
+    },
+    # Senza posizioni: indice piu' piccolo, le frasi diventano AND di parole
+    "compact": {
+        "tokenize": "unicode61 remove_diacritics 2",
+        "detail": "column",
+        "prefix": "",
+        "weights": (5.0, 1.0, 1.0, 2.0),
+    },
+    # Solo id dei documenti: il piu' piccolo, niente filtri per colonna
+    "minimal": {
+        "tokenize": "unicode61 remove_diacritics 2",
+        "detail": "none",
+        "prefix": "",
+        "weights": (1.0, 1.0, 1.0, 1.0),
+    },
+}
+FTS_PROFILE = os.environ.get("FTS_PROFILE", "default")
+FTS_REBUILD_BATCH = int(os.environ.get("FTS_REBUILD_BATCH", "2000"))
+# Rebuild in background all'avvio se l'indice non corrisponde a FTS_PROFILE
+FTS_AUTO_REBUILD = os.environ.get("FTS_AUTO_REBUILD", "true").lower() in ("1", "true")
+
+# Documenti con content oltre CHUNK_THRESHOLD caratteri si indicizzano a
+# sezioni (backend.chunks) di circa CHUNK_SIZE byte: un edit reindicizza solo
+# le sezioni cambiate e la ricerca indica la sezione trovata
+CHUNK_THRESHOLD = int(os.environ.get("CHUNK_THRESHOLD", str(64 * 1024)))
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", str(8 * 1024)))
+# Estrazione del testo da PDF/DOCX/XLSX/PPTX/drawio caricati (backend.extraction):
+# coda in SQLite svuotata da EXTRACT_WORKERS processi, EXTRACT_TIMEOUT secondi
+# per job, EXTRACT_MAX_ATTEMPTS tentativi a distanza EXTRACT_RETRY_DELAY * 2^n
+EXTRACT_ENABLED = os.environ.get("EXTRACT_ENABLED", "true").lower() in ("1", "true")
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", "2"))
+EXTRACT_TIMEOUT = float(os.environ.get("EXTRACT_TIMEOUT", "60"))
+EXTRACT_MAX_ATTEMPTS = int(os.environ.get("EXTRACT_MAX_ATTEMPTS", "3"))
+EXTRACT_RETRY_DELAY = float(os.environ.get("EXTRACT_RETRY_DELAY", "30"))
+EXTRACT_POLL_INTERVAL = float(os.environ.get("EXTRACT_POLL_INTERVAL", "5"))
+EXTRACT_MAX_CHARS = int(os.environ.get("EXTRACT_MAX_CHARS", str(20 * 1024 * 1024)))
+# Anteprime degli allegati (backend.previews) in UPLOAD_DIR/previews, LRU su disco
+PREVIEW_CACHE_MB = float(os.environ.get("PREVIEW_CACHE_MB", "256"))
+# Righe di CSV/XLSX (backend.rows): un offset salvato ogni ROWS_STRIDE righe,
+# cioe' al piu' ROWS_STRIDE - 1 righe lette a vuoto dopo il seek
+ROWS_STRIDE = int(os.environ.get("ROWS_STRIDE", "256"))
+# Content dei documenti compresso nel database (backend.compression): "zlib"
+# (deflate con un dizionario addestrato sulle note del vault) o "none"; al
+# cambio un job all'avvio riscrive le righe a blocchi di CONTENT_MIGRATE_BATCH.
+# I testi sotto CONTENT_COMPRESS_MIN byte restano in chiaro.
+CONTENT_COMPRESSION = os.environ.get("CONTENT_COMPRESSION", "none").lower()
+CONTENT_COMPRESS_MIN = int(os.environ.get("CONTENT_COMPRESS_MIN", "64"))
+CONTENT_DICT_SIZE = int(os.environ.get("CONTENT_DICT_SIZE", str(32 * 1024)))
+CONTENT_MIGRATE_BATCH = int(os.environ.get("CONTENT_MIGRATE_BATCH", "500"))
+# Storico dei documenti (backend.revisions): al piu' REVISION_SNAPSHOT_EVERY - 1
+# delta da applicare per ricostruire una versione, poi un testo intero
+REVISION_SNAPSHOT_EVERY = int(os.environ.get("REVISION_SNAPSHOT_EVERY", "100"))
+# Merge automatici di FTS5 a ogni scrittura (default 4 e 16): con la
+# manutenzione in background si alza automerge, le scritture fanno meno merge
+# e i segmenti vengono fusi nei momenti di inattivita'
+FTS_AUTOMERGE = int(os.environ.get("FTS_AUTOMERGE", "8"))
+FTS_CRISISMERGE = int(os.environ.get("FTS_CRISISMERGE", "16"))
+
+# Manutenzione in background (backend.maintenance), in un solo worker alla
+# volta: intervalli in secondi tra due esecuzioni di ogni task, 0 = disattivato.
+# merge, optimize e integrity aspettano MAINT_IDLE secondi senza scritture.
+MAINT_ENABLED = os.environ.get("MAINT_ENABLED", "true").lower() in ("1", "true")
+MAINT_TICK = float(os.environ.get("MAINT_TICK", "30"))
+MAINT_IDLE = float(os.environ.get("MAINT_IDLE", "60"))
+MAINT_MERGE_INTERVAL = float(os.environ.get("MAINT_MERGE_INTERVAL", "300"))
+MAINT_OPTIMIZE_INTERVAL = float(os.environ.get("MAINT_OPTIMIZE_INTERVAL", str(24 * 3600)))
+MAINT_INTEGRITY_INTERVAL = float(os.environ.get("MAINT_INTEGRITY_INTERVAL", str(7 * 24 * 3600)))
+MAINT_ANALYZE_INTERVAL = float(os.environ.get("MAINT_ANALYZE_INTERVAL", str(6 * 3600)))
+MAINT_CHECKPOINT_INTERVAL = float(os.environ.get("MAINT_CHECKPOINT_INTERVAL", "300"))
+# Pagine scritte per passo di merge (una transazione) e secondi di merge per giro
+MAINT_MERGE_PAGES = int(os.environ.get("MAINT_MERGE_PAGES", "500"))
+MAINT_MERGE_BUDGET = float(os.environ.get("MAINT_MERGE_BUDGET", "5"))
+# Oltre questa dimensione il checkpoint, a vault inattivo, tronca il file WAL
+MAINT_WAL_TRUNCATE_MB = float(os.environ.get("MAINT_WAL_TRUNCATE_MB", "64"))
+
+# Indice trigram opzionale per mode=substring/fuzzy di /api/search (circa la
+# dimensione del testo in piu' sul disco); disattivarlo elimina l'indice
+SEARCH_TRIGRAM = os.environ.get("SEARCH_TRIGRAM", "false").lower() in ("1", "true")
+# Secondi minimi tra due riallineamenti di search_terms (completamenti /api/search/suggest)
+SUGGEST_REFRESH_INTERVAL = float(os.environ.get("SUGGEST_REFRESH_INTERVAL", "30"))
+
+# Pool connessioni SQLite (per worker uvicorn)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL").upper()
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "8192"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_TEMP_STORE = os.environ.get("DB_TEMP_STORE", "MEMORY").upper()
+
+if DB_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"Invalid DB_SYNCHRONOUS: {DB_SYNCHRONOUS}")
+if DB_TEMP_STORE not in ("DEFAULT", "FILE", "MEMORY"):
+    raise ValueError(f"Invalid DB_TEMP_STORE: {DB_TEMP_STORE}")
+if CONTENT_COMPRESSION not in ("none", "zlib"):
+    raise ValueError(f"Invalid CONTENT_COMPRESSION: {CONTENT_COMPRESSION} (none or zlib)")
+if FTS_PROFILE not in FTS_PROFILES:
+    raise ValueError(f"Invalid FTS_PROFILE: {FTS_PROFILE} (one of {', '.join(FTS_PROFILES)})")
 
 if JWT_SECRET == "change-me-in-production":  # nosec B105
     logger.warning("JWT_SECRET is using the default value — set a secure secret in production")
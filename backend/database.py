@@ -2,22 +2,74 @@
 
 import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
 
 import bcrypt
 
-from backend.config import ADMIN_PASSWORD, DB_PATH
+from backend import chunks, compression, extraction, fts
+from backend.config import (
+    ADMIN_PASSWORD,
+    CHANGES_RETENTION_DAYS,
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+    DB_PATH,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_SYNCHRONOUS,
+    DB_TEMP_STORE,
+    SEARCH_TRIGRAM,
+)
+from backend.pool import ConnectionPool
+from backend.store import normalize_tags, tags_value
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Pool del processo corrente, creato al primo uso (anche dopo un fork)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(
+                DB_PATH,
+                size=DB_POOL_SIZE,
+                timeout=DB_POOL_TIMEOUT,
+                pragmas=[
+                    ("foreign_keys", "ON"),
+                    ("busy_timeout", DB_BUSY_TIMEOUT_MS),
+                    ("synchronous", DB_SYNCHRONOUS),
+                    ("cache_size", -DB_CACHE_SIZE_KB),
+                    ("mmap_size", DB_MMAP_SIZE),
+                    ("temp_store", DB_TEMP_STORE),
+                ],
+                # Testo di content compresso per le viste degli indici (backend.compression)
+                functions=[(fts.TEXT_FUNCTION, 1, compression.text)],
+            )
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
 
 
 @contextmanager
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys=ON")
-    try:
+def read_db():
+    with get_pool().reader() as conn:
+        yield conn
+
+
+@contextmanager
+def write_db():
+    with get_pool().writer() as conn:
         yield conn
-    finally:
-        conn.close()
 
 
 def init_db():
@@ -26,7 +78,7 @@ def init_db():
             f"SQLite >= 3.35.0 required (RETURNING clause), found {sqlite3.sqlite_version}"
         )
     os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
-    with get_db() as conn:
+    with write_db() as conn:
         conn.execute("PRAGMA journal_mode=WAL")
 
         cur = conn.cursor()
@@ -47,48 +99,324 @@ def init_db():
                 tags TEXT,
                 file_name TEXT,
                 file_type TEXT,
+                file_size INTEGER,
+                file_sha256 TEXT,
+                version INTEGER NOT NULL DEFAULT 1,
+                chunked INTEGER NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
+
+            CREATE TABLE IF NOT EXISTS vault_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
         """)
 
-        try:
-            cur.execute("""
-                CREATE VIRTUAL TABLE documents_fts USING fts5(
-                    title, content, project, tags,
-                    content=documents, content_rowid=id
-                )
-            """)
-        except sqlite3.OperationalError:
-            pass
+        # Chunk dei documenti grandi (backend.chunks): prima dell'indice, che li
+        # legge dalla vista fts.SOURCE insieme ai documenti
+        if "chunked" not in [r[1] for r in cur.execute("PRAGMA table_info(documents)")]:
+            cur.execute("ALTER TABLE documents ADD COLUMN chunked INTEGER NOT NULL DEFAULT 0")
+        cur.executescript(f"""
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                id INTEGER PRIMARY KEY,
+                doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                seq INTEGER NOT NULL,
+                start INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                heading TEXT,
+                section TEXT,
+                fenced INTEGER,
+                hash INTEGER NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_doc ON document_chunks(doc_id);
+            {fts.source_sql()};
 
-        cur.executescript("""
-            CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
-                INSERT INTO documents_fts(rowid, title, content, project, tags)
-                VALUES (new.id, new.title, new.content, new.project, new.tags);
+            CREATE TABLE IF NOT EXISTS content_dicts (
+                id INTEGER PRIMARY KEY,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        # Stato dello split all'inizio di ogni chunk, per ridividere solo attorno a
+        # un edit; NULL nei chunk di prima, che si ridividono dall'inizio
+        if "fenced" not in [r[1] for r in cur.execute("PRAGMA table_info(document_chunks)")]:
+            cur.execute("ALTER TABLE document_chunks ADD COLUMN section TEXT")
+            cur.execute("ALTER TABLE document_chunks ADD COLUMN fenced INTEGER")
+        # Vista e trigger leggono content con content_text() se il vault e' compresso
+        text = fts.text_function(conn)
+
+        # Indice full-text del profilo configurato (vedi backend.fts): qui si crea
+        # solo se manca; un indice con altre opzioni resta attivo finche' il
+        # rebuild online non lo sostituisce
+        fts_table = cur.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'documents_fts'"
+        ).fetchone()
+        if fts_table is None:
+            options = fts.index_options(fts.profile())
+            cur.execute(fts.create_sql("documents_fts", options))
+            cur.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+            fts.set_active(conn, options)
+        elif not fts.active_options(conn):
+            fts.set_active(conn, fts.legacy_options(fts_table[0]))
+        documents_au = cur.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'documents_au'"
+        ).fetchone()
+        if documents_au and fts.INDEXED_CHANGED not in documents_au[0]:
+            # Trigger di prima dei chunk, della compressione o del controllo sulle colonne
+            # cambiate: indicizzano le stesse righe
+            for name in fts.TRIGGERS:
+                cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for sql in fts.trigger_sql(text):
+            cur.execute(sql)
+        conn.commit()
+
+        # Change log per il delta sync: una riga per documento (l'ultima modifica),
+        # i delete restano come tombstone fino a compact_changes(); la riscrittura
+        # di content compresso o in chiaro non e' una modifica
+        log_au = cur.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'documents_log_au'"
+        ).fetchone()
+        if log_au and "content_recode" not in log_au[0]:
+            cur.execute("DROP TRIGGER documents_log_au")
+        cur.executescript(f"""
+            CREATE TABLE IF NOT EXISTS doc_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                updated_at TIMESTAMP,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_changes_doc ON doc_changes(doc_id);
+
+            CREATE TRIGGER IF NOT EXISTS documents_log_ai AFTER INSERT ON documents BEGIN
+                DELETE FROM doc_changes WHERE doc_id = new.id;
+                INSERT INTO doc_changes(doc_id, op, updated_at)
+                VALUES (new.id, 'create', new.updated_at);
             END;
 
-            CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
-                INSERT INTO documents_fts(documents_fts, rowid, title, content, project, tags)
-                VALUES ('delete', old.id, old.title, old.content, old.project, old.tags);
+            CREATE TRIGGER IF NOT EXISTS documents_log_ad AFTER DELETE ON documents BEGIN
+                DELETE FROM doc_changes WHERE doc_id = old.id;
+                INSERT INTO doc_changes(doc_id, op, updated_at) VALUES (old.id, 'delete', NULL);
             END;
 
-            CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
-                INSERT INTO documents_fts(documents_fts, rowid, title, content, project, tags)
-                VALUES ('delete', old.id, old.title, old.content, old.project, old.tags);
-                INSERT INTO documents_fts(rowid, title, content, project, tags)
-                VALUES (new.id, new.title, new.content, new.project, new.tags);
+            CREATE TRIGGER IF NOT EXISTS documents_log_au AFTER UPDATE ON documents
+            WHEN {fts.NOT_RECODING} BEGIN
+                DELETE FROM doc_changes WHERE doc_id = new.id;
+                INSERT INTO doc_changes(doc_id, op, updated_at)
+                VALUES (
+                    new.id,
+                    CASE WHEN old.project IS NOT new.project THEN 'move' ELSE 'update' END,
+                    new.updated_at
+                );
             END;
         """)
 
         # Indices for performance
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_docs_updated ON documents(updated_at DESC)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_docs_project ON documents(project)")
+        # (updated_at, id) letto all'indietro serve la paginazione keyset senza sort
+        cur.execute("DROP INDEX IF EXISTS idx_docs_updated")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_docs_updated_id ON documents(updated_at, id)")
+        # (project, updated_at, id): i range delle cartelle e, per una cartella esatta,
+        # la pagina gia' in ordine; il vecchio indice su (project) viene sostituito
+        if len(cur.execute("PRAGMA index_info(idx_docs_project)").fetchall()) == 1:
+            cur.execute("DROP INDEX idx_docs_project")
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_docs_project ON documents(project, updated_at, id)"
+        )
 
         columns = [row[1] for row in cur.execute("PRAGMA table_info(documents)").fetchall()]
         if "file_name" not in columns:
             cur.execute("ALTER TABLE documents ADD COLUMN file_name TEXT")
             cur.execute("ALTER TABLE documents ADD COLUMN file_type TEXT")
+        if "file_sha256" not in columns:
+            cur.execute("ALTER TABLE documents ADD COLUMN file_size INTEGER")
+            cur.execute("ALTER TABLE documents ADD COLUMN file_sha256 TEXT")
+        if "version" not in columns:
+            cur.execute("ALTER TABLE documents ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_docs_sha ON documents(file_sha256)")
+
+        # Blob store content-addressed: refcount mantenuto dai trigger su file_sha256
+        cur.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TRIGGER IF NOT EXISTS documents_blob_ai AFTER INSERT ON documents
+            WHEN new.file_sha256 IS NOT NULL BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = new.file_sha256;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS documents_blob_ad AFTER DELETE ON documents
+            WHEN old.file_sha256 IS NOT NULL BEGIN
+                UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = old.file_sha256;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS documents_blob_au AFTER UPDATE OF file_sha256 ON documents
+            WHEN old.file_sha256 IS NOT new.file_sha256 BEGIN
+                UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = old.file_sha256;
+                UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = new.file_sha256;
+            END;
+        """)
+
+        # Coda dell'estrazione del testo dai file (backend.extraction): un job per
+        # documento, run_after e' la prossima esecuzione o la scadenza del lease
+        cur.executescript("""
+            CREATE TABLE IF NOT EXISTS extract_jobs (
+                doc_id INTEGER PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
+                sha256 TEXT,
+                ext TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_after REAL NOT NULL,
+                queued_at REAL NOT NULL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_extract_jobs_due ON extract_jobs(run_after)
+                WHERE state != 'failed';
+        """)
+        if _meta(conn, "extract_backfill") is None:
+            extraction.backfill(conn)
+
+        # Storico dei documenti (backend.revisions): la versione sostituita da ogni
+        # salvataggio, come delta verso la successiva o testo intero (snapshot)
+        cur.executescript("""
+            CREATE TABLE IF NOT EXISTS document_revisions (
+                id INTEGER PRIMARY KEY,
+                doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                version INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                data BLOB,
+                title TEXT NOT NULL,
+                project TEXT,
+                tags TEXT,
+                updated_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (doc_id, version)
+            );
+        """)
+
+        # Indice delle righe di CSV e XLSX (backend.rows), per contenuto del file:
+        # offset in byte di una riga ogni ``stride``, via con il blob
+        cur.executescript("""
+            CREATE TABLE IF NOT EXISTS row_index (
+                key TEXT NOT NULL,
+                sheet INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                source TEXT,
+                dialect TEXT NOT NULL,
+                columns TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                stride INTEGER NOT NULL,
+                offsets BLOB NOT NULL,
+                PRIMARY KEY (key, sheet)
+            );
+
+            CREATE TRIGGER IF NOT EXISTS blobs_row_index_ad AFTER DELETE ON blobs BEGIN
+                DELETE FROM row_index WHERE key = old.sha256;
+            END;
+        """)
+
+        # Indice normalizzato dei tag: document_tags scritto da store.set_tags(),
+        # doc_count mantenuto dai trigger (anche sui delete a cascata)
+        cur.executescript("""
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                doc_count INTEGER NOT NULL DEFAULT 0
+            );
+
+            CREATE TABLE IF NOT EXISTS document_tags (
+                tag_id INTEGER NOT NULL REFERENCES tags(id),
+                doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                PRIMARY KEY (tag_id, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_document_tags_doc ON document_tags(doc_id);
+
+            CREATE TRIGGER IF NOT EXISTS document_tags_ai AFTER INSERT ON document_tags BEGIN
+                UPDATE tags SET doc_count = doc_count + 1 WHERE id = new.tag_id;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS document_tags_ad AFTER DELETE ON document_tags BEGIN
+                UPDATE tags SET doc_count = doc_count - 1 WHERE id = old.tag_id;
+                DELETE FROM tags WHERE id = old.tag_id AND doc_count <= 0;
+            END;
+        """)
+        if _meta(conn, "tags_index") is None:
+            rebuild_tag_index(conn)
+
+        # Albero delle cartelle materializzato: una riga per project con documenti
+        # (path '' = Unsorted), conteggi diretti e ultima modifica dai trigger;
+        # i totali dei sottoalberi si sommano su questa tabella, non su documents
+        cur.executescript("""
+            CREATE TABLE IF NOT EXISTS projects (
+                path TEXT PRIMARY KEY,
+                doc_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP
+            ) WITHOUT ROWID;
+
+            CREATE TRIGGER IF NOT EXISTS documents_project_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO projects (path, doc_count, updated_at)
+                VALUES (COALESCE(new.project, ''), 1, new.updated_at)
+                ON CONFLICT(path) DO UPDATE SET
+                    doc_count = doc_count + 1,
+                    updated_at = MAX(updated_at, excluded.updated_at);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS documents_project_ad AFTER DELETE ON documents BEGIN
+                UPDATE projects SET doc_count = doc_count - 1, updated_at = CURRENT_TIMESTAMP
+                WHERE path = COALESCE(old.project, '');
+                DELETE FROM projects WHERE path = COALESCE(old.project, '') AND doc_count <= 0;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS documents_project_au AFTER UPDATE OF project, updated_at
+            ON documents BEGIN
+                UPDATE projects SET doc_count = doc_count - 1, updated_at = CURRENT_TIMESTAMP
+                WHERE path = COALESCE(old.project, '')
+                AND COALESCE(old.project, '') != COALESCE(new.project, '');
+                DELETE FROM projects WHERE path = COALESCE(old.project, '') AND doc_count <= 0;
+                INSERT INTO projects (path, doc_count, updated_at)
+                VALUES (COALESCE(new.project, ''), 1, new.updated_at)
+                ON CONFLICT(path) DO UPDATE SET
+                    doc_count = doc_count
+                        + (COALESCE(old.project, '') != COALESCE(new.project, '')),
+                    updated_at = MAX(updated_at, excluded.updated_at);
+            END;
+        """)
+        if _meta(conn, "projects_index") is None:
+            rebuild_project_index(conn)
+
+        # Completamenti dei termini: fts5vocab da' la document frequency ma la
+        # calcola scorrendo le posting list, troppo lento per ogni tasto; se ne
+        # tiene una copia in search_terms, riallineata da apply_search_terms()
+        cur.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_vocab
+                USING fts5vocab(documents_fts, 'row');
+
+            CREATE TABLE IF NOT EXISTS search_terms (
+                term TEXT PRIMARY KEY,
+                doc_count INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        """)
+        if _meta(conn, "terms_seq") is None:
+            apply_search_terms(conn, *search_terms_diff(conn))
+
+        if SEARCH_TRIGRAM:
+            _create_trigram_index(cur, text)
+        else:
+            _drop_trigram_index(cur)
+        for table in fts.existing_tables(conn):
+            fts.tune(conn, table)
+
+        # Identita' del file di database per le cache in-process (vedi data_version)
+        cur.execute(
+            "INSERT INTO vault_meta (key, value) VALUES ('vault_id', lower(hex(randomblob(8)))) "
+            "ON CONFLICT(key) DO NOTHING"
+        )
 
         existing = cur.execute(
             "SELECT id, password_hash FROM users WHERE username = ?", ("admin",)
@@ -109,3 +437,222 @@ def init_db():
                 )
 
         conn.commit()
+        compact_changes(conn)
+        chunks.rechunk(conn)
+
+
+def _create_trigram_index(cur, text: str = ""):
+    """Indici trigram per la ricerca per sottostringa e con errori di battitura.
+
+    documents_trigram indicizza title e content dalla vista fts.TRIGRAM_SOURCE
+    (i trigger scattano solo se cambiano loro); search_terms_trigram il
+    vocabolario di search_terms, per trovare i termini simili a una parola
+    scritta male. Alla creazione si popolano entrambi dalle tabelle esistenti.
+    """
+    table = cur.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'documents_trigram'"
+    ).fetchone()
+    if table and "content=documents," in table[0]:
+        # Indice di prima della vista: letto da documents, non vedrebbe il testo compresso
+        for name in fts.TRIGRAM_TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute("DROP TABLE documents_trigram")
+        table = None
+    terms = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'search_terms_trigram'"
+    ).fetchone()
+    au = cur.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'documents_trigram_au'"
+    ).fetchone()
+    if au and fts.TRIGRAM_CHANGED not in au[0]:
+        cur.execute("DROP TRIGGER documents_trigram_au")
+    cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_trigram USING fts5(
+            title, content, content={fts.TRIGRAM_SOURCE}, content_rowid=id, tokenize='trigram'
+        )
+    """)
+    for sql in fts.trigram_sql(text):
+        cur.execute(sql)
+    cur.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_terms_trigram USING fts5(
+            term, tokenize='trigram'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS search_terms_trigram_ai AFTER INSERT ON search_terms
+        WHEN length(new.term) >= 3 BEGIN
+            INSERT INTO search_terms_trigram(term) VALUES (new.term);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS search_terms_trigram_ad AFTER DELETE ON search_terms
+        WHEN length(old.term) >= 3 BEGIN
+            DELETE FROM search_terms_trigram WHERE rowid IN (
+                SELECT rowid FROM search_terms_trigram
+                WHERE search_terms_trigram MATCH '"' || old.term || '"' AND term = old.term
+            );
+        END;
+    """)
+    if not table:
+        cur.execute("INSERT INTO documents_trigram(documents_trigram) VALUES ('rebuild')")
+    if not terms:
+        cur.execute(
+            "INSERT INTO search_terms_trigram(term) "
+            "SELECT term FROM search_terms WHERE length(term) >= 3"
+        )
+
+
+def _drop_trigram_index(cur):
+    cur.executescript("""
+        DROP TRIGGER IF EXISTS documents_trigram_ai;
+        DROP TRIGGER IF EXISTS documents_trigram_ad;
+        DROP TRIGGER IF EXISTS documents_trigram_au;
+        DROP TRIGGER IF EXISTS search_terms_trigram_ai;
+        DROP TRIGGER IF EXISTS search_terms_trigram_ad;
+        DROP TABLE IF EXISTS documents_trigram;
+        DROP TABLE IF EXISTS search_terms_trigram;
+        DROP VIEW IF EXISTS documents_trigram_source;
+    """)
+
+
+def _meta(conn, key: str) -> str | None:
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def rebuild_tag_index(conn):
+    """Ricostruisce tags/document_tags dalla colonna ``tags`` (migrazione una tantum).
+
+    Riscrive anche la colonna in forma canonica ("a,b") solo dove differisce,
+    senza toccare updated_at.
+    """
+    conn.execute("DELETE FROM document_tags")
+    conn.execute("DELETE FROM tags")
+    pairs, rewrites = [], []
+    for row in conn.execute("SELECT id, tags FROM documents WHERE tags IS NOT NULL"):
+        names = normalize_tags(row["tags"])
+        pairs += [(name, row["id"]) for name in names]
+        if tags_value(names) != row["tags"]:
+            rewrites.append((tags_value(names), row["id"]))
+    conn.executemany(
+        "INSERT INTO tags (name) VALUES (?) ON CONFLICT(name) DO NOTHING",
+        [(name,) for name, _ in pairs],
+    )
+    conn.executemany(
+        "INSERT INTO document_tags (tag_id, doc_id) SELECT id, ? FROM tags WHERE name = ?",
+        [(doc_id, name) for name, doc_id in pairs],
+    )
+    conn.executemany("UPDATE documents SET tags = ? WHERE id = ?", rewrites)
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES ('tags_index', '1') "
+        "ON CONFLICT(key) DO NOTHING"
+    )
+
+
+def rebuild_project_index(conn):
+    """Ricostruisce la tabella projects da documents (migrazione una tantum)."""
+    conn.execute("DELETE FROM projects")
+    conn.execute(
+        "INSERT INTO projects (path, doc_count, updated_at) "
+        "SELECT COALESCE(project, ''), COUNT(*), MAX(updated_at) FROM documents "
+        "GROUP BY COALESCE(project, '')"
+    )
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES ('projects_index', '1') "
+        "ON CONFLICT(key) DO NOTHING"
+    )
+
+
+def search_terms_diff(conn) -> tuple[int, list, list]:
+    """Differenze tra documents_vocab e search_terms: (testa del change log, upsert, delete).
+
+    Sola lettura: il vocabolario si scorre senza tenere il lock di scrittura.
+    """
+    head = changes_head(conn)
+    current = dict(conn.execute("SELECT term, doc_count FROM search_terms").fetchall())
+    upserts = []
+    for term, doc in conn.execute("SELECT term, doc FROM documents_vocab"):
+        if current.pop(term, None) != doc:
+            upserts.append((term, doc))
+    return head, upserts, list(current)
+
+
+def apply_search_terms(conn, head: int, upserts: list, deletes: list) -> int:
+    """Scrive il diff di search_terms_diff(); niente se c'e' gia' una copia piu' recente."""
+    if int(_meta(conn, "terms_seq") or -1) >= head:
+        return 0
+    conn.executemany(
+        "INSERT INTO search_terms (term, doc_count) VALUES (?, ?) "
+        "ON CONFLICT(term) DO UPDATE SET doc_count = excluded.doc_count",
+        upserts,
+    )
+    conn.executemany("DELETE FROM search_terms WHERE term = ?", [(t,) for t in deletes])
+    conn.executemany(
+        "INSERT INTO vault_meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        [("terms_seq", head), ("terms_refreshed", int(time.time()))],
+    )
+    conn.commit()
+    return len(upserts) + len(deletes)
+
+
+def search_terms_lag(conn) -> tuple[int, float]:
+    """Modifiche non ancora in search_terms e secondi dall'ultimo riallineamento."""
+    row = conn.execute(
+        "SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'doc_changes'), "
+        "(SELECT value FROM vault_meta WHERE key = 'terms_seq'), "
+        "(SELECT value FROM vault_meta WHERE key = 'terms_refreshed')"
+    ).fetchone()
+    return (row[0] or 0) - int(row[1] or 0), time.time() - int(row[2] or 0)
+
+
+def changes_head(conn) -> int:
+    """Ultimo numero di sequenza assegnato nel change log (0 se vuoto)."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'doc_changes'").fetchone()
+    return row[0] if row else 0
+
+
+def data_version(conn) -> tuple[str, int, str]:
+    """Versione dei dati condivisa da tutti i worker: (vault_id, testa del change log, indice).
+
+    Ogni scrittura su documents aggiunge una riga al change log, quindi la
+    coppia cambia a ogni modifica; vault_id distingue un database nuovo la cui
+    sequenza riparte da zero, le opzioni dell'indice FTS un rebuild appena
+    concluso (stessi documenti, risultati diversi).
+    """
+    row = conn.execute(
+        "SELECT (SELECT value FROM vault_meta WHERE key = 'vault_id'), "
+        "(SELECT seq FROM sqlite_sequence WHERE name = 'doc_changes'), "
+        "(SELECT value FROM vault_meta WHERE key = 'fts_profile')"
+    ).fetchone()
+    return row[0] or "", row[1] or 0, row[2] or ""
+
+
+def changes_floor(conn) -> int:
+    """Cursori sotto questa soglia hanno perso tombstone: serve un resync completo."""
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'changes_floor'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def compact_changes(conn, retention_days: int = CHANGES_RETENTION_DAYS) -> int:
+    """Elimina le tombstone piu' vecchie di ``retention_days`` e alza la soglia di resync.
+
+    Le righe dei documenti vivi non vanno mai compattate qui: i trigger tengono
+    gia' solo l'ultima modifica per documento.
+    """
+    row = conn.execute(
+        "SELECT MAX(seq) FROM doc_changes WHERE op = 'delete' AND changed_at < datetime('now', ?)",
+        (f"{-retention_days} days",),
+    ).fetchone()
+    floor = row[0]
+    if floor is None:
+        return 0
+    deleted = conn.execute(
+        "DELETE FROM doc_changes WHERE op = 'delete' AND seq <= ?", (floor,)
+    ).rowcount
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES ('changes_floor', ?) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        "value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+        (floor,),
+    )
+    conn.commit()
+    return deleted
@@ -0,0 +1,174 @@
+"""Fan-out in-process degli eventi documento per lo stream SSE."""
+
+import asyncio
+import json
+import logging
+import sqlite3
+from contextlib import suppress
+
+from backend.config import EVENTS_POLL_INTERVAL, EVENTS_QUEUE_SIZE
+from backend.database import changes_head, get_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """Coda limitata di un client SSE; ``None`` in coda chiude lo stream."""
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.dropped = False
+
+
+class EventPublisher:
+    """Un solo poller per worker legge il change log e distribuisce gli eventi.
+
+    Il poller controlla ``PRAGMA data_version`` sulla propria connessione: il
+    valore cambia a ogni commit fatto da un'altra connessione, quindi vede anche
+    le scritture degli altri worker uvicorn. I router chiamano notify() dopo il
+    commit per non aspettare il giro di polling successivo. I client lenti, la
+    cui coda si riempie, vengono disconnessi e riprendono con Last-Event-ID.
+    """
+
+    def __init__(self):
+        self._subscribers: set[Subscriber] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._conn: sqlite3.Connection | None = None
+        self._data_version = None
+        self._queue_size = EVENTS_QUEUE_SIZE
+        self._poll_interval = EVENTS_POLL_INTERVAL
+        self.last_seq = 0
+        self.published = 0
+        self.dropped = 0
+
+    async def start(self, poll_interval=EVENTS_POLL_INTERVAL, queue_size=EVENTS_QUEUE_SIZE):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._poll_interval = poll_interval
+        self._queue_size = queue_size
+        self._conn = get_pool().connect_dedicated()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self.last_seq = changes_head(self._conn)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        for sub in list(self._subscribers):
+            self._close(sub)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._loop = None
+
+    def notify(self):
+        """Sveglia il poller; chiamabile da qualsiasi thread."""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self._queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+            "last_seq": self.last_seq,
+        }
+
+    async def _run(self):
+        if self._wakeup is None:
+            return
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+            self._wakeup.clear()
+            try:
+                events = await asyncio.to_thread(self._poll, bool(self._subscribers))
+            except sqlite3.Error:
+                logger.exception("Event poller failed")
+                continue
+            for event in events:
+                self._publish(event)
+
+    def _poll(self, fetch: bool) -> list[dict]:
+        if self._conn is None:
+            return []
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return []
+        self._data_version = version
+        if not fetch:
+            # Nessun client: basta restare allineati con la testa del log
+            self.last_seq = changes_head(self._conn)
+            return []
+        rows = self._conn.execute(
+            "SELECT seq, doc_id, op, updated_at FROM doc_changes WHERE seq > ? ORDER BY seq",
+            (self.last_seq,),
+        ).fetchall()
+        if rows:
+            self.last_seq = rows[-1]["seq"]
+        return [change_event(r) for r in rows]
+
+    def _publish(self, event: dict):
+        self.published += 1
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                self._close(sub)
+
+    def _close(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+        sub.dropped = True
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+
+def change_event(row) -> dict:
+    return {
+        "seq": row["seq"],
+        "id": row["doc_id"],
+        "op": row["op"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def format_event(event: dict) -> str:
+    return f"id: {event['seq']}\nevent: {event['op']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream_events(sub: Subscriber, replay: list[dict], heartbeat: float):
+    """Eventi SSE: prima il replay da Last-Event-ID, poi quelli live, con heartbeat."""
+    last = 0
+    for event in replay:
+        last = event["seq"]
+        yield format_event(event)
+    while True:
+        try:
+            event = await asyncio.wait_for(sub.queue.get(), heartbeat)
+        except asyncio.TimeoutError:
+            yield ": ping\n\n"
+            continue
+        if event is None:
+            return
+        if event["seq"] <= last:
+            continue  # gia' inviato nel replay
+        yield format_event(event)
+
+
+publisher = EventPublisher()
@@ -0,0 +1,304 @@
+"""Coda persistente dell'estrazione del testo dai file caricati.
+
+Gli upload di PDF, DOCX, XLSX, PPTX e drawio si salvano con content vuoto e
+una riga in extract_jobs, nella stessa transazione. L'Extractor di ogni
+worker uvicorn prende i job con un UPDATE ... RETURNING (un job va a un solo
+worker anche con piu' processi) e li passa a un ProcessPoolExecutor: il
+parsing non occupa ne' l'event loop ne' il GIL del server. Un job preso
+resta ``running`` fino a run_after (lease): se il worker muore torna
+disponibile allo scadere. Il testo estratto passa da store.update_document,
+quindi aggiorna FTS, chunk e change log come una modifica normale, ma solo
+se il documento ha ancora lo stesso file e content vuoto.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+
+from backend import blobs, config, extractors, store
+
+logger = logging.getLogger(__name__)
+
+# Margine del lease oltre EXTRACT_TIMEOUT: avvio del processo, lettura del file
+LEASE_GRACE = 30.0
+
+
+def extension(file_name: str | None) -> str | None:
+    """Estensione di ``file_name`` se ha un estrattore, altrimenti None."""
+    ext = os.path.splitext(file_name or "")[1].lower()
+    return ext if ext in extractors.EXTENSIONS else None
+
+
+def enqueue(conn: sqlite3.Connection, doc_id: int, file_name: str | None, sha256: str | None):
+    """Mette in coda (o rimette da capo) l'estrazione del file di ``doc_id``; niente commit."""
+    ext = extension(file_name)
+    if ext is None:
+        return False
+    now = time.time()
+    conn.execute(
+        "INSERT INTO extract_jobs (doc_id, sha256, ext, state, attempts, run_after, queued_at) "
+        "VALUES (?, ?, ?, 'queued', 0, ?, ?) ON CONFLICT(doc_id) DO UPDATE SET "
+        "sha256 = excluded.sha256, ext = excluded.ext, state = 'queued', attempts = 0, "
+        "run_after = excluded.run_after, queued_at = excluded.queued_at, error = NULL",
+        (doc_id, sha256, ext, now, now),
+    )
+    return True
+
+
+def backfill(conn: sqlite3.Connection) -> int:
+    """Accoda i file gia' presenti senza testo (migrazione una tantum); niente commit."""
+    rows = conn.execute(
+        "SELECT id, file_name, file_sha256 FROM documents "
+        "WHERE file_name IS NOT NULL AND content = ''"
+    ).fetchall()
+    queued = sum(enqueue(conn, r["id"], r["file_name"], r["file_sha256"]) for r in rows)
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES ('extract_backfill', '1') "
+        "ON CONFLICT(key) DO NOTHING"
+    )
+    return queued
+
+
+def claim(conn: sqlite3.Connection, limit: int, now: float | None = None) -> list[dict]:
+    """Prende fino a ``limit`` job scaduti e li segna running con un lease; con commit.
+
+    I lease scaduti all'ultimo tentativo (worker morto o bloccato) diventano
+    failed invece di ripartire.
+    """
+    now = time.time() if now is None else now
+    conn.execute(
+        "UPDATE extract_jobs SET state = 'failed', error = 'Worker lost' "
+        "WHERE state = 'running' AND run_after <= ? AND attempts >= ?",
+        (now, config.EXTRACT_MAX_ATTEMPTS),
+    )
+    jobs = conn.execute(
+        "UPDATE extract_jobs SET state = 'running', attempts = attempts + 1, run_after = ? "
+        "WHERE doc_id IN (SELECT doc_id FROM extract_jobs "
+        "WHERE state != 'failed' AND run_after <= ? ORDER BY run_after LIMIT ?) "
+        "RETURNING doc_id, sha256, ext, attempts",
+        (now + config.EXTRACT_TIMEOUT + LEASE_GRACE, now, limit),
+    ).fetchall()
+    claimed = []
+    for job in jobs:
+        row = conn.execute("SELECT file_name FROM documents WHERE id = ?", (job["doc_id"],))
+        file_name = row.fetchone()["file_name"]
+        path = blobs.resolve(job["doc_id"], file_name, job["sha256"]) if file_name else None
+        claimed.append({**dict(job), "path": path})
+    conn.commit()
+    return claimed
+
+
+def complete(conn: sqlite3.Connection, job: dict, text: str) -> bool:
+    """Scrive il testo estratto e chiude il job; con commit. False se il risultato e' vecchio.
+
+    Il testo si scarta se nel frattempo il job e' stato rimesso in coda (nuovo
+    file, lease scaduto) o se il documento ha gia' un content.
+    """
+    current = conn.execute(
+        "DELETE FROM extract_jobs WHERE doc_id = ? AND state = 'running' AND attempts = ? "
+        "RETURNING sha256",
+        (job["doc_id"], job["attempts"]),
+    ).fetchone()
+    applied = bool(current and text) and (
+        conn.execute(
+            "SELECT 1 FROM documents WHERE id = ? AND file_sha256 IS ? AND content = ''",
+            (job["doc_id"], current["sha256"]),
+        ).fetchone()
+        is not None
+    )
+    if applied:
+        store.update_document(conn, job["doc_id"], {"content": text})
+    conn.commit()
+    return applied
+
+
+def fail(conn: sqlite3.Connection, job: dict, error: str, retry: bool = True) -> str:
+    """Rimette in coda con backoff esponenziale o segna failed; con commit.
+
+    Restituisce lo stato scritto ("queued" o "failed").
+    """
+    state = "queued" if retry and job["attempts"] < config.EXTRACT_MAX_ATTEMPTS else "failed"
+    delay = config.EXTRACT_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+    conn.execute(
+        "UPDATE extract_jobs SET state = ?, run_after = ?, error = ? "
+        "WHERE doc_id = ? AND state = 'running' AND attempts = ?",
+        (state, time.time() + delay, error[:500], job["doc_id"], job["attempts"]),
+    )
+    conn.commit()
+    return state
+
+
+def status(conn: sqlite3.Connection) -> dict:
+    """Profondita' della coda per stato ed eta' del job in attesa da piu' tempo."""
+    counts = dict.fromkeys(("queued", "running", "failed"), 0)
+    counts.update(conn.execute("SELECT state, COUNT(*) FROM extract_jobs GROUP BY state"))
+    oldest = conn.execute(
+        "SELECT MIN(queued_at) FROM extract_jobs WHERE state != 'failed'"
+    ).fetchone()[0]
+    age = round(time.time() - oldest, 1) if oldest is not None else None
+    return {**counts, "oldest_seconds": age}
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    # spawn: i figli non ereditano connessioni SQLite, thread e lock del server
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+class Extractor:
+    """Svuota extract_jobs con al piu' EXTRACT_WORKERS job in corso per worker uvicorn.
+
+    Come EventPublisher: un task sull'event loop, le query in un thread,
+    notify() dopo il commit di un upload per non aspettare il polling. Il
+    pool di processi si crea al primo job e si ricrea se un figlio muore.
+    """
+
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._pool: ProcessPoolExecutor | None = None
+        self._jobs: set[asyncio.Task] = set()
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        self.timeouts = 0
+        self._elapsed = 0.0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        for job in list(self._jobs):
+            job.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            # I job interrotti restano running: li riprende chiunque allo scadere del lease
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+        self._loop = None
+
+    def notify(self):
+        """Sveglia il drenaggio della coda; chiamabile da qualsiasi thread."""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def stats(self) -> dict:
+        finished = self.done + self.retried + self.failed
+        return {
+            "enabled": self._task is not None,
+            "workers": config.EXTRACT_WORKERS,
+            "in_flight": len(self._jobs),
+            "done": self.done,
+            "retried": self.retried,
+            "failures": self.failed,
+            "timeouts": self.timeouts,
+            "avg_ms": round(self._elapsed * 1000 / finished, 1) if finished else None,
+        }
+
+    async def _run(self):
+        if self._wakeup is None:
+            return
+        while True:
+            free = config.EXTRACT_WORKERS - len(self._jobs)
+            if free > 0:
+                try:
+                    claimed = await asyncio.to_thread(self._claim, free)
+                except sqlite3.Error:
+                    logger.exception("Extraction queue failed")
+                    claimed = []
+                for job in claimed:
+                    task = asyncio.create_task(self._process(job))
+                    self._jobs.add(task)
+                    task.add_done_callback(self._finished)
+                if len(claimed) == free:
+                    continue  # probabilmente ce ne sono altri
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), config.EXTRACT_POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _finished(self, task: asyncio.Task):
+        self._jobs.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _claim(self, limit: int) -> list[dict]:
+        from backend.database import write_db
+
+        with write_db() as conn:
+            return claim(conn, limit)
+
+    async def _process(self, job: dict):
+        from backend.database import write_db
+        from backend.events import publisher
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        retry, error = True, None
+        try:
+            if job["path"] is None:
+                raise FileNotFoundError(f"No file for document {job['doc_id']}")
+            if self._pool is None:
+                self._pool = _pool(config.EXTRACT_WORKERS)
+            pool = self._pool
+            text = await loop.run_in_executor(
+                pool,
+                extractors.run,
+                job["path"],
+                job["ext"],
+                config.EXTRACT_TIMEOUT,
+                config.EXTRACT_MAX_CHARS,
+            )
+        except extractors.ExtractError as exc:
+            retry, error = False, str(exc) or type(exc).__name__
+        except extractors.ExtractTimeout:
+            self.timeouts += 1
+            error = f"Timed out after {config.EXTRACT_TIMEOUT:g}s"
+        except BrokenProcessPool:
+            # Un figlio e' morto (memoria, segfault): pool nuovo per i job successivi
+            if self._pool is pool:
+                self._pool = None
+                pool.shutdown(wait=False)
+            error = "Extraction worker crashed"
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        self._elapsed += time.monotonic() - started
+
+        def finish():
+            with write_db() as conn:
+                if error is None:
+                    return complete(conn, job, text)
+                return fail(conn, job, error, retry)
+
+        try:
+            outcome = await asyncio.to_thread(finish)
+        except sqlite3.Error:
+            logger.exception("Unable to record extraction of document %s", job["doc_id"])
+            return
+        if error is None:
+            self.done += 1
+            if outcome:
+                publisher.notify()
+        elif outcome == "queued":
+            self.retried += 1
+        else:
+            self.failed += 1
+            logger.warning("Extraction of document %s failed: %s", job["doc_id"], error)
+
+
+extractor = Extractor()
@@ -0,0 +1,262 @@
+"""Estrazione del testo dai file caricati (PDF, DOCX, XLSX, PPTX, drawio).
+
+Gira nei processi del pool di backend.extraction: il modulo importa solo la
+libreria standard e pypdf, e run() interrompe il parsing dopo ``timeout``
+secondi con SIGALRM. I formati Office sono zip di XML
+generati da programmi: il testo si legge con espressioni regolari sugli
+elementi noti, senza costruire l'albero. Fogli, slide e pagine dei diagrammi
+diventano sezioni markdown (``## nome``), cosi' i chunk dei file grandi
+hanno un titolo.
+"""
+
+import base64
+import html
+import re
+import signal
+import zipfile
+import zlib
+from urllib.parse import unquote
+
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+
+EXTENSIONS = {".pdf", ".docx", ".xlsx", ".pptx", ".drawio"}
+# Limite sul decompresso di ogni parte (membro zip, diagramma)
+MAX_PART_BYTES = 256 * 1024 * 1024
+
+
+class ExtractError(Exception):
+    """File illeggibile o corrotto: riprovare non serve."""
+
+
+class ExtractTimeout(Exception):
+    """Il parsing ha superato il tempo concesso al job."""
+
+
+def _alarm(signum, frame):
+    raise ExtractTimeout()
+
+
+def run(path: str, ext: str, timeout: float, max_chars: int) -> str:
+    """Testo di ``path`` (formato da ``ext``), al piu' ``max_chars`` caratteri."""
+    if ext not in _EXTRACTORS:
+        raise ExtractError(f"No extractor for {ext}")
+    previous = signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        text = _EXTRACTORS[ext](path)
+    except (zipfile.BadZipFile, zlib.error, KeyError, ValueError, UnicodeError) as exc:
+        raise ExtractError(f"{type(exc).__name__}: {exc}") from exc
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    text = re.sub(r"[ \t]+\n", "\n", text.replace("\x00", ""))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()[:max_chars]
+
+
+def _attrs(tag: str) -> dict[str, str]:
+    return {k: html.unescape(v) for k, v in re.findall(r'([\w:]+)="([^"]*)"', tag)}
+
+
+def _member(zf: zipfile.ZipFile, name: str) -> str:
+    info = zf.getinfo(name)
+    if info.file_size > MAX_PART_BYTES:
+        raise ExtractError(f"{name} too large ({info.file_size} bytes)")
+    return zf.read(info).decode("utf-8", errors="replace")
+
+
+def _numbered(zf: zipfile.ZipFile, pattern: str) -> list[str]:
+    """Membri come ``ppt/slides/slide12.xml`` in ordine numerico."""
+    found = [(int(m.group(1)), n) for n in zf.namelist() if (m := re.fullmatch(pattern, n))]
+    return [name for _, name in sorted(found)]
+
+
+# --- Office ---------------------------------------------------------------
+
+_WORD = re.compile(r"<w:t(?:\s[^>]*)?>([^<]*)</w:t>|</w:p>|<w:tab/>|<w:br/>|<w:cr/>")
+_RUNS = re.compile(r"<(?:a:|)t(?:\s[^>]*)?>([^<]*)</(?:a:|)t>")
+
+
+def _docx(path: str) -> str:
+    with zipfile.ZipFile(path) as zf:
+        parts = ["word/document.xml"]
+        parts += _numbered(zf, r"word/(?:header|footer)(\d+)\.xml")
+        parts += [n for n in ("word/footnotes.xml", "word/endnotes.xml") if n in zf.namelist()]
+        out = []
+        for name in parts:
+            for m in _WORD.finditer(_member(zf, name)):
+                if m.group(1) is not None:
+                    out.append(html.unescape(m.group(1)))
+                else:
+                    out.append("\t" if m.group(0) == "<w:tab/>" else "\n")
+            out.append("\n\n")
+    return "".join(out)
+
+
+def _pptx(path: str) -> str:
+    with zipfile.ZipFile(path) as zf:
+        out = []
+        for i, name in enumerate(_numbered(zf, r"ppt/slides/slide(\d+)\.xml"), 1):
+            out.append(f"## Slide {i}\n\n")
+            for paragraph in re.split(r"</a:p>", _member(zf, name)):
+                runs = [html.unescape(t) for t in _RUNS.findall(paragraph)]
+                if runs:
+                    out.append("".join(runs) + "\n")
+            out.append("\n")
+    return "".join(out)
+
+
+def _shared_strings(zf: zipfile.ZipFile) -> list[str]:
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    items = re.findall(r"<si>(.*?)</si>", _member(zf, "xl/sharedStrings.xml"), re.S)
+    return ["".join(html.unescape(t) for t in _RUNS.findall(item)) for item in items]
+
+
+def _sheets(zf: zipfile.ZipFile) -> list[tuple[str, str]]:
+    """(nome, membro) dei fogli nell'ordine del workbook."""
+    targets = {}
+    if "xl/_rels/workbook.xml.rels" in zf.namelist():
+        for tag in re.findall(r"<Relationship\s[^>]*>", _member(zf, "xl/_rels/workbook.xml.rels")):
+            attrs = _attrs(tag)
+            target = attrs.get("Target", "").lstrip("/")
+            targets[attrs.get("Id")] = target if target.startswith("xl/") else "xl/" + target
+    sheets = []
+    for tag in re.findall(r"<sheet\s[^>]*>", _member(zf, "xl/workbook.xml")):
+        attrs = _attrs(tag)
+        member = targets.get(attrs.get("r:id"))
+        if member in zf.namelist():
+            sheets.append((attrs.get("name", member), member))
+    if not sheets:
+        names = _numbered(zf, r"xl/worksheets/sheet(\d+)\.xml")
+        sheets = [(f"Sheet {i}", n) for i, n in enumerate(names, 1)]
+    return sheets
+
+
+_CELL = re.compile(r"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+_VALUE = re.compile(r"<v>([^<]*)</v>")
+_COLUMN = re.compile(r"[A-Z]+")
+
+
+def _column(ref: str | None) -> int | None:
+    """Indice da 0 della colonna di un riferimento come ``AB12``."""
+    match = _COLUMN.match(ref or "")
+    if match is None:
+        return None
+    index = 0
+    for letter in match.group(0):
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def _cells(row: str, shared: list[str]) -> list[tuple[int, str]]:
+    """(colonna, valore) delle celle con un valore, nell'ordine del foglio."""
+    cells: list[tuple[int, str]] = []
+    for tag, body in _CELL.findall(row):
+        attrs = _attrs(tag)
+        kind = attrs.get("t", "n")
+        value = _VALUE.search(body or "")
+        if kind == "inlineStr":
+            text = "".join(html.unescape(t) for t in _RUNS.findall(body))
+        elif value is None:
+            continue
+        elif kind == "s":
+            text = shared[int(value.group(1))]
+        elif kind == "b":
+            text = "TRUE" if value.group(1) == "1" else "FALSE"
+        else:
+            text = html.unescape(value.group(1))
+        column = _column(attrs.get("r"))
+        cells.append((len(cells) if column is None else column, text))
+    return cells
+
+
+def _positioned(xml: str, shared: list[str]):
+    for match in re.finditer(r"<row\b[^>]*>(.*?)</row>", xml, re.S):
+        cells = _cells(match.group(1), shared)
+        values = [""] * (max(c for c, _ in cells) + 1 if cells else 0)
+        for column, text in cells:
+            values[column] = text
+        yield values
+
+
+def xlsx_sheets(path: str):
+    """(nome, righe) dei fogli: liste di celle per posizione, da leggere in ordine."""
+    with zipfile.ZipFile(path) as zf:
+        shared = _shared_strings(zf)
+        for name, member in _sheets(zf):
+            yield name, _positioned(_member(zf, member), shared)
+
+
+def _xlsx(path: str) -> str:
+    with zipfile.ZipFile(path) as zf:
+        shared = _shared_strings(zf)
+        out = []
+        for name, member in _sheets(zf):
+            out.append(f"## {name}\n\n")
+            for row in re.findall(r"<row\b[^>]*>(.*?)</row>", _member(zf, member), re.S):
+                cells = _cells(row, shared)
+                if cells:
+                    out.append("\t".join(text for _, text in cells) + "\n")
+            out.append("\n")
+    return "".join(out)
+
+
+# --- drawio ---------------------------------------------------------------
+
+
+def _inflate(data: bytes, wbits: int) -> bytes:
+    inflater = zlib.decompressobj(wbits)
+    out = inflater.decompress(data, MAX_PART_BYTES)
+    if inflater.unconsumed_tail:
+        raise ExtractError("Compressed part too large")
+    return out
+
+
+def _label(value: str) -> str:
+    """Etichetta di una cella: spesso HTML (``<b>x</b><br>y``), gia' tolto l'escape XML."""
+    value = re.sub(r"<br\s*/?>|</div>|</p>", "\n", value)
+    return html.unescape(re.sub(r"<[^>]+>", "", value)).strip()
+
+
+def _drawio(path: str) -> str:
+    with open(path, "rb") as f:
+        xml = f.read().decode("utf-8", errors="replace")
+    out = []
+    diagrams = re.findall(r"<diagram\b([^>]*)>(.*?)</diagram>", xml, re.S) or [("", xml)]
+    for tag, body in diagrams:
+        name = _attrs(tag).get("name")
+        if name:
+            out.append(f"## {name}\n\n")
+        body = body.strip()
+        if body and not body.startswith("<"):
+            # Formato compresso: base64 di deflate raw del modello url-encoded
+            body = unquote(_inflate(base64.b64decode(body), -15).decode("utf-8", "replace"))
+        for cell in re.findall(r"<(?:mxCell|UserObject|object)\b[^>]*>", body):
+            attrs = _attrs(cell)
+            label = _label(attrs.get("value") or attrs.get("label") or "")
+            if label:
+                out.append(label + "\n")
+        out.append("\n")
+    return "".join(out)
+
+
+# --- PDF ------------------------------------------------------------------
+
+
+def _pdf(path: str) -> str:
+    """Testo delle pagine, separate da una riga vuota."""
+    try:
+        reader = PdfReader(path)
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    except PyPdfError as exc:
+        raise ExtractError(str(exc)) from exc
+
+
+_EXTRACTORS = {
+    ".pdf": _pdf,
+    ".docx": _docx,
+    ".xlsx": _xlsx,
+    ".pptx": _pptx,
+    ".drawio": _drawio,
+}
@@ -0,0 +1,459 @@
+"""Profili dell'indice full-text (documents_fts) e rebuild online su tabella ombra.
+
+Un profilo (config.FTS_PROFILES) fissa tokenizer, detail e prefissi, che
+richiedono di reindicizzare, e i pesi di bm25() per colonna, che valgono da
+subito. Le opzioni dell'indice attivo stanno in ``vault_meta.fts_profile``:
+le query si costruiscono su quelle, non sulla configurazione, cosi' restano
+valide anche mentre un rebuild e' in corso.
+
+Il rebuild riempie ``documents_fts_new`` a blocchi di id, ognuno in una
+transazione breve; le letture continuano sull'indice attivo e i trigger
+ombra aggiornano le righe gia' copiate. Alla fine lo scambio (DROP + RENAME
+e trigger) e' una sola transazione. Un rebuild interrotto riprende
+dall'ultimo blocco.
+
+CLI: ``python -m backend.fts status|rebuild`` (verso config.FTS_PROFILE).
+"""
+
+import argparse
+import json
+import logging
+import time
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+SHADOW = "documents_fts_new"
+COLUMNS = ("title", "content", "project", "tags")
+# Tutte le tabelle FTS5 del vault, quelle trigram solo con SEARCH_TRIGRAM
+TABLES = ("documents_fts", "documents_trigram", "search_terms_trigram")
+# Un rebuild senza avanzamenti da questi secondi e' di un processo morto: si riprende
+STALE_AFTER = 60
+
+# Contenuto dell'indice: i documenti (senza content se divisi in chunk) e i
+# chunk, con rowid da chunks.CHUNK_BASE (vista creata da init_db). Vista e
+# trigger leggono il testo con ``{text}(...)``: "content_text" se il vault
+# salva content compresso (backend.compression), altrimenti niente, e lo
+# schema resta usabile anche da connessioni senza la funzione.
+SOURCE = "documents_fts_source"
+_SOURCE_SQL = """
+    CREATE VIEW IF NOT EXISTS {source} (id, title, content, project, tags) AS
+    SELECT id, title, CASE WHEN chunked THEN '' ELSE {text}(content) END, project, tags
+    FROM documents
+    UNION ALL
+    SELECT id, NULL, {text}(body), NULL, NULL FROM document_chunks
+"""
+TEXT_FUNCTION = "content_text"
+# Riscrittura di content in un altro formato (backend.compression): il testo
+# non cambia, quindi ne' l'indice ne' il change log
+NOT_RECODING = "NOT EXISTS (SELECT 1 FROM vault_meta WHERE key = 'content_recode')"
+# Un UPDATE che non tocca le colonne indicizzate (solo version e updated_at,
+# il content di un documento in chunk, un salvataggio senza modifiche) non
+# cancella e reinserisce la riga nell'indice; i blob si confrontano per byte
+INDEXED_CHANGED = (
+    "(old.title IS NOT new.title OR old.project IS NOT new.project "
+    "OR old.tags IS NOT new.tags OR old.chunked IS NOT new.chunked "
+    "OR (NOT new.chunked AND old.content IS NOT new.content))"
+)
+TRIGRAM_CHANGED = "(old.title IS NOT new.title OR old.content IS NOT new.content)"
+
+# Trigger che tengono l'indice allineato a SOURCE; {table} e i nomi si
+# sostituiscono per documents_fts e per la tabella ombra
+_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS {prefix}ai AFTER INSERT ON documents{new_copied} BEGIN
+        INSERT INTO {table}(rowid, title, content, project, tags) VALUES (
+            new.id, new.title, CASE WHEN new.chunked THEN '' ELSE {text}(new.content) END,
+            new.project, new.tags
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {prefix}ad AFTER DELETE ON documents{old_copied} BEGIN
+        INSERT INTO {table}({table}, rowid, title, content, project, tags) VALUES (
+            'delete', old.id, old.title,
+            CASE WHEN old.chunked THEN '' ELSE {text}(old.content) END, old.project, old.tags
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {prefix}au AFTER UPDATE ON documents
+    WHEN {not_recoding} AND {changed}{old_copied_and} BEGIN
+        INSERT INTO {table}({table}, rowid, title, content, project, tags) VALUES (
+            'delete', old.id, old.title,
+            CASE WHEN old.chunked THEN '' ELSE {text}(old.content) END, old.project, old.tags
+        );
+        INSERT INTO {table}(rowid, title, content, project, tags) VALUES (
+            new.id, new.title, CASE WHEN new.chunked THEN '' ELSE {text}(new.content) END,
+            new.project, new.tags
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {chunks_prefix}ai AFTER INSERT ON document_chunks{new_copied}
+    BEGIN
+        INSERT INTO {table}(rowid, content) VALUES (new.id, {text}(new.body));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {chunks_prefix}ad AFTER DELETE ON document_chunks{old_copied}
+    BEGIN
+        INSERT INTO {table}({table}, rowid, content) VALUES ('delete', old.id, {text}(old.body));
+    END
+    """,
+)
+_COPIED = "{}.id <= (SELECT CAST(value AS INTEGER) FROM vault_meta WHERE key = 'fts_rebuild_pos')"
+TRIGGERS = (
+    "documents_ai",
+    "documents_ad",
+    "documents_au",
+    "document_chunks_ai",
+    "document_chunks_ad",
+)
+_SHADOW_TRIGGERS = tuple(f"{SHADOW}_{op}" for op in ("ai", "ad", "au", "chunks_ai", "chunks_ad"))
+
+# documents_trigram (SEARCH_TRIGRAM) legge title e content da una vista come
+# documents_fts; i trigger scattano solo se cambiano loro
+TRIGRAM_SOURCE = "documents_trigram_source"
+_TRIGRAM_SQL = (
+    """
+    CREATE VIEW IF NOT EXISTS {source} (id, title, content) AS
+    SELECT id, title, {text}(content) FROM documents
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_trigram_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_trigram(rowid, title, content)
+        VALUES (new.id, new.title, {text}(new.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_trigram_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_trigram(documents_trigram, rowid, title, content)
+        VALUES ('delete', old.id, old.title, {text}(old.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_trigram_au AFTER UPDATE OF title, content
+    ON documents WHEN {not_recoding} AND {changed} BEGIN
+        INSERT INTO documents_trigram(documents_trigram, rowid, title, content)
+        VALUES ('delete', old.id, old.title, {text}(old.content));
+        INSERT INTO documents_trigram(rowid, title, content)
+        VALUES (new.id, new.title, {text}(new.content));
+    END
+    """,
+)
+TRIGRAM_TRIGGERS = ("documents_trigram_ai", "documents_trigram_ad", "documents_trigram_au")
+
+
+def source_sql(text: str = "") -> str:
+    return _SOURCE_SQL.format(source=SOURCE, text=text)
+
+
+def trigger_sql(text: str = "", shadow: bool = False) -> list[str]:
+    """CREATE TRIGGER di documents_fts o, con ``shadow``, della tabella ombra.
+
+    Quelli della tabella ombra valgono solo per le righe gia' copiate.
+    """
+    names = {"table": "documents_fts", "prefix": "documents_", "chunks_prefix": "document_chunks_"}
+    new_copied = old_copied = old_copied_and = ""
+    if shadow:
+        names = {"table": SHADOW, "prefix": f"{SHADOW}_", "chunks_prefix": f"{SHADOW}_chunks_"}
+        new_copied = " WHEN " + _COPIED.format("new")
+        old_copied = " WHEN " + _COPIED.format("old")
+        old_copied_and = " AND " + _COPIED.format("old")
+    return [
+        sql.format(
+            **names,
+            text=text,
+            new_copied=new_copied,
+            old_copied=old_copied,
+            old_copied_and=old_copied_and,
+            not_recoding=NOT_RECODING,
+            changed=INDEXED_CHANGED,
+        )
+        for sql in _TRIGGERS
+    ]
+
+
+def trigram_sql(text: str = "") -> list[str]:
+    """Vista e trigger di documents_trigram."""
+    return [
+        sql.format(
+            source=TRIGRAM_SOURCE, text=text, not_recoding=NOT_RECODING, changed=TRIGRAM_CHANGED
+        )
+        for sql in _TRIGRAM_SQL
+    ]
+
+
+def text_function(conn) -> str:
+    """Funzione con cui vista e trigger leggono content: "content_text" o "" (in chiaro)."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (SOURCE,)).fetchone()
+    return TEXT_FUNCTION if row and f"{TEXT_FUNCTION}(" in row[0] else ""
+
+
+def install_text(conn, text: str):
+    """Ricrea viste e trigger degli indici con ``text``; niente commit.
+
+    Da chiamare in una transazione aperta: lo scambio e' atomico per le
+    altre connessioni.
+    """
+    conn.execute(f"DROP VIEW IF EXISTS {SOURCE}")
+    conn.execute(source_sql(text))
+    for name in TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for sql in trigger_sql(text):
+        conn.execute(sql)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (SHADOW,)).fetchone():
+        for name in _SHADOW_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for sql in trigger_sql(text, shadow=True):
+            conn.execute(sql)
+    if "documents_trigram" in existing_tables(conn):
+        conn.execute(f"DROP VIEW IF EXISTS {TRIGRAM_SOURCE}")
+        for name in TRIGRAM_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for sql in trigram_sql(text):
+            conn.execute(sql)
+
+
+def profile(name: str | None = None) -> dict:
+    """Profilo ``name`` (default: config.FTS_PROFILE) con tutte le chiavi."""
+    name = name or config.FTS_PROFILE
+    if name not in config.FTS_PROFILES:
+        raise ValueError(f"Unknown FTS profile: {name}")
+    return {"name": name, **config.FTS_PROFILES[name]}
+
+
+def index_options(p: dict) -> dict:
+    """Le opzioni che cambiano il contenuto dell'indice (i pesi no)."""
+    return {
+        "tokenize": p["tokenize"],
+        "detail": p["detail"],
+        "prefix": p["prefix"],
+        "content": SOURCE,
+    }
+
+
+def create_sql(table: str, options: dict) -> str:
+    sql = (
+        f"CREATE VIRTUAL TABLE {table} USING fts5({', '.join(COLUMNS)}, "
+        f"content={options['content']}, content_rowid=id, tokenize='{options['tokenize']}', "
+        f"detail={options['detail']}"
+    )
+    if options["prefix"]:
+        sql += f", prefix='{options['prefix']}'"
+    return sql + ")"
+
+
+def legacy_options(sql: str) -> dict:
+    """Opzioni di un documents_fts creato prima dei profili (unicode61, detail=full)."""
+    return {
+        "tokenize": "unicode61",
+        "detail": "full",
+        "prefix": "2 3" if "prefix=" in sql else "",
+        "content": "documents",
+    }
+
+
+def active_options(conn) -> dict:
+    """Opzioni dell'indice attivo; dict vuoto se non e' ancora stato creato."""
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'fts_profile'").fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def set_active(conn, options: dict):
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES ('fts_profile', ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (json.dumps(options, sort_keys=True),),
+    )
+
+
+def bm25(table: str = "documents_fts") -> str:
+    """bm25() con i pesi per colonna del profilo configurato."""
+    weights = ", ".join(str(float(w)) for w in profile()["weights"])
+    return f"bm25({table}, {weights})"
+
+
+def needs_rebuild(conn) -> bool:
+    return active_options(conn) != index_options(profile())
+
+
+def existing_tables(conn) -> list[str]:
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [t for t in TABLES if t in names]
+
+
+def tune(conn, table: str):
+    """Porta automerge e crisismerge di ``table`` ai valori di config (persistono nell'indice)."""
+    current = dict(
+        conn.execute(
+            f"SELECT k, v FROM {table}_config "  # noqa: S608
+            "WHERE k IN ('automerge', 'crisismerge')"
+        ).fetchall()
+    )
+    wanted = {"automerge": config.FTS_AUTOMERGE, "crisismerge": config.FTS_CRISISMERGE}
+    for key, value in wanted.items():
+        if current.get(key) != value:
+            conn.execute(f"INSERT INTO {table}({table}, rank) VALUES (?, ?)", (key, value))
+
+
+def _claim(conn, options: dict) -> bool:
+    """Prende il rebuild verso ``options``; False se un altro processo ci sta lavorando.
+
+    Un rebuild fermo da STALE_AFTER secondi verso le stesse opzioni riprende
+    da dove era arrivato; verso opzioni diverse si ricomincia da capo.
+    """
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'fts_rebuild'").fetchone()
+    state = json.loads(row[0]) if row else None
+    now = time.time()
+    if state and now - state["heartbeat"] < STALE_AFTER:
+        return False
+    shadow = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (SHADOW,)).fetchone()
+    resume = state is not None and state["options"] == options and shadow is not None
+    if not resume:
+        _drop_shadow(conn)
+        conn.execute(create_sql(SHADOW, options))
+        tune(conn, SHADOW)
+        conn.execute(
+            "INSERT INTO vault_meta (key, value) VALUES ('fts_rebuild_pos', '0') "
+            "ON CONFLICT(key) DO UPDATE SET value = '0'"
+        )
+        for sql in trigger_sql(text_function(conn), shadow=True):
+            conn.execute(sql)
+    _heartbeat(conn, options, now)
+    conn.commit()
+    return True
+
+
+def _heartbeat(conn, options: dict, now: float | None = None):
+    conn.execute(
+        "INSERT INTO vault_meta (key, value) VALUES ('fts_rebuild', ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (json.dumps({"options": options, "heartbeat": now or time.time()}),),
+    )
+
+
+def _drop_shadow(conn):
+    for name in _SHADOW_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute(f"DROP TABLE IF EXISTS {SHADOW}")
+
+
+def _copy_batch(conn, options: dict, batch: int) -> int:
+    """Copia nella tabella ombra il blocco di id successivo; restituisce le righe copiate.
+
+    Gli id si scorrono su documents e poi su document_chunks (rowid da
+    CHUNK_BASE), con i valori presi dal contenuto dell'indice di destinazione.
+    """
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'fts_rebuild_pos'").fetchone()
+    pos = int(row[0])
+    ids = conn.execute(
+        "SELECT id FROM documents WHERE id > ? ORDER BY id LIMIT ?", (pos, batch)
+    ).fetchall()
+    if not ids:
+        ids = conn.execute(
+            "SELECT id FROM document_chunks WHERE id > ? ORDER BY id LIMIT ?", (pos, batch)
+        ).fetchall()
+    if not ids:
+        return 0
+    last = ids[-1][0]
+    conn.execute(
+        f"INSERT INTO {SHADOW}(rowid, title, content, project, tags) "  # noqa: S608
+        f"SELECT id, title, content, project, tags FROM {options['content']} "
+        "WHERE id > ? AND id <= ?",
+        (pos, last),
+    )
+    conn.execute("UPDATE vault_meta SET value = ? WHERE key = 'fts_rebuild_pos'", (last,))
+    _heartbeat(conn, options)
+    conn.commit()
+    return len(ids)
+
+
+def _swap(conn, options: dict):
+    """Sostituisce documents_fts con la tabella ombra in un'unica transazione."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for name in TRIGGERS + _SHADOW_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("DROP TABLE documents_fts")
+        conn.execute(f"ALTER TABLE {SHADOW} RENAME TO documents_fts")
+        for sql in trigger_sql(text_function(conn)):
+            conn.execute(sql)
+        set_active(conn, options)
+        conn.execute("DELETE FROM vault_meta WHERE key IN ('fts_rebuild', 'fts_rebuild_pos')")
+        # I termini dell'indice cambiano (stemming, diacritici): search_terms va riallineata
+        conn.execute("UPDATE vault_meta SET value = '-1' WHERE key = 'terms_seq'")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def rebuild(name: str | None = None, batch: int | None = None, progress=None) -> bool:
+    """Porta documents_fts al profilo ``name`` senza bloccare le letture.
+
+    False se l'indice e' gia' aggiornato o se un altro processo sta ricostruendo.
+    ``progress(copiati)`` viene chiamato dopo ogni blocco, fuori dal lock.
+    """
+    from backend import chunks
+    from backend.database import write_db
+
+    options = index_options(profile(name))
+    batch = batch or config.FTS_REBUILD_BATCH
+    with write_db() as conn:
+        if active_options(conn) == options or not _claim(conn, options):
+            return False
+    copied = 0
+    started = time.perf_counter()
+    while True:
+        with write_db() as conn:
+            n = _copy_batch(conn, options, batch)
+        if not n:
+            break
+        copied += n
+        if progress:
+            progress(copied)
+    with write_db() as conn:
+        _swap(conn, options)
+        # Un vault migrato alla vista puo' ora dividere in chunk i documenti grandi
+        chunks.rechunk(conn)
+    logger.info(
+        "FTS index rebuilt with profile %s (%d documents in %.1fs)",
+        name or config.FTS_PROFILE,
+        copied,
+        time.perf_counter() - started,
+    )
+    return True
+
+
+def status(conn) -> dict:
+    row = conn.execute("SELECT value FROM vault_meta WHERE key = 'fts_rebuild'").fetchone()
+    pos = conn.execute("SELECT value FROM vault_meta WHERE key = 'fts_rebuild_pos'").fetchone()
+    return {
+        "profile": config.FTS_PROFILE,
+        "active": active_options(conn),
+        "needs_rebuild": needs_rebuild(conn),
+        "rebuild": {**json.loads(row[0]), "pos": int(pos[0])} if row and pos else None,
+    }
+
+
+def main(argv=None):
+    from backend.database import init_db, read_db
+
+    parser = argparse.ArgumentParser(prog="python -m backend.fts")
+    parser.add_argument("command", choices=["status", "rebuild"])
+    parser.add_argument("--batch", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.command == "rebuild":
+        done = rebuild(batch=args.batch, progress=lambda n: print(f"  {n} documents indexed"))
+        print("Rebuilt" if done else "Nothing to do (index up to date or rebuild in progress)")
+    with read_db() as conn:
+        print(json.dumps(status(conn), indent=2))
+
+
+if __name__ == "__main__":
+    main()
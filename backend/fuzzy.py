@@ -0,0 +1,78 @@
+"""Ricerca con errori di battitura: parole espanse sui termini simili del vocabolario."""
+
+import sqlite3
+
+# Candidati letti per parola da ciascuna sorgente (trigram e stesso inizio)
+FUZZY_CANDIDATES = 50
+# Varianti tenute per parola, parola originale esclusa
+FUZZY_EXPANSIONS = 4
+FUZZY_MAX_WORDS = 8
+
+
+def max_edits(word: str) -> int:
+    """Errori tollerati: nessuno sotto i 4 caratteri, 1 fino a 7, poi 2."""
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Distanza di Damerau-Levenshtein (trasposizioni adiacenti), ``limit + 1`` se la supera."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _candidates(conn: sqlite3.Connection, word: str) -> dict[str, int]:
+    """Termini con trigram in comune con ``word`` o con le stesse due lettere iniziali.
+
+    Le due sorgenti si completano: una trasposizione in una parola corta
+    ("pyhton") non lascia trigram in comune, un errore nelle prime lettere
+    sfugge al range sul prefisso. Ognuna legge al piu' FUZZY_CANDIDATES righe.
+    """
+    trigrams = dict.fromkeys("".join(t) for t in zip(word, word[1:], word[2:]))
+    rows = conn.execute(
+        "SELECT s.term, s.doc_count FROM (SELECT term FROM search_terms_trigram "
+        "WHERE search_terms_trigram MATCH ? ORDER BY rank LIMIT ?) t "
+        "JOIN search_terms s ON s.term = t.term",
+        (" OR ".join(f'"{t}"' for t in trigrams), FUZZY_CANDIDATES),
+    ).fetchall()
+    limit = max_edits(word)
+    rows += conn.execute(
+        "SELECT term, doc_count FROM search_terms WHERE term >= ? AND term < ? "
+        "AND length(term) BETWEEN ? AND ? ORDER BY doc_count DESC LIMIT ?",
+        (
+            word[:2],
+            word[:2] + "\U0010ffff",
+            len(word) - limit,
+            len(word) + limit,
+            FUZZY_CANDIDATES,
+        ),
+    ).fetchall()
+    return {term: doc_count for term, doc_count in rows}
+
+
+def expand(conn: sqlite3.Connection, word: str) -> list[str]:
+    """``word`` piu' i termini del vocabolario entro max_edits(), i piu' vicini e frequenti."""
+    limit = max_edits(word)
+    if not limit:
+        return [word]
+    scored = []
+    for term, doc_count in _candidates(conn, word).items():
+        if term == word:
+            continue
+        distance = edit_distance(word, term, limit)
+        if distance <= limit:
+            scored.append((distance, -doc_count, term))
+    return [word] + [term for _, _, term in sorted(scored)[:FUZZY_EXPANSIONS]]
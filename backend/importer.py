@@ -0,0 +1,173 @@
+"""Import massivo di file e archivi zip/tar con transazioni grandi e staging in parallelo.
+
+Tre fasi:
+
+1. collect(): elenca gli elementi (file del multipart o membri degli archivi)
+   e scarta quelli non ammessi, senza leggere i contenuti;
+2. staging: copia su file temporanei con hash SHA-256 e testo estratto, in
+   parallelo su un thread pool (i tar si leggono per forza in sequenza);
+3. insert: IMPORT_BATCH_SIZE documenti per transazione. I trigger FTS restano
+   per riga, ma dentro una transazione FTS5 accumula i termini in memoria e
+   scrive i segmenti una volta sola; fsync dei blob in parallelo prima del commit.
+"""
+
+import mimetypes
+import os
+import tarfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from backend import blobs, extraction, storage, store
+from backend.config import IMPORT_BATCH_SIZE, IMPORT_MAX_BYTES, IMPORT_MAX_ITEMS, IMPORT_WORKERS
+from backend.database import write_db
+from backend.events import publisher
+
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class ImportRejected(Exception):
+    """L'import intero non e' accettabile (troppi elementi, troppo grande, archivio rotto)."""
+
+
+def _project_for(base: str | None, member_path: str) -> str | None:
+    """La cartella dentro l'archivio diventa la sottocartella del project di base."""
+    parts = [p.strip() for p in member_path.replace("\\", "/").split("/")[:-1]]
+    parts = [p for p in parts if p not in ("", ".", "..")]
+    if base and base.strip("/"):
+        parts.insert(0, base.strip("/"))
+    return "/".join(parts) or None
+
+
+class Importer:
+    def __init__(self, allowed_extensions, text_extensions, max_file_size, project, tags):
+        self.allowed = allowed_extensions
+        self.text = text_extensions
+        self.max_file_size = max_file_size
+        self.project = project
+        self.tags = tags
+        self.entries: list[dict] = []
+        self.total_size = 0
+
+    # --- fase 1 ---------------------------------------------------------------
+
+    def _add(self, path: str, size: int | None, opener) -> dict:
+        file_name = os.path.basename(path.replace("\\", "/"))
+        ext = os.path.splitext(file_name)[1].lower()
+        entry = {"name": path, "file_name": file_name, "ext": ext, "open": opener}
+        if file_name.startswith(".") or "__MACOSX" in path:
+            entry["result"] = {"status": "skipped", "detail": "Hidden file"}
+        elif ext not in self.allowed:
+            entry["result"] = {"status": "skipped", "detail": f"File type {ext} not supported"}
+        elif size is not None and size > self.max_file_size:
+            entry["result"] = {"status": "error", "detail": "File too large (max 50MB)"}
+        else:
+            entry["project"] = _project_for(self.project, path)
+            self.total_size += size or 0
+        if len(self.entries) >= IMPORT_MAX_ITEMS:
+            raise ImportRejected(f"Too many files (max {IMPORT_MAX_ITEMS})")
+        if self.total_size > IMPORT_MAX_BYTES:
+            raise ImportRejected(f"Import too large (max {IMPORT_MAX_BYTES // (1024 * 1024)}MB)")
+        self.entries.append(entry)
+        return entry
+
+    def collect(self, name: str, fileobj):
+        """Aggiunge un file caricato; gli archivi vengono espansi nei loro membri."""
+        lower = name.lower()
+        try:
+            if lower.endswith(ZIP_SUFFIXES):
+                # ZipExtFile non restituisce mai piu' di file_size byte: le dimensioni
+                # dichiarate bastano per i limiti anche contro gli zip bomb
+                zf = zipfile.ZipFile(fileobj)
+                for info in zf.infolist():
+                    if not info.is_dir():
+                        self._add(info.filename, info.file_size, partial(zf.open, info))
+            elif lower.endswith(TAR_SUFFIXES):
+                # Un tar compresso non si rilegge a salti: staging subito, in ordine
+                with tarfile.open(fileobj=fileobj, mode="r:*") as tf:
+                    for member in tf:
+                        if member.isfile():
+                            entry = self._add(
+                                member.name, member.size, partial(tf.extractfile, member)
+                            )
+                            self._stage(entry)
+            else:
+                # File del multipart, gia' nello spool: la dimensione vera conta nel totale
+                size = fileobj.seek(0, os.SEEK_END)
+                fileobj.seek(0)
+                self._add(name, size, lambda: fileobj)
+        except (zipfile.BadZipFile, tarfile.TarError) as exc:
+            raise ImportRejected(f"Invalid archive {name}: {exc}") from exc
+
+    # --- fase 2 ---------------------------------------------------------------
+
+    def _stage(self, entry: dict):
+        if "result" in entry or "tmp" in entry:
+            return
+        try:
+            with entry.pop("open")() as src:
+                tmp, size, sha256 = storage.stream_to_temp(
+                    src, blobs.blob_dir(), self.max_file_size, sync=False
+                )
+        except storage.FileTooLarge:
+            entry["result"] = {"status": "error", "detail": "File too large (max 50MB)"}
+            return
+        except (OSError, zipfile.BadZipFile, tarfile.TarError, zlib.error) as exc:
+            entry["result"] = {"status": "error", "detail": f"Unreadable file: {exc}"}
+            return
+        entry.update(tmp=tmp, size=size, sha256=sha256)
+        entry["content"] = storage.read_text(tmp) if entry["ext"] in self.text else ""
+
+    # --- fase 3 ---------------------------------------------------------------
+
+    def _insert(self, batch: list[dict], pool: ThreadPoolExecutor):
+        placed: list[str] = []
+        with write_db() as conn:
+            for entry in batch:
+                blobs.register(conn, entry["sha256"], entry["size"])
+                row = store.insert_document(
+                    conn,
+                    title=os.path.splitext(entry["file_name"])[0],
+                    content=entry["content"],
+                    project=entry["project"],
+                    tags=self.tags,
+                    file_name=entry["file_name"],
+                    file_type=mimetypes.guess_type(entry["file_name"])[0]
+                    or "application/octet-stream",
+                    file_size=entry["size"],
+                    file_sha256=entry["sha256"],
+                )
+                if not entry["content"]:
+                    extraction.enqueue(conn, row["id"], entry["file_name"], entry["sha256"])
+                if blobs.put(entry["tmp"], entry["sha256"], sync=False):
+                    placed.append(blobs.blob_path(entry["sha256"]))
+                entry["result"] = {"status": "created", "id": row["id"]}
+            # Blob e directory durevoli prima del commit che li rende visibili
+            list(pool.map(storage.fsync_file, placed))
+            list(pool.map(storage.fsync_dir, {os.path.dirname(p) for p in placed}))
+            try:
+                conn.commit()
+            except BaseException:
+                for path in placed:
+                    storage.discard(path)
+                raise
+        publisher.notify()
+        extraction.extractor.notify()
+
+    def run(self, sources) -> list[dict]:
+        """Importa ``sources`` (coppie nome, file); restituisce un risultato per elemento."""
+        try:
+            for name, fileobj in sources:
+                self.collect(name, fileobj)
+            with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+                list(pool.map(self._stage, self.entries))
+                ready = [e for e in self.entries if "result" not in e]
+                for start in range(0, len(ready), IMPORT_BATCH_SIZE):
+                    self._insert(ready[start : start + IMPORT_BATCH_SIZE], pool)  # noqa: E203
+        finally:
+            for entry in self.entries:
+                if "tmp" in entry:
+                    storage.discard(entry["tmp"])
+        return [{"name": e["name"], **e["result"]} for e in self.entries]
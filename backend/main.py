@@ -5,6 +5,7 @@ import os
 import platform
 import sqlite3
 import sys
+import threading
 from contextlib import asynccontextmanager
 
 import sentry_sdk
@@ -12,10 +13,21 @@ from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from backend import blobs, compression, extraction, fts, maintenance, previews
 from backend.auth import get_current_user
-from backend.config import DB_PATH, SENTRY_DSN
-from backend.database import get_db, init_db
-from backend.routers import auth, documents, search
+from backend.config import (
+    DB_PATH,
+    EXTRACT_ENABLED,
+    FTS_AUTO_REBUILD,
+    MAINT_ENABLED,
+    SENTRY_DSN,
+)
+from backend.database import close_pool, get_pool, init_db, read_db
+from backend.events import publisher
+from backend.extraction import extractor
+from backend.maintenance import scheduler
+from backend.routers import auth, documents, events, projects, search
+from backend.search_cache import search_cache
 
 logger = logging.getLogger(__name__)
 
@@ -23,10 +35,47 @@ if SENTRY_DSN:
     sentry_sdk.init(dsn=SENTRY_DSN, traces_sample_rate=0.3, send_default_pii=False)
 
 
+def _rebuild_fts(recode: bool):
+    try:
+        fts.rebuild()
+    except Exception:
+        logger.exception("FTS index rebuild failed, it will resume on the next start")
+        return
+    if recode:
+        _migrate_content()
+
+
+def _migrate_content():
+    try:
+        compression.migrate()
+    except Exception:
+        logger.exception("Content storage migration failed, it will resume on the next start")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    with read_db() as conn:
+        stale_index = fts.needs_rebuild(conn)
+        recode = compression.pending(conn)
+    if stale_index and FTS_AUTO_REBUILD:
+        # Le ricerche restano sull'indice attuale finche' il nuovo non e' pronto;
+        # la compressione aspetta l'indice sulla vista
+        threading.Thread(
+            target=_rebuild_fts, args=(recode,), name="fts-rebuild", daemon=True
+        ).start()
+    elif recode:
+        threading.Thread(target=_migrate_content, name="content-migrate", daemon=True).start()
+    await publisher.start()
+    if MAINT_ENABLED:
+        await scheduler.start()
+    if EXTRACT_ENABLED:
+        await extractor.start()
     yield
+    await extractor.stop()
+    await scheduler.stop()
+    await publisher.stop()
+    close_pool()
 
 
 _docs_enabled = os.environ.get("DOCS_ENABLED", "true").lower() in ("1", "true")
@@ -46,19 +95,22 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=_allowed_origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+    allow_headers=["Authorization", "Content-Type", "If-Match"],
+    expose_headers=["X-Next-Cursor", "X-Change-Seq", "ETag", "Content-Range"],
 )
 
 app.include_router(auth.router)
 app.include_router(documents.router)
 app.include_router(search.router)
+app.include_router(projects.router)
+app.include_router(events.router)
 
 
 @app.get("/api/healthz")
 def healthz():
     try:
-        with get_db() as conn:
+        with read_db() as conn:
             conn.execute("SELECT 1")
         return {"status": "ok", "db": "connected"}
     except (sqlite3.OperationalError, sqlite3.DatabaseError):
@@ -79,12 +131,22 @@ def system_info(_user: str = Depends(get_current_user)):
     except OSError:
         logger.warning("Unable to read database file size at %s", DB_PATH)
 
-    # Doc count
+    # Doc count + dedup del blob store
     doc_count = 0
+    storage_stats = None
+    fts_status = None
+    maint_status: dict = {}
+    extract_status: dict = {}
+    compression_status = None
     try:
-        with get_db() as conn:
+        with read_db() as conn:
             row = conn.execute("SELECT COUNT(*) AS c FROM documents").fetchone()
             doc_count = row["c"]
+            storage_stats = blobs.dedup_stats(conn)
+            fts_status = fts.status(conn)
+            maint_status = maintenance.status(conn)
+            extract_status = extraction.status(conn)
+            compression_status = compression.status(conn)
     except (sqlite3.OperationalError, sqlite3.DatabaseError):
         logger.warning("Unable to query document count")
 
@@ -97,4 +159,13 @@ def system_info(_user: str = Depends(get_current_user)):
         "cpu_count": os.cpu_count(),
         "db_size_mb": round(db_size / (1024 * 1024), 2),
         "doc_count": doc_count,
+        "storage": storage_stats,
+        "db_pool": get_pool().stats(),
+        "events": publisher.stats(),
+        "search_cache": search_cache.stats(),
+        "fts": fts_status,
+        "maintenance": {**maint_status, **scheduler.stats()},
+        "extraction": {**extract_status, **extractor.stats()},
+        "previews": previews.preview_cache.stats(),
+        "compression": compression_status,
     }
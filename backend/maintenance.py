@@ -0,0 +1,371 @@
+"""Manutenzione in background di SQLite e degli indici FTS5.
+
+Ogni scrittura su documents aggiunge segmenti agli indici full-text (due per
+un update, tramite i trigger); automerge li fonde mentre si scrive, ma solo
+quando un livello ne ha FTS_AUTOMERGE. I task qui fondono il resto nei
+momenti di inattivita' e tengono in ordine il database:
+
+- ``merge``: passi incrementali di merge, ognuno in una transazione breve;
+- ``optimize``: fonde ogni indice in un solo segmento;
+- ``integrity``: integrity-check degli indici FTS e ``PRAGMA integrity_check``;
+- ``analyze``: ``ANALYZE`` (limitato) se mancano le statistiche o i documenti
+  sono cambiati di molto, altrimenti ``PRAGMA optimize``;
+- ``checkpoint``: checkpoint del WAL, troncato se supera MAINT_WAL_TRUNCATE_MB.
+
+Lo scheduler gira in un solo worker uvicorn alla volta (lock sul file
+``<DB_PATH>.maint.lock``); esiti e orari stanno in ``vault_meta`` sotto
+``maint_<task>``, cosi' li vedono tutti i worker e sopravvivono al riavvio.
+
+CLI: ``python -m backend.maintenance status|run [task ...]`` (run ignora
+intervalli e inattivita').
+"""
+
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import suppress
+
+from backend import config, fts
+
+logger = logging.getLogger(__name__)
+
+# Limite di righe lette per indice da ANALYZE (PRAGMA analysis_limit)
+ANALYSIS_LIMIT = 1000
+# ANALYZE completo quando i documenti sono cambiati di questo fattore dall'ultimo
+ANALYZE_GROWTH = 2
+
+
+def _varint(buf: bytes, pos: int) -> tuple[int, int]:
+    """Varint SQLite (big-endian, 7 bit per byte, il nono byte intero): (valore, posizione)."""
+    value = 0
+    for i in range(8):
+        byte = buf[pos + i]
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos + i + 1
+    return (value << 8) | buf[pos + 8], pos + 9
+
+
+def segments(conn, table: str) -> dict:
+    """Livelli e segmenti di un indice FTS5 dal record di struttura (``<table>_data``, id 10)."""
+    row = conn.execute(f"SELECT block FROM {table}_data WHERE id = 10").fetchone()  # noqa: S608
+    if row is None:
+        return {"levels": 0, "segments": 0}
+    block = bytes(row[0])
+    # Cookie di 4 byte, seguito dal marcatore della struttura v2 se presente
+    pos = 8 if block[4:8] == b"\xff\x00\x00\x01" else 4
+    levels, pos = _varint(block, pos)
+    count, pos = _varint(block, pos)
+    return {"levels": levels, "segments": count}
+
+
+def wal_size(path: str | None = None) -> int:
+    try:
+        return os.path.getsize((path or config.DB_PATH) + "-wal")
+    except OSError:
+        return 0
+
+
+def merge(budget: float | None = None) -> dict:
+    """Passi di ``merge`` su ogni indice finche' c'e' lavoro o non scade ``budget`` secondi.
+
+    Ogni passo scrive al piu' MAINT_MERGE_PAGES pagine e rilascia il writer,
+    cosi' le richieste non aspettano l'intero merge. Secondo la documentazione
+    FTS5 un passo ha lavorato se total_changes cresce di almeno 2.
+    """
+    from backend.database import write_db
+
+    deadline = time.monotonic() + (config.MAINT_MERGE_BUDGET if budget is None else budget)
+    steps = 0
+    with write_db() as conn:
+        tables = fts.existing_tables(conn)
+    for table in tables:
+        while time.monotonic() < deadline:
+            with write_db() as conn:
+                before = conn.total_changes
+                conn.execute(
+                    f"INSERT INTO {table}({table}, rank) VALUES ('merge', ?)",
+                    (config.MAINT_MERGE_PAGES,),
+                )
+                conn.commit()
+                worked = conn.total_changes - before >= 2
+            if not worked:
+                break
+            steps += 1
+    return {"steps": steps, "finished": time.monotonic() < deadline}
+
+
+def optimize() -> dict:
+    """Fonde ogni indice FTS in un solo segmento (una transazione per indice)."""
+    from backend.database import write_db
+
+    with write_db() as conn:
+        tables = fts.existing_tables(conn)
+    for table in tables:
+        with write_db() as conn:
+            conn.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+            conn.commit()
+    return {"tables": tables}
+
+
+def integrity() -> dict:
+    """integrity-check degli indici FTS (anche contro documents) e del file di database.
+
+    Il controllo del file gira su una connessione dedicata, fuori dal pool e
+    senza il lock del writer.
+    """
+    from backend.database import get_pool, write_db
+
+    errors = []
+    with write_db() as conn:
+        tables = fts.existing_tables(conn)
+    for table in tables:
+        with write_db() as conn:
+            try:
+                # rank = 1: confronta anche l'indice con la tabella documents
+                conn.execute(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)")
+            except sqlite3.DatabaseError as exc:
+                errors.append(f"{table}: {exc}")
+            conn.rollback()
+    conn = get_pool().connect_dedicated()
+    try:
+        rows = [r[0] for r in conn.execute("PRAGMA integrity_check(20)").fetchall()]
+    finally:
+        conn.close()
+    if rows != ["ok"]:
+        errors += rows
+    if errors:
+        logger.error("Database integrity check failed: %s", "; ".join(errors))
+    return {"ok": not errors, "errors": errors}
+
+
+def analyze() -> dict:
+    """Statistiche del query planner.
+
+    ``PRAGMA optimize`` su SQLite < 3.46 analizza solo le tabelle usate dalla
+    stessa connessione, e il writer non fa le query di lettura: qui si lancia
+    ANALYZE (con analysis_limit) se mancano le statistiche o il numero di
+    documenti e' cambiato di ANALYZE_GROWTH volte dall'ultimo ANALYZE.
+    """
+    from backend.database import write_db
+
+    with write_db() as conn:
+        docs = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+        previous = last_runs(conn).get("analyze", {}).get("detail", {}).get("docs")
+        full = (
+            stats is None
+            or not previous
+            or not previous / ANALYZE_GROWTH <= max(docs, 1) <= previous * ANALYZE_GROWTH
+        )
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        if full:
+            conn.execute("ANALYZE")
+        else:
+            conn.execute("PRAGMA optimize")
+            # Si conta dall'ultimo ANALYZE vero, non da questo giro
+            docs = previous
+        conn.commit()
+    return {"analyze": full, "docs": docs}
+
+
+def checkpoint(truncate: bool | None = None) -> dict:
+    """Checkpoint PASSIVE del WAL; TRUNCATE se richiesto o, con ``None``, oltre la soglia.
+
+    TRUNCATE aspetta che i lettori finiscano tenendo il writer: lo scheduler
+    lo permette solo a vault inattivo.
+    """
+    from backend.database import write_db
+
+    if truncate is None:
+        truncate = wal_size() > config.MAINT_WAL_TRUNCATE_MB * 1024 * 1024
+    mode = "TRUNCATE" if truncate else "PASSIVE"
+    with write_db() as conn:
+        busy, log, done = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return {"mode": mode, "busy": bool(busy), "frames": log, "checkpointed": done}
+
+
+# nome -> (intervallo in config, solo a vault inattivo, funzione); eseguiti in quest'ordine
+TASKS = {
+    "integrity": ("MAINT_INTEGRITY_INTERVAL", True, integrity),
+    "optimize": ("MAINT_OPTIMIZE_INTERVAL", True, optimize),
+    "merge": ("MAINT_MERGE_INTERVAL", True, merge),
+    "analyze": ("MAINT_ANALYZE_INTERVAL", False, analyze),
+    "checkpoint": ("MAINT_CHECKPOINT_INTERVAL", False, checkpoint),
+}
+
+
+def last_runs(conn) -> dict[str, dict]:
+    rows = conn.execute(
+        "SELECT key, value FROM vault_meta WHERE key LIKE 'maint\\_%' ESCAPE '\\'"
+    ).fetchall()
+    return {key.removeprefix("maint_"): json.loads(value) for key, value in rows}
+
+
+def run_task(name: str, **kwargs) -> dict:
+    """Esegue il task ``name`` e ne registra esito e durata in vault_meta.
+
+    Un errore SQLite viene registrato e loggato, non propagato: lo scheduler
+    passa al task successivo.
+    """
+    from backend.database import write_db
+
+    started = time.time()
+    t0 = time.perf_counter()
+    record: dict = {"at": started}
+    try:
+        detail = TASKS[name][2](**kwargs)
+        record.update(ok=detail.pop("ok", True), detail=detail)
+    except sqlite3.Error as exc:
+        logger.exception("Maintenance task %s failed", name)
+        record.update(ok=False, error=str(exc))
+    record["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    with write_db() as conn:
+        conn.execute(
+            "INSERT INTO vault_meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (f"maint_{name}", json.dumps(record)),
+        )
+        conn.commit()
+    return record
+
+
+def status(conn) -> dict:
+    return {
+        "fts_segments": {t: segments(conn, t) for t in fts.existing_tables(conn)},
+        "wal_mb": round(wal_size() / (1024 * 1024), 2),
+        "tasks": last_runs(conn),
+    }
+
+
+class Scheduler:
+    """Esegue i task scaduti a ogni giro, in un thread, nel worker che tiene il lock.
+
+    "Inattivo" vuol dire che la testa del change log non e' cambiata da
+    MAINT_IDLE secondi; la si rilegge dopo ogni task, cosi' una scrittura
+    arrivata nel frattempo rimanda i task pesanti rimasti al giro dopo.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._lock_file = None
+        self._head: int | None = None
+        self._changed_at = time.monotonic()
+        self.running: str | None = None
+
+    async def start(self):
+        self._head = None
+        self._changed_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        self._release()
+
+    @property
+    def leader(self) -> bool:
+        return self._lock_file is not None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "leader": self.leader,
+            "running": self.running,
+            "idle_seconds": round(time.monotonic() - self._changed_at, 1),
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(config.MAINT_TICK)
+            try:
+                await asyncio.to_thread(self.tick)
+            except sqlite3.Error:
+                logger.exception("Maintenance scheduler failed")
+
+    def _lead(self) -> bool:
+        if self._lock_file is None:
+            lock_file = open(config.DB_PATH + ".maint.lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def _release(self):
+        lock_file, self._lock_file = self._lock_file, None
+        if lock_file is not None:
+            lock_file.close()
+
+    def _idle(self) -> bool:
+        from backend.database import changes_head, read_db
+
+        with read_db() as conn:
+            head = changes_head(conn)
+        if head != self._head:
+            self._head = head
+            self._changed_at = time.monotonic()
+        return time.monotonic() - self._changed_at >= config.MAINT_IDLE
+
+    def tick(self) -> list[str]:
+        """Un giro: esegue i task scaduti e restituisce i nomi di quelli eseguiti."""
+        from backend.database import read_db
+
+        if not self._lead():
+            return []
+        with read_db() as conn:
+            runs = last_runs(conn)
+        idle = self._idle()
+        done = []
+        for name, (interval_name, idle_only, _) in TASKS.items():
+            interval = getattr(config, interval_name)
+            if interval <= 0 or time.time() - runs.get(name, {}).get("at", 0) < interval:
+                continue
+            if idle_only and not idle:
+                continue
+            kwargs = {"truncate": False} if name == "checkpoint" and not idle else {}
+            self.running = name
+            try:
+                run_task(name, **kwargs)
+            finally:
+                self.running = None
+            done.append(name)
+            idle = self._idle()
+        return done
+
+
+scheduler = Scheduler()
+
+
+def main(argv=None):
+    from backend.database import init_db, read_db
+
+    parser = argparse.ArgumentParser(prog="python -m backend.maintenance")
+    parser.add_argument("command", choices=["status", "run"])
+    parser.add_argument("tasks", nargs="*", metavar="task", help=", ".join(TASKS))
+    args = parser.parse_args(argv)
+    unknown = set(args.tasks) - set(TASKS)
+    if unknown:
+        parser.error(f"unknown task: {', '.join(sorted(unknown))}")
+
+    init_db()
+    if args.command == "run":
+        for name in args.tasks or TASKS:
+            record = run_task(name)
+            print(f"  {name}: {'ok' if record['ok'] else 'FAILED'} ({record['duration_ms']} ms)")
+    with read_db() as conn:
+        print(json.dumps(status(conn), indent=2))
+
+
+if __name__ == "__main__":
+    main()
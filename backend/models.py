@@ -1,14 +1,18 @@
 """Pydantic schemas per request/response dell'API."""
 
-from typing import Annotated
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, BeforeValidator
+from pydantic import BaseModel, BeforeValidator, Field
 
 
 def _parse_tags(v):
-    """Converte tags comma-separated da SQLite in lista Python."""
+    """Converte tags comma-separated da SQLite in lista Python.
+
+    La colonna e' gia' in forma canonica ("a,b", vedi store.tags_value):
+    basta uno split, senza strip per ogni tag.
+    """
     if isinstance(v, str):
-        return [t.strip() for t in v.split(",") if t.strip()]
+        return v.split(",") if v else []
     if v is None:
         return []
     return v
@@ -41,6 +45,99 @@ class DocumentUpdate(BaseModel):
     tags: str | None = None
 
 
+class TextEdit(BaseModel):
+    """Sostituisce ``content[start:end]`` della versione base con ``text``.
+
+    Gli offset sono in caratteri Unicode (code point) del testo base.
+    """
+
+    start: int = Field(ge=0)
+    end: int = Field(ge=0)
+    text: str = ""
+
+
+class DocumentPatch(BaseModel):
+    """Modifiche a una versione nota: ``version`` o l'ETag in If-Match.
+
+    ``edits`` in ordine e senza sovrapposizioni, tutti riferiti alla versione base.
+    """
+
+    version: int | None = Field(default=None, ge=1)
+    edits: list[TextEdit] = Field(default=[], max_length=10000)
+    title: str | None = None
+    project: str | None = None
+    tags: str | None = None
+
+
+class BatchOperation(BaseModel):
+    op: Literal["update", "delete"]
+    id: int
+    title: str | None = None
+    content: str | None = None
+    project: str | None = None
+    tags: str | None = None
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(min_length=1, max_length=1000)
+
+
+class BatchResponse(BaseModel):
+    updated: int
+    deleted: int
+
+
+class TagCount(BaseModel):
+    name: str
+    count: int
+
+
+class ImportItemResult(BaseModel):
+    name: str
+    status: Literal["created", "skipped", "error"]
+    id: int | None = None
+    detail: str | None = None
+
+
+class ImportResponse(BaseModel):
+    created: int
+    skipped: int
+    failed: int
+    items: list[ImportItemResult]
+
+
+class ProjectRename(BaseModel):
+    path: str
+    new_path: str
+
+
+class ProjectMove(BaseModel):
+    path: str
+    parent: str | None = None
+
+
+class ProjectDelete(BaseModel):
+    path: str
+
+
+class ProjectUpdateResponse(BaseModel):
+    path: str
+    new_path: str | None = None
+    updated: int
+
+
+class ProjectNode(BaseModel):
+    """Cartella dell'albero; ``children`` e' None se il nodo non e' stato espanso."""
+
+    name: str
+    path: str
+    doc_count: int
+    total_count: int
+    updated_at: str | None = None
+    has_children: bool = False
+    children: list["ProjectNode"] | None = None
+
+
 class DocumentResponse(BaseModel):
     id: int
     title: str
@@ -49,24 +146,152 @@ class DocumentResponse(BaseModel):
     tags: TagList
     file_name: str | None = None
     file_type: str | None = None
+    version: int = 1
     created_at: str
     updated_at: str
 
 
-class DocumentListItem(BaseModel):
+class DocumentInfo(BaseModel):
+    """Risposta del PATCH: il documento senza content, che il client ha gia'."""
+
     id: int
     title: str
     project: str | None = None
     tags: TagList
     file_name: str | None = None
     file_type: str | None = None
+    version: int
     created_at: str
     updated_at: str
 
 
-class SearchResult(BaseModel):
-    id: int
+class RevisionInfo(BaseModel):
+    """Versione precedente di un documento; ``kind`` dice come e' salvato il testo."""
+
+    version: int
+    kind: Literal["snapshot", "delta", "same"]
     title: str
-    snippet: str
     project: str | None = None
     tags: TagList
+    updated_at: str | None = None
+    stored_bytes: int | None = None
+
+
+class RevisionResponse(BaseModel):
+    version: int
+    title: str
+    content: str
+    project: str | None = None
+    tags: TagList
+    updated_at: str | None = None
+
+
+class DocumentListItem(BaseModel):
+    """Riga della lista documenti; con ``fields=`` restano solo le colonne richieste."""
+
+    id: int
+    title: str | None = None
+    project: str | None = None
+    tags: TagList = []
+    file_name: str | None = None
+    file_type: str | None = None
+    created_at: str | None = None
+    updated_at: str | None = None
+
+
+class PreviewInfo(BaseModel):
+    """Anteprima di un allegato: immagini da ``/preview/{page}?size=&v=version`` se renderable."""
+
+    pages: int | None = None
+    renderable: bool = False
+    sizes: list[int]
+    version: str
+
+
+class RowColumn(BaseModel):
+    name: str
+    type: str
+
+
+class RowsResponse(BaseModel):
+    """Righe ``offset``..``offset + limit`` di un foglio; i CSV hanno un solo foglio."""
+
+    sheet: int
+    sheets: list[str]
+    columns: list[RowColumn]
+    row_count: int
+    offset: int
+    rows: list[list[str]]
+
+
+class DocumentChange(BaseModel):
+    seq: int
+    id: int
+    op: str
+    updated_at: str | None = None
+    document: DocumentListItem | None = None
+
+
+class ChangesResponse(BaseModel):
+    changes: list[DocumentChange]
+    next_since: int
+    has_more: bool = False
+    resync_required: bool = False
+
+
+class SearchSection(BaseModel):
+    """Chunk trovato di un documento grande: titolo e posizione nel content (caratteri)."""
+
+    heading: str | None = None
+    offset: int
+    length: int
+
+
+class SearchResult(BaseModel):
+    """Risultato di ricerca; con ``snippets=false`` restano solo ``id`` e ``rank``."""
+
+    id: int
+    rank: float | None = None
+    title: str | None = None
+    snippet: str | None = None
+    project: str | None = None
+    tags: TagList = []
+    section: SearchSection | None = None
+
+
+class SearchFacets(BaseModel):
+    """Conteggi sull'intero insieme dei risultati ("" = Unsorted / senza tipo)."""
+
+    project: dict[str, int]
+    tag: dict[str, int]
+    file_type: dict[str, int]
+
+
+class SearchPage(BaseModel):
+    total: int
+    results: list[SearchResult]
+    facets: SearchFacets
+
+
+class SearchSnippet(BaseModel):
+    id: int
+    snippet: str
+    section: SearchSection | None = None
+
+
+class SuggestTerm(BaseModel):
+    """Termine dell'indice che completa l'ultima parola; ``text`` e' la query completata."""
+
+    term: str
+    doc_count: int
+    text: str
+
+
+class SuggestTitle(BaseModel):
+    id: int
+    title: str
+
+
+class SearchSuggestions(BaseModel):
+    terms: list[SuggestTerm]
+    titles: list[SuggestTitle]
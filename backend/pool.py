@@ -0,0 +1,163 @@
+"""Pool di connessioni SQLite: lettori riutilizzabili e un writer dedicato."""
+
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Nessuna connessione disponibile entro il timeout del pool."""
+
+
+class ConnectionPool:
+    """Connessioni configurate una sola volta e riusate tra le richieste.
+
+    I lettori sono limitati a ``size`` connessioni ``query_only``; tutte le
+    scritture passano dall'unico writer, serializzate da un lock (SQLite in
+    WAL ammette comunque un solo writer alla volta).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        timeout: float,
+        pragmas: list[tuple[str, object]],
+        functions: list[tuple[str, int, Callable]] | None = None,
+    ):
+        self.path = path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._pragmas = pragmas
+        self._functions = functions or []
+        self._idle: list[sqlite3.Connection] = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "read_checkouts": 0,
+            "write_checkouts": 0,
+            "waits": 0,
+            "wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "timeouts": 0,
+        }
+
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self._pragmas:
+            conn.execute(f"PRAGMA {name}={value}")
+        for name, nargs, func in self._functions:
+            conn.create_function(name, nargs, func, deterministic=True)
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _record_wait(self, started: float):
+        waited = (time.perf_counter() - started) * 1000
+        if waited >= 1:
+            self._stats["waits"] += 1
+        self._stats["wait_ms"] += waited
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    try:
+                        conn = self._connect(readonly=True)
+                    except sqlite3.Error:
+                        self._open -= 1
+                        raise
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout("Timed out waiting for a database connection")
+            self._stats["read_checkouts"] += 1
+            self._record_wait(started)
+        return conn
+
+    def _release_reader(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._open -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def reader(self):
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    @contextmanager
+    def writer(self):
+        started = time.perf_counter()
+        if not self._writer_lock.acquire(timeout=self.timeout):
+            with self._cond:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout("Timed out waiting for the database writer")
+        try:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            if self._writer is None:
+                self._writer = self._connect(readonly=False)
+            with self._cond:
+                self._stats["write_checkouts"] += 1
+                self._record_wait(started)
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+        finally:
+            self._writer_lock.release()
+
+    def connect_dedicated(self) -> sqlite3.Connection:
+        """Connessione di sola lettura fuori dal pool, per un consumer di lunga durata."""
+        return self._connect(readonly=True)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._open,
+                "idle": len(self._idle),
+                "max_size": self.size,
+                "writer_busy": self._writer_lock.locked(),
+                **{k: round(v, 2) if isinstance(v, float) else v for k, v in self._stats.items()},
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._open -= len(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,289 @@
+"""Anteprime degli allegati: numero di pagine e immagini delle pagine, in cache su disco.
+
+Le immagini si generano alla prima richiesta e restano in UPLOAD_DIR/previews,
+con il nome ricavato dallo SHA-256 del file, dalla pagina e dalla larghezza:
+il contenuto non cambia mai, quindi il client le tiene in cache per sempre.
+Pillow disegna immagini e miniature di DOCX, XLSX e PPTX (docProps/thumbnail),
+pypdfium2 le pagine dei PDF.
+"""
+
+import io
+import json
+import logging
+import os
+import re
+import threading
+import zipfile
+
+import pypdfium2
+from PIL import Image
+
+from backend import config
+
+logger = logging.getLogger(__name__)
+
+# Larghezze servite: una richiesta va alla prima uguale o maggiore
+SIZES = (160, 480, 1024)
+# Da incrementare se cambia il modo di generare: invalida la cache su disco
+VERSION = 1
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif"}
+OFFICE_EXTENSIONS = {".docx", ".xlsx", ".pptx"}
+_THUMBNAIL = re.compile(r"docProps/thumbnail\.(?:png|jpe?g)", re.I)
+_MEDIA_TYPES = ((b"\x89PNG", "image/png"), (b"\xff\xd8", "image/jpeg"), (b"RIFF", "image/webp"))
+# PDFium non e' thread-safe: una chiamata alla volta per processo
+_pdfium_lock = threading.Lock()
+
+
+class PreviewUnavailable(Exception):
+    """Niente anteprima per questo file, pagina o ambiente."""
+
+
+def snap(size: int) -> int:
+    return next((s for s in SIZES if s >= size), SIZES[-1])
+
+
+def media_type(data: bytes) -> str:
+    return next((t for magic, t in _MEDIA_TYPES if data.startswith(magic)), "image/png")
+
+
+def webp() -> bool:
+    """Se Pillow e' compilato con WebP; altrimenti le immagini sono PNG."""
+    return "WEBP" in Image.SAVE
+
+
+# --- numero di pagine ------------------------------------------------------
+
+
+def _pdf_pages(path: str) -> int:
+    with _pdfium_lock:
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+
+def _office_pages(path: str, ext: str) -> tuple[int | None, bool]:
+    """(pagine, fogli o slide dai metadati; se c'e' una miniatura incorporata)."""
+    with zipfile.ZipFile(path) as zf:
+        names = zf.namelist()
+        thumbnail = any(_THUMBNAIL.fullmatch(n) for n in names)
+        if ext == ".xlsx" and "xl/workbook.xml" in names:
+            workbook = zf.read("xl/workbook.xml").decode("utf-8", "replace")
+            return len(re.findall(r"<sheet\s", workbook)) or None, thumbnail
+        if "docProps/app.xml" not in names:
+            return None, thumbnail
+        app = zf.read("docProps/app.xml").decode("utf-8", "replace")
+    match = re.search(r"<(?:Pages|Slides)>(\d+)<", app)
+    return (int(match.group(1)) if match else None), thumbnail
+
+
+def describe(path: str, ext: str) -> dict:
+    """Pagine del file e, per DOCX/XLSX/PPTX, se ha una miniatura incorporata."""
+    pages: int | None = None
+    thumbnail = False
+    try:
+        if ext == ".pdf":
+            pages = _pdf_pages(path)
+        elif ext in IMAGE_EXTENSIONS:
+            pages = 1
+        elif ext in OFFICE_EXTENSIONS:
+            pages, thumbnail = _office_pages(path, ext)
+    except Exception:
+        logger.warning("Unable to read %s for preview", path, exc_info=True)
+    return {"pages": pages, "thumbnail": thumbnail}
+
+
+# --- immagini --------------------------------------------------------------
+
+
+def _encode(image, size: int) -> bytes:
+    if image.width > size:
+        height = max(1, round(image.height * size / image.width))
+        image = image.resize((size, height), Image.Resampling.LANCZOS)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    out = io.BytesIO()
+    if webp():
+        image.save(out, "WEBP", quality=80, method=4)
+    else:
+        image.save(out, "PNG", optimize=True)
+    return out.getvalue()
+
+
+def render(path: str, ext: str, page: int, size: int) -> bytes:
+    """Immagine della pagina ``page`` (da 1) larga al piu' ``size`` pixel."""
+    if ext == ".pdf":
+        with _pdfium_lock:
+            pdf = pypdfium2.PdfDocument(path)
+            try:
+                if page > len(pdf):
+                    raise PreviewUnavailable("Page out of range")
+                pdf_page = pdf[page - 1]
+                bitmap = pdf_page.render(scale=size / pdf_page.get_width())
+                image = bitmap.to_pil()
+            finally:
+                pdf.close()
+        return _encode(image, size)
+    if page != 1:
+        raise PreviewUnavailable("Page out of range")
+    if ext in IMAGE_EXTENSIONS:
+        with Image.open(path) as image:
+            image.seek(0)
+            return _encode(image, size)
+    if ext in OFFICE_EXTENSIONS:
+        with zipfile.ZipFile(path) as zf:
+            name = next((n for n in zf.namelist() if _THUMBNAIL.fullmatch(n)), None)
+            if name is None:
+                raise PreviewUnavailable("No embedded thumbnail")
+            data = zf.read(name)
+        with Image.open(io.BytesIO(data)) as image:
+            return _encode(image, size)
+    raise PreviewUnavailable(f"No preview for {ext or 'this file'}")
+
+
+# --- cache su disco --------------------------------------------------------
+
+
+class PreviewCache:
+    """File in UPLOAD_DIR/previews, LRU limitata a PREVIEW_CACHE_MB.
+
+    L'ordine LRU e' l'mtime dei file, aggiornato a ogni hit: sopravvive ai
+    riavvii ed e' condiviso tra i worker. Oltre il limite si eliminano i
+    file meno usati fino al 90%. Richieste concorrenti della stessa voce
+    aspettano la prima invece di generarla di nuovo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[str, threading.Lock] = {}
+        self._root: str | None = None
+        self._bytes = 0
+        self._entries = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _dir(self) -> str:
+        root = os.path.join(config.UPLOAD_DIR, "previews")
+        if root != self._root:
+            self._root = root
+            self._entries, self._bytes = 0, 0
+            for _, size, _ in self._files(root):
+                self._entries += 1
+                self._bytes += size
+        return root
+
+    @staticmethod
+    def _files(root: str):
+        """(path, byte, mtime) dei file in cache."""
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, name: str, build) -> bytes:
+        """Contenuto della voce ``name``; ``build()`` la genera se manca."""
+        with self._lock:
+            path = os.path.join(self._dir(), name[:2], name)
+            flight = self._flights.setdefault(name, threading.Lock())
+        try:
+            with flight:
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    os.utime(path)
+                    with self._lock:
+                        self.hits += 1
+                    return data
+                except FileNotFoundError:
+                    pass
+                data = build()
+                self._write(path, data)
+                return data
+        finally:
+            with self._lock:
+                self._flights.pop(name, None)
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.misses += 1
+            self._entries += 1
+            self._bytes += len(data)
+            if self._bytes > config.PREVIEW_CACHE_MB * 1024 * 1024:
+                self._evict()
+
+    def _evict(self):
+        """Elimina i file meno usati fino al 90% del limite (con il lock preso)."""
+        target = config.PREVIEW_CACHE_MB * 1024 * 1024 * 0.9
+        files = sorted(self._files(self._root or ""), key=lambda f: f[2])
+        self._entries, self._bytes = len(files), sum(f[1] for f in files)
+        for path, size, _ in files:
+            if self._bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._entries -= 1
+            self._bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._files(self._dir()):
+                os.remove(path)
+            self._entries, self._bytes = 0, 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._dir()
+            return {
+                "entries": self._entries,
+                "mb": round(self._bytes / (1024 * 1024), 2),
+                "max_mb": config.PREVIEW_CACHE_MB,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "webp": webp(),
+            }
+
+
+preview_cache = PreviewCache()
+
+
+def file_info(key: str, path: str, ext: str) -> dict:
+    """Pagine del file con SHA-256 ``key`` (in cache) e se il server ne genera le immagini."""
+    name = f"{key}-v{VERSION}.json"
+    described = json.loads(
+        preview_cache.get(name, lambda: json.dumps(describe(path, ext)).encode())
+    )
+    if ext in (".pdf", *IMAGE_EXTENSIONS):
+        renderable = described["pages"] is not None
+    else:
+        renderable = described["thumbnail"]
+    return {"pages": described["pages"], "renderable": renderable, "sizes": list(SIZES)}
+
+
+def page_image(key: str, path: str, ext: str, page: int, size: int) -> bytes:
+    """render() del file con SHA-256 ``key``, in cache; PreviewUnavailable se non si puo'."""
+
+    def build():
+        try:
+            return render(path, ext, page, size)
+        except PreviewUnavailable:
+            raise
+        except Exception as exc:
+            logger.warning("Preview of %s failed", path, exc_info=True)
+            raise PreviewUnavailable("Unable to render this file") from exc
+
+    return preview_cache.get(f"{key}-v{VERSION}-p{page}-{size}", build)
@@ -0,0 +1,180 @@
+"""Storico delle versioni dei documenti: delta inversi e snapshot periodici.
+
+Il content della versione corrente sta in documents. Ogni salvataggio
+aggiunge a document_revisions la versione che sostituisce (titolo, project,
+tag e testo), con il testo come delta che la ricostruisce dalla versione
+successiva. Il delta copia dal testo nuovo il prefisso e il suffisso comuni
+(e, se il tratto cambiato e' lungo, le righe uguali al suo interno): costa
+quanto la modifica, non quanto il documento. Dopo config.REVISION_SNAPSHOT_EVERY
+delta di fila, o quando il delta non e' piu' piccolo del testo, la revisione
+e' il testo intero: una versione si ricostruisce dal primo snapshot sopra
+di lei (o dal documento) applicando al piu' altrettanti delta. Nessuna
+revisione dipende da quelle piu' vecchie, che si possono togliere senza
+riscrivere le altre.
+
+I dati seguono il formato del vault (backend.compression). Gli spostamenti
+di cartella (store.rewrite_subtree) salvano con record_same() una revisione
+SAME per documento, come un salvataggio che non cambia il testo.
+"""
+
+import difflib
+import json
+import sqlite3
+
+from backend import compression, config, textdiff
+
+# Revisione con lo stesso testo della successiva (data NULL)
+SAME = "same"
+DELTA = "delta"
+SNAPSHOT = "snapshot"
+# Sotto questa lunghezza il tratto cambiato si salva intero, senza diff per righe
+LINE_DIFF_MIN = 4096
+# Oltre queste righe difflib costerebbe troppo sul percorso del PUT
+LINE_DIFF_MAX = 20000
+
+
+class RevisionNotFound(Exception):
+    """Versione mai salvata (o del documento corrente)."""
+
+
+def diff(source: str, target: str) -> list:
+    """Operazioni che costruiscono ``target`` da ``source``.
+
+    Una lista di ``[inizio, lunghezza]`` (copia da ``source``) e stringhe
+    (testo da inserire), da concatenare in ordine.
+    """
+    start, end = textdiff.changed_span(source, target)
+    ops: list = [[0, start]] if start else []
+    old, new = source[start : len(source) - end], target[start : len(target) - end]  # noqa: E203
+    if len(old) + len(new) < LINE_DIFF_MIN or not old or not new:
+        ops.append(new)
+    else:
+        old_lines, new_lines = old.splitlines(keepends=True), new.splitlines(keepends=True)
+        if max(len(old_lines), len(new_lines)) > LINE_DIFF_MAX:
+            ops.append(new)
+        else:
+            offsets = [start]
+            for line in old_lines:
+                offsets.append(offsets[-1] + len(line))
+            matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag == "equal":
+                    ops.append([offsets[i1], offsets[i2] - offsets[i1]])
+                elif j2 > j1:
+                    ops.append("".join(new_lines[j1:j2]))
+    if end:
+        ops.append([len(source) - end, end])
+    return [op for op in ops if op]
+
+
+def apply(source: str, ops: list) -> str:
+    return "".join(
+        source[op[0] : op[0] + op[1]] if isinstance(op, list) else op for op in ops  # noqa: E203
+    )
+
+
+def record(conn: sqlite3.Connection, old: sqlite3.Row, content: str | None, previous: str | None):
+    """Salva la versione ``old`` (riga prima dell'UPDATE) come revisione; niente commit.
+
+    ``content`` e' il testo nuovo e ``previous`` quello di ``old``, in
+    chiaro; None se il salvataggio non cambia il testo. Costo fisso: una
+    lettura della revisione precedente e il diff del tratto cambiato.
+    """
+    last = conn.execute(
+        "SELECT kind, depth FROM document_revisions WHERE doc_id = ? "
+        "ORDER BY version DESC LIMIT 1",
+        (old["id"],),
+    ).fetchone()
+    depth = last["depth"] if last else 0
+    data: str | bytes | None
+    if content is None or previous is None or content == previous:
+        kind, data = SAME, None
+    else:
+        delta = json.dumps(diff(content, previous), ensure_ascii=False, separators=(",", ":"))
+        if depth + 1 >= config.REVISION_SNAPSHOT_EVERY or len(delta) >= len(previous):
+            kind, text, depth = SNAPSHOT, previous, 0
+        else:
+            kind, text, depth = DELTA, delta, depth + 1
+        data = compression.encode(text, compression.encoder(conn))
+    conn.execute(
+        "INSERT INTO document_revisions "
+        "(doc_id, version, kind, depth, data, title, project, tags, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            old["id"],
+            old["version"],
+            kind,
+            depth,
+            data,
+            old["title"],
+            old["project"],
+            old["tags"],
+            old["updated_at"],
+        ),
+    )
+
+
+def record_same(conn: sqlite3.Connection, clause: str, params: list):
+    """Revisione SAME per ogni riga di documents che soddisfa ``clause``; niente commit.
+
+    Per gli UPDATE di soli metadati su molte righe, da chiamare prima: un solo
+    INSERT ... SELECT, la profondita' resta quella dell'ultima revisione.
+    """
+    conn.execute(
+        "INSERT INTO document_revisions "
+        "(doc_id, version, kind, depth, data, title, project, tags, updated_at) "
+        "SELECT id, version, ?, COALESCE((SELECT r.depth FROM document_revisions r "
+        "WHERE r.doc_id = documents.id ORDER BY r.version DESC LIMIT 1), 0), NULL, "
+        f"title, project, tags, updated_at FROM documents WHERE {clause}",  # noqa: S608
+        [SAME, *params],
+    )
+
+
+def history(conn: sqlite3.Connection, doc_id: int, limit: int, before: int | None = None):
+    """Revisioni di ``doc_id`` dalla piu' recente, con version < ``before``."""
+    return conn.execute(
+        "SELECT version, kind, title, project, tags, updated_at, "
+        "length(CAST(data AS BLOB)) AS stored_bytes FROM document_revisions "
+        "WHERE doc_id = ? AND version < ? ORDER BY version DESC LIMIT ?",
+        (doc_id, before if before is not None else 1 << 62, limit),
+    ).fetchall()
+
+
+def load(conn: sqlite3.Connection, doc_id: int, version: int) -> dict:
+    """La versione ``version`` di ``doc_id``: titolo, project, tag e content.
+
+    Si risale dalla revisione cercata al primo snapshot (o al documento) e
+    si applicano i delta all'indietro.
+    """
+    wanted = None
+    chain = []
+    base = None
+    for row in conn.execute(
+        "SELECT version, kind, data, title, project, tags, updated_at FROM document_revisions "
+        "WHERE doc_id = ? AND version >= ? ORDER BY version",
+        (doc_id, version),
+    ):
+        if wanted is None:
+            if row["version"] != version:
+                break
+            wanted = row
+        if row["kind"] == SNAPSHOT:
+            base = compression.text(row["data"])
+            break
+        if row["kind"] == DELTA:
+            chain.append(row["data"])
+    if wanted is None:
+        raise RevisionNotFound(f"Version {version} not found")
+    if base is None:
+        current = conn.execute("SELECT content FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        base = compression.text(current["content"])
+    for data in reversed(chain):
+        base = apply(base, json.loads(compression.text(data)))
+    return {
+        "version": wanted["version"],
+        "title": wanted["title"],
+        "content": base,
+        "project": wanted["project"],
+        "tags": wanted["tags"],
+        "updated_at": wanted["updated_at"],
+    }
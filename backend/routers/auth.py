@@ -6,7 +6,7 @@ from collections import defaultdict
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 
 from backend.auth import create_token, get_current_user, hash_password, verify_password
-from backend.database import get_db
+from backend.database import read_db, write_db
 from backend.models import LoginRequest, TokenResponse
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -37,7 +37,7 @@ def login(body: LoginRequest, request: Request):
     )
     _check_rate_limit(client_ip)
 
-    with get_db() as conn:
+    with read_db() as conn:
         row = conn.execute(
             "SELECT username, password_hash FROM users WHERE username = ?",
             (body.username,),
@@ -66,7 +66,7 @@ def change_password(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Cannot change another user's password",
         )
-    with get_db() as conn:
+    with write_db() as conn:
         conn.execute(
             "UPDATE users SET password_hash = ? WHERE username = ?",
             (hash_password(body.password), current_user),
@@ -3,14 +3,59 @@
 import asyncio
 import mimetypes
 import os
-
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+import tempfile
+from urllib.parse import quote
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.responses import FileResponse
-
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from backend import (
+    blobs,
+    caching,
+    compression,
+    config,
+    extraction,
+    importer,
+    previews,
+    revisions,
+    rows,
+    storage,
+    store,
+    textdiff,
+)
 from backend.auth import get_current_user
-from backend.config import UPLOAD_DIR
-from backend.database import get_db
-from backend.models import DocumentCreate, DocumentListItem, DocumentResponse, DocumentUpdate
+from backend.cursors import decode_cursor, encode_cursor
+from backend.database import changes_floor, changes_head, read_db, write_db
+from backend.events import publisher
+from backend.models import (
+    BatchRequest,
+    BatchResponse,
+    ChangesResponse,
+    DocumentCreate,
+    DocumentInfo,
+    DocumentListItem,
+    DocumentPatch,
+    DocumentResponse,
+    DocumentUpdate,
+    ImportResponse,
+    PreviewInfo,
+    RevisionInfo,
+    RevisionResponse,
+    RowsResponse,
+    TagCount,
+)
+from backend.store import subtree_clause
 
 router = APIRouter(prefix="/api/docs", tags=["documents"])
 
@@ -48,180 +93,864 @@ TEXT_EXTENSIONS = {
     ".xml",
     ".html",
     ".htm",
-    ".drawio",
 }
 MAX_FILE_SIZE = 50 * 1024 * 1024
-
-
-@router.get("", response_model=list[DocumentListItem])
-def list_documents(_user: str = Depends(get_current_user)):
-    with get_db() as conn:
+# Byte del multipart di /upload oltre al file: boundary, intestazioni, project e tags
+FORM_OVERHEAD = 64 * 1024
+
+LIST_FIELDS = (
+    "id",
+    "title",
+    "project",
+    "tags",
+    "file_name",
+    "file_type",
+    "created_at",
+    "updated_at",
+)
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+DEFAULT_ROWS = 100
+MAX_ROWS = 1000
+MAX_REVISIONS = 500
+
+
+def list_query(
+    limit: int,
+    cursor: str | None = None,
+    project: str | None = None,
+    tag: str | None = None,
+    file_type: str | None = None,
+    columns: tuple[str, ...] = LIST_FIELDS,
+    dense_tag: bool = False,
+    recursive: bool = True,
+) -> tuple[str, list]:
+    """Query keyset su (updated_at, id) per una pagina di ``limit`` + 1 righe.
+
+    Filtro per tag: per un tag raro si parte da document_tags (pochi id da
+    ordinare); per un tag diffuso (``dense_tag``) si scorre idx_docs_updated_id
+    e si verifica l'appartenenza sulla chiave di document_tags, fermandosi
+    dopo ``limit`` righe.
+
+    Con ``recursive=False`` solo i documenti direttamente nella cartella
+    (senza ``project``: gli Unsorted), come li mostra l'albero.
+    """
+    select = [c for c in LIST_FIELDS if c in columns or c in ("id", "updated_at")]
+    table = "documents"
+    where: list[str] = []
+    params: list = []
+    if not recursive and project and project.strip("/"):
+        where.append("project = ?")
+        params.append(project.strip("/"))
+    elif not recursive:
+        where.append("(project IS NULL OR project = '')")
+    elif project and project.strip("/"):
+        table = "documents INDEXED BY idx_docs_project"
+        clause, clause_params = subtree_clause(project)
+        where.append(clause)
+        params += clause_params
+    if tag and dense_tag:
+        where.append(
+            "EXISTS (SELECT 1 FROM document_tags WHERE doc_id = documents.id "
+            "AND tag_id = (SELECT id FROM tags WHERE name = ?))"
+        )
+        params.append(tag.strip())
+    elif tag:
+        where.append(
+            "id IN (SELECT doc_id FROM document_tags WHERE tag_id = "
+            "(SELECT id FROM tags WHERE name = ?))"
+        )
+        params.append(tag.strip())
+    if file_type:
+        where.append("file_type = ?")
+        params.append(file_type)
+    if cursor:
+        where.append("(updated_at, id) < (?, ?)")
+        params += decode_cursor(cursor, 2)
+    sql = f"SELECT {', '.join(select)} FROM {table}"  # noqa: S608
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
+def _tag_is_dense(conn, tag: str, limit: int) -> bool:
+    """Conviene scorrere l'indice temporale se il tag copre gran parte del vault.
+
+    Costo stimato: ordinare ``doc_count`` id contro leggere circa
+    ``limit * totale / doc_count`` righe; MAX(id) approssima il totale in O(1).
+    """
+    row = conn.execute(
+        "SELECT doc_count, (SELECT MAX(id) FROM documents) AS total FROM tags WHERE name = ?",
+        (tag.strip(),),
+    ).fetchone()
+    return bool(row) and row["doc_count"] ** 2 > (limit + 1) * (row["total"] or 0)
+
+
+def _parse_fields(fields: str | None) -> tuple[str, ...]:
+    if not fields:
+        return LIST_FIELDS
+    requested = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = set(requested) - set(LIST_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+        )
+    return ("id",) + requested
+
+
+@router.get("", response_model=list[DocumentListItem], response_model_exclude_unset=True)
+def list_documents(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    project: str | None = None,
+    tag: str | None = None,
+    file_type: str | None = None,
+    fields: str | None = None,
+    recursive: bool = True,
+    _user: str = Depends(get_current_user),
+):
+    """Pagina di documenti, dal piu' recente; il cursore successivo e' in X-Next-Cursor."""
+    columns = _parse_fields(fields)
+    with read_db() as conn:
+        dense = bool(tag) and _tag_is_dense(conn, tag, limit)
+        sql, params = list_query(limit, cursor, project, tag, file_type, columns, dense, recursive)
+        # Letto prima della pagina: i client ripartono da qui con /changes
+        response.headers["X-Change-Seq"] = str(changes_head(conn))
+        rows = conn.execute(sql, params).fetchall()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+    return [{c: r[c] for c in columns} for r in rows]
+
+
+@router.get("/changes", response_model=ChangesResponse)
+def list_changes(
+    since: int = Query(..., ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    _user: str = Depends(get_current_user),
+):
+    """Documenti cambiati dopo ``since``: stato attuale, o tombstone per i delete."""
+    with read_db() as conn:
+        head = changes_head(conn)
+        if since < changes_floor(conn) or since > head:
+            return {"changes": [], "next_since": head, "resync_required": True}
         rows = conn.execute(
-            "SELECT id, title, project, tags, file_name, file_type, "
-            "created_at, updated_at FROM documents ORDER BY updated_at DESC"
+            "SELECT c.seq, c.doc_id, c.op, c.updated_at AS changed, d.id, d.title, d.project, "
+            "d.tags, d.file_name, d.file_type, d.created_at, d.updated_at "
+            "FROM doc_changes c LEFT JOIN documents d ON d.id = c.doc_id "
+            "WHERE c.seq > ? ORDER BY c.seq LIMIT ?",
+            (since, limit + 1),
         ).fetchall()
-    return [dict(r) for r in rows]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [
+        {
+            "seq": r["seq"],
+            "id": r["doc_id"],
+            "op": r["op"],
+            "updated_at": r["changed"],
+            "document": {c: r[c] for c in LIST_FIELDS} if r["id"] is not None else None,
+        }
+        for r in rows
+    ]
+    next_since = rows[-1]["seq"] if has_more else max([head] + [r["seq"] for r in rows[-1:]])
+    return {"changes": changes, "next_since": next_since, "has_more": has_more}
 
 
 @router.post("", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
 def create_document(doc: DocumentCreate, _user: str = Depends(get_current_user)):
-    with get_db() as conn:
-        row = conn.execute(
-            "INSERT INTO documents (title, content, project, tags)"
-            " VALUES (?, ?, ?, ?) RETURNING *",
-            (doc.title, doc.content, doc.project, doc.tags),
-        ).fetchone()
-        conn.commit()
+    with write_db() as conn:
+        row = store.insert_document(
+            conn, title=doc.title, content=doc.content, project=doc.project, tags=doc.tags
+        )
+        store.commit(conn)
+        publisher.notify()
     return dict(row)
 
 
-def _write_file(file_path: str, data: bytes):
-    with open(file_path, "wb") as f:
-        f.write(data)
+def _store_upload(tmp_path, title, content, project, tags, file_name, file_type, size, sha256):
+    """Registra il blob, inserisce la riga, mette il file nel blob store e poi fa commit.
+
+    Eseguito in un thread: l'attesa del writer non deve bloccare l'event loop.
+    Se lo stesso contenuto e' gia' presente il file temporaneo viene scartato.
+    PDF e documenti Office entrano con content vuoto e un job di estrazione.
+    """
+    with write_db() as conn:
+        blobs.register(conn, sha256, size)
+        row = store.insert_document(
+            conn,
+            title=title,
+            content=content,
+            project=project,
+            tags=tags,
+            file_name=file_name,
+            file_type=file_type,
+            file_size=size,
+            file_sha256=sha256,
+        )
+        queued = not content and extraction.enqueue(conn, row["id"], file_name, sha256)
+        placed = blobs.put(tmp_path, sha256)
+        try:
+            conn.commit()
+        except BaseException:
+            if placed:
+                storage.discard(blobs.blob_path(sha256))
+            raise
+    publisher.notify()
+    if queued:
+        extraction.extractor.notify()
+    return row
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large (max 50MB)"
+    )
 
 
-@router.post("/upload", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
-async def upload_document(
-    file: UploadFile = File(...),
-    project: str = Form(default=None),
-    tags: str = Form(default=None),
-    _user: str = Depends(get_current_user),
-):
-    if not file.filename:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Filename is required")
-    safe_name = os.path.basename(file.filename)
-    ext = os.path.splitext(safe_name)[1].lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=f"File type {ext} not supported"
+class _UploadForm:
+    """Multipart di /upload letto mentre arriva: la parte ``file`` va dritta su disco.
+
+    Callback del parser di python-multipart. I dati del file finiscono in uno
+    storage.TempFile nella cartella dei blob, senza lo spool di Starlette in
+    /tmp; nome ed estensione si controllano appena arrivano le intestazioni
+    della parte, prima di scrivere. Intestazioni e campi di testo (``project``,
+    ``tags``) restano in memoria, al piu' FORM_OVERHEAD byte in tutto.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.fields: dict[str, str] = {}
+        self.file_name = ""
+        self.temp: storage.TempFile | None = None
+        self.complete = False
+        self._small = 0
+        self._headers: dict[bytes, bytes] = {}
+        self._header = bytearray()
+        self._value = bytearray()
+        self._name = ""
+        self._to_file = False
+        self._skip = False
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._part_begin,
+                "on_header_field": self._header_field,
+                "on_header_value": self._header_value,
+                "on_header_end": self._header_end,
+                "on_headers_finished": self._headers_finished,
+                "on_part_data": self._part_data,
+                "on_part_end": self._part_end,
+                "on_end": self._end,
+            },
         )
 
-    data = await file.read()
-    if len(data) > MAX_FILE_SIZE:
+    def feed(self, chunk: bytes):
+        self._parser.write(chunk)
+
+    def finish(self):
+        self._parser.finalize()
+
+    def discard(self):
+        if self.temp is not None:
+            self.temp.discard()
+
+    def _keep(self, buf: bytearray, data: bytes, start: int, end: int):
+        self._small += end - start
+        if self._small > FORM_OVERHEAD:
+            raise storage.FileTooLarge()
+        buf += data[start:end]
+
+    def _part_begin(self):
+        self._headers = {}
+        self._header, self._value = bytearray(), bytearray()
+
+    def _header_field(self, data: bytes, start: int, end: int):
+        self._keep(self._header, data, start, end)
+
+    def _header_value(self, data: bytes, start: int, end: int):
+        self._keep(self._value, data, start, end)
+
+    def _header_end(self):
+        self._headers[bytes(self._header).lower()] = bytes(self._value)
+        self._header, self._value = bytearray(), bytearray()
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._to_file = False
+        # Altre parti con un file oltre alla prima ``file`` si scartano
+        self._skip = b"filename" in options and (self._name != "file" or self.temp is not None)
+        if self._skip or b"filename" not in options:
+            return
+        self.file_name = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+        if not self.file_name:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Filename is required"
+            )
+        ext = os.path.splitext(self.file_name)[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"File type {ext} not supported"
+            )
+        self.temp = storage.TempFile(blobs.blob_dir(), MAX_FILE_SIZE)
+        self._to_file = True
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._to_file:
+            self.temp.write(data[start:end])
+        elif not self._skip:
+            self._keep(self._value, data, start, end)
+
+    def _part_end(self):
+        if not self._to_file and not self._skip and self._name:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+        self._value = bytearray()
+        self._to_file = False
+
+    def _end(self):
+        self.complete = True
+
+
+async def _receive_upload(request: Request) -> _UploadForm:
+    """Body di /upload da ``request.stream()``, con il limite applicato mentre arriva.
+
+    Un Content-Length oltre il limite si rifiuta prima di leggere; senza (chunked)
+    si contano i byte ricevuti. Nessun file temporaneo resta se la richiesta fallisce.
+    """
+    media_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if media_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Expected multipart/form-data"
+        )
+    limit = MAX_FILE_SIZE + FORM_OVERHEAD
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise _too_large()
+    form = _UploadForm(options[b"boundary"])
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise storage.FileTooLarge()
+            await asyncio.to_thread(form.feed, chunk)
+        form.finish()
+        if not form.complete:
+            raise MultipartParseError("Unexpected end of body")
+    except storage.FileTooLarge:
+        form.discard()
+        raise _too_large()
+    except MultipartParseError:
+        form.discard()
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="File too large (max 50MB)"
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed multipart body"
         )
+    except BaseException:
+        form.discard()
+        raise
+    if form.temp is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File is required")
+    return form
+
+
+def _ingest_upload(temp: storage.TempFile, ext, title, project, tags, file_name, file_type):
+    try:
+        tmp_path, size, sha256 = temp.close()
+        content = storage.read_text(tmp_path) if ext in TEXT_EXTENSIONS else ""
+        return _store_upload(
+            tmp_path, title, content, project, tags, file_name, file_type, size, sha256
+        )
+    finally:
+        temp.discard()
 
-    content = ""
-    if ext in TEXT_EXTENSIONS:
-        content = data.decode("utf-8", errors="replace")
 
+@router.post("/upload", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
+async def upload_document(request: Request, _user: str = Depends(get_current_user)):
+    """Carica un file: multipart con ``file`` e, facoltativi, ``project`` e ``tags``."""
+    form = await _receive_upload(request)
+    safe_name = form.file_name
+    ext = os.path.splitext(safe_name)[1].lower()
     file_type = mimetypes.guess_type(safe_name)[0] or "application/octet-stream"
     title = os.path.splitext(safe_name)[0]
+    row = await asyncio.to_thread(
+        _ingest_upload,
+        form.temp,
+        ext,
+        title,
+        form.fields.get("project"),
+        form.fields.get("tags"),
+        safe_name,
+        file_type,
+    )
+    return dict(row)
 
-    with get_db() as conn:
-        row = conn.execute(
-            "INSERT INTO documents (title, content, project, tags, file_name, file_type) "
-            "VALUES (?, ?, ?, ?, ?, ?) RETURNING *",
-            (title, content, project, tags, safe_name, file_type),
-        ).fetchone()
-        conn.commit()
-        doc_id = row["id"]
 
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(UPLOAD_DIR, f"{doc_id}_{safe_name}")
-    await asyncio.to_thread(_write_file, file_path, data)
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip": "import.zip",
+    "application/x-zip-compressed": "import.zip",
+    "application/x-tar": "import.tar",
+    "application/gzip": "import.tar.gz",
+    "application/x-gzip": "import.tar.gz",
+}
 
-    return dict(row)
+
+async def _spool_body(request: Request):
+    """Archivio inviato come body grezzo: su disco a chunk, con il limite di IMPORT_MAX_BYTES."""
+    os.makedirs(blobs.blob_dir(), exist_ok=True)
+    spool = tempfile.TemporaryFile(dir=blobs.blob_dir(), prefix=".import-")
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > config.IMPORT_MAX_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Import too large",
+                )
+            await asyncio.to_thread(spool.write, chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def _run_import(sources, project, tags) -> dict:
+    job = importer.Importer(
+        ALLOWED_EXTENSIONS, TEXT_EXTENSIONS, MAX_FILE_SIZE, project=project, tags=tags
+    )
+    try:
+        items = job.run(sources)
+    except importer.ImportRejected as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    counts = {"created": 0, "skipped": 0, "error": 0}
+    for item in items:
+        counts[item["status"]] += 1
+    return {
+        "created": counts["created"],
+        "skipped": counts["skipped"],
+        "failed": counts["error"],
+        "items": items,
+    }
+
+
+@router.post("/import", response_model=ImportResponse)
+async def import_documents(
+    request: Request,
+    project: str | None = Query(default=None),
+    tags: str | None = Query(default=None),
+    _user: str = Depends(get_current_user),
+):
+    """Import massivo: multipart con piu' ``files`` (anche zip/tar) o un archivio nel body.
+
+    Un risultato per file; gli errori dei singoli file non fermano gli altri.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "multipart/form-data":
+        # Starlette mette i file nello spool prima del conteggio dell'Importer:
+        # un body dichiarato oltre il limite non si legge nemmeno
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > config.IMPORT_MAX_BYTES + FORM_OVERHEAD:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Import too large"
+            )
+        form = await request.form(max_files=config.IMPORT_MAX_ITEMS)
+        try:
+            sources = [
+                (os.path.basename(f.filename or ""), f.file)
+                for f in form.getlist("files")
+                if not isinstance(f, str)
+            ]
+            if not sources:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail="No files to import"
+                )
+            return await asyncio.to_thread(_run_import, sources, project, tags)
+        finally:
+            await form.close()
+
+    name = ARCHIVE_CONTENT_TYPES.get(content_type)
+    if name is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send multipart files or a zip/tar archive",
+        )
+    spool = await _spool_body(request)
+    try:
+        return await asyncio.to_thread(_run_import, [(name, spool)], project, tags)
+    finally:
+        spool.close()
+
+
+def _accel_response(real_path: str, media_type: str | None, file_name: str, etag: str):
+    """Delega l'invio del file a nginx: qui restano solo auth e lookup nel DB.
+
+    nginx serve la location internal con sendfile, gestendo da se' Range e
+    If-Range; passa al client Content-Type, Content-Disposition e
+    Cache-Control della risposta originale. Le altre intestazioni le scarta,
+    ETag compreso: la location lo rimette da ``X-File-ETag``, cosi' resta
+    quello basato sullo SHA-256 e non mtime-size. I 304 li risponde gia' il
+    chiamante.
+    """
+    rel = os.path.relpath(real_path, os.path.realpath(config.UPLOAD_DIR))
+    quoted = quote(file_name)
+    if quoted != file_name:
+        disposition = f"attachment; filename*=utf-8''{quoted}"
+    else:
+        disposition = f'attachment; filename="{file_name}"'
+    return Response(
+        media_type=media_type or "application/octet-stream",
+        headers={
+            "X-Accel-Redirect": config.FILE_ACCEL_PREFIX.rstrip("/") + "/" + quote(rel),
+            "Content-Disposition": disposition,
+            "Cache-Control": caching.CACHE_CONTROL,
+            "ETag": etag,
+            "X-File-ETag": etag,
+        },
+    )
 
 
 @router.get("/{doc_id}/file")
-def get_document_file(doc_id: int, _user: str = Depends(get_current_user)):
-    with get_db() as conn:
+def get_document_file(doc_id: int, request: Request, _user: str = Depends(get_current_user)):
+    with read_db() as conn:
         row = conn.execute(
-            "SELECT file_name, file_type FROM documents WHERE id = ?", (doc_id,)
+            "SELECT file_name, file_type, file_sha256 FROM documents WHERE id = ?", (doc_id,)
         ).fetchone()
     if not row or not row["file_name"]:
         raise HTTPException(status_code=404, detail="No file attached")
 
-    file_path = os.path.join(UPLOAD_DIR, f"{doc_id}_{row['file_name']}")
-    if not os.path.exists(file_path):
+    file_path = blobs.resolve(doc_id, row["file_name"], row["file_sha256"])
+    if file_path is None:
         raise HTTPException(status_code=404, detail="File not found on disk")
 
     real_path = os.path.realpath(file_path)
-    if not real_path.startswith(os.path.realpath(UPLOAD_DIR)):
+    if not real_path.startswith(os.path.realpath(config.UPLOAD_DIR)):
         raise HTTPException(status_code=403, detail="Access denied")
 
+    stat = os.stat(real_path)
+    etag = caching.file_etag(row["file_sha256"], stat)
+    if caching.etag_matches(request.headers.get("if-none-match"), etag):
+        return caching.not_modified(etag)
+
+    if config.FILE_ACCEL_PREFIX:
+        return _accel_response(real_path, row["file_type"], row["file_name"], etag)
+
+    # Range / If-Range (206, resume dei download) li gestisce FileResponse con questo ETag
     return FileResponse(
         real_path,
         media_type=row["file_type"],
         filename=row["file_name"],
+        stat_result=stat,
+        headers={"ETag": etag, "Cache-Control": caching.CACHE_CONTROL},
+    )
+
+
+def _file_source(doc_id: int) -> tuple[str, str, str]:
+    """(path, estensione, chiave del contenuto) del file di ``doc_id``, o 404."""
+    with read_db() as conn:
+        row = conn.execute(
+            "SELECT file_name, file_sha256 FROM documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+    if not row or not row["file_name"]:
+        raise HTTPException(status_code=404, detail="No file attached")
+    file_path = blobs.resolve(doc_id, row["file_name"], row["file_sha256"])
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="File not found on disk")
+    key = row["file_sha256"]
+    if not key:
+        # File legacy fuori dal blob store: id, mtime e dimensione
+        key = f"{doc_id}-" + caching.file_etag(None, os.stat(file_path)).strip('"')
+    return file_path, os.path.splitext(row["file_name"])[1].lower(), key
+
+
+@router.get("/{doc_id}/preview", response_model=PreviewInfo)
+def get_document_preview(doc_id: int, _user: str = Depends(get_current_user)):
+    file_path, ext, key = _file_source(doc_id)
+    info = previews.file_info(key, file_path, ext)
+    return {**info, "version": key}
+
+
+@router.get("/{doc_id}/preview/{page}")
+def get_document_preview_page(
+    doc_id: int,
+    request: Request,
+    page: int = Path(ge=1),
+    size: int = Query(default=previews.SIZES[1], ge=1),
+    v: str | None = Query(default=None),
+    _user: str = Depends(get_current_user),
+):
+    """Immagine di una pagina; con ``v`` uguale alla versione del file, in cache per sempre."""
+    file_path, ext, key = _file_source(doc_id)
+    size = previews.snap(size)
+    etag = f'"{key}-{page}-{size}-{previews.VERSION}"'
+    cache_control = caching.IMMUTABLE if v == key else caching.CACHE_CONTROL
+    if caching.etag_matches(request.headers.get("if-none-match"), etag):
+        return caching.not_modified(etag, cache_control)
+    try:
+        data = previews.page_image(key, file_path, ext, page, size)
+    except previews.PreviewUnavailable as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    return Response(
+        content=data,
+        media_type=previews.media_type(data),
+        headers={"ETag": etag, "Cache-Control": cache_control},
     )
 
 
+@router.get("/{doc_id}/rows", response_model=RowsResponse)
+def get_document_rows(
+    doc_id: int,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=DEFAULT_ROWS, ge=1, le=MAX_ROWS),
+    columns: str | None = Query(default=None),
+    sheet: int = Query(default=0, ge=0),
+    _user: str = Depends(get_current_user),
+):
+    """Un intervallo di righe di un CSV o XLSX, con le colonne e il numero di righe.
+
+    ``columns`` e' un elenco di nomi separati da virgola; l'indice delle righe
+    si costruisce alla prima richiesta sul file.
+    """
+    file_path, ext, key = _file_source(doc_id)
+    try:
+        indexed = rows.sheets(key, file_path, ext)
+    except rows.RowsUnavailable as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    if sheet >= len(indexed):
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    selected = indexed[sheet]
+    names = [c["name"] for c in selected["columns"]]
+    wanted = list(range(len(names)))
+    if columns:
+        requested = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in requested if c not in names]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown columns: {', '.join(unknown)}",
+            )
+        wanted = [names.index(c) for c in requested]
+    return {
+        "sheet": sheet,
+        "sheets": [s["name"] for s in indexed],
+        "columns": [selected["columns"][i] for i in wanted],
+        "row_count": selected["row_count"],
+        "offset": offset,
+        "rows": rows.read(selected, file_path, offset, limit, wanted),
+    }
+
+
+@router.get("/{doc_id}/revisions", response_model=list[RevisionInfo])
+def list_revisions(
+    doc_id: int,
+    limit: int = Query(50, ge=1, le=MAX_REVISIONS),
+    before: int | None = Query(None, ge=1, description="Solo le versioni precedenti a questa"),
+    _user: str = Depends(get_current_user),
+):
+    """Versioni precedenti dalla piu' recente; la corrente e' il documento stesso."""
+    with read_db() as conn:
+        if not conn.execute("SELECT 1 FROM documents WHERE id = ?", (doc_id,)).fetchone():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+        return [dict(r) for r in revisions.history(conn, doc_id, limit, before)]
+
+
+@router.get("/{doc_id}/revisions/{version}", response_model=RevisionResponse)
+def get_revision(doc_id: int, version: int, _user: str = Depends(get_current_user)):
+    with read_db() as conn:
+        try:
+            return revisions.load(conn, doc_id, version)
+        except revisions.RevisionNotFound:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Revision not found")
+
+
+@router.post("/{doc_id}/revisions/{version}/restore", response_model=DocumentResponse)
+def restore_revision(doc_id: int, version: int, _user: str = Depends(get_current_user)):
+    """Riporta titolo, content, project e tag a ``version`` come nuova versione."""
+    with write_db() as conn:
+        try:
+            old = revisions.load(conn, doc_id, version)
+        except revisions.RevisionNotFound:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Revision not found")
+        row = store.update_document(
+            conn, doc_id, {k: old[k] for k in ("title", "content", "project", "tags")}
+        )
+        store.commit(conn)
+        publisher.notify()
+    return row
+
+
 @router.get("/{doc_id}", response_model=DocumentResponse)
-def get_document(doc_id: int, _user: str = Depends(get_current_user)):
-    with get_db() as conn:
+def get_document(
+    doc_id: int,
+    request: Request,
+    response: Response,
+    _user: str = Depends(get_current_user),
+):
+    with read_db() as conn:
         row = conn.execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
     if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-    return dict(row)
+    etag = caching.document_etag(row)
+    if caching.etag_matches(request.headers.get("if-none-match"), etag):
+        return caching.not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = caching.CACHE_CONTROL
+    return store.plain(row)
+
+
+def _check_base(conn, doc_id: int, if_match: str | None, version: int | None, columns: str):
+    """La riga corrente se e' la versione su cui il client ha lavorato, altrimenti 412.
+
+    Va chiamata nella transazione che scrive: il writer e' uno solo, quindi
+    nessun altro salvataggio si infila tra il controllo e l'UPDATE.
+    """
+    row = conn.execute(
+        f"SELECT id, version, created_at{columns} FROM documents WHERE id = ?",  # noqa: S608
+        (doc_id,),
+    ).fetchone()
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    etag = caching.document_etag(row)
+    if (if_match is not None and not caching.if_match(if_match, etag)) or (
+        version is not None and version != row["version"]
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"Document changed (now at version {row['version']})",
+            headers={"ETag": etag},
+        )
+    return row
 
 
 @router.put("/{doc_id}", response_model=DocumentResponse)
 def update_document(
     doc_id: int,
     doc: DocumentUpdate,
+    request: Request,
+    response: Response,
     _user: str = Depends(get_current_user),
 ):
-    with get_db() as conn:
-        existing = conn.execute("SELECT id FROM documents WHERE id = ?", (doc_id,)).fetchone()
-        if not existing:
+    """Sostituisce i campi inviati; con If-Match solo se il documento non e' cambiato."""
+    updates = doc.model_dump(exclude_none=True)
+    if_match = request.headers.get("if-match")
+    with write_db() as conn:
+        if if_match is not None:
+            _check_base(conn, doc_id, if_match, None, "")
+        row = store.update_document(conn, doc_id, updates)
+        if not row:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+        if updates:
+            store.commit(conn)
+            publisher.notify()
+
+    response.headers["ETag"] = caching.document_etag(row)
+    return dict(row)
 
-        updates = {}
-        if doc.title is not None:
-            updates["title"] = doc.title
-        if doc.content is not None:
-            updates["content"] = doc.content
-        if doc.project is not None:
-            updates["project"] = doc.project
-        if doc.tags is not None:
-            updates["tags"] = doc.tags
 
+@router.patch("/{doc_id}", response_model=DocumentInfo)
+def patch_document(
+    doc_id: int,
+    patch: DocumentPatch,
+    request: Request,
+    response: Response,
+    _user: str = Depends(get_current_user),
+):
+    """Applica ``edits`` al content della versione base e aggiorna i metadati inviati.
+
+    La base e' l'ETag in If-Match o ``version``: se il documento e' cambiato
+    nel frattempo risponde 412 senza scrivere (il client ricarica e riapplica).
+    Il client invia solo i tratti cambiati e riceve la nuova versione senza
+    content: un salvataggio costa quanto la modifica, non quanto il documento.
+    """
+    if_match = request.headers.get("if-match")
+    if if_match is None and patch.version is None:
+        raise HTTPException(
+            status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+            detail="Send If-Match or version",
+        )
+    updates = patch.model_dump(include={"title", "project", "tags"}, exclude_none=True)
+    with write_db() as conn:
+        columns = ", content" if patch.edits else ""
+        base = _check_base(conn, doc_id, if_match, patch.version, columns)
+        previous = None
+        if patch.edits:
+            previous = compression.text(base["content"])
+            try:
+                updates["content"] = textdiff.splice(
+                    previous, [(e.start, e.end, e.text) for e in patch.edits]
+                )
+            except textdiff.InvalidEdit as exc:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        row = store.update_document(conn, doc_id, updates, previous)
         if updates:
-            set_clause = ", ".join(f"{k} = ?" for k in updates)
-            values = list(updates.values())
-            row = conn.execute(
-                f"UPDATE documents SET {set_clause}, updated_at = CURRENT_TIMESTAMP "  # noqa: S608
-                "WHERE id = ? RETURNING *",
-                values + [doc_id],
-            ).fetchone()
-            conn.commit()
-        else:
-            row = conn.execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            store.commit(conn)
+            publisher.notify()
 
+    response.headers["ETag"] = caching.document_etag(row)
     return dict(row)
 
 
 @router.delete("/{doc_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_document(doc_id: int, _user: str = Depends(get_current_user)):
-    with get_db() as conn:
-        existing = conn.execute(
-            "SELECT file_name FROM documents WHERE id = ?", (doc_id,)
-        ).fetchone()
-        if not existing:
+    cleanup: list = []
+    with write_db() as conn:
+        if not store.delete_document(conn, doc_id, cleanup):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-
-        conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
-        conn.commit()
-
-    if existing["file_name"]:
-        file_path = os.path.join(UPLOAD_DIR, f"{doc_id}_{existing['file_name']}")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-
-@router.get("/meta/tags", response_model=list[str])
-def list_tags(_user: str = Depends(get_current_user)):
-    with get_db() as conn:
-        rows = conn.execute(
-            "SELECT DISTINCT tags FROM documents WHERE tags IS NOT NULL AND tags != ''"
-        ).fetchall()
-    all_tags = set()
-    for row in rows:
-        for tag in row["tags"].split(","):
-            tag = tag.strip()
-            if tag:
-                all_tags.add(tag)
-    return sorted(all_tags)
+        store.commit(conn, cleanup)
+        publisher.notify()
+
+
+@router.post("/batch", response_model=BatchResponse)
+def batch_documents(batch: BatchRequest, _user: str = Depends(get_current_user)):
+    """Update e delete misti in un'unica transazione: o passano tutti o nessuno."""
+    updated = deleted = 0
+    cleanup: list = []
+    with write_db() as conn:
+        for op in batch.operations:
+            if op.op == "delete":
+                found = store.delete_document(conn, op.id, cleanup)
+                deleted += 1
+            else:
+                updates = op.model_dump(include=set(store.UPDATABLE_FIELDS), exclude_none=True)
+                found = store.update_document(conn, op.id, updates) is not None
+                updated += 1
+            if not found:
+                # Il writer fa rollback all'uscita: i blob tornano dal cestino
+                store.restore(cleanup)
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail=f"Document {op.id} not found"
+                )
+        store.commit(conn, cleanup)
+        publisher.notify()
+    return {"updated": updated, "deleted": deleted}
+
+
+@router.get("/meta/tags", response_model=list[str] | list[TagCount])
+def list_tags(
+    with_counts: bool = False,
+    prefix: str | None = None,
+    limit: int | None = Query(default=None, ge=1, le=10000),
+    _user: str = Depends(get_current_user),
+):
+    """Tag distinti dall'indice ``tags`` (conteggi precalcolati), senza scansire i documenti."""
+    sql = "SELECT name, doc_count AS count FROM tags"
+    params: list = []
+    if prefix:
+        # Range sull'indice UNIQUE(name): O(risultato) anche con migliaia di tag
+        sql += " WHERE name >= ? AND name < ?"
+        params += [prefix, prefix + "\U0010ffff"]
+    sql += " ORDER BY doc_count DESC, name" if with_counts else " ORDER BY name"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with read_db() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    if with_counts:
+        return [dict(r) for r in rows]
+    return [r["name"] for r in rows]
@@ -0,0 +1,54 @@
+"""Router stream Server-Sent Events delle modifiche ai documenti."""
+
+import asyncio
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import StreamingResponse
+
+from backend.auth import get_current_user
+from backend.config import EVENTS_HEARTBEAT
+from backend.database import changes_floor, changes_head, read_db
+from backend.events import change_event, publisher, stream_events
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+def _replay(since: int) -> list[dict]:
+    with read_db() as conn:
+        if since < changes_floor(conn):
+            return [{"seq": changes_head(conn), "id": None, "op": "resync", "updated_at": None}]
+        rows = conn.execute(
+            "SELECT seq, doc_id, op, updated_at FROM doc_changes WHERE seq > ? ORDER BY seq",
+            (since,),
+        ).fetchall()
+    return [change_event(r) for r in rows]
+
+
+@router.get("")
+async def events(
+    last_event_id: str | None = Header(default=None),
+    _user: str = Depends(get_current_user),
+):
+    """Stream text/event-stream di create/update/move/delete (id evento = seq del change log)."""
+    # Iscrizione prima del replay: nessun evento cade tra i due
+    sub = publisher.subscribe()
+    replay = []
+    if last_event_id and last_event_id.isdigit():
+        try:
+            replay = await asyncio.to_thread(_replay, int(last_event_id))
+        except BaseException:
+            publisher.unsubscribe(sub)
+            raise
+
+    async def body():
+        try:
+            async for chunk in stream_events(sub, replay, EVENTS_HEARTBEAT):
+                yield chunk
+        finally:
+            publisher.unsubscribe(sub)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,124 @@
+"""Router cartelle (project): albero con conteggi e rename, move, delete di un sottoalbero."""
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+
+from backend import store
+from backend.auth import get_current_user
+from backend.database import changes_head, read_db, write_db
+from backend.events import publisher
+from backend.models import (
+    ProjectDelete,
+    ProjectMove,
+    ProjectNode,
+    ProjectRename,
+    ProjectUpdateResponse,
+)
+
+router = APIRouter(prefix="/api/projects", tags=["projects"])
+
+
+def _normalize(path: str | None) -> str:
+    return "/".join(p.strip() for p in (path or "").split("/") if p.strip())
+
+
+def _rewrite(path: str, new_path: str | None) -> dict:
+    if not path:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid path")
+    if new_path is not None and (new_path == path or new_path.startswith(path + "/")):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot move a folder into itself",
+        )
+    with write_db() as conn:
+        updated = store.rewrite_subtree(conn, path, new_path)
+        store.commit(conn)
+    if updated:
+        publisher.notify()
+    return {"path": path, "new_path": new_path, "updated": updated}
+
+
+@router.post("/rename", response_model=ProjectUpdateResponse)
+def rename_project(body: ProjectRename, _user: str = Depends(get_current_user)):
+    new_path = _normalize(body.new_path)
+    if not new_path:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid new path")
+    return _rewrite(_normalize(body.path), new_path)
+
+
+@router.post("/move", response_model=ProjectUpdateResponse)
+def move_project(body: ProjectMove, _user: str = Depends(get_current_user)):
+    path = _normalize(body.path)
+    name = path.rsplit("/", 1)[-1]
+    parent = _normalize(body.parent)
+    return _rewrite(path, f"{parent}/{name}" if parent else name)
+
+
+@router.post("/delete", response_model=ProjectUpdateResponse)
+def delete_project(body: ProjectDelete, _user: str = Depends(get_current_user)):
+    """Elimina la cartella: i documenti restano e finiscono in Unsorted."""
+    return _rewrite(_normalize(body.path), None)
+
+
+def _node(name: str, path: str) -> dict:
+    return {"name": name, "path": path, "doc_count": 0, "total_count": 0, "updated_at": None}
+
+
+def _build_tree(rows, root: str) -> dict:
+    """Albero annidato dalle righe di projects sotto ``root``, con totali e ultima modifica."""
+    top = {**_node(root.rsplit("/", 1)[-1], root), "children": {}}
+    for row in rows:
+        chain, node = [top], top
+        for part in [p for p in row["path"][len(root) :].split("/") if p]:  # noqa: E203
+            if part not in node["children"]:
+                path = f"{node['path']}/{part}" if node["path"] else part
+                node["children"][part] = {**_node(part, path), "children": {}}
+            node = node["children"][part]
+            chain.append(node)
+        node["doc_count"] += row["doc_count"]
+        for n in chain:
+            n["total_count"] += row["doc_count"]
+            if row["updated_at"] and (n["updated_at"] or "") < row["updated_at"]:
+                n["updated_at"] = row["updated_at"]
+    return top
+
+
+def _emit(node: dict, depth: int | None) -> dict:
+    """Serializza il nodo fino a ``depth`` livelli (None: tutto l'albero)."""
+    children = sorted(node["children"].values(), key=lambda c: c["name"])
+    expand = depth is None or depth > 0
+    return {
+        **node,
+        "has_children": bool(children),
+        "children": (
+            [_emit(c, None if depth is None else depth - 1) for c in children] if expand else None
+        ),
+    }
+
+
+@router.get("/tree", response_model=ProjectNode)
+def project_tree(
+    response: Response,
+    path: str | None = None,
+    depth: int | None = Query(default=None, ge=0),
+    _user: str = Depends(get_current_user),
+):
+    """Albero delle cartelle con conteggi, senza leggere i documenti.
+
+    Senza ``path`` la radice: ``doc_count`` sono i documenti Unsorted e
+    ``total_count`` tutto il vault. ``depth`` limita i livelli restituiti
+    (``depth=1``: solo i figli diretti, per espandere un nodo alla volta).
+    """
+    root = _normalize(path)
+    with read_db() as conn:
+        response.headers["X-Change-Seq"] = str(changes_head(conn))
+        if root:
+            clause, params = store.subtree_clause(root, column="path")
+            rows = conn.execute(
+                f"SELECT path, doc_count, updated_at FROM projects WHERE {clause}",  # noqa: S608
+                params,
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT path, doc_count, updated_at FROM projects").fetchall()
+    if root and not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+    return _emit(_build_tree(rows, root), depth)
@@ -1,41 +1,486 @@
 """Router ricerca full-text con SQLite FTS5."""
 
+import re
 import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from functools import partial
+from typing import Literal
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
 
+from backend import fts
 from backend.auth import get_current_user
-from backend.database import get_db
-from backend.models import SearchResult
+from backend.chunks import CHUNK_BASE
+from backend.config import SEARCH_TRIGRAM, SUGGEST_REFRESH_INTERVAL
+from backend.cursors import decode_cursor, encode_cursor
+from backend.database import (
+    apply_search_terms,
+    data_version,
+    read_db,
+    search_terms_diff,
+    search_terms_lag,
+    write_db,
+)
+from backend.fuzzy import FUZZY_MAX_WORDS, expand
+from backend.models import SearchPage, SearchResult, SearchSnippet, SearchSuggestions
+from backend.search_cache import search_cache
+from backend.store import subtree_clause
 
 router = APIRouter(prefix="/api/search", tags=["search"])
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_SNIPPET_IDS = 200
+MAX_SUGGESTIONS = 20
+SNIPPET = "snippet({table}, 1, '<mark>', '</mark>', '...', 32)"
+# Indice FTS5 per modalita': phrase e fuzzy su documents_fts (fuzzy con le
+# parole gia' espanse), substring su documents_trigram
+TABLES = {"phrase": "documents_fts", "fuzzy": "documents_fts", "substring": "documents_trigram"}
 
-@router.get("", response_model=list[SearchResult])
+
+def _match(q: str) -> str:
+    # Wrap in double quotes to treat as literal phrase (avoids FTS5 syntax errors)
+    return '"' + q.replace('"', '""') + '"'
+
+
+def _query(conn, q: str) -> str:
+    """Frase esatta; AND delle parole se l'indice attivo non ha le posizioni (detail)."""
+    if fts.active_options(conn).get("detail", "full") == "full":
+        return _match(q)
+    return " AND ".join(_match(w) for w in _tokens(q)) or _match(q)
+
+
+def _filters(project: str | None, tag: str | None, file_type: str | None) -> tuple[str, list]:
+    where: list[str] = []
+    params: list = []
+    if project and project.strip("/"):
+        clause, clause_params = subtree_clause(project, column="d.project")
+        where.append(clause)
+        params += clause_params
+    if tag:
+        where.append(
+            "d.id IN (SELECT doc_id FROM document_tags WHERE tag_id = "
+            "(SELECT id FROM tags WHERE name = ?))"
+        )
+        params.append(tag.strip())
+    if file_type:
+        where.append("d.file_type = ?")
+        params.append(file_type)
+    return "".join(f" AND {w}" for w in where), params
+
+
+# Le righe di un documento diviso in chunk: la sua (titolo, project, tag) e
+# quelle dei chunk, lette per range di rowid; {cond} limita a un cursore
+_DOC_ROWS = (
+    "SELECT f.rowid AS row, {rank} AS rank FROM documents_fts f "
+    "WHERE documents_fts MATCH :match AND f.rowid = :doc{cond} "
+    "UNION ALL SELECT f.rowid, {rank} FROM documents_fts f "
+    "CROSS JOIN document_chunks c ON c.id = f.rowid WHERE documents_fts MATCH :match "
+    "AND f.rowid BETWEEN (SELECT MIN(id) FROM document_chunks WHERE doc_id = :doc) "
+    "AND (SELECT MAX(id) FROM document_chunks WHERE doc_id = :doc) AND c.doc_id = :doc{cond} "
+    "ORDER BY rank, row LIMIT 1"
+)
+# Documento di una riga di documents_fts, per i filtri
+_DOC_ID = (
+    f"CASE WHEN f.rowid < {CHUNK_BASE} THEN f.rowid "
+    "ELSE (SELECT doc_id FROM document_chunks WHERE id = f.rowid) END"
+)
+
+
+def _first_row(conn, match: str, doc: int, before=None):
+    """Prima riga in ordine (rank, rowid) del documento chunked ``doc``, o fino a ``before``."""
+    rank = fts.bm25()
+    cond = f" AND ({rank}, f.rowid) <= (:rank, :row)" if before else ""
+    params = {"match": match, "doc": doc}
+    if before:
+        params.update(rank=before[0], row=before[1])
+    return conn.execute(_DOC_ROWS.format(rank=rank, cond=cond), params).fetchone()
+
+
+def _ranked(
+    conn, table: str, match: str, filters: str, params: list, after, limit: int
+) -> list[dict]:
+    """Id e rank dei ``limit`` + 1 documenti successivi ad ``after`` in ordine (rank, riga).
+
+    bm25() con rowid nell'ORDER BY: un top-N del sorter di SQLite, deterministico
+    anche sui pareggi, e il cursore e' un semplice confronto di row value. Su
+    documents_trigram niente bm25 (su una sottostringa comune supera il secondo):
+    i piu' recenti prima, leggendo l'indice per rowid decrescente.
+
+    Un documento diviso in chunk ha piu' righe: conta la prima (``row``, con
+    la sezione se e' un chunk), le altre si saltano; dopo un cursore si salta
+    anche il documento che ha una riga prima del cursore, gia' restituito. Se
+    i salti lasciano la pagina corta si legge il blocco successivo, doppio.
+    """
+    trigram = table == "documents_trigram"
+    rank = "NULL" if trigram else fts.bm25(table)
+    sql = f"SELECT f.rowid AS row, {rank} AS rank FROM {table} f"
+    if filters:
+        # CROSS JOIN: FTS5 resta il loop esterno, documents solo per i filtri
+        owner = "f.rowid" if trigram else _DOC_ID
+        sql += f" CROSS JOIN documents d ON d.id = {owner}"
+    sql += f" WHERE {table} MATCH ?{filters}"
+    params = [match, *params]
+    if trigram:
+        if after:
+            sql += " AND f.rowid < ?"
+            params.append(after[-1])
+        rows = conn.execute(f"{sql} ORDER BY f.rowid DESC LIMIT ?", [*params, limit + 1])
+        return [{"id": r["row"], "rank": None, "row": r["row"]} for r in rows]
+
+    results: list[dict] = []
+    seen: set[int] = set()
+    cursor, batch = after, limit + 1
+    while True:
+        page_sql, page_params = sql, params
+        if cursor:
+            page_sql += f" AND ({rank}, f.rowid) > (?, ?)"
+            page_params = [*params, *cursor]
+        rows = conn.execute(
+            f"{page_sql} ORDER BY rank, row LIMIT ?", [*page_params, batch]
+        ).fetchall()
+        docs, chunked = _owners(conn, [r["row"] for r in rows], after is not None)
+        for r in rows:
+            doc = docs.get(r["row"])
+            if doc is None or doc in seen:
+                continue
+            seen.add(doc)
+            if doc in chunked and _first_row(conn, match, doc, before=after):
+                continue
+            results.append({"id": doc, "rank": r["rank"], "row": r["row"]})
+            if len(results) > limit:
+                return results
+        if len(rows) < batch:
+            return results
+        cursor, batch = (rows[-1]["rank"], rows[-1]["row"]), batch * 2
+
+
+def _owners(conn, rows: list[int], flags: bool) -> tuple[dict[int, int], set[int]]:
+    """Documento di ogni riga e, con ``flags``, quali di questi sono divisi in chunk."""
+    docs = {r: r for r in rows if r < CHUNK_BASE}
+    chunk_rows = [r for r in rows if r >= CHUNK_BASE]
+    if chunk_rows:
+        placeholders = ", ".join("?" * len(chunk_rows))
+        docs.update(
+            conn.execute(
+                "SELECT id, doc_id FROM document_chunks "  # noqa: S608
+                f"WHERE id IN ({placeholders})",
+                chunk_rows,
+            ).fetchall()
+        )
+    chunked: set[int] = set()
+    if flags and docs:
+        ids = set(docs.values())
+        placeholders = ", ".join("?" * len(ids))
+        chunked = {
+            r[0]
+            for r in conn.execute(
+                f"SELECT id FROM documents WHERE chunked AND id IN ({placeholders})",  # noqa: S608
+                list(ids),
+            )
+        }
+    return docs, chunked
+
+
+def _empty_facets() -> dict[str, Counter]:
+    return {"project": Counter(), "tag": Counter(), "file_type": Counter()}
+
+
+def _facets(conn, table: str, filters: str, params: list) -> dict[str, Counter]:
+    """Conteggi per project, tag e file_type in una sola scansione dei risultati.
+
+    Il GROUP BY sulle tre colonne aggrega in SQLite (senza bm25, nessun ORDER BY);
+    in Python si ripartiscono solo le poche combinazioni distinte. Su
+    documents_fts si contano le righe dei documenti e poi i documenti trovati
+    solo nei loro chunk.
+    """
+    counts = _empty_facets()
+    queries = [
+        (
+            f"SELECT d.project, d.tags, d.file_type, COUNT(*) FROM {table} f "  # noqa: S608
+            f"JOIN documents d ON d.id = f.rowid WHERE {table} MATCH ? "
+            f"AND f.rowid < {CHUNK_BASE}{filters} GROUP BY d.project, d.tags, d.file_type",
+            params,
+        )
+    ]
+    if table == "documents_fts":
+        queries.append(
+            (
+                "SELECT d.project, d.tags, d.file_type, COUNT(DISTINCT c.doc_id) "
+                "FROM documents_fts f CROSS JOIN document_chunks c ON c.id = f.rowid "
+                "JOIN documents d ON d.id = c.doc_id WHERE documents_fts MATCH ? "
+                f"AND f.rowid >= {CHUNK_BASE}{filters} AND c.doc_id NOT IN ("
+                "SELECT rowid FROM documents_fts WHERE documents_fts MATCH ? "
+                f"AND rowid < {CHUNK_BASE}) GROUP BY d.project, d.tags, d.file_type",
+                [*params, params[0]],
+            )
+        )
+    for sql, query_params in queries:
+        for project, tags, file_type, n in conn.execute(sql, query_params):
+            counts["project"][project or ""] += n
+            counts["file_type"][file_type or ""] += n
+            for name in tags.split(",") if tags else ():
+                counts["tag"][name] += n
+    return counts
+
+
+def _hydrate(conn, match: str, rows: list[int], table: str = "documents_fts") -> dict[int, dict]:
+    """Titolo, snippet, project e tag delle sole righe ``rows``, per riga.
+
+    Una scansione FTS5 limitata al range di rowid delle righe (``+`` tiene l'IN
+    fuori dal vtab): costa meno di un seek con MATCH ripartito per ogni id, e
+    lo snippet si calcola solo per le righe che passano il filtro. Le righe
+    dei chunk hanno lo snippet della sezione e la sezione stessa.
+    """
+    details: dict[int, dict] = {}
+    snippet = SNIPPET.format(table=table)
+    doc_rows = [r for r in rows if r < CHUNK_BASE]
+    chunk_rows = [r for r in rows if r >= CHUNK_BASE]
+    if doc_rows:
+        placeholders = ", ".join("?" * len(doc_rows))
+        for r in conn.execute(
+            f"SELECT d.id, d.title, {snippet} AS snippet, "  # noqa: S608
+            f"d.project, d.tags FROM {table} f JOIN documents d ON d.id = f.rowid "
+            f"WHERE {table} MATCH ? AND f.rowid BETWEEN ? AND ? "
+            f"AND +f.rowid IN ({placeholders})",
+            [match, min(doc_rows), max(doc_rows), *doc_rows],
+        ):
+            details[r["id"]] = dict(r)
+    if chunk_rows:
+        placeholders = ", ".join("?" * len(chunk_rows))
+        for r in conn.execute(
+            f"SELECT f.rowid AS row, d.id, d.title, {snippet} AS snippet, "  # noqa: S608
+            "d.project, d.tags, c.heading, c.start, c.length FROM documents_fts f "
+            "CROSS JOIN document_chunks c ON c.id = f.rowid JOIN documents d ON d.id = c.doc_id "
+            "WHERE documents_fts MATCH ? AND f.rowid BETWEEN ? AND ? "
+            f"AND +f.rowid IN ({placeholders})",
+            [match, min(chunk_rows), max(chunk_rows), *chunk_rows],
+        ):
+            section = {"heading": r["heading"], "offset": r["start"], "length": r["length"]}
+            details[r["row"]] = {k: r[k] for k in ("id", "title", "snippet", "project", "tags")}
+            details[r["row"]]["section"] = section
+    return details
+
+
+def _fuzzy_match(conn, q: str) -> str:
+    """Parole in AND, ognuna in OR con le sue varianti del vocabolario (vedi fuzzy.expand)."""
+    groups = [" OR ".join(_match(v) for v in expand(conn, w)) for w in _tokens(q)]
+    return " AND ".join(f"({g})" for g in groups)
+
+
+def _run(
+    q: str, mode: str, limit: int, after, snippets: bool, facets: bool, filters: tuple
+) -> tuple:
+    """Esegue la ricerca: (corpo della risposta, cursore successivo o None)."""
+    table = TABLES[mode]
+    where, filter_params = _filters(*filters)
+    counts = _empty_facets()
+    try:
+        with read_db() as conn:
+            if mode == "fuzzy":
+                match = _fuzzy_match(conn, q)
+            else:
+                match = _query(conn, q) if mode == "phrase" else _match(q)
+            page = _ranked(conn, table, match, where, filter_params, after, limit)
+            if snippets:
+                # Snippet solo per le righe della pagina, non per tutti i risultati
+                details = _hydrate(conn, match, [r["row"] for r in page[:limit]], table)
+                page = [{**r, **details.get(r["row"], {})} for r in page]
+            if facets:
+                counts = _facets(conn, table, where, [match, *filter_params])
+    except sqlite3.OperationalError:
+        page = []
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1]["rank"], page[-1]["row"])
+    page = [{k: v for k, v in r.items() if k != "row"} for r in page]
+    if not facets:
+        return page, next_cursor
+    body = {
+        "total": counts["project"].total(),
+        "results": page,
+        "facets": {name: dict(c.most_common()) for name, c in counts.items()},
+    }
+    return body, next_cursor
+
+
+@router.get(
+    "",
+    response_model=list[SearchResult] | SearchPage,
+    response_model_exclude_unset=True,
+)
 def search(
+    response: Response,
     q: str = Query(..., min_length=1),
+    mode: Literal["phrase", "substring", "fuzzy"] = "phrase",
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    snippets: bool = True,
+    facets: bool = False,
+    project: str | None = None,
+    tag: str | None = None,
+    file_type: str | None = None,
     _user: str = Depends(get_current_user),
 ):
-    # Wrap in double quotes to treat as literal phrase (avoids FTS5 syntax errors)
-    safe_q = '"' + q.replace('"', '""') + '"'
+    """Risultati per rank; il cursore della pagina successiva e' in X-Next-Cursor.
+
+    Il cursore e' la coppia (rank, id) dell'ultima riga: nessun OFFSET e gli
+    snippet si calcolano solo per le righe restituite. ``snippets=false`` da'
+    solo id e rank (gli snippet delle righe mostrate con /snippets);
+    ``facets=true`` aggiunge i conteggi per project, tag e file_type su tutti
+    i risultati. Le risposte passano dalla search_cache, chiave normalizzata.
+
+    Con l'indice trigram (SEARCH_TRIGRAM): ``mode=substring`` trova ``q`` anche
+    dentro le parole (almeno 3 caratteri, i piu' recenti prima, senza rank);
+    ``mode=fuzzy`` tollera errori di battitura espandendo ogni parola sui
+    termini simili del vocabolario.
+    """
+    if mode != "phrase" and not SEARCH_TRIGRAM:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"mode={mode} requires the trigram index (SEARCH_TRIGRAM)",
+        )
+    after = decode_cursor(cursor, 2) if cursor else None
+    # Il tokenizer ignora maiuscole e spazi ripetuti: stessa chiave, stessi risultati
+    q = " ".join(q.lower().split())
+    if mode == "substring" and len(q) < 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Substring search needs at least 3 characters",
+        )
+    if mode == "fuzzy" and not 0 < len(_tokens(q)) <= FUZZY_MAX_WORDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Fuzzy search needs 1 to {FUZZY_MAX_WORDS} words",
+        )
+    filters = ((project or "").strip("/") or None, (tag or "").strip() or None, file_type)
+    key = (q, mode, limit, cursor, snippets, facets, filters)
+    with read_db() as conn:
+        version = data_version(conn)
+    body, next_cursor = search_cache.get(
+        version, key, partial(_run, q, mode, limit, after, snippets, facets, filters)
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return body
+
+
+@router.get(
+    "/snippets",
+    response_model=list[SearchSnippet],
+    response_model_exclude_unset=True,
+)
+def search_snippets(
+    q: str = Query(..., min_length=1),
+    ids: str = Query(..., min_length=1),
+    _user: str = Depends(get_current_user),
+):
+    """Snippet per i documenti ``ids`` (comma-separated) tra i risultati di ``q``.
+
+    Per un documento diviso in chunk, lo snippet della riga migliore con la sua sezione.
+    """
     try:
-        with get_db() as conn:
-            rows = conn.execute(
-                """
-                SELECT
-                    d.id,
-                    d.title,
-                    snippet(documents_fts, 1, '<mark>', '</mark>', '...', 32) AS snippet,
-                    d.project,
-                    d.tags
-                FROM documents_fts
-                JOIN documents d ON d.id = documents_fts.rowid
-                WHERE documents_fts MATCH ?
-                ORDER BY rank
-                LIMIT 50
-                """,
-                (safe_q,),
-            ).fetchall()
+        doc_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid ids")
+    if len(doc_ids) > MAX_SNIPPET_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many ids (max {MAX_SNIPPET_IDS})",
+        )
+    try:
+        with read_db() as conn:
+            match = _query(conn, q)
+            rows = {i: i for i in doc_ids}
+            for doc in _owners(conn, doc_ids, True)[1]:
+                best = _first_row(conn, match, doc)
+                if best:
+                    rows[doc] = best["row"]
+            details = _hydrate(conn, match, list(rows.values()))
     except sqlite3.OperationalError:
         return []
-    return [dict(r) for r in rows]
+    return [
+        {k: v for k, v in details[rows[i]].items() if k in ("id", "snippet", "section")}
+        for i in doc_ids
+        if rows[i] in details
+    ]
+
+
+_terms_refresh = threading.Lock()
+
+
+def _tokens(text: str) -> list[str]:
+    """Parole come le vede il tokenizer unicode61: minuscole, senza diacritici."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r"[^\W_]+", text)
+
+
+def _title_prefix(conn, words: list[str]) -> str:
+    """Parole del titolo con l'ultima come prefisso (senza filtro colonna con detail=none)."""
+    match = _query(conn, " ".join(words)) + "*"
+    if fts.active_options(conn).get("detail") == "none":
+        return match
+    return f"title : ({match})"
+
+
+def _refresh_terms():
+    """Riallinea search_terms; una sola esecuzione alla volta per processo."""
+    if not _terms_refresh.acquire(blocking=False):
+        return
+    try:
+        with read_db() as conn:
+            diff = search_terms_diff(conn)
+        with write_db() as conn:
+            apply_search_terms(conn, *diff)
+    finally:
+        _terms_refresh.release()
+
+
+@router.get("/suggest", response_model=SearchSuggestions)
+def search_suggest(
+    background: BackgroundTasks,
+    prefix: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(8, ge=1, le=MAX_SUGGESTIONS),
+    _user: str = Depends(get_current_user),
+):
+    """Completamenti dell'ultima parola di ``prefix`` mentre si digita.
+
+    ``terms``: termini dell'indice per document frequency, da search_terms
+    (riallineata dopo le scritture, in background e al piu' ogni
+    SUGGEST_REFRESH_INTERVAL secondi). ``titles``: i documenti piu' recenti il
+    cui titolo contiene la frase con l'ultima parola come prefisso, serviti
+    dagli indici prefix='2 3' (da due caratteri in su).
+    """
+    words = _tokens(prefix)
+    if not words:
+        return {"terms": [], "titles": []}
+    last, head = words[-1], " ".join(words[:-1] + [""])
+    with read_db() as conn:
+        terms = conn.execute(
+            "SELECT term, doc_count FROM search_terms WHERE term >= ? AND term < ? "
+            "ORDER BY doc_count DESC, term LIMIT ?",
+            (last, last + "\U0010ffff", limit),
+        ).fetchall()
+        titles = []
+        if len(last) >= 2:
+            titles = conn.execute(
+                "SELECT d.id, d.title FROM documents_fts f JOIN documents d ON d.id = f.rowid "
+                f"WHERE documents_fts MATCH ? AND f.rowid < {CHUNK_BASE} "
+                "ORDER BY f.rowid DESC LIMIT ?",
+                (_title_prefix(conn, words), limit),
+            ).fetchall()
+        lag, age = search_terms_lag(conn)
+    if lag > 0 and age >= SUGGEST_REFRESH_INTERVAL:
+        background.add_task(_refresh_terms)
+    return {
+        "terms": [
+            {"term": r["term"], "doc_count": r["doc_count"], "text": head + r["term"]}
+            for r in terms
+        ],
+        "titles": [dict(r) for r in titles],
+    }
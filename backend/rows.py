@@ -0,0 +1,255 @@
+"""Righe di CSV e XLSX a intervalli, raggiunte con un seek invece di rileggere il file.
+
+Alla prima richiesta il file si scorre una volta e in row_index si salvano
+colonne (nome e tipo), numero di righe e l'offset in byte di una riga ogni
+ROWS_STRIDE: la riga N si legge con un seek all'offset del suo blocco e al
+piu' ROWS_STRIDE - 1 righe scartate. I fogli XLSX sono XML compresso, dove
+il seek non si puo' fare: si convertono una volta in CSV in UPLOAD_DIR/rows
+e si indicizzano quelli. L'indice e' per contenuto (SHA-256 del file) e se
+ne va con il blob; i CSV derivati orfani li toglie ``python -m backend.blobs gc``.
+"""
+
+import array
+import codecs
+import csv
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import zipfile
+
+from backend import config, extractors, storage
+
+EXTENSIONS = {".csv", ".xlsx"}
+# Righe lette per dedurre il tipo delle colonne
+SCHEMA_SAMPLE = 1000
+_TYPES = (
+    ("integer", re.compile(r"[+-]?\d+")),
+    ("number", re.compile(r"[+-]?(?:\d+(?:[.,]\d*)?|[.,]\d+)(?:[eE][+-]?\d+)?")),
+    ("boolean", re.compile(r"true|false", re.I)),
+    ("date", re.compile(r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?Z?")),
+)
+
+
+class RowsUnavailable(Exception):
+    """File senza righe leggibili (formato non tabellare o corrotto)."""
+
+
+def derived_dir() -> str:
+    return os.path.join(config.UPLOAD_DIR, "rows")
+
+
+def _dialect(sample: str) -> dict:
+    """Separatore e virgolette dalle prime righe; excel se non si capisce."""
+    try:
+        sniffed = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        return {"delimiter": ",", "quotechar": '"'}
+    return {"delimiter": sniffed.delimiter, "quotechar": sniffed.quotechar or '"'}
+
+
+def _records(f, dialect: dict):
+    """(offset, celle) dei record da f (binario); un campo tra virgolette puo' andare a capo.
+
+    csv.reader chiede una riga alla volta e non legge oltre il record, quindi
+    dopo ogni record f.tell() e' l'inizio del successivo. Le righe vuote si saltano.
+    """
+
+    def lines():
+        for raw in iter(f.readline, b""):
+            yield raw.decode("utf-8", errors="replace")
+
+    offset = f.tell()
+    for cells in csv.reader(lines(), **dialect):
+        if cells:
+            yield offset, cells
+        offset = f.tell()
+
+
+def _column_type(values: list[str]) -> str:
+    values = [v.strip() for v in values if v.strip()]
+    for name, pattern in _TYPES:
+        if values and all(pattern.fullmatch(v) for v in values):
+            return name
+    return "text"
+
+
+def index_csv(path: str, dialect: dict | None = None) -> dict:
+    """Una passata sul file: colonne, righe (esclusa l'intestazione) e offset."""
+    stride = config.ROWS_STRIDE
+    with open(path, "rb") as f:
+        start = 3 if f.read(3) == codecs.BOM_UTF8 else 0
+        if dialect is None:
+            f.seek(start)
+            sample = f.read(64 * 1024).decode("utf-8", errors="replace")
+            dialect = _dialect(sample[: sample.rfind("\n") + 1] or sample)
+        f.seek(start)
+        records = _records(f, dialect)
+        header: list[str] = next(records, (start, []))[1]
+        offsets = array.array("Q")
+        sample_rows = []
+        count, width = 0, len(header)
+        for offset, cells in records:
+            if count % stride == 0:
+                offsets.append(offset)
+            if count < SCHEMA_SAMPLE:
+                sample_rows.append(cells)
+            width = max(width, len(cells))
+            count += 1
+    columns = []
+    for i in range(width):
+        name = header[i].strip() if i < len(header) else ""
+        values = [r[i] for r in sample_rows if i < len(r)]
+        columns.append({"name": name or f"column {i + 1}", "type": _column_type(values)})
+    return {
+        "dialect": dialect,
+        "columns": columns,
+        "row_count": count,
+        "stride": stride,
+        "offsets": offsets.tobytes(),
+    }
+
+
+def _index_xlsx(key: str, path: str) -> list[dict]:
+    """Ogni foglio in un CSV derivato, poi indicizzato come un CSV caricato."""
+    indexed = []
+    folder = os.path.join(derived_dir(), key[:2])
+    os.makedirs(folder, exist_ok=True)
+    for n, (name, rows) in enumerate(extractors.xlsx_sheets(path)):
+        target = os.path.join(folder, f"{key}-{n}.csv")
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerows(r for r in rows if any(r))
+            os.replace(tmp, target)
+        finally:
+            storage.discard(tmp)
+        index = index_csv(target, {"delimiter": ",", "quotechar": '"'})
+        source = os.path.relpath(target, config.UPLOAD_DIR)
+        indexed.append({**index, "name": name, "source": source})
+    return indexed
+
+
+def build(key: str, path: str, ext: str) -> list[dict]:
+    """Indice di ogni foglio del file (uno solo per i CSV)."""
+    if ext not in EXTENSIONS:
+        raise RowsUnavailable(f"No rows for {ext or 'this file'}")
+    try:
+        if ext == ".csv":
+            return [{**index_csv(path), "name": "", "source": None}]
+        indexed = _index_xlsx(key, path)
+    except csv.Error as exc:
+        raise RowsUnavailable(f"Unreadable CSV: {exc}") from exc
+    except (zipfile.BadZipFile, extractors.ExtractError, KeyError, ValueError) as exc:
+        raise RowsUnavailable(f"Unreadable spreadsheet: {exc}") from exc
+    if not indexed:
+        raise RowsUnavailable("No sheets in this file")
+    return indexed
+
+
+def _load(conn: sqlite3.Connection, key: str) -> list[dict]:
+    rows = conn.execute(
+        "SELECT sheet, name, source, dialect, columns, row_count, stride, offsets "
+        "FROM row_index WHERE key = ? ORDER BY sheet",
+        (key,),
+    ).fetchall()
+    found = []
+    for row in rows:
+        sheet = dict(row)
+        sheet["dialect"] = json.loads(sheet["dialect"])
+        sheet["columns"] = json.loads(sheet["columns"])
+        if sheet["source"] and not os.path.exists(_source(sheet, "")):
+            return []  # CSV derivato sparito: si ricostruisce
+        found.append(sheet)
+    return found
+
+
+def _save(conn: sqlite3.Connection, key: str, indexed: list[dict]):
+    conn.execute("DELETE FROM row_index WHERE key = ?", (key,))
+    conn.executemany(
+        "INSERT INTO row_index (key, sheet, name, source, dialect, columns, row_count, "
+        "stride, offsets) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                key,
+                n,
+                s["name"],
+                s["source"],
+                json.dumps(s["dialect"]),
+                json.dumps(s["columns"]),
+                s["row_count"],
+                s["stride"],
+                s["offsets"],
+            )
+            for n, s in enumerate(indexed)
+        ],
+    )
+
+
+_lock = threading.Lock()
+_flights: dict[str, threading.Lock] = {}
+
+
+def sheets(key: str, path: str, ext: str) -> list[dict]:
+    """Indice dei fogli del file con contenuto ``key``, costruito alla prima richiesta.
+
+    Richieste concorrenti per lo stesso file aspettano la prima invece di
+    rileggerlo; la lettura del file avviene fuori dalla transazione di scrittura.
+    """
+    from backend.database import read_db, write_db
+
+    with read_db() as conn:
+        found = _load(conn, key)
+    if found:
+        return found
+    with _lock:
+        flight = _flights.setdefault(key, threading.Lock())
+    try:
+        with flight:
+            with read_db() as conn:
+                found = _load(conn, key)
+            if found:
+                return found
+            built = build(key, path, ext)
+            with write_db() as conn:
+                _save(conn, key, built)
+                conn.commit()
+            for n, sheet in enumerate(built):
+                sheet["sheet"] = n
+            return built
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+
+
+def _source(sheet: dict, path: str) -> str:
+    return os.path.join(config.UPLOAD_DIR, sheet["source"]) if sheet["source"] else path
+
+
+def read(sheet: dict, path: str, offset: int, limit: int, columns: list[int]) -> list[list[str]]:
+    """Righe ``offset``..``offset + limit`` (da 0, intestazione esclusa), solo ``columns``."""
+    if offset >= sheet["row_count"] or limit <= 0:
+        return []
+    offsets = array.array("Q")
+    offsets.frombytes(sheet["offsets"])
+    block, skip = divmod(offset, sheet["stride"])
+    with open(_source(sheet, path), "rb") as f:
+        f.seek(offsets[block])
+        records = itertools.islice(_records(f, sheet["dialect"]), skip, skip + limit)
+        return [[cells[i] if i < len(cells) else "" for i in columns] for _, cells in records]
+
+
+def gc(conn: sqlite3.Connection) -> int:
+    """Rimuove i CSV derivati che nessun indice usa piu'."""
+    used = {r[0] for r in conn.execute("SELECT source FROM row_index WHERE source IS NOT NULL")}
+    removed = 0
+    for root, _, names in os.walk(derived_dir()):
+        for name in names:
+            path = os.path.join(root, name)
+            if not name.endswith(".tmp") and os.path.relpath(path, config.UPLOAD_DIR) not in used:
+                storage.discard(path)
+                removed += 1
+    return removed
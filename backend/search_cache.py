@@ -0,0 +1,118 @@
+"""Cache LRU in-process dei risultati di ricerca, con invalidazione sulla versione del DB."""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from backend.config import SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_TTL
+
+
+class SearchCache:
+    """LRU limitata in byte, con TTL e coalescenza delle richieste identiche.
+
+    Tutte le voci appartengono a una sola versione dei dati (vedi
+    database.data_version): ogni scrittura sui documenti, anche da un altro
+    worker, la fa avanzare e alla prima richiesta successiva le voci vecchie
+    vengono scartate in blocco. Richieste identiche concorrenti aspettano il
+    calcolo della prima invece di rieseguire la query.
+    """
+
+    def __init__(self, max_bytes: int = SEARCH_CACHE_MAX_BYTES, ttl: float = SEARCH_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # key -> (scadenza, byte, valore)
+        self._inflight: dict[tuple, Future] = {}
+        self._version = None
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, version, key, compute):
+        """Valore per ``key`` alla ``version`` dei dati; ``compute()`` solo se manca."""
+        if self.max_bytes <= 0:
+            return compute()
+        flight = (version, key)
+        with self._lock:
+            self._sync(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._drop(key)
+            waiter = self._inflight.get(flight)
+            leader = waiter is None
+            if leader:
+                waiter = self._inflight[flight] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return waiter.result()
+
+        try:
+            value = compute()
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[flight]
+            waiter.set_exception(exc)
+            raise
+        with self._lock:
+            del self._inflight[flight]
+            if version == self._version:
+                self._store(key, value)
+        waiter.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _sync(self, version):
+        if version == self._version:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        self._version = version
+
+    def _store(self, key, value):
+        size = len(json.dumps(value, default=str)) + len(repr(key))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+
+search_cache = SearchCache()
@@ -0,0 +1,115 @@
+"""Scrittura su disco dei file caricati: streaming a chunk, hash e rename atomico."""
+
+import codecs
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+def fsync_dir(path: str):
+    """Rende durevole un rename dentro ``path`` (no-op dove non supportato)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_file(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class TempFile:
+    """File temporaneo dentro ``dest_dir`` scritto a pezzi man mano che arrivano.
+
+    Il limite di dimensione e' verificato a ogni write() e lo SHA-256 e'
+    calcolato al volo: in memoria resta al massimo il pezzo in scrittura.
+    close() restituisce (path temporaneo, dimensione, sha256 hex) con il file
+    gia' su disco (fsync, a meno di ``sync=False``: allora tocca al chiamante
+    con fsync_file); discard() lo elimina.
+    """
+
+    def __init__(self, dest_dir: str, max_size: int):
+        os.makedirs(dest_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+        self._out = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+        self._max_size = max_size
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self._max_size:
+            raise FileTooLarge()
+        self._digest.update(chunk)
+        self._out.write(chunk)
+
+    def close(self, sync: bool = True) -> tuple[str, int, str]:
+        self._out.flush()
+        if sync:
+            os.fsync(self._out.fileno())
+        self._out.close()
+        return self.path, self.size, self._digest.hexdigest()
+
+    def discard(self):
+        self._out.close()
+        discard(self.path)
+
+
+def stream_to_temp(
+    src: BinaryIO, dest_dir: str, max_size: int, sync: bool = True
+) -> tuple[str, int, str]:
+    """Copia ``src`` a chunk in un TempFile dentro ``dest_dir``; restituisce TempFile.close()."""
+    temp = TempFile(dest_dir, max_size)
+    try:
+        while chunk := src.read(CHUNK_SIZE):
+            temp.write(chunk)
+        return temp.close(sync)
+    except BaseException:
+        temp.discard()
+        raise
+
+
+def read_text(path: str) -> str:
+    """Decodifica UTF-8 incrementale dal disco (byte invalidi sostituiti)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts = []
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def place(tmp_path: str, final_path: str, sync: bool = True):
+    """Rename atomico nella posizione definitiva, reso durevole con fsync della directory.
+
+    Con ``sync=False`` l'fsync della directory resta a carico del chiamante
+    (l'import lo fa una volta per directory invece che per file).
+    """
+    os.replace(tmp_path, final_path)
+    if sync:
+        fsync_dir(os.path.dirname(final_path))
+
+
+def discard(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,188 @@
+"""Scritture sui documenti condivise dai router (singole, batch e per cartella).
+
+Le funzioni lavorano sulla connessione writer gia' aperta e non fanno commit:
+chi le chiama decide quante operazioni far stare in una transazione e chiude
+con commit(), che sistema anche i file dei blob rimossi.
+"""
+
+import sqlite3
+
+from backend import blobs, chunks, compression, revisions, storage
+
+UPDATABLE_FIELDS = ("title", "content", "project", "tags")
+
+
+def subtree_clause(path: str, column: str = "project") -> tuple[str, list]:
+    """Filtro su ``column`` per una cartella e tutte le sue sottocartelle.
+
+    Il range [path, path + '0') e' un'unica scansione di idx_docs_project
+    ('0' segue '/' in ASCII); la condizione residua scarta i fratelli come
+    ``path-old`` che cadono nello stesso range.
+    """
+    path = path.strip("/")
+    return (
+        f"{column} >= ? AND {column} < ? AND ({column} = ? OR {column} >= ?)",
+        [path, path + "0", path, path + "/"],
+    )
+
+
+def normalize_tags(tags: str | None) -> list[str]:
+    """Tag da stringa comma-separated: spazi rimossi, duplicati e vuoti scartati."""
+    return [t for t in dict.fromkeys(t.strip() for t in (tags or "").split(",")) if t]
+
+
+def tags_value(names: list[str]) -> str | None:
+    """Forma canonica della colonna ``tags`` ("a,b"), None se non ci sono tag."""
+    return ",".join(names) or None
+
+
+def set_tags(conn: sqlite3.Connection, doc_id: int, names: list[str], replace: bool = True):
+    """Allinea document_tags ai tag del documento; i conteggi li tengono i trigger."""
+    if replace:
+        conn.execute("DELETE FROM document_tags WHERE doc_id = ?", (doc_id,))
+    if not names:
+        return
+    conn.executemany(
+        "INSERT INTO tags (name) VALUES (?) ON CONFLICT(name) DO NOTHING", [(n,) for n in names]
+    )
+    placeholders = ", ".join("?" for _ in names)
+    conn.execute(
+        f"INSERT INTO document_tags (tag_id, doc_id) SELECT id, ? FROM tags "  # noqa: S608
+        f"WHERE name IN ({placeholders})",
+        [doc_id, *names],
+    )
+
+
+def plain(row: sqlite3.Row | None, content: str | None = None) -> dict | None:
+    """La riga come dict con content in chiaro (``content`` se gia' noto)."""
+    if row is None:
+        return None
+    doc = dict(row)
+    doc["content"] = compression.text(doc["content"]) if content is None else content
+    return doc
+
+
+def insert_document(conn: sqlite3.Connection, **fields):
+    """INSERT di un documento (colonne in ``fields``) con tag e chunk; restituisce la riga.
+
+    content si salva nel formato del vault (backend.compression), la riga
+    restituita lo ha in chiaro.
+    """
+    names = normalize_tags(fields.get("tags"))
+    fields["tags"] = tags_value(names)
+    content = fields.get("content")
+    fields["chunked"] = int(chunks.needed(conn, content))
+    if content:
+        fields["content"] = compression.encode(content, compression.encoder(conn))
+    columns = ", ".join(fields)
+    placeholders = ", ".join("?" for _ in fields)
+    row = conn.execute(
+        f"INSERT INTO documents ({columns}) VALUES ({placeholders}) RETURNING *",  # noqa: S608
+        list(fields.values()),
+    ).fetchone()
+    set_tags(conn, row["id"], names, replace=False)
+    if row["chunked"]:
+        chunks.sync(conn, row["id"], content)
+    return plain(row, content)
+
+
+def update_document(
+    conn: sqlite3.Connection, doc_id: int, updates: dict, previous: str | None = None
+):
+    """Applica ``updates`` (sottoinsieme di UPDATABLE_FIELDS); None se l'id non esiste.
+
+    Per un documento diviso in chunk si reindicizzano solo i chunk cambiati.
+    La versione sostituita va nello storico (backend.revisions); ``previous``
+    e' il suo content in chiaro, se chi chiama l'ha gia' letto. La riga
+    restituita ha content in chiaro.
+    """
+    updates = {k: v for k, v in updates.items() if k in UPDATABLE_FIELDS}
+    if not updates:
+        return plain(conn.execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone())
+    # La versione sostituita, per lo storico; il content solo se cambia
+    columns = "id, title, project, tags, version, updated_at"
+    if "content" in updates and previous is None:
+        columns += ", content"
+    old = conn.execute(
+        f"SELECT {columns} FROM documents WHERE id = ?", (doc_id,)  # noqa: S608
+    ).fetchone()
+    if old is None:
+        return None
+    names = None
+    if "tags" in updates:
+        names = normalize_tags(updates["tags"])
+        updates["tags"] = tags_value(names)
+    content = updates.get("content")
+    if "content" in updates:
+        updates["chunked"] = int(chunks.needed(conn, content))
+        updates["content"] = compression.encode(content, compression.encoder(conn))
+    set_clause = ", ".join(f"{k} = ?" for k in updates)
+    row = conn.execute(
+        f"UPDATE documents SET {set_clause}, version = version + 1, "  # noqa: S608
+        "updated_at = CURRENT_TIMESTAMP WHERE id = ? RETURNING *",
+        [*updates.values(), doc_id],
+    ).fetchone()
+    if "content" not in updates:
+        previous = None
+    elif previous is None:
+        previous = compression.text(old["content"])
+    revisions.record(conn, old, content, previous)
+    if names is not None:
+        set_tags(conn, doc_id, names)
+    if "content" in updates:
+        chunks.sync(conn, doc_id, content if row["chunked"] else None, previous)
+    return plain(row, content)
+
+
+def delete_document(conn: sqlite3.Connection, doc_id: int, cleanup: list) -> bool:
+    """Elimina la riga e rilascia il blob; i file da sistemare finiscono in ``cleanup``."""
+    row = conn.execute(
+        "DELETE FROM documents WHERE id = ? RETURNING file_name, file_sha256", (doc_id,)
+    ).fetchone()
+    if not row:
+        return False
+    # Il blob si rimuove solo con l'ultimo riferimento
+    trash = blobs.release(conn, row["file_sha256"])
+    legacy = blobs.legacy_path(doc_id, row["file_name"]) if row["file_name"] else None
+    cleanup.append((trash, row["file_sha256"], legacy))
+    return True
+
+
+def rewrite_subtree(conn: sqlite3.Connection, path: str, new_path: str | None) -> int:
+    """Sposta ``path`` e le sue sottocartelle sotto ``new_path`` (None: Unsorted).
+
+    Un solo UPDATE sul range di idx_docs_project: i trigger aggiornano FTS e
+    change log riga per riga, ma commit e fsync sono uno solo. Lo storico
+    riceve una revisione SAME per documento (project e version cambiano).
+    """
+    clause, params = subtree_clause(path)
+    revisions.record_same(conn, clause, params)
+    if new_path is None:
+        set_clause, set_params = "project = NULL", []
+    else:
+        set_clause, set_params = "project = ? || substr(project, ?)", [new_path, len(path) + 1]
+    return conn.execute(
+        f"UPDATE documents INDEXED BY idx_docs_project SET {set_clause}, "  # noqa: S608
+        f"version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE {clause}",
+        set_params + params,
+    ).rowcount
+
+
+def commit(conn: sqlite3.Connection, cleanup: list | None = None):
+    """Commit; poi elimina i blob nel cestino e i file legacy, o li ripristina se fallisce."""
+    cleanup = cleanup or []
+    try:
+        conn.commit()
+    except BaseException:
+        restore(cleanup)
+        raise
+    for trash, _sha256, legacy in cleanup:
+        blobs.purge(trash)
+        if legacy:
+            storage.discard(legacy)
+
+
+def restore(cleanup: list):
+    """Rimette a posto i blob spostati nel cestino quando la transazione non va a buon fine."""
+    for trash, sha256, _legacy in reversed(cleanup):
+        blobs.restore(trash, sha256)
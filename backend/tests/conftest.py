@@ -1,6 +1,7 @@
 """Shared fixtures for MD Vault backend tests."""
 
 import importlib
+import io
 import os
 
 # Set env vars BEFORE any backend imports
@@ -54,3 +55,34 @@ def auth_header(client):
     assert resp.status_code == 200, f"Login failed: {resp.text}"
     token = resp.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture()
+def create_doc(client, auth_header):
+    """Return a helper that creates a document via the API and returns its JSON."""
+
+    def create(title, content="x", **fields):
+        resp = client.post(
+            "/api/docs", json={"title": title, "content": content, **fields}, headers=auth_header
+        )
+        assert resp.status_code == 201, resp.text
+        return resp.json()
+
+    return create
+
+
+@pytest.fixture()
+def upload_file(client, auth_header):
+    """Return a helper that uploads a file and returns the new document id."""
+
+    def upload(name, body, **data):
+        resp = client.post(
+            "/api/docs/upload",
+            files={"file": (name, io.BytesIO(body))},
+            data=data,
+            headers=auth_header,
+        )
+        assert resp.status_code == 201, resp.text
+        return resp.json()["id"]
+
+    return upload
@@ -0,0 +1,130 @@
+"""Tests for the content-addressed blob store."""
+
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+
+def _refcount(sha256):
+    from backend.database import read_db
+
+    with read_db() as conn:
+        row = conn.execute("SELECT refcount FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    return row["refcount"] if row else None
+
+
+class TestBlobStore:
+    """Tests for upload dedup and reference counting."""
+
+    def test_same_content_stored_once(self, client, auth_header, upload_file):
+        from backend import blobs
+
+        body = b"%PDF-1.4 same bytes"
+        sha256 = hashlib.sha256(body).hexdigest()
+        ids = [upload_file("a.pdf", body, project=p) for p in ("one", "two", "three")]
+
+        path = blobs.blob_path(sha256)
+        assert path.endswith(os.path.join(sha256[:2], sha256[2:4], sha256))
+        assert os.path.exists(path)
+        assert _refcount(sha256) == 3
+        for doc_id in ids:
+            resp = client.get(f"/api/docs/{doc_id}/file", headers=auth_header)
+            assert resp.content == body
+
+        info = client.get("/api/system-info", headers=auth_header).json()["storage"]
+        assert info["blobs"] == 1
+        assert info["dedup_ratio"] == 3.0
+        assert info["legacy_files"] == 0
+
+    def test_blob_removed_with_last_reference(self, client, auth_header, upload_file):
+        from backend import blobs
+
+        body = b"%PDF-1.4 shared"
+        sha256 = hashlib.sha256(body).hexdigest()
+        first = upload_file("a.pdf", body)
+        second = upload_file("b.pdf", body)
+
+        client.delete(f"/api/docs/{first}", headers=auth_header)
+        assert _refcount(sha256) == 1
+        assert client.get(f"/api/docs/{second}/file", headers=auth_header).content == body
+
+        client.delete(f"/api/docs/{second}", headers=auth_header)
+        assert _refcount(sha256) is None
+        assert not os.path.exists(blobs.blob_path(sha256))
+        assert os.listdir(blobs.trash_dir()) == []
+
+
+class TestMigration:
+    """Tests for moving legacy {id}_{name} files into the blob store."""
+
+    def test_migrate_legacy_files(self, client, auth_header):
+        from backend import blobs
+        from backend.database import write_db
+
+        body = b"legacy bytes"
+        sha256 = hashlib.sha256(body).hexdigest()
+        with write_db() as conn:
+            ids = [
+                conn.execute(
+                    "INSERT INTO documents (title, file_name, file_type) "
+                    "VALUES ('Old', 'old.pdf', 'application/pdf') RETURNING id"
+                ).fetchone()["id"]
+                for _ in range(2)
+            ]
+            conn.commit()
+        for doc_id in ids:
+            with open(blobs.legacy_path(doc_id, "old.pdf"), "wb") as f:
+                f.write(body)
+
+        # Served from the legacy path until migrated
+        assert client.get(f"/api/docs/{ids[0]}/file", headers=auth_header).content == body
+        info = client.get("/api/system-info", headers=auth_header).json()["storage"]
+        assert info["legacy_files"] == 2
+
+        assert blobs.migrate() == 2
+        assert _refcount(sha256) == 2
+        assert not os.path.exists(blobs.legacy_path(ids[0], "old.pdf"))
+        assert client.get(f"/api/docs/{ids[1]}/file", headers=auth_header).content == body
+        info = client.get("/api/system-info", headers=auth_header).json()["storage"]
+        assert info["legacy_files"] == 0
+        assert info["blobs"] == 1
+
+    def test_gc_removes_orphans(self, client, auth_header):
+        from backend import blobs
+
+        orphan = blobs.blob_path("f" * 64)
+        os.makedirs(os.path.dirname(orphan), exist_ok=True)
+        with open(orphan, "wb") as f:
+            f.write(b"orphan")
+        assert blobs.gc() == 1
+        assert not os.path.exists(orphan)
+
+    def test_gc_waits_for_uncommitted_upload(self, client, auth_header, tmp_path):
+        from backend import blobs
+        from backend.database import read_db, write_db
+
+        body = b"%PDF-1.4 uploaded while gc runs"
+        sha256 = hashlib.sha256(body).hexdigest()
+        tmp = tmp_path / "upload.tmp"
+        tmp.write_bytes(body)
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        # Come _store_upload: riga e file nel blob store, commit dopo
+        with write_db() as conn:
+            blobs.register(conn, sha256, len(body))
+            assert blobs.put(str(tmp), sha256)
+            gc = subprocess.Popen(
+                [sys.executable, "-c", "from backend import blobs; print(blobs.gc())"],
+                cwd=root,
+                env={**os.environ, "PYTHONPATH": root},
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            time.sleep(1)
+            conn.commit()
+        out, _ = gc.communicate(timeout=60)
+        assert gc.returncode == 0 and out.split()[-1] == "0"
+        assert os.path.exists(blobs.blob_path(sha256))
+        with read_db() as conn:
+            assert conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
@@ -0,0 +1,203 @@
+"""Tests for chunked indexing of large documents and section-level search hits."""
+
+import pytest
+
+
+def _markdown(sections: int = 12, marker: str = "") -> str:
+    parts = []
+    for i in range(sections):
+        lines = [f"line {j} of section {i} with filler words lorem ipsum dolor" for j in range(8)]
+        parts.append(f"## Section {i}\nkeyword{i} {marker}\n" + "\n".join(lines) + "\n\n")
+    return "".join(parts)
+
+
+def _search(client, auth_header, q, **params):
+    resp = client.get("/api/search", params={"q": q, **params}, headers=auth_header)
+    assert resp.status_code == 200
+    return resp
+
+
+def _chunks(doc_id):
+    from backend.database import read_db
+
+    with read_db() as conn:
+        return conn.execute(
+            "SELECT id, seq, start, length, heading FROM document_chunks WHERE doc_id = ? "
+            "ORDER BY seq",
+            (doc_id,),
+        ).fetchall()
+
+
+@pytest.fixture()
+def small_chunks(monkeypatch):
+    monkeypatch.setenv("CHUNK_THRESHOLD", "2000")
+    monkeypatch.setenv("CHUNK_SIZE", "512")
+
+
+class TestSplit:
+    """Tests for chunks.split()."""
+
+    def test_cuts_before_headings_and_covers_content(self):
+        from backend import chunks
+
+        content = _markdown() + "```\n# not a heading\n```\n"
+        parts = chunks.split(content, 512)
+        assert "".join(body for _, _, body in parts) == content
+        for start, heading, body in parts:
+            assert content.startswith(body, start)
+            assert len(body.encode()) <= 4 * 512
+            if body.startswith("## Section"):
+                assert heading == body.split("\n")[0][3:]
+        assert not any(h == "not a heading" for _, h, _ in parts)
+        assert "Section 11" in {h for _, h, _ in parts}
+
+    def test_edit_moves_only_nearby_cuts(self):
+        from backend import chunks
+
+        text = "".join(f"paragraph {i} " * (i % 7 + 1) + "\n" for i in range(2000))
+        before = [body for _, _, body in chunks.split(text, 512)]
+        edited = text.replace("paragraph 1000 ", "paragraph 1000 edited ", 1)
+        after = [body for _, _, body in chunks.split(edited, 512)]
+        assert len(before) > 20
+        assert len(set(after) - set(before)) <= 2
+
+    def test_long_lines_split_on_character_boundaries(self):
+        from backend import chunks
+
+        content = "è" * 5000
+        parts = chunks.split(content, 512)
+        assert "".join(body for _, _, body in parts) == content
+        assert all(len(body.encode()) <= 4 * 512 for _, _, body in parts)
+
+
+class TestChunkedDocuments:
+    """Tests for storing, searching and editing chunked documents."""
+
+    def test_search_returns_matching_section(self, small_chunks, client, auth_header, create_doc):
+        content = _markdown()
+        doc_id = create_doc("Big notes", content)["id"]
+        create_doc("Small", "keyword7 appears here too")
+        assert len(_chunks(doc_id)) > 1
+
+        results = _search(client, auth_header, "keyword7").json()
+        assert sorted(r["title"] for r in results) == ["Big notes", "Small"]
+        hit = next(r for r in results if r["id"] == doc_id)
+        section = hit["section"]
+        assert section["heading"] == "Section 7"
+        offset = section["offset"]
+        assert 0 <= content.find("keyword7", offset) - offset < section["length"]
+        assert "<mark>keyword7</mark>" in hit["snippet"]
+        assert "section" not in next(r for r in results if r["id"] != doc_id)
+
+        # Il titolo resta sulla riga del documento
+        assert [r["id"] for r in _search(client, auth_header, "big").json()] == [doc_id]
+        resp = client.get(
+            "/api/search/snippets",
+            params={"q": "keyword3", "ids": str(doc_id)},
+            headers=auth_header,
+        )
+        assert resp.json()[0]["section"]["heading"] == "Section 3"
+
+    def test_edit_reindexes_only_changed_chunks(
+        self, small_chunks, client, auth_header, create_doc
+    ):
+        content = _markdown()
+        doc_id = create_doc("Big", content)["id"]
+        before = {r["id"]: r["heading"] for r in _chunks(doc_id)}
+        edited = content.replace("keyword5", "keyword5 replacement", 1)
+        resp = client.put(f"/api/docs/{doc_id}", json={"content": edited}, headers=auth_header)
+        assert resp.status_code == 200
+        after = {r["id"]: r["heading"] for r in _chunks(doc_id)}
+        assert len(set(after) - set(before)) == 1
+        assert after[max(after)] == "Section 5"
+        assert [r["id"] for r in _search(client, auth_header, "replacement").json()] == [doc_id]
+        resp = client.put(f"/api/docs/{doc_id}", json={"tags": "big"}, headers=auth_header)
+        assert {r["id"] for r in _chunks(doc_id)} == set(after)
+
+        # Sotto la soglia il documento torna indicizzato intero
+        resp = client.put(
+            f"/api/docs/{doc_id}", json={"content": "short keyword5"}, headers=auth_header
+        )
+        assert _chunks(doc_id) == []
+        hits = _search(client, auth_header, "keyword5").json()
+        assert [r["id"] for r in hits] == [doc_id] and "section" not in hits[0]
+
+    def test_edit_resplits_only_around_change(self, small_chunks, client, auth_header, create_doc):
+        import random
+
+        from backend import chunks, compression, maintenance, store
+        from backend.database import write_db
+
+        rng = random.Random(3)
+        pieces = ["```\n", "## Title\n", "è" * 700 + "\n", "x\r\n", "plain words here\n"]
+        content = "".join(rng.choice(pieces) for _ in range(600))
+        doc_id = create_doc("Big", content)["id"]
+        ids = {r["id"] for r in _chunks(doc_id)}
+        reindexed = 0
+        for _ in range(60):
+            start = rng.randrange(len(content))
+            end = start + rng.choice([0, 3, 300])
+            edited = content[:start] + rng.choice(pieces + ["z"]) + content[end:]
+            with write_db() as conn:
+                store.update_document(conn, doc_id, {"content": edited})
+                conn.commit()
+                rows = conn.execute(
+                    "SELECT id, seq, start, heading, body FROM document_chunks WHERE doc_id = ? "
+                    "ORDER BY seq",
+                    (doc_id,),
+                ).fetchall()
+            # Stessi chunk dello split intero, ma ridivisi solo vicino all'edit
+            assert [r["seq"] for r in rows] == list(range(len(rows)))
+            parts = [(r["start"], r["heading"], compression.text(r["body"])) for r in rows]
+            assert parts == chunks.split(edited, 512)
+            reindexed += len({r["id"] for r in rows} - ids)
+            content, ids = edited, {r["id"] for r in rows}
+        # Un ``` aggiunto o tolto cambia i titoli fino al blocco successivo
+        assert len(rows) > 100 and reindexed < 3 * 60
+        assert maintenance.run_task("integrity")["ok"]
+
+    def test_pages_and_facets_count_documents_once(
+        self, small_chunks, client, auth_header, create_doc
+    ):
+        from backend import maintenance
+
+        ids = [create_doc(f"Doc {i}", _markdown(marker="common"))["id"] for i in range(3)]
+        small = create_doc("Small", "common")["id"]
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+            resp = _search(client, auth_header, "common", **params)
+            seen += [r["id"] for r in resp.json()]
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert sorted(seen) == sorted(ids + [small])
+
+        body = _search(client, auth_header, "common", facets="true").json()
+        assert body["total"] == 4 and body["facets"]["project"] == {"": 4}
+
+        client.delete(f"/api/docs/{ids[0]}", headers=auth_header)
+        assert _chunks(ids[0]) == []
+        assert len(_search(client, auth_header, "common").json()) == 3
+        assert maintenance.run_task("integrity")["ok"]
+
+    def test_rechunk_and_rebuild(self, client, auth_header, create_doc, monkeypatch):
+        from backend import chunks, config, fts
+        from backend.database import write_db
+
+        doc_id = create_doc("Big", _markdown())["id"]
+        assert _chunks(doc_id) == []
+        monkeypatch.setattr(config, "CHUNK_THRESHOLD", 2000)
+        monkeypatch.setattr(config, "CHUNK_SIZE", 512)
+        with write_db() as conn:
+            assert chunks.rechunk(conn) == 1
+            assert chunks.rechunk(conn) == 0
+        assert len(_chunks(doc_id)) > 1
+
+        assert fts.rebuild("stemmed", batch=4)
+        hit = _search(client, auth_header, "keyword9").json()[0]
+        assert hit["id"] == doc_id and hit["section"]["heading"] == "Section 9"
+        with write_db() as conn:
+            conn.execute(
+                "INSERT INTO documents_fts(documents_fts, rank) VALUES ('integrity-check', 1)"
+            )
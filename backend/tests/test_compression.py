@@ -0,0 +1,166 @@
+"""Tests for compressed content storage and the migration between storage modes."""
+
+import threading
+
+import pytest
+
+
+def _note(i: int) -> str:
+    return (
+        f"# Meeting notes {i}\n"
+        "Attendees: the platform team and the release managers.\n"
+        f"Action items: deploy build {i} to staging, then update the runbook.\n"
+        "Status: waiting for the security review before production rollout.\n"
+    )
+
+
+def _settle():
+    """Aspetta la migrazione lanciata all'avvio."""
+    for thread in threading.enumerate():
+        if thread.name == "content-migrate":
+            thread.join()
+
+
+def _storage_types():
+    from backend.database import read_db
+
+    with read_db() as conn:
+        docs = {r[0] for r in conn.execute("SELECT typeof(content) FROM documents")}
+        bodies = {r[0] for r in conn.execute("SELECT typeof(body) FROM document_chunks")}
+    return docs, bodies
+
+
+def _integrity():
+    from backend import fts
+    from backend.database import write_db
+
+    with write_db() as conn:
+        for table in fts.existing_tables(conn):
+            if table != "search_terms_trigram":
+                conn.execute(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)")
+
+
+@pytest.fixture()
+def small_chunks(monkeypatch):
+    monkeypatch.setenv("CHUNK_THRESHOLD", "2000")
+    monkeypatch.setenv("CHUNK_SIZE", "512")
+
+
+@pytest.fixture()
+def compressed(small_chunks, monkeypatch):
+    monkeypatch.setenv("CONTENT_COMPRESSION", "zlib")
+    monkeypatch.setenv("SEARCH_TRIGRAM", "true")
+    import backend.routers.search
+
+    monkeypatch.setattr(backend.routers.search, "SEARCH_TRIGRAM", True)
+
+
+class TestCompressedVault:
+    """Tests for reads, writes and search on a vault with CONTENT_COMPRESSION=zlib."""
+
+    def test_round_trip_and_snippets(self, compressed, client, auth_header, create_doc):
+        _settle()
+        doc = create_doc("Standup", _note(1))
+        assert doc["content"] == _note(1)
+        big = "".join(f"## Part {i}\n" + _note(i) * 6 + "\n" for i in range(10))
+        big_id = create_doc("Handbook", big)["id"]
+        short_id = create_doc("Short", "tiny")["id"]
+        assert _storage_types() == ({"blob", "text"}, {"blob"})
+
+        resp = client.get(f"/api/docs/{doc['id']}", headers=auth_header)
+        assert resp.json()["content"] == _note(1)
+        assert client.get(f"/api/docs/{big_id}", headers=auth_header).json()["content"] == big
+        assert client.get(f"/api/docs/{short_id}", headers=auth_header).json()["content"] == "tiny"
+
+        resp = client.put(
+            f"/api/docs/{doc['id']}",
+            json={"content": _note(1).replace("staging", "kubernetes")},
+            headers=auth_header,
+        )
+        assert "kubernetes" in resp.json()["content"]
+        hits = client.get("/api/search", params={"q": "kubernetes"}, headers=auth_header).json()
+        assert [h["id"] for h in hits] == [doc["id"]]
+        assert "<mark>kubernetes</mark>" in hits[0]["snippet"]
+        hits = client.get("/api/search", params={"q": "staging"}, headers=auth_header).json()
+        assert {h["id"] for h in hits} == {big_id}
+        params = {"q": "ubernet", "mode": "substring"}
+        hits = client.get("/api/search", params=params, headers=auth_header).json()
+        assert [h["id"] for h in hits] == [doc["id"]]
+
+        assert client.delete(f"/api/docs/{big_id}", headers=auth_header).status_code == 204
+        _integrity()
+
+        stats = client.get("/api/system-info", headers=auth_header).json()["compression"]
+        assert stats["mode"] == "zlib" and stats["migrating"] is False
+
+    def test_dictionary_for_small_notes(self, compressed, client, auth_header, create_doc):
+        from backend import compression
+        from backend.database import read_db, write_db
+
+        _settle()
+        for i in range(compression.TRAIN_MIN_DOCS):
+            create_doc(f"Note {i}", _note(i))
+        with write_db() as conn:
+            dict_id = compression.train(conn)
+            enc = compression.encoder(conn)
+        assert dict_id and enc[0] == dict_id
+        with_dict = compression.encode(_note(999), enc)
+        without = compression.encode(_note(999), (0, b""))
+        assert len(with_dict) < len(without) / 2
+        assert compression.text(with_dict) == compression.text(without) == _note(999)
+
+        doc_id = create_doc("New", _note(1000))["id"]
+        with read_db() as conn:
+            stored = conn.execute(
+                "SELECT content FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+        assert stored[0][0] == compression.DEFLATE_DICT
+        # Un altro processo non ha il dizionario in memoria: lo legge dal database
+        compression._dicts.clear()
+        resp = client.get(f"/api/docs/{doc_id}", headers=auth_header)
+        assert resp.json()["content"] == _note(1000)
+
+
+class TestMigration:
+    """Tests for compress/decompress of an existing vault."""
+
+    def test_both_ways_without_changes(
+        self, small_chunks, client, auth_header, create_doc, monkeypatch
+    ):
+        from backend import compression, config, fts
+        from backend.database import read_db
+
+        ids = [create_doc(f"Note {i}", _note(i))["id"] for i in range(25)]
+        big = "".join(f"## Part {i}\n" + _note(i) * 6 + "\n" for i in range(10))
+        create_doc("Handbook", big)
+        client.put(f"/api/docs/{ids[0]}", json={"content": _note(100)}, headers=auth_header)
+        with read_db() as conn:
+            head = conn.execute("SELECT MAX(seq) FROM doc_changes").fetchone()[0]
+            versions = conn.execute("SELECT id, version FROM documents").fetchall()
+        assert _storage_types() == ({"text"}, {"text"})
+
+        monkeypatch.setattr(config, "CONTENT_COMPRESSION", "zlib")
+        progress: list[int] = []
+        assert compression.migrate(batch=4, progress=progress.append)
+        assert progress[-1] > 25 and not compression.migrate()
+        assert _storage_types() == ({"blob"}, {"blob"})
+        with read_db() as conn:
+            assert fts.text_function(conn) == fts.TEXT_FUNCTION
+            status = compression.status(conn, sizes=True)
+        assert status["dictionary"] and status["documents"]["ratio"] < 0.5
+        _integrity()
+        hits = client.get("/api/search", params={"q": "runbook"}, headers=auth_header).json()
+        assert len(hits) == 26 and all("<mark>" in h["snippet"] for h in hits)
+        rev = client.get(f"/api/docs/{ids[0]}/revisions/1", headers=auth_header).json()
+        assert rev["content"] == _note(0)
+
+        monkeypatch.setattr(config, "CONTENT_COMPRESSION", "none")
+        assert compression.migrate(batch=4)
+        assert _storage_types() == ({"text"}, {"text"})
+        with read_db() as conn:
+            assert fts.text_function(conn) == ""
+            assert conn.execute("SELECT MAX(seq) FROM doc_changes").fetchone()[0] == head
+            assert conn.execute("SELECT id, version FROM documents").fetchall() == versions
+        _integrity()
+        resp = client.get(f"/api/docs/{ids[3]}", headers=auth_header)
+        assert resp.json()["content"] == _note(3)
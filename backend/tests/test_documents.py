@@ -1,6 +1,7 @@
 """Tests for document CRUD endpoints."""
 
 import io
+import os
 
 
 class TestListDocuments:
@@ -32,6 +33,197 @@ class TestListDocuments:
         # List response should NOT include content field
         assert "content" not in data[0]
 
+    def test_keyset_pagination(self, client, auth_header):
+        for i in range(5):
+            client.post(
+                "/api/docs", json={"title": f"Doc {i}", "content": "x"}, headers=auth_header
+            )
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            resp = client.get("/api/docs", params=params, headers=auth_header)
+            assert resp.status_code == 200
+            seen += [d["id"] for d in resp.json()]
+            pages += 1
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert pages == 3
+        # Same-second updated_at ties are broken by id, newest first
+        assert seen == sorted(seen, reverse=True)
+        assert len(set(seen)) == 5
+
+    def test_invalid_cursor(self, client, auth_header):
+        resp = client.get("/api/docs", params={"cursor": "not-a-cursor"}, headers=auth_header)
+        assert resp.status_code == 400
+
+    def test_project_subtree_filter(self, client, auth_header):
+        for project in ["infra", "infra/k3s", "infra/k3s/helm", "infra-old", "infrastructure"]:
+            client.post(
+                "/api/docs",
+                json={"title": project, "content": "x", "project": project},
+                headers=auth_header,
+            )
+
+        resp = client.get("/api/docs", params={"project": "infra"}, headers=auth_header)
+        assert sorted(d["project"] for d in resp.json()) == [
+            "infra",
+            "infra/k3s",
+            "infra/k3s/helm",
+        ]
+
+    def test_project_filter_uses_index_range_scan(self, client):
+        from backend.database import read_db
+        from backend.routers.documents import list_query
+
+        sql, params = list_query(10, project="infra")
+        with read_db() as conn:
+            plan = " ".join(r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        assert "idx_docs_project (project>? AND project<?)" in plan
+
+    def test_tag_and_file_type_filters(self, client, auth_header):
+        client.post(
+            "/api/docs",
+            json={"title": "A", "content": "x", "tags": "python,web"},
+            headers=auth_header,
+        )
+        client.post(
+            "/api/docs",
+            json={"title": "B", "content": "x", "tags": "ops, python"},
+            headers=auth_header,
+        )
+        client.post(
+            "/api/docs",
+            json={"title": "C", "content": "x", "tags": "pythonic"},
+            headers=auth_header,
+        )
+        client.post(
+            "/api/docs/upload",
+            files={"file": ("notes.txt", io.BytesIO(b"hi"), "text/plain")},
+            data={"tags": "python"},
+            headers=auth_header,
+        )
+
+        resp = client.get("/api/docs", params={"tag": "python"}, headers=auth_header)
+        assert sorted(d["title"] for d in resp.json()) == ["A", "B", "notes"]
+
+        resp = client.get(
+            "/api/docs",
+            params={"tag": "python", "file_type": "text/plain"},
+            headers=auth_header,
+        )
+        assert [d["title"] for d in resp.json()] == ["notes"]
+
+    def test_fields_projection(self, client, auth_header):
+        client.post(
+            "/api/docs",
+            json={"title": "Proj", "content": "x", "project": "p", "tags": "a"},
+            headers=auth_header,
+        )
+
+        resp = client.get("/api/docs", params={"fields": "title,tags"}, headers=auth_header)
+        assert resp.status_code == 200
+        assert resp.json() == [{"id": 1, "title": "Proj", "tags": ["a"]}]
+
+        resp = client.get("/api/docs", params={"fields": "content"}, headers=auth_header)
+        assert resp.status_code == 400
+
+
+class TestChanges:
+    """Tests for GET /api/docs/changes."""
+
+    def test_list_reports_change_seq(self, client, auth_header, create_doc):
+        resp = client.get("/api/docs", headers=auth_header)
+        assert resp.headers["X-Change-Seq"] == "0"
+        create_doc("A")
+        resp = client.get("/api/docs", headers=auth_header)
+        assert resp.headers["X-Change-Seq"] == "1"
+
+    def test_returns_only_changed_rows(self, client, auth_header, create_doc):
+        a = create_doc("A")["id"]
+        b = create_doc("B", project="p1")["id"]
+        since = int(client.get("/api/docs", headers=auth_header).headers["X-Change-Seq"])
+
+        client.put(f"/api/docs/{a}", json={"title": "A2"}, headers=auth_header)
+        client.put(f"/api/docs/{b}", json={"project": "p2"}, headers=auth_header)
+        c = create_doc("C")["id"]
+        client.delete(f"/api/docs/{c}", headers=auth_header)
+
+        resp = client.get("/api/docs/changes", params={"since": since}, headers=auth_header)
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["resync_required"] is False
+        ops = {ch["id"]: ch["op"] for ch in data["changes"]}
+        assert ops == {a: "update", b: "move", c: "delete"}
+        by_id = {ch["id"]: ch for ch in data["changes"]}
+        assert by_id[a]["document"]["title"] == "A2"
+        assert by_id[b]["document"]["project"] == "p2"
+        # Tombstone: no document payload
+        assert by_id[c]["document"] is None
+
+        resp = client.get(
+            "/api/docs/changes", params={"since": data["next_since"]}, headers=auth_header
+        )
+        assert resp.json()["changes"] == []
+        assert resp.json()["next_since"] == data["next_since"]
+
+    def test_log_keeps_one_row_per_document(self, client, auth_header, create_doc):
+        a = create_doc("A")["id"]
+        for i in range(5):
+            client.put(f"/api/docs/{a}", json={"title": f"A{i}"}, headers=auth_header)
+
+        resp = client.get("/api/docs/changes", params={"since": 0}, headers=auth_header)
+        changes = resp.json()["changes"]
+        assert len(changes) == 1
+        assert changes[0]["seq"] == 6
+
+    def test_paging(self, client, auth_header, create_doc):
+        for i in range(3):
+            create_doc(f"D{i}")
+
+        resp = client.get(
+            "/api/docs/changes", params={"since": 0, "limit": 2}, headers=auth_header
+        )
+        data = resp.json()
+        assert data["has_more"] is True
+        assert len(data["changes"]) == 2
+        resp = client.get(
+            "/api/docs/changes", params={"since": data["next_since"]}, headers=auth_header
+        )
+        assert [ch["seq"] for ch in resp.json()["changes"]] == [3]
+
+    def test_resync_after_compaction(self, client, auth_header, create_doc):
+        from backend.database import changes_floor, compact_changes, write_db
+
+        a = create_doc("A")["id"]
+        create_doc("B")
+        client.delete(f"/api/docs/{a}", headers=auth_header)
+        with write_db() as conn:
+            assert compact_changes(conn, retention_days=-1) == 1
+
+        resp = client.get("/api/docs/changes", params={"since": 1}, headers=auth_header)
+        assert resp.json()["resync_required"] is True
+        resp = client.get("/api/docs/changes", params={"since": 3}, headers=auth_header)
+        assert resp.json()["resync_required"] is False
+
+        # La soglia non scende: vault_meta.value e' TEXT, il confronto e' tra interi
+        with write_db() as conn:
+            conn.execute("UPDATE vault_meta SET value = '100' WHERE key = 'changes_floor'")
+            conn.commit()
+        b = create_doc("C")["id"]
+        client.delete(f"/api/docs/{b}", headers=auth_header)
+        with write_db() as conn:
+            assert compact_changes(conn, retention_days=-1) == 1
+            assert changes_floor(conn) == 100
+
+    def test_future_cursor_requires_resync(self, client, auth_header):
+        resp = client.get("/api/docs/changes", params={"since": 999}, headers=auth_header)
+        assert resp.json()["resync_required"] is True
+
 
 class TestCreateDocument:
     """Tests for POST /api/docs."""
@@ -98,6 +290,27 @@ class TestGetDocument:
         resp = client.get("/api/docs/99999", headers=auth_header)
         assert resp.status_code == 404
 
+    def test_conditional_get(self, client, auth_header):
+        doc_id = client.post(
+            "/api/docs", json={"title": "Cached", "content": "v1"}, headers=auth_header
+        ).json()["id"]
+        resp = client.get(f"/api/docs/{doc_id}", headers=auth_header)
+        etag = resp.headers["etag"]
+        assert resp.headers["cache-control"] == "private, no-cache"
+
+        resp = client.get(f"/api/docs/{doc_id}", headers={**auth_header, "If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.content == b""
+        assert resp.headers["etag"] == etag
+
+        # Same second as the create: the version still changes the ETag
+        client.put(f"/api/docs/{doc_id}", json={"content": "v2"}, headers=auth_header)
+        resp = client.get(f"/api/docs/{doc_id}", headers={**auth_header, "If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()["content"] == "v2"
+        assert resp.json()["version"] == 2
+        assert resp.headers["etag"] != etag
+
 
 class TestUpdateDocument:
     """Tests for PUT /api/docs/{doc_id}."""
@@ -159,6 +372,55 @@ class TestDeleteDocument:
         assert resp.status_code == 404
 
 
+class TestBatch:
+    """Tests for POST /api/docs/batch."""
+
+    def test_mixed_updates_and_deletes(self, client, auth_header):
+        ids = [
+            client.post(
+                "/api/docs", json={"title": f"D{i}", "content": "x"}, headers=auth_header
+            ).json()["id"]
+            for i in range(3)
+        ]
+        resp = client.post(
+            "/api/docs/batch",
+            json={
+                "operations": [
+                    {"op": "update", "id": ids[0], "project": "p", "tags": "t"},
+                    {"op": "delete", "id": ids[1]},
+                    {"op": "update", "id": ids[2], "title": "Renamed"},
+                ]
+            },
+            headers=auth_header,
+        )
+        assert resp.status_code == 200
+        assert resp.json() == {"updated": 2, "deleted": 1}
+        docs = {d["id"]: d for d in client.get("/api/docs", headers=auth_header).json()}
+        assert set(docs) == {ids[0], ids[2]}
+        assert docs[ids[0]]["project"] == "p"
+        assert docs[ids[2]]["title"] == "Renamed"
+
+    def test_missing_document_rolls_back(self, client, auth_header):
+        import hashlib
+
+        from backend import blobs
+
+        body = b"attached"
+        doc_id = client.post(
+            "/api/docs/upload",
+            files={"file": ("a.pdf", io.BytesIO(body), "application/pdf")},
+            headers=auth_header,
+        ).json()["id"]
+        resp = client.post(
+            "/api/docs/batch",
+            json={"operations": [{"op": "delete", "id": doc_id}, {"op": "delete", "id": 999}]},
+            headers=auth_header,
+        )
+        assert resp.status_code == 404
+        assert client.get(f"/api/docs/{doc_id}", headers=auth_header).status_code == 200
+        assert os.path.exists(blobs.blob_path(hashlib.sha256(body).hexdigest()))
+
+
 class TestFileUpload:
     """Tests for file upload and download."""
 
@@ -211,6 +473,180 @@ class TestFileUpload:
         assert resp.status_code == 200
         assert resp.content == file_content
 
+    def test_file_conditional_and_range(self, client, auth_header):
+        import hashlib
+
+        body = bytes(range(256)) * 4
+        doc_id = client.post(
+            "/api/docs/upload",
+            files={"file": ("data.pdf", io.BytesIO(body), "application/pdf")},
+            headers=auth_header,
+        ).json()["id"]
+        url = f"/api/docs/{doc_id}/file"
+
+        resp = client.get(url, headers=auth_header)
+        etag = resp.headers["etag"]
+        assert etag == f'"{hashlib.sha256(body).hexdigest()}"'
+        assert resp.headers["accept-ranges"] == "bytes"
+
+        resp = client.get(url, headers={**auth_header, "If-None-Match": f"W/{etag}"})
+        assert resp.status_code == 304
+
+        resp = client.get(url, headers={**auth_header, "Range": "bytes=100-199"})
+        assert resp.status_code == 206
+        assert resp.headers["content-range"] == f"bytes 100-199/{len(body)}"
+        assert resp.content == body[100:200]
+
+        # Resume: If-Range with the current ETag honours the range, a stale one gets 200
+        resp = client.get(url, headers={**auth_header, "Range": "bytes=1000-", "If-Range": etag})
+        assert resp.status_code == 206
+        assert resp.content == body[1000:]
+        resp = client.get(url, headers={**auth_header, "Range": "bytes=0-9", "If-Range": '"old"'})
+        assert resp.status_code == 200
+        assert resp.content == body
+
+    def test_download_offloaded_to_nginx(self, client, auth_header, monkeypatch):
+        import hashlib
+
+        from backend import config
+
+        body = b"served by nginx"
+        sha256 = hashlib.sha256(body).hexdigest()
+        doc_id = client.post(
+            "/api/docs/upload",
+            files={"file": ("relazione finale.pdf", io.BytesIO(body), "application/pdf")},
+            headers=auth_header,
+        ).json()["id"]
+
+        monkeypatch.setattr(config, "FILE_ACCEL_PREFIX", "/_files/")
+        resp = client.get(f"/api/docs/{doc_id}/file", headers=auth_header)
+        assert resp.status_code == 200
+        assert resp.content == b""
+        assert resp.headers["x-accel-redirect"] == (
+            f"/_files/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+        )
+        assert resp.headers["content-type"] == "application/pdf"
+        assert "filename*=utf-8''relazione%20finale.pdf" in resp.headers["content-disposition"]
+        # nginx scarta l'ETag della risposta upstream e lo rimette da X-File-ETag
+        assert resp.headers["x-file-etag"] == resp.headers["etag"]
+        assert sha256 in resp.headers["x-file-etag"]
+        cached = client.get(
+            f"/api/docs/{doc_id}/file",
+            headers={**auth_header, "If-None-Match": resp.headers["etag"]},
+        )
+        assert cached.status_code == 304 and "x-accel-redirect" not in cached.headers
+
+    def test_too_large_rejected_while_streaming(self, client, auth_header, monkeypatch):
+        import backend.routers.documents as documents
+
+        monkeypatch.setattr(documents, "MAX_FILE_SIZE", 10)
+        resp = client.post(
+            "/api/docs/upload",
+            files={"file": ("big.txt", io.BytesIO(b"x" * 11), "text/plain")},
+            headers=auth_header,
+        )
+        assert resp.status_code == 413
+        assert client.get("/api/docs", headers=auth_header).json() == []
+        # No partial temp file left behind
+        from backend import blobs
+
+        assert not [f for f in os.listdir(blobs.blob_dir()) if f.endswith(".part")]
+
+    def test_oversized_body_not_read_to_the_end(self, client, auth_header, monkeypatch):
+        import asyncio
+
+        import backend.routers.documents as documents
+        from backend import blobs
+        from backend.main import app
+
+        monkeypatch.setattr(documents, "MAX_FILE_SIZE", 1024 * 1024)
+        head = b'--b\r\nContent-Disposition: form-data; name="file"; filename="big.txt"\r\n\r\n'
+        chunks = [head] + [b"x" * 65536] * 100
+
+        def request(length=None):
+            pulled = []
+            sent = []
+
+            async def receive():
+                pulled.append(1)
+                body = chunks[len(pulled) - 1] if len(pulled) <= len(chunks) else b""
+                return {"type": "http.request", "body": body, "more_body": len(pulled) < 101}
+
+            async def send(message):
+                sent.append(message)
+
+            headers = [
+                (b"authorization", auth_header["Authorization"].encode()),
+                (b"content-type", b"multipart/form-data; boundary=b"),
+            ]
+            if length:
+                headers.append((b"content-length", str(length).encode()))
+            scope = {
+                "type": "http",
+                "http_version": "1.1",
+                "method": "POST",
+                "scheme": "http",
+                "server": ("testserver", 80),
+                "path": "/api/docs/upload",
+                "raw_path": b"/api/docs/upload",
+                "root_path": "",
+                "query_string": b"",
+                "headers": headers,
+            }
+            asyncio.run(app(scope, receive, send))
+            return sent[0]["status"], len(pulled)
+
+        # Oltre il limite dopo ~1 MiB: il resto del body (6 MiB) non viene letto
+        status_code, pulled = request()
+        assert status_code == 413 and pulled < 25
+        # Con Content-Length il rifiuto arriva prima di leggere il body
+        status_code, pulled = request(sum(map(len, chunks)))
+        assert status_code == 413 and pulled == 0
+        assert not [f for f in os.listdir(blobs.blob_dir()) if f.endswith(".part")]
+
+    def test_multipart_errors(self, client, auth_header):
+        for body, detail in (
+            (
+                b'--b\r\nContent-Disposition: form-data; name="project"\r\n\r\nx\r\n--b--\r\n',
+                "File is required",
+            ),
+            (
+                b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\nab',
+                "Malformed multipart body",
+            ),
+        ):
+            resp = client.post(
+                "/api/docs/upload",
+                content=body,
+                headers={**auth_header, "Content-Type": "multipart/form-data; boundary=b"},
+            )
+            assert resp.status_code == 400 and resp.json()["detail"] == detail
+        resp = client.post("/api/docs/upload", json={"file": "x"}, headers=auth_header)
+        assert resp.status_code == 400
+        assert client.get("/api/docs", headers=auth_header).json() == []
+
+    def test_hash_and_multibyte_text_across_chunks(self, client, auth_header, monkeypatch):
+        import hashlib
+
+        from backend import storage
+        from backend.database import read_db
+
+        monkeypatch.setattr(storage, "CHUNK_SIZE", 3)
+        body = "caffè però così".encode()
+        resp = client.post(
+            "/api/docs/upload",
+            files={"file": ("it.md", io.BytesIO(body), "text/markdown")},
+            headers=auth_header,
+        )
+        assert resp.status_code == 201
+        assert resp.json()["content"] == "caffè però così"
+        with read_db() as conn:
+            row = conn.execute(
+                "SELECT file_size, file_sha256 FROM documents WHERE id = ?", (resp.json()["id"],)
+            ).fetchone()
+        assert row["file_size"] == len(body)
+        assert row["file_sha256"] == hashlib.sha256(body).hexdigest()
+
     def test_download_no_file_doc(self, client, auth_header):
         # Create a document without a file attachment
         create_resp = client.post(
@@ -243,3 +679,52 @@ class TestTags:
         assert resp.status_code == 200
         tags = resp.json()
         assert sorted(tags) == ["fastapi", "python", "vue"]
+
+    def test_counts_follow_writes(self, client, auth_header):
+        first = client.post(
+            "/api/docs",
+            json={"title": "A", "content": "a", "tags": " py , web,py"},
+            headers=auth_header,
+        ).json()
+        assert first["tags"] == ["py", "web"]
+        second = client.post(
+            "/api/docs", json={"title": "B", "content": "b", "tags": "py"}, headers=auth_header
+        ).json()
+
+        def counts():
+            resp = client.get("/api/docs/meta/tags?with_counts=true", headers=auth_header)
+            return {t["name"]: t["count"] for t in resp.json()}
+
+        assert counts() == {"py": 2, "web": 1}
+        client.put(f"/api/docs/{first['id']}", json={"tags": "web,ops"}, headers=auth_header)
+        assert counts() == {"py": 1, "web": 1, "ops": 1}
+        client.delete(f"/api/docs/{second['id']}", headers=auth_header)
+        assert counts() == {"web": 1, "ops": 1}
+
+        resp = client.get("/api/docs", params={"tag": "ops"}, headers=auth_header)
+        assert [d["id"] for d in resp.json()] == [first["id"]]
+
+    def test_prefix_and_limit(self, client, auth_header):
+        client.post(
+            "/api/docs",
+            json={"title": "A", "content": "a", "tags": "k8s,kafka,python"},
+            headers=auth_header,
+        )
+        resp = client.get("/api/docs/meta/tags?prefix=k&limit=1", headers=auth_header)
+        assert resp.json() == ["k8s"]
+
+    def test_migration_from_tags_column(self, client, auth_header):
+        from backend.database import init_db, read_db, write_db
+
+        with write_db() as conn:
+            conn.execute(
+                "INSERT INTO documents (title, content, tags) VALUES ('Old', '', 'ops, python,')"
+            )
+            conn.execute("DELETE FROM vault_meta WHERE key = 'tags_index'")
+            conn.commit()
+        init_db()
+
+        resp = client.get("/api/docs/meta/tags?with_counts=true", headers=auth_header)
+        assert resp.json() == [{"name": "ops", "count": 1}, {"name": "python", "count": 1}]
+        with read_db() as conn:
+            assert conn.execute("SELECT tags FROM documents").fetchone()[0] == "ops,python"
@@ -0,0 +1,119 @@
+"""Tests for the document event publisher and GET /api/events."""
+
+import asyncio
+import importlib
+
+import pytest
+
+
+@pytest.fixture()
+def db(tmp_data):
+    import backend.config
+    import backend.database
+
+    importlib.reload(backend.config)
+    importlib.reload(backend.database)
+    backend.database.init_db()
+    yield backend.database
+    backend.database.close_pool()
+
+
+def _insert(database, title):
+    with database.write_db() as conn:
+        conn.execute("INSERT INTO documents (title, content) VALUES (?, '')", (title,))
+        conn.commit()
+
+
+class TestPublisher:
+    """Tests for EventPublisher fan-out."""
+
+    def test_commit_is_published_to_subscribers(self, db):
+        from backend.events import EventPublisher
+
+        async def scenario():
+            pub = EventPublisher()
+            await pub.start(poll_interval=5)
+            first, second = pub.subscribe(), pub.subscribe()
+            await asyncio.to_thread(_insert, db, "Hello")
+            pub.notify()
+            events = [await asyncio.wait_for(s.queue.get(), 2) for s in (first, second)]
+            await pub.stop()
+            return events
+
+        events = asyncio.run(scenario())
+        assert [e["op"] for e in events] == ["create", "create"]
+        assert events[0]["id"] == 1
+        assert events[0]["seq"] == 1
+
+    def test_detects_commits_without_notify(self, db):
+        from backend.events import EventPublisher
+
+        async def scenario():
+            pub = EventPublisher()
+            await pub.start(poll_interval=0.05)
+            sub = pub.subscribe()
+            # Simulates a write from another worker: no notify() call
+            await asyncio.to_thread(_insert, db, "Elsewhere")
+            event = await asyncio.wait_for(sub.queue.get(), 2)
+            await pub.stop()
+            return event
+
+        assert asyncio.run(scenario())["op"] == "create"
+
+    def test_slow_consumer_is_dropped(self, db):
+        from backend.events import EventPublisher
+
+        async def scenario():
+            pub = EventPublisher()
+            await pub.start(poll_interval=5, queue_size=1)
+            slow = pub.subscribe()
+            for title in ("A", "B"):
+                await asyncio.to_thread(_insert, db, title)
+            pub.notify()
+            sentinel = await asyncio.wait_for(slow.queue.get(), 2)
+            stats = pub.stats()
+            await pub.stop()
+            return slow, sentinel, stats
+
+        slow, sentinel, stats = asyncio.run(scenario())
+        assert slow.dropped is True
+        assert sentinel is None
+        assert stats["dropped"] == 1
+        assert stats["subscribers"] == 0
+
+
+class TestStream:
+    """Tests for SSE framing."""
+
+    def test_replay_heartbeat_and_dedup(self):
+        from backend.events import Subscriber, stream_events
+
+        async def scenario():
+            sub = Subscriber(10)
+            replay = [{"seq": 3, "id": 1, "op": "update", "updated_at": "t"}]
+            stream = stream_events(sub, replay, heartbeat=0.01)
+            chunks = [await stream.__anext__(), await stream.__anext__()]
+            # Already sent by the replay: skipped
+            sub.queue.put_nowait({"seq": 3, "id": 1, "op": "update", "updated_at": "t"})
+            sub.queue.put_nowait({"seq": 4, "id": 2, "op": "delete", "updated_at": None})
+            sub.queue.put_nowait(None)
+            chunks += [c async for c in stream]
+            return chunks
+
+        chunks = asyncio.run(scenario())
+        assert chunks[0].startswith("id: 3\nevent: update\ndata: ")
+        assert chunks[1] == ": ping\n\n"
+        assert chunks[2].startswith("id: 4\nevent: delete\n")
+        assert len(chunks) == 3
+
+
+class TestEventsEndpoint:
+    """Tests for GET /api/events."""
+
+    def test_unauthenticated(self, client):
+        resp = client.get("/api/events")
+        assert resp.status_code == 401
+
+    def test_publisher_stats_in_system_info(self, client, auth_header):
+        resp = client.get("/api/system-info", headers=auth_header)
+        assert resp.json()["events"]["subscribers"] == 0
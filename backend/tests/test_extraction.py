@@ -0,0 +1,273 @@
+"""Tests for background text extraction from PDF, Office and drawio uploads."""
+
+import base64
+import io
+import time
+import zipfile
+import zlib
+from urllib.parse import quote
+
+import pytest
+
+
+def _zip(members: dict[str, str]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, text in members.items():
+            zf.writestr(name, text)
+    return buf.getvalue()
+
+
+def _docx(*paragraphs: str) -> bytes:
+    body = "".join(
+        f"<w:p><w:r><w:t xml:space='preserve'>{p}</w:t></w:r></w:p>" for p in paragraphs
+    )
+    return _zip({"word/document.xml": f"<w:document><w:body>{body}</w:body></w:document>"})
+
+
+def _xlsx() -> bytes:
+    return _zip(
+        {
+            "xl/workbook.xml": '<workbook><sheets><sheet name="Budget &amp; costs" sheetId="1" '
+            'r:id="rId1"/></sheets></workbook>',
+            "xl/_rels/workbook.xml.rels": '<Relationships><Relationship Id="rId1" '
+            'Target="worksheets/sheet1.xml"/></Relationships>',
+            "xl/sharedStrings.xml": "<sst><si><t>Item</t></si><si><t>gizmoline</t></si></sst>",
+            "xl/worksheets/sheet1.xml": '<worksheet><sheetData><row r="1"><c r="A1" t="s"><v>0</v>'
+            '</c><c r="B1" t="inlineStr"><is><t>Cost</t></is></c></row><row r="2"><c r="A2" '
+            't="s"><v>1</v></c><c r="B2"><v>42.5</v></c></row></sheetData></worksheet>',
+        }
+    )
+
+
+def _pptx() -> bytes:
+    slide = (
+        '<p:sld><a:p><a:r><a:t>{}</a:t></a:r><a:r><a:t xml:lang="en"> {}</a:t></a:r></a:p></p:sld>'
+    )
+    return _zip(
+        {
+            "ppt/slides/slide2.xml": slide.format("Second", "slide"),
+            "ppt/slides/slide10.xml": slide.format("Tenth", "roadmapword"),
+            "ppt/slides/slide1.xml": slide.format("Opening", "remarks"),
+        }
+    )
+
+
+def _drawio(compressed: bool = False) -> bytes:
+    model = (
+        '<mxGraphModel><root><mxCell id="0"/><mxCell id="2" '
+        'value="&lt;b&gt;Load balancer&lt;/b&gt;&lt;br&gt;flamingoport" vertex="1"/>'
+        '<UserObject label="Database" id="3"/></root></mxGraphModel>'
+    )
+    if compressed:
+        deflate = zlib.compressobj(9, zlib.DEFLATED, -15)
+        raw = deflate.compress(quote(model).encode()) + deflate.flush()
+        model = base64.b64encode(raw).decode()
+    return f'<mxfile><diagram name="Network" id="a">{model}</diagram></mxfile>'.encode()
+
+
+def _pdf(*lines: str) -> bytes:
+    """PDF di una pagina con xref, una riga per argomento (Helvetica, WinAnsi)."""
+    ops = "BT /F1 12 Tf 72 712 Td 14 TL " + " T* ".join(f"({line}) Tj" for line in lines) + " ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(ops), ops.encode("latin-1")),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    trailer = b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+    return out + trailer % (len(objects) + 1, xref)
+
+
+def _write(tmp_path, name: str, body: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(body)
+    return str(path)
+
+
+def _job(doc_id):
+    from backend.database import read_db
+
+    with read_db() as conn:
+        row = conn.execute("SELECT * FROM extract_jobs WHERE doc_id = ?", (doc_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def _wait(predicate, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting for extraction"
+        time.sleep(0.05)
+
+
+@pytest.fixture()
+def queue_only(monkeypatch):
+    """Coda senza Extractor in background: i test la guidano a mano."""
+    monkeypatch.setenv("EXTRACT_ENABLED", "false")
+
+
+class TestExtractors:
+    """Tests for extractors.run() on each supported format."""
+
+    def test_office_formats(self, tmp_path):
+        from backend import extractors
+
+        text = extractors.run(
+            _write(tmp_path, "a.docx", _docx("Quarterly report", "Tom &amp; Jerry")),
+            ".docx",
+            10,
+            1000,
+        )
+        assert text == "Quarterly report\nTom & Jerry"
+
+        text = extractors.run(_write(tmp_path, "a.xlsx", _xlsx()), ".xlsx", 10, 1000)
+        assert text == "## Budget & costs\n\nItem\tCost\ngizmoline\t42.5"
+
+        text = extractors.run(_write(tmp_path, "a.pptx", _pptx()), ".pptx", 10, 1000)
+        assert text.startswith("## Slide 1\n\nOpening remarks\n\n## Slide 2\n\nSecond slide")
+        assert text.endswith("## Slide 3\n\nTenth roadmapword")
+        assert extractors.run(_write(tmp_path, "b.pptx", _pptx()), ".pptx", 10, 14) == (
+            "## Slide 1\n\nOp"
+        )
+
+    def test_drawio_plain_and_compressed(self, tmp_path):
+        from backend import extractors
+
+        for compressed in (False, True):
+            path = _write(tmp_path, "d.drawio", _drawio(compressed))
+            text = extractors.run(path, ".drawio", 10, 1000)
+            assert text == "## Network\n\nLoad balancer\nflamingoport\nDatabase"
+
+    def test_pdf_text(self, tmp_path):
+        from backend import extractors
+
+        path = _write(tmp_path, "a.pdf", _pdf("Hello pdfword", r"Escaped \(x\) caf\351"))
+        assert extractors.run(path, ".pdf", 10, 1000) == "Hello pdfword\nEscaped (x) café"
+        # Una pagina senza testo non e' un errore
+        empty = _write(tmp_path, "empty.pdf", _pdf())
+        assert extractors.run(empty, ".pdf", 10, 1000) == ""
+        truncated = _write(tmp_path, "cut.pdf", _pdf("Hello")[:-60])
+        with pytest.raises(extractors.ExtractError):
+            extractors.run(truncated, ".pdf", 10, 1000)
+
+    def test_corrupt_files_and_timeout(self, tmp_path, monkeypatch):
+        from backend import extractors
+
+        for ext in (".docx", ".xlsx", ".pdf"):
+            with pytest.raises(extractors.ExtractError):
+                extractors.run(_write(tmp_path, "bad" + ext, b"not a real file"), ext, 10, 100)
+        with pytest.raises(extractors.ExtractError):
+            extractors.run(_write(tmp_path, "a.doc", b"x"), ".doc", 10, 100)
+
+        monkeypatch.setitem(extractors._EXTRACTORS, ".pdf", lambda path: time.sleep(5))
+        started = time.monotonic()
+        with pytest.raises(extractors.ExtractTimeout):
+            extractors.run(_write(tmp_path, "slow.pdf", b"%PDF"), ".pdf", 0.1, 100)
+        assert time.monotonic() - started < 2
+
+
+class TestExtractionQueue:
+    """Tests for the extract_jobs queue and the background Extractor."""
+
+    def test_uploads_become_searchable(self, client, auth_header, upload_file):
+        files = {
+            "report.docx": (_docx("Quarterly zebraword report"), "zebraword"),
+            "budget.xlsx": (_xlsx(), "gizmoline"),
+            "deck.pptx": (_pptx(), "roadmapword"),
+            "network.drawio": (_drawio(compressed=True), "flamingoport"),
+            "scan.pdf": (_pdf("Hello pdfword"), "pdfword"),
+        }
+        ids = {name: upload_file(name, body) for name, (body, _) in files.items()}
+        # La risposta non aspetta l'estrazione
+        assert all(_job(doc_id) is not None for doc_id in ids.values())
+
+        _wait(lambda: all(_job(doc_id) is None for doc_id in ids.values()))
+        for name, (_, word) in files.items():
+            resp = client.get("/api/search", params={"q": word}, headers=auth_header)
+            assert [r["id"] for r in resp.json()] == [ids[name]]
+        doc = client.get(f"/api/docs/{ids['budget.xlsx']}", headers=auth_header).json()
+        assert "gizmoline\t42.5" in doc["content"]
+
+        info = client.get("/api/system-info", headers=auth_header).json()["extraction"]
+        assert info["queued"] == info["running"] == info["failed"] == 0
+        assert info["done"] >= 5 and info["enabled"] is True and info["in_flight"] == 0
+        assert info["avg_ms"] > 0
+
+    def test_corrupt_upload_fails_without_retry(self, client, auth_header, upload_file):
+        doc_id = upload_file("broken.docx", b"not a zip file")
+        _wait(lambda: _job(doc_id)["state"] == "failed")
+        job = _job(doc_id)
+        assert job["attempts"] == 1 and "BadZipFile" in job["error"]
+        info = client.get("/api/system-info", headers=auth_header).json()["extraction"]
+        assert info["failed"] == 1 and info["oldest_seconds"] is None
+        assert info["failures"] >= 1
+
+        client.delete(f"/api/docs/{doc_id}", headers=auth_header)
+        assert _job(doc_id) is None
+
+    def test_retry_backoff_and_lease(
+        self, queue_only, client, auth_header, upload_file, monkeypatch
+    ):
+        from backend import config, extraction
+        from backend.database import write_db
+
+        monkeypatch.setattr(config, "EXTRACT_MAX_ATTEMPTS", 2)
+        doc_id = upload_file("a.pdf", _pdf("text"))
+        now = time.time()
+        with write_db() as conn:
+            [job] = extraction.claim(conn, 5, now)
+            assert job["attempts"] == 1 and job["path"].endswith(job["sha256"])
+            assert extraction.claim(conn, 5, now) == []
+            assert extraction.fail(conn, job, "boom") == "queued"
+            retry_at = _job(doc_id)["run_after"]
+            assert retry_at >= now + config.EXTRACT_RETRY_DELAY
+            assert extraction.claim(conn, 5, retry_at - 1) == []
+
+            [job] = extraction.claim(conn, 5, retry_at)
+            assert job["attempts"] == 2
+            # Lease scaduto all'ultimo tentativo: il worker e' morto, niente altro giro
+            lease = _job(doc_id)["run_after"]
+            assert lease > retry_at + config.EXTRACT_TIMEOUT
+            assert extraction.claim(conn, 5, lease) == []
+            assert _job(doc_id)["state"] == "failed"
+            # Un risultato arrivato dopo il lease non si applica
+            assert extraction.complete(conn, job, "late text") is False
+            assert extraction.status(conn)["failed"] == 1
+
+    def test_stale_results_and_backfill(self, queue_only, client, auth_header, upload_file):
+        from backend import extraction
+        from backend.database import write_db
+
+        first = upload_file("a.pdf", _pdf("first"))
+        second = upload_file("b.pdf", _pdf("second"))
+        with write_db() as conn:
+            jobs = {job["doc_id"]: job for job in extraction.claim(conn, 5)}
+        # Il documento ha gia' un testo scritto a mano: l'estrazione non lo sovrascrive
+        client.put(f"/api/docs/{first}", json={"content": "typed"}, headers=auth_header)
+        with write_db() as conn:
+            assert extraction.complete(conn, jobs[first], "extracted") is False
+            assert extraction.complete(conn, jobs[second], "extracted") is True
+        assert _job(first) is None and _job(second) is None
+        docs = [client.get(f"/api/docs/{i}", headers=auth_header).json() for i in (first, second)]
+        assert [d["content"] for d in docs] == ["typed", "extracted"]
+
+        # Migrazione: i file caricati prima della coda entrano una volta sola
+        with write_db() as conn:
+            conn.execute("UPDATE documents SET content = '' WHERE id = ?", (second,))
+            conn.execute("DELETE FROM vault_meta WHERE key = 'extract_backfill'")
+            conn.commit()
+        from backend.database import init_db
+
+        init_db()
+        init_db()
+        assert _job(second)["state"] == "queued" and _job(first) is None
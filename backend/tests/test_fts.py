@@ -0,0 +1,133 @@
+"""Tests for FTS index profiles and the online rebuild."""
+
+import json
+import time
+
+import pytest
+
+
+def _titles(client, auth_header, q):
+    resp = client.get("/api/search", params={"q": q}, headers=auth_header)
+    assert resp.status_code == 200
+    return [r["title"] for r in resp.json()]
+
+
+@pytest.fixture()
+def stemmed(monkeypatch):
+    monkeypatch.setenv("FTS_PROFILE", "stemmed")
+
+
+class TestProfiles:
+    """Tests for index creation and queries under each profile."""
+
+    def test_new_vault_uses_configured_profile(self, stemmed, client, auth_header, create_doc):
+        from backend import fts
+        from backend.database import read_db
+
+        create_doc("Cluster notes", "deploying clusters on monday")
+        create_doc("Misc", "notes about one cluster")
+        with read_db() as conn:
+            assert fts.active_options(conn)["tokenize"].startswith("porter")
+            assert not fts.needs_rebuild(conn)
+        assert _titles(client, auth_header, "deployed") == ["Cluster notes"]
+        # Peso 5 sul titolo: il documento col termine nel titolo viene prima
+        assert _titles(client, auth_header, "cluster") == ["Cluster notes", "Misc"]
+
+    @pytest.mark.parametrize("profile", ["compact", "minimal"])
+    def test_queries_without_positions(self, client, auth_header, create_doc, profile):
+        from backend import fts
+
+        create_doc("Kubernetes upgrade", "steps to upgrade the cluster")
+        assert fts.rebuild(profile)
+        # Niente frasi senza posizioni: le parole vanno in AND
+        assert _titles(client, auth_header, "upgrade cluster") == ["Kubernetes upgrade"]
+        resp = client.get(
+            "/api/search/suggest", params={"prefix": "kubernetes up"}, headers=auth_header
+        )
+        assert [t["title"] for t in resp.json()["titles"]] == ["Kubernetes upgrade"]
+
+    def test_system_info_reports_index(self, client, auth_header):
+        resp = client.get("/api/system-info", headers=auth_header)
+        info = resp.json()["fts"]
+        assert info["profile"] == "default"
+        assert info["needs_rebuild"] is False and info["rebuild"] is None
+
+
+class TestOnlineRebuild:
+    """Tests for fts.rebuild() while the vault is in use."""
+
+    def test_writes_and_reads_during_rebuild(self, client, auth_header, create_doc):
+        from backend import fts
+        from backend.database import read_db, write_db
+
+        ids = [create_doc(f"Doc {i}", f"alpha text {i}")["id"] for i in range(9)]
+        seen = []
+
+        def progress(copied):
+            # Letture sull'indice vecchio, scritture su righe gia' copiate e non
+            seen.append(len(_titles(client, auth_header, "alpha")))
+            if copied == 3:
+                client.put(f"/api/docs/{ids[0]}", json={"content": "beta"}, headers=auth_header)
+                client.put(f"/api/docs/{ids[7]}", json={"content": "beta"}, headers=auth_header)
+                client.delete(f"/api/docs/{ids[1]}", headers=auth_header)
+                client.delete(f"/api/docs/{ids[8]}", headers=auth_header)
+                create_doc("New", "alpha fresh")
+
+        assert fts.rebuild("stemmed", batch=3, progress=progress)
+        assert seen[0] == 9
+        assert sorted(_titles(client, auth_header, "alpha")) == [
+            "Doc 2",
+            "Doc 3",
+            "Doc 4",
+            "Doc 5",
+            "Doc 6",
+            "New",
+        ]
+        assert sorted(_titles(client, auth_header, "beta")) == ["Doc 0", "Doc 7"]
+        with write_db() as conn:
+            conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('integrity-check')")
+        with read_db() as conn:
+            assert fts.active_options(conn)["tokenize"].startswith("porter")
+            names = {
+                r[0]
+                for r in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%fts_new%'")
+            }
+            assert names == set()
+
+    def test_nothing_to_do_or_claimed_elsewhere(self, client, auth_header):
+        from backend import fts
+        from backend.database import write_db
+
+        assert not fts.rebuild()
+        with write_db() as conn:
+            conn.execute(
+                "INSERT INTO vault_meta (key, value) VALUES ('fts_rebuild', ?)",
+                (json.dumps({"options": {}, "heartbeat": time.time()}),),
+            )
+            conn.commit()
+        assert not fts.rebuild("compact")
+
+    def test_resumes_interrupted_rebuild(self, client, auth_header, create_doc):
+        from backend import fts
+        from backend.database import write_db
+
+        for i in range(5):
+            create_doc(f"Doc {i}", "gamma")
+
+        def crash(copied):
+            raise RuntimeError("worker killed")
+
+        with pytest.raises(RuntimeError):
+            fts.rebuild("compact", batch=2, progress=crash)
+        with write_db() as conn:
+            row = conn.execute("SELECT value FROM vault_meta WHERE key = 'fts_rebuild'").fetchone()
+            state = json.loads(row[0])
+            state["heartbeat"] -= fts.STALE_AFTER
+            conn.execute(
+                "UPDATE vault_meta SET value = ? WHERE key = 'fts_rebuild'", (json.dumps(state),)
+            )
+            conn.commit()
+        copied = []
+        assert fts.rebuild("compact", batch=2, progress=copied.append)
+        assert copied == [2, 3]
+        assert len(_titles(client, auth_header, "gamma")) == 5
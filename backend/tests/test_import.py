@@ -0,0 +1,137 @@
+"""Tests for POST /api/docs/import."""
+
+import io
+import tarfile
+import zipfile
+
+
+def _zip(files: dict) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, body in files.items():
+            zf.writestr(name, body)
+    return buf.getvalue()
+
+
+class TestImport:
+    """Tests for bulk import of files and archives."""
+
+    def test_multipart_files(self, client, auth_header):
+        resp = client.post(
+            "/api/docs/import?project=inbox&tags=imported",
+            files=[
+                ("files", ("a.md", io.BytesIO(b"# A"), "text/markdown")),
+                ("files", ("b.txt", io.BytesIO(b"bee"), "text/plain")),
+                ("files", ("evil.exe", io.BytesIO(b"MZ"), "application/octet-stream")),
+            ],
+            headers=auth_header,
+        )
+        assert resp.status_code == 200
+        data = resp.json()
+        assert (data["created"], data["skipped"], data["failed"]) == (2, 1, 0)
+        assert [i["status"] for i in data["items"]] == ["created", "created", "skipped"]
+
+        doc = client.get(f"/api/docs/{data['items'][0]['id']}", headers=auth_header).json()
+        assert doc["title"] == "a"
+        assert doc["content"] == "# A"
+        assert doc["project"] == "inbox"
+        assert doc["tags"] == ["imported"]
+
+    def test_zip_folders_become_projects(self, client, auth_header):
+        archive = _zip(
+            {
+                "notes/todo.md": "buy milk",
+                "notes/2025/jan.md": "january",
+                "notes/.DS_Store": "junk",
+                "readme.md": "top level",
+            }
+        )
+        resp = client.post(
+            "/api/docs/import?project=vault",
+            files=[("files", ("export.zip", io.BytesIO(archive), "application/zip"))],
+            headers=auth_header,
+        )
+        data = resp.json()
+        assert data["created"] == 3
+        assert data["skipped"] == 1
+        docs = {
+            d["title"]: d["project"] for d in client.get("/api/docs", headers=auth_header).json()
+        }
+        assert docs == {"todo": "vault/notes", "jan": "vault/notes/2025", "readme": "vault"}
+
+        results = client.get("/api/search?q=january", headers=auth_header).json()
+        assert results[0]["title"] == "jan"
+
+    def test_streamed_tar_body(self, client, auth_header):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+            for name, body in (("docs/one.md", b"one"), ("docs/two.md", b"two")):
+                info = tarfile.TarInfo(name)
+                info.size = len(body)
+                tf.addfile(info, io.BytesIO(body))
+        resp = client.post(
+            "/api/docs/import",
+            content=buf.getvalue(),
+            headers={**auth_header, "Content-Type": "application/gzip"},
+        )
+        assert resp.status_code == 200
+        assert resp.json()["created"] == 2
+
+    def test_duplicate_content_shares_blob(self, client, auth_header):
+        archive = _zip({"a/same.pdf": b"%PDF same", "b/same.pdf": b"%PDF same"})
+        client.post(
+            "/api/docs/import",
+            content=archive,
+            headers={**auth_header, "Content-Type": "application/zip"},
+        )
+        info = client.get("/api/system-info", headers=auth_header).json()["storage"]
+        assert info["blobs"] == 1
+        assert info["dedup_ratio"] == 2.0
+
+    def test_too_large_member_reported(self, client, auth_header, monkeypatch):
+        import backend.routers.documents as documents
+
+        monkeypatch.setattr(documents, "MAX_FILE_SIZE", 4)
+        archive = _zip({"ok.md": "tiny", "big.md": "much too large"})
+        resp = client.post(
+            "/api/docs/import",
+            content=archive,
+            headers={**auth_header, "Content-Type": "application/zip"},
+        )
+        statuses = {i["name"]: i["status"] for i in resp.json()["items"]}
+        assert statuses == {"ok.md": "created", "big.md": "error"}
+
+    def test_multipart_total_size_limited(self, client, auth_header, monkeypatch):
+        from backend import importer
+
+        monkeypatch.setattr(importer, "IMPORT_MAX_BYTES", 1000)
+        files = [("files", (f"{n}.md", io.BytesIO(b"x" * 400), "text/markdown")) for n in "abc"]
+        resp = client.post("/api/docs/import", files=files, headers=auth_header)
+        assert resp.status_code == 400 and resp.json()["detail"].startswith("Import too large")
+        assert client.get("/api/docs", headers=auth_header).json() == []
+        # Sotto il limite lo stesso import passa
+        resp = client.post("/api/docs/import", files=files[:2], headers=auth_header)
+        assert resp.json()["created"] == 2
+
+    def test_declared_length_over_limit(self, client, auth_header, monkeypatch):
+        from backend import config
+
+        monkeypatch.setattr(config, "IMPORT_MAX_BYTES", 1000)
+        files = [("files", ("big.md", io.BytesIO(b"x" * 100_000), "text/markdown"))]
+        resp = client.post("/api/docs/import", files=files, headers=auth_header)
+        assert resp.status_code == 413
+        assert client.get("/api/docs", headers=auth_header).json() == []
+
+    def test_invalid_archive_and_content_type(self, client, auth_header):
+        resp = client.post(
+            "/api/docs/import",
+            content=b"not a zip",
+            headers={**auth_header, "Content-Type": "application/zip"},
+        )
+        assert resp.status_code == 400
+        resp = client.post(
+            "/api/docs/import",
+            content=b"{}",
+            headers={**auth_header, "Content-Type": "application/json"},
+        )
+        assert resp.status_code == 415
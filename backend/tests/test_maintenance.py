@@ -0,0 +1,123 @@
+"""Tests for the background FTS and SQLite maintenance tasks."""
+
+import pytest
+
+
+def _segments(table="documents_fts"):
+    from backend import maintenance
+    from backend.database import read_db
+
+    with read_db() as conn:
+        return maintenance.segments(conn, table)["segments"]
+
+
+@pytest.fixture()
+def due(monkeypatch):
+    """Every task is due on each tick and the vault counts as idle right away."""
+    from backend import config
+
+    monkeypatch.setattr(config, "MAINT_IDLE", 0)
+    for interval in ("INTEGRITY", "OPTIMIZE", "MERGE", "ANALYZE", "CHECKPOINT"):
+        monkeypatch.setattr(config, f"MAINT_{interval}_INTERVAL", 1e-6)
+    return config
+
+
+class TestTasks:
+    """Tests for the individual maintenance tasks."""
+
+    def test_merge_and_optimize_reduce_segments(self, client, auth_header, create_doc):
+        from backend import maintenance
+        from backend.database import read_db
+
+        with read_db() as conn:
+            config = dict(conn.execute("SELECT k, v FROM documents_fts_config").fetchall())
+        assert config["automerge"] == 8 and config["crisismerge"] == 16
+
+        for i in range(6):
+            create_doc(f"Doc {i}", f"alpha beta {i}")
+        assert _segments() == 6  # sotto automerge: nessun merge durante le scritture
+        record = maintenance.run_task("merge")
+        assert record["ok"] and record["detail"] == {"steps": 1, "finished": True}
+        assert _segments() == 1
+
+        for i in range(3):
+            create_doc(f"More {i}", "gamma")
+        assert _segments() == 4
+        maintenance.run_task("optimize")
+        assert _segments() == 1
+        resp = client.get("/api/search", params={"q": "alpha"}, headers=auth_header)
+        assert len(resp.json()) == 6
+
+    def test_integrity_detects_index_drift(self, client, auth_header, create_doc):
+        from backend import maintenance
+        from backend.database import write_db
+
+        doc_id = create_doc("Doc", "original text")["id"]
+        assert maintenance.run_task("integrity")["ok"]
+        with write_db() as conn:
+            conn.execute("DROP TRIGGER documents_au")
+            conn.execute("UPDATE documents SET content = 'changed' WHERE id = ?", (doc_id,))
+            conn.commit()
+        record = maintenance.run_task("integrity")
+        assert not record["ok"]
+        assert record["detail"]["errors"][0].startswith("documents_fts:")
+
+        resp = client.get("/api/system-info", headers=auth_header)
+        assert resp.json()["maintenance"]["tasks"]["integrity"]["ok"] is False
+
+    def test_analyze_and_checkpoint(self, client, auth_header, create_doc):
+        from backend import maintenance
+
+        create_doc("Doc", "text")
+        assert maintenance.run_task("analyze")["detail"] == {"analyze": True, "docs": 1}
+        # Stesso numero di documenti: basta PRAGMA optimize
+        assert maintenance.run_task("analyze")["detail"] == {"analyze": False, "docs": 1}
+
+        assert maintenance.run_task("checkpoint")["detail"]["mode"] == "PASSIVE"
+        assert maintenance.wal_size() > 0
+        record = maintenance.run_task("checkpoint", truncate=True)
+        assert record["detail"]["mode"] == "TRUNCATE" and not record["detail"]["busy"]
+        # Il record dell'esito stesso riscrive qualche pagina nel WAL appena troncato
+        assert maintenance.wal_size() < 64 * 1024
+
+
+class TestScheduler:
+    """Tests for scheduling, idle detection and leadership."""
+
+    def test_runs_due_tasks_only_when_idle(self, client, auth_header, create_doc, due):
+        from backend import maintenance
+
+        scheduler = maintenance.Scheduler()
+        try:
+            assert scheduler.tick() == list(maintenance.TASKS)
+            due.MAINT_IDLE = 60
+            create_doc("Doc", "text")
+            # Scrittura recente: solo i task leggeri
+            assert scheduler.tick() == ["analyze", "checkpoint"]
+            due.MAINT_OPTIMIZE_INTERVAL = 0
+            due.MAINT_IDLE = 0
+            assert scheduler.tick() == ["integrity", "merge", "analyze", "checkpoint"]
+        finally:
+            scheduler._release()
+
+    def test_single_leader(self, client, due):
+        from backend import maintenance
+
+        first, second = maintenance.Scheduler(), maintenance.Scheduler()
+        assert first.tick()
+        assert second.tick() == [] and not second.leader
+        first._release()
+        assert second.tick() and second.leader
+        second._release()
+
+    def test_system_info_reports_maintenance(self, client, auth_header, create_doc):
+        from backend import maintenance
+
+        create_doc("Doc", "text")
+        maintenance.run_task("merge")
+        resp = client.get("/api/system-info", headers=auth_header)
+        info = resp.json()["maintenance"]
+        assert info["fts_segments"] == {"documents_fts": {"levels": 1, "segments": 1}}
+        assert info["wal_mb"] >= 0 and info["enabled"] is True
+        assert set(info["tasks"]) == {"merge"}
+        assert info["tasks"]["merge"]["duration_ms"] >= 0
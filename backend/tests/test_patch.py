@@ -0,0 +1,124 @@
+"""Tests for PATCH /api/docs/{id}: text edits against a base version and If-Match."""
+
+import pytest
+
+
+def _patch(client, auth_header, doc_id, body, if_match=None):
+    headers = dict(auth_header)
+    if if_match:
+        headers["If-Match"] = if_match
+    return client.patch(f"/api/docs/{doc_id}", json=body, headers=headers)
+
+
+def _ids(client, auth_header, q):
+    hits = client.get("/api/search", params={"q": q}, headers=auth_header).json()
+    return {h["id"] for h in hits}
+
+
+@pytest.fixture()
+def small_chunks(monkeypatch):
+    monkeypatch.setenv("CHUNK_THRESHOLD", "2000")
+    monkeypatch.setenv("CHUNK_SIZE", "512")
+
+
+class TestPatch:
+    """Tests for applying text edits."""
+
+    def test_edits_apply_and_reindex(self, small_chunks, client, auth_header, create_doc):
+        from backend.database import write_db
+
+        sections = [
+            f"## Section {i}\n" + f"paragraph {i} about deployments. " * 20 for i in range(8)
+        ]
+        doc = create_doc("Runbook", "\n".join(sections))
+        content = doc["content"]
+        pos = content.index("paragraph 5")
+        edits = [
+            {"start": 0, "end": 0, "text": "Intro ✓ 😀\n"},
+            {"start": pos, "end": pos + len("paragraph"), "text": "kubernetes"},
+            {"start": len(content), "end": len(content), "text": "\nThe end"},
+        ]
+        resp = _patch(client, auth_header, doc["id"], {"version": 1, "edits": edits})
+        assert resp.status_code == 200
+        expected = "Intro ✓ 😀\n" + content.replace("paragraph 5", "kubernetes 5", 1) + "\nThe end"
+        assert resp.json()["version"] == 2 and "content" not in resp.json()
+        assert resp.headers["ETag"].startswith(f'"{doc["id"]}-2-')
+        assert client.get(f"/api/docs/{doc['id']}", headers=auth_header).json()["content"] == (
+            expected
+        )
+        assert _ids(client, auth_header, "kubernetes") == {doc["id"]}
+
+        # Solo metadati con l'ETag: il content resta, la versione sale
+        resp = _patch(
+            client, auth_header, doc["id"], {"title": "Ops", "tags": "k8s"}, resp.headers["ETag"]
+        )
+        assert resp.json()["title"] == "Ops" and resp.json()["tags"] == ["k8s"]
+        assert client.get(f"/api/docs/{doc['id']}", headers=auth_header).json()["content"] == (
+            expected
+        )
+        assert _ids(client, auth_header, "k8s") == {doc["id"]}
+        rev = client.get(f"/api/docs/{doc['id']}/revisions/1", headers=auth_header).json()
+        assert rev["content"] == content
+        with write_db() as conn:
+            conn.execute(
+                "INSERT INTO documents_fts(documents_fts, rank) VALUES ('integrity-check', 1)"
+            )
+
+    def test_invalid_edits(self, client, auth_header, create_doc):
+        doc = create_doc("Note", "hello world")
+        for edits in (
+            [{"start": 3, "end": 20, "text": "x"}],
+            [{"start": 5, "end": 3}],
+            [{"start": 4, "end": 6, "text": "a"}, {"start": 5, "end": 7, "text": "b"}],
+        ):
+            resp = _patch(client, auth_header, doc["id"], {"version": 1, "edits": edits})
+            assert resp.status_code == 400
+        resp = client.get(f"/api/docs/{doc['id']}", headers=auth_header).json()
+        assert resp["content"] == "hello world" and resp["version"] == 1
+        resp = _patch(client, auth_header, 999, {"version": 1})
+        assert resp.status_code == 404
+
+
+class TestConcurrency:
+    """Tests for If-Match, base versions and 412 responses."""
+
+    def test_stale_base_is_rejected(self, client, auth_header, create_doc):
+        doc = create_doc("Shared", "first line\n")
+        etag = client.get(f"/api/docs/{doc['id']}", headers=auth_header).headers["ETag"]
+        edit = {"start": 0, "end": 5, "text": "FIRST"}
+
+        resp = _patch(client, auth_header, doc["id"], {"edits": [edit]})
+        assert resp.status_code == 428
+        # Prima scheda: salva sulla versione 1
+        resp = _patch(client, auth_header, doc["id"], {"edits": [edit]}, etag)
+        assert resp.status_code == 200
+        current = resp.headers["ETag"]
+        # Seconda scheda: ancora sulla versione 1
+        for body, if_match in (({"version": 1, "edits": [edit]}, None), ({"edits": []}, etag)):
+            resp = _patch(client, auth_header, doc["id"], body, if_match)
+            assert resp.status_code == 412
+            assert resp.headers["ETag"] == current
+        resp = client.put(
+            f"/api/docs/{doc['id']}",
+            json={"content": "overwrite"},
+            headers={**auth_header, "If-Match": etag},
+        )
+        assert resp.status_code == 412
+        resp = client.put(
+            f"/api/docs/{doc['id']}",
+            json={"content": "overwrite"},
+            headers={**auth_header, "If-Match": f"W/{current}"},
+        )
+        assert resp.status_code == 412
+        assert client.get(f"/api/docs/{doc['id']}", headers=auth_header).json()["content"] == (
+            "FIRST line\n"
+        )
+
+        resp = client.put(
+            f"/api/docs/{doc['id']}",
+            json={"content": "overwrite"},
+            headers={**auth_header, "If-Match": current},
+        )
+        assert resp.status_code == 200 and resp.json()["version"] == 3
+        resp = _patch(client, auth_header, doc["id"], {"version": 3, "title": "Final"}, "*")
+        assert resp.status_code == 200 and resp.json()["title"] == "Final"
@@ -0,0 +1,89 @@
+"""Tests for the SQLite connection pool."""
+
+import sqlite3
+import threading
+
+import pytest
+
+from backend.pool import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture()
+def pool(tmp_path):
+    db_path = str(tmp_path / "pool.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.close()
+    p = ConnectionPool(
+        db_path, size=2, timeout=0.2, pragmas=[("foreign_keys", "ON"), ("cache_size", -1024)]
+    )
+    yield p
+    p.close()
+
+
+class TestReaders:
+    """Tests for pooled read connections."""
+
+    def test_connections_are_reused(self, pool):
+        with pool.reader() as first:
+            pass
+        with pool.reader() as second:
+            pass
+        assert first is second
+        assert pool.stats()["size"] == 1
+        assert pool.stats()["read_checkouts"] == 2
+
+    def test_pragmas_applied_once(self, pool):
+        with pool.reader() as conn:
+            assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -1024
+
+    def test_readers_are_query_only(self, pool):
+        with pool.reader() as conn:
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO t (v) VALUES ('x')")
+
+    def test_bounded_size_times_out(self, pool):
+        with pool.reader(), pool.reader():
+            with pytest.raises(PoolTimeout):
+                with pool.reader():
+                    pass
+        stats = pool.stats()
+        assert stats["timeouts"] == 1
+        assert stats["size"] == 2
+
+    def test_waiter_gets_released_connection(self, pool):
+        results = []
+        holder = pool.reader()
+        holder.__enter__()
+
+        def worker():
+            with pool.reader(), pool.reader() as conn:
+                results.append(conn.execute("SELECT 1").fetchone()[0])
+
+        t = threading.Thread(target=worker)
+        t.start()
+        holder.__exit__(None, None, None)
+        t.join()
+        assert results == [1]
+
+
+class TestWriter:
+    """Tests for the dedicated writer connection."""
+
+    def test_commit_visible_to_readers(self, pool):
+        with pool.writer() as conn:
+            conn.execute("INSERT INTO t (v) VALUES ('a')")
+            conn.commit()
+        with pool.reader() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+
+    def test_uncommitted_work_rolled_back(self, pool):
+        with pytest.raises(RuntimeError):
+            with pool.writer() as conn:
+                conn.execute("INSERT INTO t (v) VALUES ('a')")
+                raise RuntimeError("boom")
+        with pool.writer() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        assert pool.stats()["write_checkouts"] == 2
@@ -0,0 +1,164 @@
+"""Tests for attachment previews: page counts, rendered pages and the disk cache."""
+
+import io
+import os
+import struct
+import time
+import zipfile
+import zlib
+
+import pytest
+
+
+def _png(width: int = 4, height: int = 3) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    rows = b"".join(b"\x00" + b"\xff\x00\x00" * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _pptx(thumbnail: bool = True) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("docProps/app.xml", "<Properties><Slides>3</Slides></Properties>")
+        zf.writestr("ppt/slides/slide1.xml", "<p:sld><a:t>Hi</a:t></p:sld>")
+        if thumbnail:
+            zf.writestr("docProps/thumbnail.png", _png())
+    return buf.getvalue()
+
+
+def _pdf(pages: int) -> bytes:
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument.new()
+    for _ in range(pages):
+        pdf.new_page(612, 792)
+    buf = io.BytesIO()
+    pdf.save(buf)
+    pdf.close()
+    return buf.getvalue()
+
+
+class TestPreviewEndpoints:
+    """Tests for GET /api/docs/{id}/preview and /preview/{page}."""
+
+    def test_office_thumbnail_cached_with_etag(self, client, auth_header, upload_file):
+        doc_id = upload_file("deck.pptx", _pptx())
+        info = client.get(f"/api/docs/{doc_id}/preview", headers=auth_header).json()
+        assert info["pages"] == 3 and info["renderable"] is True
+        assert info["sizes"] == [160, 480, 1024] and len(info["version"]) == 64
+
+        url = f"/api/docs/{doc_id}/preview/1"
+        params = {"size": 200, "v": info["version"]}
+        resp = client.get(url, params=params, headers=auth_header)
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] in ("image/png", "image/webp")
+        assert "immutable" in resp.headers["cache-control"]
+        etag = resp.headers["etag"]
+        assert etag.endswith('-1-480-1"')
+
+        again = client.get(url, params=params, headers={**auth_header, "If-None-Match": etag})
+        assert again.status_code == 304 and again.headers["etag"] == etag
+        # Senza la versione del file l'URL non e' stabile: si rivalida
+        resp = client.get(url, headers=auth_header)
+        assert resp.headers["cache-control"] == "private, no-cache"
+        assert client.get(f"/api/docs/{doc_id}/preview/2", headers=auth_header).status_code == 404
+
+        stats = client.get("/api/system-info", headers=auth_header).json()["previews"]
+        # info, pagina 1 a 480 px generata una volta e poi letta dal disco
+        assert stats["misses"] >= 2 and stats["hits"] >= 1 and stats["entries"] >= 2
+
+    def test_pdf_pages_and_missing_thumbnails(self, client, auth_header, upload_file):
+        from PIL import Image
+
+        doc_id = upload_file("scan.pdf", _pdf(4))
+        info = client.get(f"/api/docs/{doc_id}/preview", headers=auth_header).json()
+        assert info["pages"] == 4 and info["renderable"] is True
+        resp = client.get(f"/api/docs/{doc_id}/preview/4?size=160", headers=auth_header)
+        assert resp.status_code == 200
+        with Image.open(io.BytesIO(resp.content)) as image:
+            assert image.width == 160 and abs(image.height - 792 * 160 / 612) < 1
+        assert client.get(f"/api/docs/{doc_id}/preview/5", headers=auth_header).status_code == 404
+
+        doc_id = upload_file("broken.pdf", b"%PDF-1.4\n%%EOF\n")
+        info = client.get(f"/api/docs/{doc_id}/preview", headers=auth_header).json()
+        assert info["pages"] is None and info["renderable"] is False
+
+        doc_id = upload_file("plain.pptx", _pptx(thumbnail=False))
+        info = client.get(f"/api/docs/{doc_id}/preview", headers=auth_header).json()
+        assert info == {**info, "pages": 3, "renderable": False}
+        resp = client.get(f"/api/docs/{doc_id}/preview/1", headers=auth_header)
+        assert resp.status_code == 404 and resp.json()["detail"] == "No embedded thumbnail"
+
+        doc_id = upload_file("notes.md", b"# text")
+        info = client.get(f"/api/docs/{doc_id}/preview", headers=auth_header).json()
+        assert info["pages"] is None and info["renderable"] is False
+        resp = client.get("/api/docs/999/preview", headers=auth_header)
+        assert resp.status_code == 404
+
+    def test_image_thumbnail(self, client, auth_header, upload_file):
+        from PIL import Image
+
+        from backend import previews
+
+        doc_id = upload_file("photo.png", _png(600, 300))
+        resp = client.get(f"/api/docs/{doc_id}/preview/1?size=100", headers=auth_header)
+        assert resp.headers["content-type"] == ("image/webp" if previews.webp() else "image/png")
+        with Image.open(io.BytesIO(resp.content)) as image:
+            assert image.size == (160, 80)
+
+
+class TestPreviewCache:
+    """Tests for the size-bounded disk cache."""
+
+    def test_least_recently_used_evicted(self, tmp_path, monkeypatch):
+        from backend import config, previews
+
+        monkeypatch.setattr(config, "UPLOAD_DIR", str(tmp_path))
+        monkeypatch.setattr(config, "PREVIEW_CACHE_MB", 1000 / (1024 * 1024))
+        cache = previews.PreviewCache()
+        builds = []
+
+        def build(name):
+            builds.append(name)
+            return name.encode() * 200
+
+        for name in ("aa", "bb"):
+            assert cache.get(name, lambda: build(name)) == name.encode() * 200
+            time.sleep(0.01)
+        cache.get("aa", lambda: build("aa"))  # hit: aa torna la piu' recente
+        time.sleep(0.01)
+        cache.get("cc", lambda: build("cc"))
+        assert builds == ["aa", "bb", "cc"]
+        assert cache.stats()["entries"] == 2 and cache.evictions == 1
+        assert not os.path.exists(tmp_path / "previews" / "bb" / "bb")
+        cache.get("bb", lambda: build("bb"))
+        assert builds[-1] == "bb"
+
+        # Un'altra istanza (riavvio, altro worker) ritrova i file sul disco
+        other = previews.PreviewCache()
+        assert other.stats()["entries"] == 2
+        assert other.get("bb", lambda: build("never")) == b"bb" * 200
+        # Ne' le hit ne' le generazioni lasciano lock per voce
+        assert cache._flights == {} and other._flights == {}
+
+    def test_failed_build_not_cached(self, tmp_path, monkeypatch):
+        from backend import config, previews
+
+        monkeypatch.setattr(config, "UPLOAD_DIR", str(tmp_path))
+        cache = previews.PreviewCache()
+
+        def fail():
+            raise previews.PreviewUnavailable("nope")
+
+        with pytest.raises(previews.PreviewUnavailable):
+            cache.get("xx", fail)
+        assert cache.get("xx", lambda: b"ok") == b"ok"
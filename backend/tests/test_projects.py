@@ -0,0 +1,150 @@
+"""Tests for the folder endpoints under /api/projects."""
+
+
+def _projects(client, auth_header):
+    docs = client.get("/api/docs", headers=auth_header).json()
+    return {d["title"]: d["project"] for d in docs}
+
+
+class TestRenameProject:
+    """Tests for POST /api/projects/rename."""
+
+    def test_renames_whole_subtree(self, client, auth_header, create_doc):
+        create_doc("root", "root", project="infra")
+        create_doc("child", "child", project="infra/k3s")
+        create_doc("sibling", "sibling", project="infra-old")
+        create_doc("other", "other", project="notes")
+
+        resp = client.post(
+            "/api/projects/rename",
+            json={"path": "infra", "new_path": "ops/infra"},
+            headers=auth_header,
+        )
+        assert resp.status_code == 200
+        assert resp.json()["updated"] == 2
+        assert _projects(client, auth_header) == {
+            "root": "ops/infra",
+            "child": "ops/infra/k3s",
+            "sibling": "infra-old",
+            "other": "notes",
+        }
+
+    def test_search_index_follows(self, client, auth_header, create_doc):
+        create_doc("findme", "findme", project="old")
+        client.post(
+            "/api/projects/rename", json={"path": "old", "new_path": "new"}, headers=auth_header
+        )
+        results = client.get("/api/search?q=findme", headers=auth_header).json()
+        assert results[0]["project"] == "new"
+
+    def test_into_itself_rejected(self, client, auth_header):
+        resp = client.post(
+            "/api/projects/rename",
+            json={"path": "infra", "new_path": "infra/sub"},
+            headers=auth_header,
+        )
+        assert resp.status_code == 400
+
+    def test_unauthenticated(self, client):
+        resp = client.post("/api/projects/rename", json={"path": "a", "new_path": "b"})
+        assert resp.status_code == 401
+
+
+class TestMoveAndDeleteProject:
+    """Tests for POST /api/projects/move and /api/projects/delete."""
+
+    def test_move_under_new_parent(self, client, auth_header, create_doc):
+        create_doc("doc", "doc", project="notes/2025")
+        resp = client.post(
+            "/api/projects/move",
+            json={"path": "notes/2025", "parent": "archive"},
+            headers=auth_header,
+        )
+        assert resp.json() == {"path": "notes/2025", "new_path": "archive/2025", "updated": 1}
+
+        client.post("/api/projects/move", json={"path": "archive/2025"}, headers=auth_header)
+        assert _projects(client, auth_header) == {"doc": "2025"}
+
+    def test_delete_moves_documents_to_unsorted(self, client, auth_header, create_doc):
+        create_doc("a", "a", project="tmp")
+        create_doc("b", "b", project="tmp/x")
+        resp = client.post("/api/projects/delete", json={"path": "tmp"}, headers=auth_header)
+        assert resp.json()["updated"] == 2
+        assert _projects(client, auth_header) == {"a": None, "b": None}
+
+
+class TestProjectTree:
+    """Tests for GET /api/projects/tree."""
+
+    def _tree(self, client, auth_header, **params):
+        resp = client.get("/api/projects/tree", params=params, headers=auth_header)
+        assert resp.status_code == 200
+        return resp.json()
+
+    def test_counts_and_hierarchy(self, client, auth_header, create_doc):
+        create_doc("a", "a", project="infra")
+        create_doc("b", "b", project="infra/k3s")
+        create_doc("c", "c", project="infra/k3s")
+        create_doc("d", "d", project="notes")
+        create_doc("e", "e", project=None)
+
+        tree = self._tree(client, auth_header)
+        assert (tree["doc_count"], tree["total_count"]) == (1, 5)
+        infra, notes = tree["children"]
+        assert (infra["path"], infra["doc_count"], infra["total_count"]) == ("infra", 1, 3)
+        assert infra["children"][0]["path"] == "infra/k3s"
+        assert infra["children"][0]["doc_count"] == 2
+        assert notes["total_count"] == 1 and notes["has_children"] is False
+        assert infra["updated_at"] is not None
+
+    def test_lazy_expansion(self, client, auth_header, create_doc):
+        create_doc("a", "a", project="infra/k3s/prod")
+        create_doc("b", "b", project="infra-old")
+
+        tree = self._tree(client, auth_header, depth=1)
+        infra = tree["children"][0]
+        assert infra["has_children"] is True and infra["children"] is None
+
+        node = self._tree(client, auth_header, path="infra", depth=1)
+        assert node["total_count"] == 1
+        assert [c["path"] for c in node["children"]] == ["infra/k3s"]
+        assert node["children"][0]["children"] is None
+
+        resp = client.get("/api/projects/tree?path=missing", headers=auth_header)
+        assert resp.status_code == 404
+
+    def test_follows_moves_and_deletes(self, client, auth_header, create_doc):
+        doc_id = create_doc("a", "a", project="old")["id"]
+        create_doc("b", "b", project="old/sub")
+        client.post(
+            "/api/projects/rename", json={"path": "old", "new_path": "new"}, headers=auth_header
+        )
+        client.put(f"/api/docs/{doc_id}", json={"project": "other"}, headers=auth_header)
+        tree = self._tree(client, auth_header)
+        assert {c["path"]: c["total_count"] for c in tree["children"]} == {"new": 1, "other": 1}
+
+        client.delete(f"/api/docs/{doc_id}", headers=auth_header)
+        assert [c["path"] for c in self._tree(client, auth_header)["children"]] == ["new"]
+
+    def test_folder_documents_not_recursive(self, client, auth_header, create_doc):
+        create_doc("top", "top", project="infra")
+        create_doc("nested", "nested", project="infra/k3s")
+        create_doc("loose", "loose", project=None)
+        resp = client.get(
+            "/api/docs", params={"project": "infra", "recursive": "false"}, headers=auth_header
+        )
+        assert [d["title"] for d in resp.json()] == ["top"]
+        resp = client.get("/api/docs", params={"recursive": "false"}, headers=auth_header)
+        assert [d["title"] for d in resp.json()] == ["loose"]
+
+    def test_migration_builds_index(self, client, auth_header, create_doc):
+        from backend.database import init_db, write_db
+
+        create_doc("a", "a", project="infra")
+        with write_db() as conn:
+            conn.execute("DELETE FROM projects")
+            conn.execute("DELETE FROM vault_meta WHERE key = 'projects_index'")
+            conn.commit()
+        init_db()
+        tree = self._tree(client, auth_header)
+        assert [(c["path"], c["doc_count"]) for c in tree["children"]] == [("infra", 1)]
@@ -0,0 +1,126 @@
+"""Tests for document revisions: reverse deltas, snapshots, history and restore."""
+
+import random
+
+
+def _put(client, auth_header, doc_id, **updates):
+    resp = client.put(f"/api/docs/{doc_id}", json=updates, headers=auth_header)
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def _lines(n: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    return [f"line {i} {rng.random():.6f} àè\n" for i in range(n)]
+
+
+class TestDiff:
+    """Tests for the delta format."""
+
+    def test_round_trips(self):
+        from backend import revisions
+
+        base = "".join(_lines(3000))
+        rng = random.Random(7)
+        scattered = _lines(3000)
+        for i in rng.sample(range(3000), 20):
+            scattered[i] = f"edited {i}\n"
+        cases = [
+            ("", "new text"),
+            ("old text", ""),
+            ("same", "same"),
+            ("abcdef", "abXYef"),
+            (base, base.replace("line 1500 ", "line 1500 edited ")),
+            (base, base[:1000] + base[5000:]),
+            (base, "".join(scattered)),
+            (base, "prefix\n" + base + "suffix\n"),
+        ]
+        for source, target in cases:
+            ops = revisions.diff(source, target)
+            assert revisions.apply(source, ops) == target
+        # Modifiche sparse: si copiano le righe uguali invece del tratto intero
+        ops = revisions.diff(base, "".join(scattered))
+        inserted = sum(len(op) for op in ops if isinstance(op, str))
+        assert inserted < 1000
+
+
+class TestRevisionEndpoints:
+    """Tests for GET /api/docs/{id}/revisions and the restore endpoint."""
+
+    def test_history_reconstructs_every_version(
+        self, client, auth_header, create_doc, monkeypatch
+    ):
+        from backend import config
+
+        monkeypatch.setattr(config, "REVISION_SNAPSHOT_EVERY", 3)
+        lines = _lines(500)
+        doc_id = create_doc("Log", "".join(lines), project="ops", tags="a")["id"]
+        saved = {1: ("Log", "".join(lines), "ops", ["a"])}
+        for version in range(2, 10):
+            if version == 5:
+                doc = _put(client, auth_header, doc_id, title="Renamed", tags="a,b")
+            else:
+                lines[version * 40] = f"changed in version {version}\n"
+                doc = _put(client, auth_header, doc_id, content="".join(lines))
+            assert doc["version"] == version
+            saved[version] = (doc["title"], doc["content"], doc["project"], doc["tags"])
+
+        history = client.get(f"/api/docs/{doc_id}/revisions", headers=auth_header).json()
+        assert [r["version"] for r in history] == list(range(8, 0, -1))
+        kinds = {r["version"]: r["kind"] for r in history}
+        assert kinds[4] == "same" and "snapshot" in kinds.values()
+        # Un delta di una riga costa poco rispetto al documento (~20 KB)
+        assert all(r["stored_bytes"] < 300 for r in history if r["kind"] == "delta")
+        for version in range(1, 9):
+            rev = client.get(f"/api/docs/{doc_id}/revisions/{version}", headers=auth_header)
+            data = rev.json()
+            assert (data["title"], data["content"], data["project"], data["tags"]) == saved[
+                version
+            ]
+        page = client.get(
+            f"/api/docs/{doc_id}/revisions?before=4&limit=2", headers=auth_header
+        ).json()
+        assert [r["version"] for r in page] == [3, 2]
+
+        resp = client.get(f"/api/docs/{doc_id}/revisions/9", headers=auth_header)
+        assert resp.status_code == 404
+        assert client.get("/api/docs/999/revisions", headers=auth_header).status_code == 404
+
+    def test_restore_creates_new_version(self, client, auth_header, create_doc):
+        from backend.database import read_db
+
+        doc_id = create_doc("Draft", "first body", tags="x")["id"]
+        _put(client, auth_header, doc_id, title="Final", content="second body", project="p")
+        resp = client.post(f"/api/docs/{doc_id}/revisions/1/restore", headers=auth_header)
+        assert resp.status_code == 200
+        doc = resp.json()
+        assert doc["version"] == 3 and doc["title"] == "Draft"
+        assert doc["content"] == "first body" and doc["project"] is None and doc["tags"] == ["x"]
+        hits = client.get("/api/search", params={"q": "first"}, headers=auth_header).json()
+        assert [h["id"] for h in hits] == [doc_id]
+        # Anche il ripristino e' nello storico: la versione 2 resta raggiungibile
+        rev = client.get(f"/api/docs/{doc_id}/revisions/2", headers=auth_header).json()
+        assert rev["content"] == "second body"
+        resp = client.post(f"/api/docs/{doc_id}/revisions/7/restore", headers=auth_header)
+        assert resp.status_code == 404
+
+        assert client.delete(f"/api/docs/{doc_id}", headers=auth_header).status_code == 204
+        with read_db() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM document_revisions").fetchone()[0] == 0
+
+    def test_folder_moves_are_recorded(self, client, auth_header, create_doc):
+        doc_id = create_doc("Runbook", "steps", project="old/sub")["id"]
+        other = create_doc("Elsewhere", "x", project="older")["id"]
+        client.post(
+            "/api/projects/rename", json={"path": "old", "new_path": "new"}, headers=auth_header
+        )
+        client.post("/api/projects/delete", json={"path": "new"}, headers=auth_header)
+        doc = client.get(f"/api/docs/{doc_id}", headers=auth_header).json()
+        assert doc["version"] == 3 and doc["project"] is None
+
+        history = client.get(f"/api/docs/{doc_id}/revisions", headers=auth_header).json()
+        assert [(r["version"], r["kind"]) for r in history] == [(2, "same"), (1, "same")]
+        for version, project in ((1, "old/sub"), (2, "new/sub")):
+            rev = client.get(f"/api/docs/{doc_id}/revisions/{version}", headers=auth_header)
+            assert rev.json()["project"] == project and rev.json()["content"] == "steps"
+        assert client.get(f"/api/docs/{other}/revisions", headers=auth_header).json() == []
@@ -0,0 +1,134 @@
+"""Tests for the row-range API over CSV and XLSX attachments."""
+
+import io
+import zipfile
+
+
+def _csv(rows: int) -> bytes:
+    lines = ["id;name;price;active"]
+    lines += [f"{i};item {i};{i * 1.5};{'true' if i % 2 else 'false'}" for i in range(rows)]
+    return ("\ufeff" + "\n".join(lines) + "\n").encode()
+
+
+def _xlsx() -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr(
+            "xl/workbook.xml",
+            '<workbook><sheets><sheet name="People" r:id="rId1"/>'
+            '<sheet name="Empty" r:id="rId2"/></sheets></workbook>',
+        )
+        zf.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<Relationships><Relationship Id="rId1" Target="worksheets/sheet1.xml"/>'
+            '<Relationship Id="rId2" Target="worksheets/sheet2.xml"/></Relationships>',
+        )
+        zf.writestr("xl/sharedStrings.xml", "<sst><si><t>Name</t></si><si><t>Ada</t></si></sst>")
+        zf.writestr(
+            "xl/worksheets/sheet1.xml",
+            "<worksheet><sheetData>"
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="inlineStr"><is><t>Age</t></is>'
+            "</c></row>"
+            '<row r="2"><c r="A2" t="s"><v>1</v></c><c r="C2"><v>36</v></c></row>'
+            '<row r="3"><c r="A3" t="inlineStr"><is><t>Line, "two"\nthree</t></is></c>'
+            '<c r="C3"><v>41</v></c></row>'
+            "</sheetData></worksheet>",
+        )
+        zf.writestr("xl/worksheets/sheet2.xml", "<worksheet><sheetData/></worksheet>")
+    return buf.getvalue()
+
+
+class TestCsvRows:
+    """Tests for GET /api/docs/{id}/rows on CSV files."""
+
+    def test_schema_and_ranges_across_blocks(self, client, auth_header, upload_file, monkeypatch):
+        from backend import config
+
+        monkeypatch.setattr(config, "ROWS_STRIDE", 7)
+        doc_id = upload_file("items.csv", _csv(50))
+        resp = client.get(f"/api/docs/{doc_id}/rows?limit=3", headers=auth_header)
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["row_count"] == 50 and data["sheets"] == [""]
+        assert data["columns"] == [
+            {"name": "id", "type": "integer"},
+            {"name": "name", "type": "text"},
+            {"name": "price", "type": "number"},
+            {"name": "active", "type": "boolean"},
+        ]
+        assert data["rows"][0] == ["0", "item 0", "0.0", "false"]
+
+        for offset in (0, 6, 7, 20, 48):
+            url = f"/api/docs/{doc_id}/rows?offset={offset}&limit=4&columns=name,id"
+            page = client.get(url, headers=auth_header).json()
+            expected = [[f"item {i}", str(i)] for i in range(offset, min(offset + 4, 50))]
+            assert page["rows"] == expected and page["offset"] == offset
+            assert [c["name"] for c in page["columns"]] == ["name", "id"]
+        end = client.get(f"/api/docs/{doc_id}/rows?offset=50", headers=auth_header).json()
+        assert end["rows"] == [] and end["row_count"] == 50
+
+    def test_index_built_once_and_persisted(self, client, auth_header, upload_file, monkeypatch):
+        from backend import rows
+        from backend.database import read_db
+
+        body = b'a,b\n1,"multi\nline"\n\n2,x\n'
+        doc_id = upload_file("quoted.csv", body)
+        built = []
+        original = rows.build
+        monkeypatch.setattr(rows, "build", lambda *a: built.append(a) or original(*a))
+        for _ in range(3):
+            page = client.get(f"/api/docs/{doc_id}/rows", headers=auth_header).json()
+            assert page["rows"] == [["1", "multi\nline"], ["2", "x"]]
+        assert len(built) == 1
+        with read_db() as conn:
+            stored = conn.execute("SELECT row_count, source FROM row_index").fetchall()
+        assert [tuple(r) for r in stored] == [(2, None)]
+
+        # Stesso contenuto in un altro documento: stesso indice
+        other = upload_file("copy.csv", body)
+        client.get(f"/api/docs/{other}/rows", headers=auth_header)
+        assert len(built) == 1
+
+    def test_errors(self, client, auth_header, upload_file):
+        doc_id = upload_file("items.csv", _csv(3))
+        resp = client.get(f"/api/docs/{doc_id}/rows?columns=id,nope", headers=auth_header)
+        assert resp.status_code == 400 and "nope" in resp.json()["detail"]
+        resp = client.get(f"/api/docs/{doc_id}/rows?sheet=1", headers=auth_header)
+        assert resp.status_code == 404
+        resp = client.get(f"/api/docs/{doc_id}/rows?limit=5000", headers=auth_header)
+        assert resp.status_code == 422
+        pdf = upload_file("scan.pdf", b"%PDF-1.4\n%%EOF\n")
+        assert client.get(f"/api/docs/{pdf}/rows", headers=auth_header).status_code == 404
+        bad = upload_file("broken.xlsx", b"not a zip")
+        resp = client.get(f"/api/docs/{bad}/rows", headers=auth_header)
+        assert resp.status_code == 404 and "Unreadable" in resp.json()["detail"]
+
+
+class TestXlsxRows:
+    """Tests for sheets converted to indexed CSV."""
+
+    def test_sheets_positions_and_gc(self, client, auth_header, upload_file):
+        import os
+
+        from backend import blobs, config, rows
+        from backend.database import read_db
+
+        doc_id = upload_file("people.xlsx", _xlsx())
+        data = client.get(f"/api/docs/{doc_id}/rows", headers=auth_header).json()
+        assert data["sheets"] == ["People", "Empty"] and data["row_count"] == 2
+        assert [c["name"] for c in data["columns"]] == ["Name", "column 2", "Age"]
+        assert data["columns"][2]["type"] == "integer"
+        assert data["rows"] == [["Ada", "", "36"], ['Line, "two"\nthree', "", "41"]]
+
+        empty = client.get(f"/api/docs/{doc_id}/rows?sheet=1", headers=auth_header).json()
+        assert empty["row_count"] == 0 and empty["columns"] == [] and empty["rows"] == []
+
+        with read_db() as conn:
+            sources = [r[0] for r in conn.execute("SELECT source FROM row_index ORDER BY sheet")]
+        assert all(os.path.exists(os.path.join(config.UPLOAD_DIR, s)) for s in sources)
+        assert client.delete(f"/api/docs/{doc_id}", headers=auth_header).status_code == 204
+        with read_db() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM row_index").fetchone()[0] == 0
+        blobs.gc()
+        assert not any(os.path.exists(os.path.join(config.UPLOAD_DIR, s)) for s in sources)
+        assert not any(files for _, _, files in os.walk(rows.derived_dir()))
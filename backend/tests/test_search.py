@@ -1,5 +1,13 @@
 """Tests for search, healthz, and system-info endpoints."""
 
+import importlib
+import threading
+import time
+
+import pytest
+
+from backend.search_cache import SearchCache
+
 
 class TestSearch:
     """Tests for GET /api/search."""
@@ -57,6 +65,337 @@ class TestSearch:
         assert resp.status_code == 401
 
 
+class TestSearchPaging:
+    """Tests for cursor pagination, facets and snippets on /api/search."""
+
+    def _seed(self, client, auth_header):
+        for i in range(7):
+            client.post(
+                "/api/docs",
+                json={
+                    "title": f"Doc {i}",
+                    # Stessa lunghezza per colonna: rank uguali a gruppi, ordinati per id
+                    "content": "kubernetes " * (i // 3 + 1) + "filler " * (3 - i // 3),
+                    "project": "infra/k3s" if i % 2 else "notes/old",
+                    "tags": "k8s,ops" if i < 3 else "ops,misc",
+                },
+                headers=auth_header,
+            )
+
+    def _all_pages(self, client, auth_header, **params):
+        seen, cursor = [], None
+        while True:
+            query = {"q": "kubernetes", "limit": 2, **params}
+            if cursor:
+                query["cursor"] = cursor
+            resp = client.get("/api/search", params=query, headers=auth_header)
+            assert resp.status_code == 200
+            body = resp.json()
+            seen += body["results"] if isinstance(body, dict) else body
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                return seen
+
+    def test_cursor_pages_cover_all_results_once(self, client, auth_header):
+        self._seed(client, auth_header)
+        full = client.get("/api/search", params={"q": "kubernetes"}, headers=auth_header).json()
+        paged = self._all_pages(client, auth_header)
+        assert [r["id"] for r in paged] == [r["id"] for r in full]
+        assert len({r["id"] for r in paged}) == 7
+        ranks = [r["rank"] for r in paged]
+        assert ranks == sorted(ranks) and len(set(ranks)) < len(ranks)
+
+    def test_ids_only_and_batch_snippets(self, client, auth_header):
+        self._seed(client, auth_header)
+        hits = self._all_pages(client, auth_header, snippets="false")
+        assert set(hits[0]) == {"id", "rank"}
+
+        ids = ",".join(str(h["id"]) for h in hits[:3])
+        resp = client.get(
+            "/api/search/snippets", params={"q": "kubernetes", "ids": ids}, headers=auth_header
+        )
+        assert [s["id"] for s in resp.json()] == [h["id"] for h in hits[:3]]
+        assert "<mark>kubernetes</mark>" in resp.json()[0]["snippet"]
+
+    def test_facets(self, client, auth_header):
+        self._seed(client, auth_header)
+        resp = client.get(
+            "/api/search", params={"q": "kubernetes", "facets": "true"}, headers=auth_header
+        )
+        body = resp.json()
+        assert body["total"] == 7
+        assert body["facets"]["project"] == {"notes/old": 4, "infra/k3s": 3}
+        assert body["facets"]["tag"] == {"ops": 7, "misc": 4, "k8s": 3}
+        assert body["results"][0]["snippet"]
+        assert self._all_pages(client, auth_header, facets="true") == self._all_pages(
+            client, auth_header
+        )
+
+    def test_filters(self, client, auth_header):
+        self._seed(client, auth_header)
+        resp = client.get(
+            "/api/search",
+            params={"q": "kubernetes", "project": "infra", "tag": "k8s"},
+            headers=auth_header,
+        )
+        assert [r["title"] for r in resp.json()] == ["Doc 1"]
+
+    def test_invalid_cursor(self, client, auth_header):
+        resp = client.get("/api/search", params={"q": "x", "cursor": "nope"}, headers=auth_header)
+        assert resp.status_code == 400
+
+
+class TestSearchCache:
+    """Tests for the search result cache."""
+
+    def _stats(self, client, auth_header):
+        return client.get("/api/system-info", headers=auth_header).json()["search_cache"]
+
+    def test_repeat_hits_and_write_invalidates(self, client, auth_header):
+        client.post(
+            "/api/docs", json={"title": "One", "content": "cached words"}, headers=auth_header
+        )
+        before = self._stats(client, auth_header)
+        first = client.get("/api/search", params={"q": "Cached"}, headers=auth_header).json()
+        again = client.get("/api/search", params={"q": " cached "}, headers=auth_header).json()
+        assert again == first and len(first) == 1
+        after = self._stats(client, auth_header)
+        assert after["misses"] - before["misses"] == 1
+        assert after["hits"] - before["hits"] == 1
+
+        client.post(
+            "/api/docs", json={"title": "Two", "content": "cached again"}, headers=auth_header
+        )
+        results = client.get("/api/search", params={"q": "cached"}, headers=auth_header).json()
+        assert len(results) == 2
+        assert self._stats(client, auth_header)["invalidations"] > after["invalidations"]
+
+    def test_concurrent_identical_queries_coalesce(self):
+        cache = SearchCache(max_bytes=1 << 20, ttl=60)
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return ["result"]
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get(1, "q", compute)))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        while cache.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        assert calls == [1] and results == [["result"]] * 4
+
+    def test_byte_bound_ttl_and_version(self):
+        cache = SearchCache(max_bytes=200, ttl=60)
+        for i in range(10):
+            cache.get(1, i, lambda: "x" * 40)
+        stats = cache.stats()
+        assert stats["bytes"] <= 200 and stats["evictions"] > 0
+
+        assert cache.get(2, 9, lambda: "new") == "new"
+        assert cache.stats()["entries"] == 1
+
+        cache.ttl = 0
+        cache.get(2, "ttl", lambda: "a")
+        assert cache.get(2, "ttl", lambda: "b") == "b"
+
+
+class TestSearchSuggest:
+    """Tests for GET /api/search/suggest."""
+
+    def _suggest(self, client, auth_header, prefix):
+        resp = client.get("/api/search/suggest", params={"prefix": prefix}, headers=auth_header)
+        assert resp.status_code == 200
+        return resp.json()
+
+    def test_terms_by_document_frequency(self, client, auth_header, monkeypatch):
+        import backend.routers.search
+
+        monkeypatch.setattr(backend.routers.search, "SUGGEST_REFRESH_INTERVAL", 0)
+        for i, content in enumerate(["deploy", "deploy deployment", "deploy depot", "deploy"]):
+            client.post(
+                "/api/docs", json={"title": f"Doc {i}", "content": content}, headers=auth_header
+            )
+        # La prima richiesta vede la copia vecchia e avvia il riallineamento
+        self._suggest(client, auth_header, "dep")
+        body = self._suggest(client, auth_header, "kubernetes Dép")
+        assert [(t["term"], t["doc_count"]) for t in body["terms"]] == [
+            ("deploy", 4),
+            ("deployment", 1),
+            ("depot", 1),
+        ]
+        assert body["terms"][0]["text"] == "kubernetes deploy"
+
+    def test_titles_are_live_and_newest_first(self, client, auth_header):
+        for title in ["Kubernetes setup", "Kubectl cheatsheet", "Notes on kubernetes"]:
+            client.post("/api/docs", json={"title": title, "content": "body"}, headers=auth_header)
+        body = self._suggest(client, auth_header, "kub")
+        assert [t["title"] for t in body["titles"]] == [
+            "Notes on kubernetes",
+            "Kubectl cheatsheet",
+            "Kubernetes setup",
+        ]
+        body = self._suggest(client, auth_header, "kubernetes se")
+        assert [t["title"] for t in body["titles"]] == ["Kubernetes setup"]
+        assert self._suggest(client, auth_header, "k")["titles"] == []
+        assert self._suggest(client, auth_header, "--") == {"terms": [], "titles": []}
+
+    def test_migration_adds_prefix_index(self, client, auth_header):
+        from backend import fts
+        from backend.database import init_db, read_db, write_db
+
+        client.post("/api/docs", json={"title": "Old vault", "content": "x"}, headers=auth_header)
+        with write_db() as conn:
+            conn.executescript("""
+                DROP TABLE documents_fts;
+                CREATE VIRTUAL TABLE documents_fts USING fts5(
+                    title, content, project, tags, content=documents, content_rowid=id
+                );
+                INSERT INTO documents_fts(documents_fts) VALUES ('rebuild');
+                DELETE FROM search_terms;
+                DELETE FROM vault_meta WHERE key IN ('terms_seq', 'fts_profile');
+            """)
+        init_db()
+        with read_db() as conn:
+            assert fts.active_options(conn)["prefix"] == ""
+            assert fts.needs_rebuild(conn)
+        assert fts.rebuild()
+        with read_db() as conn:
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'documents_fts'")
+            assert "prefix='2 3'" in sql.fetchone()[0]
+        body = self._suggest(client, auth_header, "vau")
+        assert [t["term"] for t in body["terms"]] == ["vault"]
+        assert [t["title"] for t in body["titles"]] == ["Old vault"]
+
+    def test_unauthenticated(self, client):
+        assert client.get("/api/search/suggest", params={"prefix": "a"}).status_code == 401
+
+
+class TestSearchTrigram:
+    """Tests for mode=substring and mode=fuzzy on the optional trigram index."""
+
+    @pytest.fixture(autouse=True)
+    def trigram(self, monkeypatch):
+        import backend.routers.search
+
+        monkeypatch.setenv("SEARCH_TRIGRAM", "true")
+        monkeypatch.setattr(backend.routers.search, "SEARCH_TRIGRAM", True)
+
+    def _search(self, client, auth_header, q, mode, **params):
+        return client.get(
+            "/api/search", params={"q": q, "mode": mode, **params}, headers=auth_header
+        )
+
+    def _refresh_terms(self):
+        from backend.database import apply_search_terms, search_terms_diff, write_db
+
+        with write_db() as conn:
+            apply_search_terms(conn, *search_terms_diff(conn))
+
+    def test_substring_inside_identifiers(self, client, auth_header):
+        for title, content in [
+            ("Config", "set maxConnectionPoolSize in app.yaml"),
+            ("Paths", "logs go to /var/log/mdvault/app.log"),
+            ("Other", "nothing to see"),
+        ]:
+            client.post(
+                "/api/docs", json={"title": title, "content": content}, headers=auth_header
+            )
+        assert self._search(client, auth_header, "connection", "phrase").json() == []
+        resp = self._search(client, auth_header, "connectionpool", "substring")
+        assert [r["title"] for r in resp.json()] == ["Config"]
+        assert "<mark>ConnectionPool</mark>" in resp.json()[0]["snippet"]
+        resp = self._search(client, auth_header, "log/mdvault", "substring")
+        assert [r["title"] for r in resp.json()] == ["Paths"]
+        resp = self._search(client, auth_header, "ab", "substring")
+        assert resp.status_code == 400
+
+    def test_substring_pages_newest_first_and_follows_edits(self, client, auth_header):
+        ids = [
+            client.post(
+                "/api/docs", json={"title": f"d{i}", "content": "xyzzy"}, headers=auth_header
+            ).json()["id"]
+            for i in range(5)
+        ]
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            resp = self._search(client, auth_header, "yzz", "substring", **params)
+            seen += [r["id"] for r in resp.json()]
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == ids[::-1]
+
+        client.put(f"/api/docs/{ids[0]}", json={"content": "plain"}, headers=auth_header)
+        client.delete(f"/api/docs/{ids[1]}", headers=auth_header)
+        resp = self._search(client, auth_header, "yzz", "substring")
+        assert [r["id"] for r in resp.json()] == ids[:1:-1]
+
+    def test_fuzzy_tolerates_typos(self, client, auth_header):
+        from backend.database import read_db
+
+        for title, content in [
+            ("K8s", "kubernetes cluster upgrade"),
+            ("Py", "python packaging notes"),
+            ("Misc", "kitchen recipes"),
+        ]:
+            client.post(
+                "/api/docs", json={"title": title, "content": content}, headers=auth_header
+            )
+        self._refresh_terms()
+        assert self._search(client, auth_header, "kubernetse", "phrase").json() == []
+        for q, title in [
+            ("kubernetse", "K8s"),
+            ("pyhton", "Py"),
+            ("kuberntes clustr", "K8s"),
+            ("packaging", "Py"),
+        ]:
+            resp = self._search(client, auth_header, q, "fuzzy")
+            assert [r["title"] for r in resp.json()] == [title], q
+        assert self._search(client, auth_header, "--", "fuzzy").status_code == 400
+
+        k8s = self._search(client, auth_header, "kubernetes", "phrase").json()[0]["id"]
+        client.delete(f"/api/docs/{k8s}", headers=auth_header)
+        self._refresh_terms()
+        assert self._search(client, auth_header, "kubernetse", "fuzzy").json() == []
+        with read_db() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM search_terms_trigram WHERE term = 'kubernetes'"
+            ).fetchone()
+        assert row[0] == 0
+
+    def test_disabled_by_default(self, client, auth_header, monkeypatch):
+        import backend.config
+        import backend.database
+        import backend.routers.search
+        from backend.database import init_db, read_db
+
+        monkeypatch.setattr(backend.routers.search, "SEARCH_TRIGRAM", False)
+        resp = self._search(client, auth_header, "abc", "substring")
+        assert resp.status_code == 400
+        assert "SEARCH_TRIGRAM" in resp.json()["detail"]
+
+        monkeypatch.setenv("SEARCH_TRIGRAM", "false")
+        importlib.reload(backend.config)
+        importlib.reload(backend.database)
+        init_db()
+        with read_db() as conn:
+            names = conn.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE '%trigram%'"
+            ).fetchall()
+        assert names == []
+
+
 class TestHealthz:
     """Tests for GET /api/healthz."""
 
@@ -81,6 +420,7 @@ class TestSystemInfo:
         assert "sqlite" in data
         assert "doc_count" in data
         assert "db_size_mb" in data
+        assert data["db_pool"]["max_size"] >= 1
 
     def test_unauthenticated_returns_401(self, client):
         resp = client.get("/api/system-info")
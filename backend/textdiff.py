@@ -0,0 +1,55 @@
+"""Confronto e modifica di testi lunghi: tratto cambiato tra due versioni e sostituzioni.
+
+Usati dallo storico (backend.revisions), dal PATCH dei documenti e dai chunk,
+che ridividono solo attorno al tratto cambiato.
+"""
+
+_BLOCK = 4096
+
+
+class InvalidEdit(ValueError):
+    """Modifica fuori dal testo base o sovrapposta alla precedente."""
+
+
+def common_prefix(a: str, b: str) -> int:
+    """Lunghezza del prefisso comune, a blocchi (confronti di slice in C)."""
+    n = min(len(a), len(b))
+    i = 0
+    while i + _BLOCK <= n and a[i : i + _BLOCK] == b[i : i + _BLOCK]:  # noqa: E203
+        i += _BLOCK
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def common_suffix(a: str, b: str, limit: int) -> int:
+    """Lunghezza del suffisso comune, al piu' ``limit`` (non si sovrappone al prefisso)."""
+    n = min(len(a), len(b), limit)
+    i = 0
+    while i + _BLOCK <= n:
+        x, y = len(a) - i, len(b) - i
+        if a[x - _BLOCK : x] != b[y - _BLOCK : y]:  # noqa: E203
+            break
+        i += _BLOCK
+    while i < n and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+    return i
+
+
+def changed_span(old: str, new: str) -> tuple[int, int]:
+    """(prefisso, suffisso) comuni: il tratto cambiato e' ``[prefisso, len - suffisso)``."""
+    start = common_prefix(old, new)
+    return start, common_suffix(old, new, min(len(old), len(new)) - start)
+
+
+def splice(content: str, edits: list[tuple[int, int, str]]) -> str:
+    """Applica a ``content`` le sostituzioni ``(start, end, text)``, in ordine e disgiunte."""
+    parts = []
+    pos = 0
+    for start, end, text in edits:
+        if start < pos or end < start or end > len(content):
+            raise InvalidEdit(f"Edit [{start}, {end}) out of order or past the end")
+        parts += [content[pos:start], text]
+        pos = end
+    parts.append(content[pos:])
+    return "".join(parts)
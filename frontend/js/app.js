@@ -1,12 +1,17 @@
 import { state } from "./state.js";
 import { initAuth, showLogin, showMain, onLoginSuccess } from "./auth.js";
 import { initDocuments, loadDocuments, onDocumentsLoaded } from "./documents.js";
+import { onDocumentEvent, startEvents } from "./events.js";
 import { initTree, renderTree } from "./tree.js";
 import { initWindows } from "./windows.js";
 
 // Wire cross-module callbacks
-onLoginSuccess(loadDocuments);
+onLoginSuccess(function () {
+    loadDocuments();
+    startEvents();
+});
 onDocumentsLoaded(renderTree);
+onDocumentEvent(loadDocuments);
 
 // Initialize all modules
 initAuth();
@@ -2,6 +2,7 @@
 
 import { state } from "./state.js";
 import { apiFetch, setOnUnauthorized } from "./api.js";
+import { stopEvents } from "./events.js";
 
 var loginSuccessCallback = null;
 
@@ -71,6 +72,8 @@ async function doLogin() {
 function doLogout() {
     sessionStorage.removeItem("md_vault_token");
     state.token = null;
+    state.changeSeq = null;
+    stopEvents();
     showLogin();
 }
 
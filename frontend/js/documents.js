@@ -10,6 +10,7 @@ var docContainer = document.getElementById("doc-container");
 var statusCount = document.getElementById("status-count");
 var searchInput = document.getElementById("search-input");
 var searchBtn = document.getElementById("search-btn");
+var searchSuggest = document.getElementById("search-suggest");
 var editorOverlay = document.getElementById("editor-overlay");
 var editorTitle = document.getElementById("editor-title");
 var docTitleInput = document.getElementById("doc-title");
@@ -108,9 +109,13 @@ async function renderFilePreview(doc, container) {
     try {
         if (ext === "pdf") {
             await renderPdf(doc.id, container);
-        } else if (ext === "docx" || ext === "doc") {
+        } else if (ext === "docx" || ext === "xlsx" || ext === "pptx") {
+            await renderOffice(doc, ext, container);
+        } else if (ext === "doc") {
             await renderDocx(doc.id, container);
-        } else if (ext === "xlsx" || ext === "xls" || ext === "csv") {
+        } else if (ext === "csv") {
+            await renderRows(doc.id, container, 0);
+        } else if (ext === "xls") {
             await renderSpreadsheet(doc.id, container);
         } else if (["png", "jpg", "jpeg", "gif", "svg"].indexOf(ext) !== -1) {
             await renderImage(doc.id, container);
@@ -126,28 +131,134 @@ async function renderFilePreview(doc, container) {
     }
 }
 
+// --- Server-side previews (page images cached on disk, see backend/previews.py) ---
+async function fetchPreviewInfo(docId) {
+    try {
+        var res = await apiFetch("/docs/" + docId + "/preview");
+        return res.ok ? await res.json() : null;
+    } catch (e) {
+        return null;
+    }
+}
+
+function whenVisible(el, fn) {
+    if (!("IntersectionObserver" in window)) {
+        fn();
+        return;
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries.some(function (e) { return e.isIntersecting; })) {
+            observer.disconnect();
+            fn();
+        }
+    }, { rootMargin: "600px" });
+    observer.observe(el);
+}
+
+function previewImage(docId, info, page, size) {
+    // Fetched when scrolled into view; "v" makes the URL immutable, so the browser cache keeps it
+    var img = document.createElement("img");
+    img.className = "preview-page";
+    img.alt = "Page " + page;
+    whenVisible(img, function () {
+        var path = "/docs/" + docId + "/preview/" + page + "?size=" + size +
+            "&v=" + encodeURIComponent(info.version);
+        apiFetch(path).then(function (r) {
+            if (!r.ok) throw new Error("HTTP " + r.status);
+            return r.blob();
+        }).then(function (blob) {
+            var blobUrl = URL.createObjectURL(blob);
+            img.onload = function () {
+                img.classList.add("loaded");
+                URL.revokeObjectURL(blobUrl);
+            };
+            img.src = blobUrl;
+        }).catch(function () {
+            img.alt = "Preview not available";
+        });
+    });
+    return img;
+}
+
 async function renderPdf(docId, container) {
+    var info = await fetchPreviewInfo(docId);
+    if (info && info.renderable && info.pages) {
+        container.textContent = "";
+        for (var p = 1; p <= info.pages; p++) {
+            container.appendChild(previewImage(docId, info, p, 1024));
+        }
+        return;
+    }
+
+    // No server renderer: pdf.js reads only the byte ranges it needs and draws pages on scroll
     await loadScript("https://cdnjs.cloudflare.com/ajax/libs/pdf.js/3.11.174/pdf.min.js");
     container.textContent = "";
-    var res = await apiFetch(filePath(docId));
-    var data = await res.arrayBuffer();
-
     pdfjsLib.GlobalWorkerOptions.workerSrc =
         "https://cdnjs.cloudflare.com/ajax/libs/pdf.js/3.11.174/pdf.worker.min.js";
-    var pdf = await pdfjsLib.getDocument({ data: data }).promise;
+    var pdf = await pdfjsLib.getDocument({
+        url: "/api" + filePath(docId),
+        httpHeaders: { Authorization: "Bearer " + state.token },
+        disableAutoFetch: true,
+        disableStream: true,
+    }).promise;
 
     for (var i = 1; i <= pdf.numPages; i++) {
-        var page = await pdf.getPage(i);
-        var viewport = page.getViewport({ scale: 1.2 });
         var canvas = document.createElement("canvas");
-        canvas.width = viewport.width;
-        canvas.height = viewport.height;
-        canvas.style.display = "block";
-        canvas.style.marginBottom = "8px";
-        canvas.style.maxWidth = "100%";
-        var ctx = canvas.getContext("2d");
-        await page.render({ canvasContext: ctx, viewport: viewport }).promise;
+        canvas.className = "preview-page";
         container.appendChild(canvas);
+        whenVisible(canvas, renderPdfPage.bind(null, pdf, i, canvas));
+    }
+}
+
+async function renderPdfPage(pdf, number, canvas) {
+    var page = await pdf.getPage(number);
+    var viewport = page.getViewport({ scale: 1.2 });
+    canvas.width = viewport.width;
+    canvas.height = viewport.height;
+    canvas.classList.add("loaded");
+    await page.render({ canvasContext: canvas.getContext("2d"), viewport: viewport }).promise;
+}
+
+async function renderOffice(doc, ext, container) {
+    // Embedded thumbnail + text extracted on the server; the full file only on request
+    var full = { docx: renderDocx, xlsx: renderRows }[ext];
+    var info = await fetchPreviewInfo(doc.id);
+    var thumbnail = info && info.renderable;
+    if (!thumbnail && !doc.content && full) {
+        await full(doc.id, container);
+        return;
+    }
+    container.textContent = "";
+    if (info && info.pages) {
+        var count = document.createElement("div");
+        count.className = "doc-meta";
+        var unit = { docx: " pages", xlsx: " sheets", pptx: " slides" }[ext];
+        count.textContent = info.pages + unit;
+        container.appendChild(count);
+    }
+    if (thumbnail) container.appendChild(previewImage(doc.id, info, 1, 480));
+    if (doc.content) {
+        var text = document.createElement("pre");
+        text.className = "extracted-text";
+        text.textContent = doc.content;
+        container.appendChild(text);
+    } else {
+        var pending = document.createElement("div");
+        pending.className = "doc-meta";
+        pending.textContent = "Text extraction pending.";
+        container.appendChild(pending);
+    }
+    if (full) {
+        var btn = document.createElement("button");
+        btn.className = "win-btn-sm";
+        btn.textContent = "Full Preview";
+        btn.addEventListener("click", function () {
+            container.textContent = "Loading preview...";
+            full(doc.id, container).catch(function (e) {
+                container.textContent = "Failed to load preview: " + e.message;
+            });
+        });
+        container.appendChild(btn);
     }
 }
 
@@ -162,6 +273,91 @@ async function renderDocx(docId, container) {
     container.appendChild(createSanitizedFragment(safeHtml));
 }
 
+var ROWS_PAGE = 200;
+
+async function renderRows(docId, container, sheet) {
+    // Rows come from /rows a page at a time as the table scrolls; the file itself is never fetched
+    var base = "/docs/" + docId + "/rows?limit=" + ROWS_PAGE + "&sheet=" + (sheet || 0);
+    var res = await apiFetch(base);
+    if (!res.ok) throw new Error("HTTP " + res.status);
+    var page = await res.json();
+    container.textContent = "";
+
+    if (page.sheets.length > 1) {
+        var tabs = document.createElement("div");
+        page.sheets.forEach(function (name, i) {
+            var tab = document.createElement("button");
+            tab.className = "win-btn-sm";
+            tab.textContent = name;
+            tab.disabled = i === page.sheet;
+            tab.addEventListener("click", function () {
+                renderRows(docId, container, i).catch(function (e) {
+                    container.textContent = "Failed to load preview: " + e.message;
+                });
+            });
+            tabs.appendChild(tab);
+        });
+        container.appendChild(tabs);
+    }
+
+    var meta = document.createElement("div");
+    meta.className = "doc-meta";
+    meta.textContent = page.row_count + " rows, " + page.columns.length + " columns";
+    container.appendChild(meta);
+
+    var wrapper = document.createElement("div");
+    wrapper.className = "spreadsheet-view";
+    var table = document.createElement("table");
+    var head = document.createElement("tr");
+    page.columns.forEach(function (col) {
+        var th = document.createElement("th");
+        th.textContent = col.name;
+        th.title = col.type;
+        head.appendChild(th);
+    });
+    var thead = document.createElement("thead");
+    thead.appendChild(head);
+    var tbody = document.createElement("tbody");
+    table.appendChild(thead);
+    table.appendChild(tbody);
+    wrapper.appendChild(table);
+    container.appendChild(wrapper);
+
+    function append(rows) {
+        rows.forEach(function (row) {
+            var tr = document.createElement("tr");
+            row.forEach(function (cell) {
+                var td = document.createElement("td");
+                td.textContent = cell;
+                tr.appendChild(td);
+            });
+            tbody.appendChild(tr);
+        });
+    }
+    append(page.rows);
+
+    var loaded = page.rows.length;
+    if (loaded >= page.row_count) return;
+    var sentinel = document.createElement("div");
+    sentinel.className = "doc-meta";
+    sentinel.textContent = "Loading more rows...";
+    container.appendChild(sentinel);
+    function more() {
+        apiFetch(base + "&offset=" + loaded).then(function (r) {
+            if (!r.ok) throw new Error("HTTP " + r.status);
+            return r.json();
+        }).then(function (next) {
+            append(next.rows);
+            loaded += next.rows.length;
+            if (next.rows.length && loaded < next.row_count) whenVisible(sentinel, more);
+            else sentinel.remove();
+        }).catch(function (e) {
+            sentinel.textContent = "Failed to load rows: " + e.message;
+        });
+    }
+    whenVisible(sentinel, more);
+}
+
 async function renderSpreadsheet(docId, container) {
     await loadScript("https://cdn.jsdelivr.net/npm/xlsx@0.18/dist/xlsx.full.min.js");
     container.textContent = "Loading spreadsheet...";
@@ -188,7 +384,12 @@ async function renderSpreadsheet(docId, container) {
 }
 
 async function renderImage(docId, container) {
+    var info = await fetchPreviewInfo(docId);
     container.textContent = "";
+    if (info && info.renderable) {
+        container.appendChild(previewImage(docId, info, 1, 1024));
+        return;
+    }
     var res = await apiFetch(filePath(docId));
     var blob = await res.blob();
     var img = document.createElement("img");
@@ -257,14 +458,101 @@ function renderCode(content, container) {
 }
 
 // --- Documents ---
+// The tree skeleton (folders with counts) comes from /projects/tree; documents are
+// fetched only for Unsorted and the folders the user opens, then kept current
+// through the change log.
+var FOLDER_PAGE = 1000;
+
+function sortDocs(docs) {
+    return docs.sort(function (a, b) {
+        if (a.updated_at !== b.updated_at) return a.updated_at < b.updated_at ? 1 : -1;
+        return b.id - a.id;
+    });
+}
+
+function indexDocuments() {
+    var docs = [];
+    state.folderDocs.forEach(function (list) { docs = docs.concat(list); });
+    state.documents = docs;
+}
+
+export function findTreeNode(path) {
+    var node = state.tree;
+    (path || "").split("/").filter(Boolean).forEach(function (part) {
+        node = node && (node.children || []).find(function (c) { return c.name === part; });
+    });
+    return node || null;
+}
+
+async function fetchFolder(path) {
+    var res = await apiFetch("/docs?recursive=false&limit=" + FOLDER_PAGE +
+        (path ? "&project=" + encodeURIComponent(path) : ""));
+    if (!res.ok) return;
+    state.folderDocs.set(path, await res.json());
+}
+
+// Load the documents of folders that are open but not fetched yet
+export async function loadFolders(paths) {
+    var missing = paths.filter(function (p) { return !state.folderDocs.has(p); });
+    await Promise.all(missing.map(fetchFolder));
+    indexDocuments();
+}
+
+async function fetchTree() {
+    var res = await apiFetch("/projects/tree");
+    var seq = Number(res.headers.get("X-Change-Seq"));
+    state.tree = await res.json();
+    return seq;
+}
+
+// Apply the change log since the last sync to the loaded folders; false when a
+// full reload is needed
+async function applyChanges() {
+    var folders = new Map();
+    var location = new Map();
+    state.folderDocs.forEach(function (list, path) {
+        folders.set(path, new Map(list.map(function (d) {
+            location.set(d.id, path);
+            return [d.id, d];
+        })));
+    });
+    var more = true;
+    while (more) {
+        var res = await apiFetch("/docs/changes?since=" + state.changeSeq);
+        if (!res.ok) return false;
+        var data = await res.json();
+        if (data.resync_required) return false;
+        data.changes.forEach(function (c) {
+            if (location.has(c.id)) folders.get(location.get(c.id)).delete(c.id);
+            location.delete(c.id);
+            var path = c.document ? c.document.project || "" : null;
+            if (path !== null && folders.has(path)) {
+                folders.get(path).set(c.id, c.document);
+                location.set(c.id, path);
+            }
+        });
+        state.changeSeq = data.next_since;
+        more = data.has_more;
+    }
+    folders.forEach(function (docs, path) {
+        state.folderDocs.set(path, sortDocs(Array.from(docs.values())));
+    });
+    return true;
+}
+
 export async function loadDocuments() {
     try {
-        var res = await apiFetch("/docs");
-        state.documents = await res.json();
-        statusCount.textContent = state.documents.length + " document" + (state.documents.length !== 1 ? "s" : "");
-        // Clean emptyFolders: remove paths where docs exist with that exact project
+        var seq = await fetchTree();
+        if (state.changeSeq === null || !(await applyChanges())) {
+            state.changeSeq = seq;
+            state.folderDocs = new Map();
+        }
+        await loadFolders([""].concat(Array.from(state.expandedPaths)));
+        var total = state.tree.total_count;
+        statusCount.textContent = total + " document" + (total !== 1 ? "s" : "");
+        // Clean emptyFolders: remove paths the server tree already has
         state.emptyFolders = state.emptyFolders.filter(function (path) {
-            return !state.documents.some(function (d) { return d.project === path; });
+            return !findTreeNode(path);
         });
         if (documentsLoadedCallback) documentsLoadedCallback();
     } catch (err) {
@@ -273,7 +561,8 @@ export async function loadDocuments() {
 }
 
 // --- Document View ---
-export async function loadDocument(id) {
+// section: chunk matched by a search ({heading, offset, length}); scrolls to its heading
+export async function loadDocument(id, section) {
     try {
         var res = await apiFetch("/docs/" + id);
         if (!res.ok) return;
@@ -370,22 +659,32 @@ export async function loadDocument(id) {
 
         frag.appendChild(body);
         setDocContainerContent([frag]);
+        if (section && section.heading) scrollToHeading(body, section.heading);
     } catch (err) {
         // handled
     }
 }
 
+function scrollToHeading(body, text) {
+    var headings = body.querySelectorAll("h1, h2, h3, h4, h5, h6");
+    for (var i = 0; i < headings.length; i++) {
+        if (headings[i].textContent.trim() === text.trim()) {
+            headings[i].scrollIntoView({ block: "start" });
+            return;
+        }
+    }
+}
+
 // --- Editor ---
 export function openEditor(doc) {
+    state.editingDoc = doc || null;
     if (doc) {
-        state.editingDocId = doc.id;
         editorTitle.textContent = "Edit Document";
         docTitleInput.value = doc.title;
         docProjectInput.value = doc.project || "";
         docTagsInput.value = (doc.tags || []).join(", ");
         docContentInput.value = doc.content;
     } else {
-        state.editingDocId = null;
         editorTitle.textContent = "New Document";
         docTitleInput.value = "";
         docProjectInput.value = "";
@@ -396,6 +695,45 @@ export function openEditor(doc) {
     docTitleInput.focus();
 }
 
+function isHighSurrogate(text, i) {
+    var c = text.charCodeAt(i);
+    return c >= 0xd800 && c <= 0xdbff;
+}
+
+function isLowSurrogate(text, i) {
+    var c = text.charCodeAt(i);
+    return c >= 0xdc00 && c <= 0xdfff;
+}
+
+// UTF-16 offset -> code point offset (the API counts characters like Python)
+function codePoints(text, end) {
+    var count = end;
+    for (var i = 1; i < end; i++) {
+        if (isLowSurrogate(text, i) && isHighSurrogate(text, i - 1)) count--;
+    }
+    return count;
+}
+
+// Single edit replacing the changed span between the common prefix and suffix
+function textEdits(base, text) {
+    if (base === text) return [];
+    var max = Math.min(base.length, text.length);
+    var start = 0;
+    while (start < max && base.charCodeAt(start) === text.charCodeAt(start)) start++;
+    var end = 0;
+    while (end < max - start &&
+           base.charCodeAt(base.length - 1 - end) === text.charCodeAt(text.length - 1 - end)) end++;
+    // Never split a surrogate pair
+    if (start > 0 && isLowSurrogate(base, start)) start--;
+    if (end > 0 && isLowSurrogate(base, base.length - end)) end--;
+    var from = codePoints(base, start);
+    return [{
+        start: from,
+        end: from + codePoints(base.slice(start, base.length - end), base.length - end - start),
+        text: text.slice(start, text.length - end),
+    }];
+}
+
 function closeEditor() {
     editorOverlay.style.display = "none";
 }
@@ -405,10 +743,8 @@ export function confirmDelete(doc) {
     deleteMsg.textContent = 'Delete "' + doc.title + '"?';
     state.pendingDeleteAction = async function () {
         if (doc.project) {
-            var othersInFolder = state.documents.filter(function (d) {
-                return d.project === doc.project && d.id !== doc.id;
-            });
-            if (othersInFolder.length === 0 && !state.emptyFolders.includes(doc.project)) {
+            var folder = findTreeNode(doc.project);
+            if ((!folder || folder.doc_count <= 1) && !state.emptyFolders.includes(doc.project)) {
                 state.emptyFolders.push(doc.project);
             }
         }
@@ -473,6 +809,13 @@ export async function doSearch() {
                 title.textContent = r.title;
                 item.appendChild(title);
 
+                if (r.section && r.section.heading) {
+                    var section = document.createElement("div");
+                    section.className = "search-result-section";
+                    section.textContent = "\u00a7 " + r.section.heading;
+                    item.appendChild(section);
+                }
+
                 var snippet = document.createElement("div");
                 snippet.className = "search-result-snippet";
                 var safeSnippet = sanitize(r.snippet);
@@ -480,7 +823,7 @@ export async function doSearch() {
                 item.appendChild(snippet);
 
                 item.addEventListener("click", function () {
-                    loadDocument(r.id);
+                    loadDocument(r.id, r.section);
                 });
 
                 container.appendChild(item);
@@ -493,6 +836,58 @@ export async function doSearch() {
     }
 }
 
+// --- Search-as-you-type ---
+var suggestTimer = null;
+var suggestSeq = 0;
+var suggestedTitles = new Map();
+
+async function fetchSuggestions(prefix) {
+    var seq = ++suggestSeq;
+    try {
+        var res = await apiFetch("/search/suggest?prefix=" + encodeURIComponent(prefix));
+        if (!res.ok || seq !== suggestSeq) return;
+        var body = await res.json();
+        if (seq !== suggestSeq) return;
+        suggestedTitles = new Map();
+        var options = [];
+        body.terms.forEach(function (t) {
+            var opt = document.createElement("option");
+            opt.value = t.text;
+            opt.label = t.doc_count + " docs";
+            options.push(opt);
+        });
+        body.titles.forEach(function (t) {
+            if (suggestedTitles.has(t.title)) return;
+            suggestedTitles.set(t.title, t.id);
+            var opt = document.createElement("option");
+            opt.value = t.title;
+            opt.label = "document";
+            options.push(opt);
+        });
+        searchSuggest.replaceChildren.apply(searchSuggest, options);
+    } catch (err) {
+        // handled
+    }
+}
+
+function onSearchInput() {
+    var value = searchInput.value;
+    // Titolo scelto dalla lista: apre direttamente il documento
+    if (suggestedTitles.has(value)) {
+        loadDocument(suggestedTitles.get(value));
+        return;
+    }
+    clearTimeout(suggestTimer);
+    if (!value.trim()) {
+        suggestSeq++;
+        searchSuggest.replaceChildren();
+        return;
+    }
+    suggestTimer = setTimeout(function () {
+        fetchSuggestions(value);
+    }, 150);
+}
+
 // --- Upload ---
 async function doUpload() {
     var files = uploadFileInput.files;
@@ -553,11 +948,23 @@ export function initDocuments() {
 
         try {
             var res;
-            if (state.editingDocId) {
-                res = await apiFetch("/docs/" + state.editingDocId, {
-                    method: "PUT",
-                    body: payload,
+            var base = state.editingDoc;
+            if (base) {
+                // Only the changed span goes over the wire; 412 if saved elsewhere meanwhile
+                res = await apiFetch("/docs/" + base.id, {
+                    method: "PATCH",
+                    body: {
+                        version: base.version,
+                        edits: textEdits(base.content, payload.content),
+                        title: payload.title,
+                        project: payload.project,
+                        tags: payload.tags,
+                    },
                 });
+                if (res.status === 412) {
+                    alert("This document was changed elsewhere. Copy your edits and reopen it.");
+                    return;
+                }
             } else {
                 res = await apiFetch("/docs", {
                     method: "POST",
@@ -608,4 +1015,5 @@ export function initDocuments() {
     searchInput.addEventListener("keydown", function (e) {
         if (e.key === "Enter") doSearch();
     });
+    searchInput.addEventListener("input", onSearchInput);
 }
@@ -0,0 +1,76 @@
+"use strict";
+
+import { state } from "./state.js";
+
+// Live document changes over SSE. Uses fetch streaming instead of EventSource
+// so the JWT travels in the Authorization header, not in the URL.
+var controller = null;
+var lastEventId = null;
+var retryDelay = 1000;
+var refreshTimer = null;
+var onChange = null;
+
+export function onDocumentEvent(fn) {
+    onChange = fn;
+}
+
+function scheduleRefresh() {
+    // Coalesce bursts (e.g. a folder rename) into a single delta sync
+    if (refreshTimer) return;
+    refreshTimer = setTimeout(function () {
+        refreshTimer = null;
+        if (onChange) onChange();
+    }, 250);
+}
+
+function handleFrame(frame) {
+    var id = null;
+    var isEvent = false;
+    frame.split("\n").forEach(function (line) {
+        if (line.startsWith("id: ")) id = line.slice(4);
+        else if (line.startsWith("event: ")) isEvent = true;
+    });
+    if (id) lastEventId = id;
+    if (isEvent) scheduleRefresh();
+}
+
+async function connect() {
+    controller = new AbortController();
+    var headers = { Authorization: "Bearer " + state.token };
+    if (lastEventId) headers["Last-Event-ID"] = lastEventId;
+    var res = await fetch("/api/events", { headers: headers, signal: controller.signal });
+    if (!res.ok || !res.body) throw new Error("events: HTTP " + res.status);
+    retryDelay = 1000;
+    var reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+    var buffer = "";
+    while (true) {
+        var chunk = await reader.read();
+        if (chunk.done) return;
+        buffer += chunk.value;
+        var frames = buffer.split("\n\n");
+        buffer = frames.pop();
+        frames.forEach(handleFrame);
+    }
+}
+
+export async function startEvents() {
+    stopEvents();
+    var current;
+    while (state.token) {
+        try {
+            await connect();
+        } catch (err) {
+            if (controller && controller.signal.aborted) return;
+        }
+        current = controller;
+        await new Promise(function (resolve) { setTimeout(resolve, retryDelay); });
+        if (current !== controller || current.signal.aborted) return;
+        retryDelay = Math.min(retryDelay * 2, 30000);
+    }
+}
+
+export function stopEvents() {
+    if (controller) controller.abort();
+    controller = null;
+    lastEventId = null;
+}
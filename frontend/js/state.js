@@ -2,13 +2,16 @@
 
 export const state = {
     token: sessionStorage.getItem("md_vault_token"),
+    tree: null,
+    folderDocs: new Map(),
     documents: [],
+    changeSeq: null,
     currentDocId: null,
     currentDoc: null,
-    editingDocId: null,
+    editingDoc: null,
     pendingFolderAction: null,
     emptyFolders: [],
-    collapsedPaths: new Set(),
+    expandedPaths: new Set(),
     menuOpen: false,
     isMaximized: false,
     pendingDeleteAction: null,
@@ -2,7 +2,7 @@
 
 import { state } from "./state.js";
 import { apiFetch } from "./api.js";
-import { getFileIcon, getTreeLabel, loadDocuments, loadDocument, openEditor, confirmDelete } from "./documents.js";
+import { getFileIcon, getTreeLabel, loadDocuments, loadDocument, loadFolders, openEditor, confirmDelete } from "./documents.js";
 
 // --- DOM refs ---
 var treeContainer = document.getElementById("tree-container");
@@ -12,23 +12,29 @@ var deleteOverlay = document.getElementById("delete-overlay");
 var deleteMsg = document.getElementById("delete-msg");
 
 // --- Folder tree builder ---
+// Folders and counts from the server tree; docs only for the folders already loaded
 function buildFolderTree() {
-    var root = { children: {}, docs: [] };
+    var root = { children: {}, docs: [], total: 0, count: 0 };
     function ensurePath(parts) {
         var node = root;
         for (var i = 0; i < parts.length; i++) {
             if (!node.children[parts[i]]) {
-                node.children[parts[i]] = { children: {}, docs: [] };
+                node.children[parts[i]] = { children: {}, docs: [], total: 0, count: 0 };
             }
             node = node.children[parts[i]];
         }
         return node;
     }
-    state.documents.forEach(function (doc) {
-        if (!doc.project) return;
-        var parts = doc.project.split("/");
-        ensurePath(parts).docs.push(doc);
-    });
+    function addNode(serverNode) {
+        if (serverNode.path) {
+            var node = ensurePath(serverNode.path.split("/"));
+            node.total = serverNode.total_count;
+            node.count = serverNode.doc_count;
+            node.docs = state.folderDocs.get(serverNode.path) || [];
+        }
+        (serverNode.children || []).forEach(addNode);
+    }
+    if (state.tree) addNode(state.tree);
     state.emptyFolders.forEach(function (path) {
         ensurePath(path.split("/"));
     });
@@ -52,14 +58,14 @@ function createTreeFolder(name, fullPath, node) {
     folder.className = "tree-folder";
     folder.dataset.project = fullPath;
 
-    // Restore collapsed state
-    if (state.collapsedPaths.has(fullPath)) {
+    // Folders start collapsed: their documents are fetched on first expand
+    if (!state.expandedPaths.has(fullPath)) {
         folder.classList.add("collapsed");
     }
 
     var label = document.createElement("span");
     label.className = "tree-folder-icon";
-    label.textContent = name;
+    label.textContent = node.total ? name + " (" + node.total + ")" : name;
     folder.appendChild(label);
 
     var children = document.createElement("div");
@@ -75,11 +81,16 @@ function createTreeFolder(name, fullPath, node) {
         children.appendChild(createTreeFile(doc));
     });
 
-    if (sortedChildNames.length === 0 && node.docs.length === 0) {
+    if (sortedChildNames.length === 0 && node.total === 0) {
         var hint = document.createElement("div");
         hint.className = "tree-no-project";
         hint.textContent = "(empty)";
         children.appendChild(hint);
+    } else if (state.folderDocs.has(fullPath) && node.docs.length < node.count) {
+        var more = document.createElement("div");
+        more.className = "tree-no-project";
+        more.textContent = "(" + (node.count - node.docs.length) + " more, use search)";
+        children.appendChild(more);
     }
     folder.appendChild(children);
 
@@ -188,67 +199,50 @@ function promptRenameFolder(oldName) {
 }
 
 async function renameFolder(oldPath, newPath) {
-    var docsToUpdate = state.documents.filter(function (d) {
-        return d.project === oldPath || (d.project && d.project.startsWith(oldPath + "/"));
+    // One request and one transaction for the whole subtree
+    var res = await apiFetch("/projects/rename", {
+        method: "POST",
+        body: { path: oldPath, new_path: newPath },
     });
-    for (var i = 0; i < docsToUpdate.length; i++) {
-        var updatedProject;
-        if (docsToUpdate[i].project === oldPath) {
-            updatedProject = newPath;
-        } else {
-            updatedProject = newPath + docsToUpdate[i].project.substring(oldPath.length);
-        }
-        await apiFetch("/docs/" + docsToUpdate[i].id, {
-            method: "PUT",
-            body: { project: updatedProject },
-        });
-    }
+    if (!res.ok) return;
     state.emptyFolders = state.emptyFolders.map(function (p) {
         if (p === oldPath) return newPath;
         if (p.startsWith(oldPath + "/")) return newPath + p.substring(oldPath.length);
         return p;
     });
-    // Update collapsed paths
-    var newCollapsed = new Set();
-    state.collapsedPaths.forEach(function (p) {
+    // Update expanded paths
+    var newExpanded = new Set();
+    state.expandedPaths.forEach(function (p) {
         if (p === oldPath) {
-            newCollapsed.add(newPath);
+            newExpanded.add(newPath);
         } else if (p.startsWith(oldPath + "/")) {
-            newCollapsed.add(newPath + p.substring(oldPath.length));
+            newExpanded.add(newPath + p.substring(oldPath.length));
         } else {
-            newCollapsed.add(p);
+            newExpanded.add(p);
         }
     });
-    state.collapsedPaths = newCollapsed;
+    state.expandedPaths = newExpanded;
     await loadDocuments();
 }
 
-function collectAllDocs(node) {
-    var result = node.docs.slice();
-    Object.keys(node.children).forEach(function (k) {
-        result = result.concat(collectAllDocs(node.children[k]));
-    });
-    return result;
-}
-
 function confirmDeleteFolder(fullPath, node) {
-    var allDocs = collectAllDocs(node);
-    if (allDocs.length > 0) {
-        deleteMsg.textContent = 'Delete folder "' + fullPath + '"? Its ' + allDocs.length + ' document(s) will move to Unsorted.';
+    var total = node.total || 0;
+    if (total > 0) {
+        deleteMsg.textContent = 'Delete folder "' + fullPath + '"? Its ' + total + ' document(s) will move to Unsorted.';
     } else {
         deleteMsg.textContent = 'Delete empty folder "' + fullPath + '"?';
     }
     state.pendingDeleteAction = async function () {
-        for (var i = 0; i < allDocs.length; i++) {
-            await apiFetch("/docs/" + allDocs[i].id, {
-                method: "PUT",
-                body: { project: null },
+        if (total > 0) {
+            await apiFetch("/projects/delete", {
+                method: "POST",
+                body: { path: fullPath },
             });
         }
         state.emptyFolders = state.emptyFolders.filter(function (p) {
             return p !== fullPath && !p.startsWith(fullPath + "/");
         });
-        state.collapsedPaths.delete(fullPath);
+        state.expandedPaths.delete(fullPath);
         await loadDocuments();
     };
     deleteOverlay.style.display = "flex";
@@ -277,14 +271,8 @@ function closeFolderDialog() {
 
 // --- Render Tree ---
 export function renderTree() {
-    // Save collapsed state before clearing
-    treeContainer.querySelectorAll(".tree-folder.collapsed").forEach(function (f) {
-        var path = f.dataset.project;
-        if (path) state.collapsedPaths.add(path);
-    });
-
     treeContainer.textContent = "";
-    var ungrouped = state.documents.filter(function (d) { return !d.project; });
+    var ungrouped = state.folderDocs.get("") || [];
 
     var tree = buildFolderTree();
     var sortedNames = Object.keys(tree.children).sort();
@@ -315,7 +303,7 @@ export function renderTree() {
     }
     treeContainer.appendChild(unsortedZone);
 
-    if (state.documents.length === 0 && sortedNames.length === 0) {
+    if (!(state.tree && state.tree.total_count) && sortedNames.length === 0) {
         var empty = document.createElement("div");
         empty.className = "tree-no-project";
         empty.textContent = "No documents yet";
@@ -343,9 +331,10 @@ export function initTree() {
                 var path = folder.dataset.project;
                 if (path) {
                     if (folder.classList.contains("collapsed")) {
-                        state.collapsedPaths.add(path);
+                        state.expandedPaths.delete(path);
                     } else {
-                        state.collapsedPaths.delete(path);
+                        state.expandedPaths.add(path);
+                        if (!state.folderDocs.has(path)) loadFolders([path]).then(renderTree);
                     }
                 }
             }
@@ -2,7 +2,7 @@
 
 import { state } from "./state.js";
 import { apiFetch } from "./api.js";
-import { openEditor, confirmDelete, loadDocuments, setDocContainerContent } from "./documents.js";
+import { openEditor, confirmDelete, loadDocuments, loadFolders, setDocContainerContent } from "./documents.js";
 import { renderTree } from "./tree.js";
 
 // --- DOM refs ---
@@ -169,19 +169,20 @@ export function initWindows() {
     // --- View menu ---
     document.getElementById("btn-expand-all").addEventListener("click", function () {
         closeAllMenus();
-        state.collapsedPaths.clear();
         treeContainer.querySelectorAll(".tree-folder").forEach(function (f) {
             f.classList.remove("collapsed");
+            var path = f.dataset.project;
+            if (path) state.expandedPaths.add(path);
         });
+        loadFolders(Array.from(state.expandedPaths)).then(renderTree);
     });
 
     document.getElementById("btn-collapse-all").addEventListener("click", function () {
         closeAllMenus();
         treeContainer.querySelectorAll(".tree-folder").forEach(function (f) {
             f.classList.add("collapsed");
-            var path = f.dataset.project;
-            if (path) state.collapsedPaths.add(path);
         });
+        state.expandedPaths.clear();
     });
 
     // --- Help menu ---
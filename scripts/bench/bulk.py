@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Benchmark rename di una cartella: un PUT per documento vs endpoint bulk.
+
+Uso: python scripts/bench/bulk.py [--docs 20000] [--folder 2000]
+"""
+
+import argparse
+import asyncio
+import time
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+def seed_folder(n: int, path: str):
+    from backend.database import write_db
+
+    with write_db() as conn:
+        conn.executemany(
+            "INSERT INTO documents (title, content, project) VALUES (?, ?, ?)",
+            [
+                (f"doc {i}", f"body {i}", path if i % 3 == 0 else f"{path}/sub{i % 7}")
+                for i in range(n)
+            ],
+        )
+        conn.commit()
+
+
+async def per_document(client, headers, old, new):
+    """Come il vecchio renameFolder in tree.js: PUT sequenziali, uno per documento."""
+    docs, cursor = [], None
+    while True:
+        params = {"project": old, "limit": 1000, "fields": "id,project"}
+        if cursor:
+            params["cursor"] = cursor
+        resp = await client.get("/api/docs", params=params, headers=headers)
+        docs += resp.json()
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    for doc in docs:
+        resp = await client.put(
+            f"/api/docs/{doc['id']}",
+            json={"project": new + doc["project"].removeprefix(old)},
+            headers=headers,
+        )
+        assert resp.status_code == 200, resp.text
+    return len(docs)
+
+
+async def bulk(client, headers, old, new):
+    resp = await client.post(
+        "/api/projects/rename", json={"path": old, "new_path": new}, headers=headers
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()["updated"]
+
+
+async def batch(client, headers, old, new):
+    """POST /api/docs/batch con gli stessi update del loop per documento."""
+    resp = await client.get(
+        "/api/docs",
+        params={"project": old, "limit": 1000, "fields": "id,project"},
+        headers=headers,
+    )
+    docs = resp.json()
+    ops = [
+        {"op": "update", "id": d["id"], "project": new + d["project"].removeprefix(old)}
+        for d in docs
+    ]
+    resp = await client.post("/api/docs/batch", json={"operations": ops}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return len(ops)
+
+
+async def run(app, strategy, old, new):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        n = await strategy(client, common.auth_header(), old, new)
+        return n, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20_000)
+    parser.add_argument("--folder", type=int, default=2000)
+    args = parser.parse_args()
+
+    from backend.config import DB_PATH
+    from backend.main import app
+
+    print(f"Seeding {args.docs} documents + {args.folder} in the renamed folder ({DB_PATH}) ...")
+    common.seed_db(args.docs)
+    seed_folder(args.folder, "bench/a")
+    # batch accetta al massimo 1000 operazioni: cartella separata da 1000 documenti
+    seed_folder(min(args.folder, 1000), "bench/c")
+
+    for label, strategy, old, new in (
+        ("PUT per document", per_document, "bench/a", "bench/b"),
+        ("POST /api/projects/rename", bulk, "bench/b", "bench/a"),
+        ("POST /api/docs/batch (1000)", batch, "bench/c", "bench/d"),
+    ):
+        n, elapsed = asyncio.run(run(app, strategy, old, new))
+        print(f"{label:>30}: {n:5d} docs in {elapsed * 1000:9.1f} ms ({n / elapsed:8.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Benchmark indicizzazione a chunk dei documenti grandi (backend.chunks).
+
+Carica ``--docs`` documenti markdown di ``--size`` KiB (un titolo ogni ~40
+righe) indicizzati interi, poi li divide in chunk con CHUNK_THRESHOLD; in
+entrambi i casi: latenza di un edit di una riga (store.update_document,
+come PUT /api/docs), dimensione di documents_fts e dei chunk, p50/p99 di
+/api/search su un termine comune e uno raro.
+
+Uso: python scripts/bench/chunks.py [--docs 20] [--size 2048] [--edits 50] [--repeat 20]
+"""
+
+import argparse
+import random
+from functools import partial
+
+import common
+
+
+def make_markdown(rng: random.Random, size: int) -> str:
+    docs = common.make_docs(
+        size * 1024 // 700 + 1, seed=rng.randint(0, 1 << 30), words_per_doc=100
+    )
+    lines = []
+    for i, (title, content, _, _) in enumerate(docs):
+        if i % 5 == 0:
+            lines.append(f"\n## {title}\n")
+        lines.append(content.split("\n\n", 1)[1] + "\n")
+    return "".join(lines)[: size * 1024]
+
+
+def search(q):
+    from fastapi import Response
+
+    from backend.routers.search import search
+    from backend.search_cache import search_cache
+
+    search_cache.clear()
+    params = dict(limit=50, cursor=None, snippets=True, facets=False)
+    params.update(project=None, tag=None, file_type=None)
+    return search(Response(), q, "phrase", **params, _user="admin")
+
+
+def edits(ids: list[int], n: int, rng: random.Random) -> dict:
+    from backend import store
+    from backend.database import write_db
+
+    def edit():
+        doc_id = rng.choice(ids)
+        with write_db() as conn:
+            content = conn.execute(
+                "SELECT content FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()[0]
+            cut = content.index("\n", rng.randint(0, len(content) - 1)) + 1
+            content = content[:cut] + f"edit {rng.random()}\n" + content[cut:]
+            store.update_document(conn, doc_id, {"content": content})
+            conn.commit()
+
+    return common.measure(edit, n)
+
+
+def report(label: str, ids: list[int], args, rng: random.Random):
+    from backend.database import read_db
+
+    with read_db() as conn:
+        sizes = dict(
+            conn.execute(
+                "SELECT CASE WHEN name LIKE 'documents_fts%' THEN 'fts' ELSE 'chunks' END, "
+                "SUM(pgsize) FROM dbstat WHERE name LIKE 'documents_fts%' "
+                "OR name LIKE '%chunks%' GROUP BY 1"
+            ).fetchall()
+        )
+        n_chunks = conn.execute("SELECT COUNT(*) FROM document_chunks").fetchone()[0]
+    mib = {k: round(v / (1024 * 1024), 1) for k, v in sizes.items()}
+    index, stored = mib.get("fts"), mib.get("chunks")
+    print(f"\n{label}: {n_chunks} chunks, index {index} MiB, chunk table {stored} MiB")
+    latency = edits(ids, args.edits, rng)
+    print(f"  edit one line: {latency}")
+    for q in ("python", "zezezene"):
+        fn = partial(search, q)
+        fn()
+        print(f"  search {q:>10}: {common.measure(fn, args.repeat)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--size", type=int, default=2048, help="KiB per document")
+    parser.add_argument("--edits", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from backend import chunks, config, maintenance, store
+    from backend.database import write_db
+
+    threshold = config.CHUNK_THRESHOLD
+    config.CHUNK_THRESHOLD = 1 << 62
+    print(f"Seeding 10000 small and {args.docs} documents of {args.size} KiB ...")
+    common.seed_db(10_000)
+    rng = random.Random(7)
+    with write_db() as conn:
+        ids = []
+        for i in range(args.docs):
+            content = make_markdown(rng, args.size)
+            ids.append(store.insert_document(conn, title=f"Big {i}", content=content)["id"])
+        conn.commit()
+    maintenance.optimize()
+    report("whole documents", ids, args, rng)
+
+    config.CHUNK_THRESHOLD = threshold
+    with write_db() as conn:
+        chunks.rechunk(conn)
+    maintenance.optimize()
+    report(f"chunked (CHUNK_SIZE {config.CHUNK_SIZE})", ids, args, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Utility condivise dai benchmark: vault temporaneo e corpus sintetico.
+
+Va importato prima di qualsiasi modulo ``backend``: imposta le variabili
+d'ambiente (DB_PATH, UPLOAD_DIR, ...) su una directory temporanea.
+"""
+
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+WORKDIR = os.environ.get("BENCH_DIR") or tempfile.mkdtemp(prefix="mdvault-bench-")
+os.environ["DB_PATH"] = os.path.join(WORKDIR, "vault.db")
+os.environ["UPLOAD_DIR"] = os.path.join(WORKDIR, "uploads")
+os.environ.setdefault("JWT_SECRET", "bench-secret-key-for-benchmarks-only-32b")
+os.environ.setdefault("ADMIN_PASSWORD", "bench-password")
+os.environ["SENTRY_DSN"] = ""
+os.environ.setdefault("DOCS_ENABLED", "false")
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "ti", "so", "vu", "de", "pa", "ze", "qui", "bro"]
+COMMON_TERMS = ["kubernetes", "python", "backup", "deploy", "sqlite", "nginx", "docker"]
+PROJECTS = [
+    "infra",
+    "infra/k3s",
+    "infra/terraform",
+    "notes",
+    "notes/2025",
+    "notes/2026",
+    "work/clients/acme",
+    "work/clients/globex",
+    "study",
+]
+TAGS = ["python", "devops", "sql", "linux", "howto", "todo", "draft", "ref", "k8s", "security"]
+
+
+def _vocabulary(rng: random.Random, size: int = 5000) -> list[str]:
+    words = set(COMMON_TERMS)
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_docs(n: int, seed: int = 42, words_per_doc: int = 120):
+    """Genera ``n`` tuple (title, content, project, tags) deterministiche."""
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng)
+    # Distribuzione zipf-like: pochi termini molto frequenti, coda lunga di rari
+    weights = [1 / (i + 1) for i in range(len(vocab))]
+    for i in range(n):
+        body = rng.choices(vocab, weights=weights, k=words_per_doc)
+        title = " ".join(rng.choices(vocab, weights=weights, k=4)) + f" {i}"
+        project = rng.choice(PROJECTS) if rng.random() > 0.1 else None
+        tags = ",".join(rng.sample(TAGS, rng.randint(0, 3))) or None
+        yield title, "# " + title + "\n\n" + " ".join(body), project, tags
+
+
+def seed_db(n: int, batch: int = 5000):
+    """Inizializza lo schema e inserisce ``n`` documenti sintetici."""
+    from backend.database import init_db, rebuild_tag_index, write_db
+
+    init_db()
+    docs = make_docs(n)
+    with write_db() as conn:
+        while True:
+            chunk = [d for _, d in zip(range(batch), docs)]
+            if not chunk:
+                break
+            conn.executemany(
+                "INSERT INTO documents (title, content, project, tags) VALUES (?, ?, ?, ?)",
+                chunk,
+            )
+            conn.commit()
+        rebuild_tag_index(conn)
+        conn.commit()
+
+
+def raw_connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def auth_header() -> dict:
+    from backend.auth import create_token
+
+    return {"Authorization": f"Bearer {create_token('admin')}"}
+
+
+def measure(fn, repeat: int) -> dict:
+    """Esegue ``fn`` ``repeat`` volte e restituisce p50/p99 in millisecondi."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+def file_size_mb(path: str) -> float:
+    total = 0
+    for suffix in ("", "-wal"):
+        try:
+            total += os.path.getsize(path + suffix)
+        except OSError:
+            pass
+    return round(total / (1024 * 1024), 2)
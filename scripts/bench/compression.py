@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Benchmark content compresso (backend.compression).
+
+Carica ``--docs`` note markdown (sezioni ricorrenti come in appunti e
+runbook, piu' testo sintetico) e misura in chiaro, dopo ``compress`` e dopo
+``decompress``: dimensione del database dopo VACUUM, durata di un backup con
+l'API di backup di SQLite (come scripts/backup.py), GET di un documento e
+ricerca con snippet. Misura anche la durata delle due migrazioni.
+
+Uso: python scripts/bench/compression.py [--docs 20000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+import common
+
+_SECTIONS = [
+    "## Context\nThis note tracks the current state of the service and the open decisions.\n",
+    "## Steps\n1. Check the dashboard for errors\n2. Drain the node\n3. Apply the change\n",
+    "## Checklist\n- [ ] backup verified\n- [ ] monitoring alerts muted\n- [x] owner notified\n",
+    "## Links\n- Runbook: see the infra/runbooks folder\n- Dashboard: grafana, service view\n",
+    "## Notes\nFollow up with the team next week; keep the rollback plan ready.\n",
+]
+
+
+def make_notes(n: int):
+    rng = random.Random(11)
+    for title, body, project, tags in common.make_docs(n, words_per_doc=60):
+        sections = "\n".join(rng.sample(_SECTIONS, rng.randint(2, 4)))
+        yield title, f"{body}\n\n{sections}", project, tags
+
+
+def backup_ms() -> float:
+    target = os.path.join(common.WORKDIR, "backup.db")
+    if os.path.exists(target):
+        os.remove(target)
+    src, dst = common.raw_connect(), sqlite3.connect(target)
+    started = time.perf_counter()
+    with dst:
+        src.backup(dst)
+    elapsed = (time.perf_counter() - started) * 1000
+    src.close()
+    dst.close()
+    return round(elapsed, 1)
+
+
+def report(label: str, client, headers, ids):
+    from backend.database import write_db
+
+    with write_db() as conn:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    path = os.environ["DB_PATH"]
+    backups = sorted(backup_ms() for _ in range(3))
+    rng = random.Random(3)
+    get = common.measure(lambda: client.get(f"/api/docs/{rng.choice(ids)}", headers=headers), 300)
+    search = common.measure(
+        lambda: client.get("/api/search?q=kubernetes&limit=20", headers=headers), 50
+    )
+    print(
+        f"  {label:12} db {common.file_size_mb(path):7.2f} MB, backup p50 {backups[1]} ms, "
+        f"GET p50 {get['p50_ms']} ms, search p50 {search['p50_ms']} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from backend import compression
+    from backend.database import init_db, read_db, write_db
+    from backend.main import app
+
+    init_db()
+    with write_db() as conn:
+        conn.executemany(
+            "INSERT INTO documents (title, content, project, tags) VALUES (?, ?, ?, ?)",
+            make_notes(args.docs),
+        )
+        conn.commit()
+        ids = [r[0] for r in conn.execute("SELECT id FROM documents")]
+    headers = common.auth_header()
+    print(f"{args.docs} notes")
+    with TestClient(app) as client:
+        report("plain", client, headers, ids)
+        for target in ("zlib", "none"):
+            started = time.perf_counter()
+            compression.migrate(target)
+            print(f"  migrate to {target}: {time.perf_counter() - started:.1f} s")
+            if target == "zlib":
+                report("compressed", client, headers, ids)
+                with read_db() as conn:
+                    stats = compression.status(conn, sizes=True)
+                print(f"    documents: {stats['documents']}, dictionary: {stats['dictionary']}")
+        report("decompressed", client, headers, ids)
+
+
+if __name__ == "__main__":
+    main()
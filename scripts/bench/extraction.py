@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Benchmark estrazione del testo in background (backend.extraction).
+
+Genera ``--files`` file DOCX, XLSX, PPTX e PDF sintetici e misura: il costo
+del parsing per formato (quello che un upload pagherebbe facendolo nella
+richiesta), la latenza di /api/docs/upload con la coda, e per 1, 2 e 4
+processi il tempo per svuotarla e il ritardo massimo dell'event loop nel
+frattempo.
+
+Uso: python scripts/bench/extraction.py [--files 200] [--words 20000]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import time
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+import common
+
+WORKBOOK = '<workbook><sheets><sheet name="Data" r:id="rId1"/></sheets></workbook>'
+WORKBOOK_RELS = (
+    '<Relationships><Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>'
+)
+
+
+def _zip(members: dict[str, str]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, text in members.items():
+            zf.writestr(name, text)
+    return buf.getvalue()
+
+
+def make_file(ext: str, words: list[str]) -> bytes:
+    lines = [" ".join(words[i : i + 12]) for i in range(0, len(words), 12)]  # noqa: E203
+    if ext == ".docx":
+        body = "".join(f"<w:p><w:r><w:t>{escape(t)}</w:t></w:r></w:p>" for t in lines)
+        return _zip({"word/document.xml": f"<w:document><w:body>{body}</w:body></w:document>"})
+    if ext == ".pptx":
+        slides = {}
+        for n, start in enumerate(range(0, len(lines), 20), 1):
+            part = lines[start : start + 20]  # noqa: E203
+            runs = "".join(f"<a:p><a:r><a:t>{escape(t)}</a:t></a:r></a:p>" for t in part)
+            slides[f"ppt/slides/slide{n}.xml"] = f"<p:sld>{runs}</p:sld>"
+        return _zip(slides)
+    if ext == ".xlsx":
+        rows = "".join(
+            f'<row r="{r}">'
+            + "".join(f'<c t="inlineStr"><is><t>{w}</t></is></c>' for w in t.split())
+            + "</row>"
+            for r, t in enumerate(lines, 1)
+        )
+        sheet = f"<worksheet><sheetData>{rows}</sheetData></worksheet>"
+        return _zip(
+            {
+                "xl/workbook.xml": WORKBOOK,
+                "xl/_rels/workbook.xml.rels": WORKBOOK_RELS,
+                "xl/worksheets/sheet1.xml": sheet,
+            }
+        )
+    return _pdf(lines)
+
+
+def _pdf(lines: list[str]) -> bytes:
+    """PDF con xref, 60 righe per pagina in Helvetica compressa."""
+    pages = [lines[i : i + 60] for i in range(0, len(lines), 60)]  # noqa: E203
+    kids = " ".join(f"{4 + 2 * n} 0 R" for n in range(len(pages)))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for n, page in enumerate(pages):
+        ops = "BT /F1 10 Tf 40 800 Td 12 TL " + " T* ".join(f"({t}) Tj" for t in page) + " ET"
+        stream = zlib.compress(ops.encode())
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {5 + 2 * n} 0 R "
+            "/Resources << /Font << /F1 3 0 R >> >> >>".encode()
+        )
+        objects.append(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    trailer = b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+    return out + trailer % (len(objects) + 1, xref)
+
+
+def make_files(n: int, words: int) -> list[tuple[str, bytes]]:
+    vocab = list({w for _, content, _, _ in common.make_docs(200) for w in content.split()})
+    rng = random.Random(3)
+    exts = [".docx", ".xlsx", ".pptx", ".pdf"]
+    return [
+        (f"file{i}{exts[i % 4]}", make_file(exts[i % 4], rng.choices(vocab, k=words)))
+        for i in range(n)
+    ]
+
+
+def parse_costs(files):
+    from backend import config, extractors
+
+    tmp = os.path.join(common.WORKDIR, "parse")
+    os.makedirs(tmp, exist_ok=True)
+    for ext in (".docx", ".xlsx", ".pptx", ".pdf"):
+        name, body = next(f for f in files if f[0].endswith(ext))
+        path = os.path.join(tmp, name)
+        with open(path, "wb") as f:
+            f.write(body)
+        args = (path, ext, config.EXTRACT_TIMEOUT, config.EXTRACT_MAX_CHARS)
+        stats = common.measure(lambda: extractors.run(*args), 10)
+        print(f"  parse {ext:6} {len(body) / 1024:7.0f} KiB: {stats}")
+
+
+async def drain(app, files, workers: int, upload: bool) -> dict:
+    import httpx
+
+    from backend import config
+    from backend.database import read_db
+    from backend.extraction import extractor
+
+    config.EXTRACT_WORKERS = workers
+    lag = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag[0] = max(lag[0], time.perf_counter() - started - 0.01)
+
+    def queued():
+        with read_db() as conn:
+            return conn.execute("SELECT COUNT(*) FROM extract_jobs").fetchone()[0]
+
+    await extractor.start()
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    uploads = []
+    if upload:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, body in files:
+                t = time.perf_counter()
+                resp = await client.post(
+                    "/api/docs/upload",
+                    files={"file": (name, io.BytesIO(body))},
+                    headers=common.auth_header(),
+                )
+                uploads.append((time.perf_counter() - t) * 1000)
+                assert resp.status_code == 201, resp.text
+    else:
+        extractor.notify()
+    while await asyncio.to_thread(queued):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    await extractor.stop()
+    result = {"drain_s": round(elapsed, 2), "max_loop_lag_ms": round(lag[0] * 1000, 1)}
+    if uploads:
+        result["upload_p50_ms"] = round(statistics.median(uploads), 1)
+    return result
+
+
+def requeue():
+    from backend import extraction
+    from backend.database import write_db
+
+    with write_db() as conn:
+        conn.execute("UPDATE documents SET content = '' WHERE file_name IS NOT NULL")
+        extraction.backfill(conn)
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--words", type=int, default=20_000, help="parole per file")
+    args = parser.parse_args()
+
+    from backend.database import init_db
+    from backend.main import app
+
+    init_db()
+    files = make_files(args.files, args.words)
+    print(f"{args.files} files, {args.words} words each")
+    parse_costs(files)
+    print(f"  workers 2, with uploads: {asyncio.run(drain(app, files, 2, upload=True))}")
+    for workers in (1, 2, 4):
+        requeue()
+        print(f"  workers {workers}: {asyncio.run(drain(app, files, workers, upload=False))}")
+
+
+if __name__ == "__main__":
+    main()
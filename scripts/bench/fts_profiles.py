@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Benchmark profili FTS (config.FTS_PROFILES): dimensione dell'indice vs latenza.
+
+Per ogni profilo: rebuild online dallo stesso vault, dimensione di
+documents_fts e p50/p99 di /api/search (parola comune, rara, due parole) e
+di /api/search/suggest.
+
+Uso: python scripts/bench/fts_profiles.py [--docs 100000] [--repeat 20]
+"""
+
+import argparse
+import time
+from functools import partial
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+def search(q):
+    from fastapi import Response
+
+    from backend.routers.search import search
+    from backend.search_cache import search_cache
+
+    search_cache.clear()
+    params = dict(limit=50, cursor=None, snippets=True, facets=False)
+    params.update(project=None, tag=None, file_type=None)
+    return search(Response(), q, "phrase", **params, _user="admin")
+
+
+def suggest(prefix):
+    from fastapi import BackgroundTasks
+
+    from backend.routers.search import search_suggest
+
+    return search_suggest(BackgroundTasks(), prefix, limit=8, _user="admin")
+
+
+def fts_size_mb(conn) -> float:
+    row = conn.execute(
+        "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'documents_fts%'"
+    ).fetchone()
+    return round(row[0] / (1024 * 1024), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from backend import fts
+    from backend.config import FTS_PROFILES
+    from backend.database import read_db
+
+    print(f"Seeding {args.docs} documents ...")
+    common.seed_db(args.docs)
+    queries = {
+        "common": partial(search, "python"),
+        "rare": partial(search, "zezezene"),
+        "two words": partial(search, "kalomi kabrone"),
+        "suggest": partial(suggest, "kal"),
+    }
+    for name in FTS_PROFILES:
+        started = time.perf_counter()
+        fts.rebuild(name)
+        elapsed = time.perf_counter() - started
+        with read_db() as conn:
+            size = fts_size_mb(conn)
+        print(f"{name}: {size} MiB, rebuild {elapsed:.1f} s")
+        for label, fn in queries.items():
+            fn()
+            print(f"  {label:>10}: {common.measure(fn, args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Benchmark import di molti markdown: un /api/docs/upload per file vs /api/docs/import (zip).
+
+Uso: python scripts/bench/import_files.py [--files 10000] [--sample 500]
+"""
+
+import argparse
+import asyncio
+import io
+import time
+import zipfile
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+def make_files(n: int) -> list[tuple[str, bytes]]:
+    return [
+        (f"{project or 'unsorted'}/{i}.md", content.encode())
+        for i, (_title, content, project, _tags) in enumerate(common.make_docs(n))
+    ]
+
+
+async def upload_each(client, headers, files):
+    for name, body in files:
+        resp = await client.post(
+            "/api/docs/upload",
+            files={"file": (name.rsplit("/", 1)[-1], io.BytesIO(body), "text/markdown")},
+            headers=headers,
+        )
+        assert resp.status_code == 201, resp.text
+
+
+async def import_zip(client, headers, files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, body in files:
+            zf.writestr(name, body)
+    resp = await client.post(
+        "/api/docs/import",
+        content=buf.getvalue(),
+        headers={**headers, "Content-Type": "application/zip"},
+    )
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["created"] == len(files), resp.json()["failed"]
+
+
+async def run(app, strategy, files):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        started = time.perf_counter()
+        await strategy(client, common.auth_header(), files)
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10_000)
+    parser.add_argument("--sample", type=int, default=500, help="file caricati uno a uno")
+    args = parser.parse_args()
+
+    from backend.config import DB_PATH
+    from backend.database import init_db
+    from backend.main import app
+
+    init_db()
+    files = make_files(args.files)
+    print(f"Importing into {DB_PATH}")
+
+    elapsed = asyncio.run(run(app, upload_each, files[: args.sample]))
+    rate = args.sample / elapsed
+    print(
+        f"  upload per file: {args.sample:6d} files in {elapsed:7.2f} s ({rate:7.0f} files/s)"
+        f" -> {args.files} files ~ {args.files / rate:.0f} s"
+    )
+    elapsed = asyncio.run(run(app, import_zip, files))
+    print(
+        f"  import zip:      {args.files:6d} files in {elapsed:7.2f} s"
+        f" ({args.files / elapsed:7.0f} files/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Benchmark manutenzione FTS (backend.maintenance): segmenti e latenze sotto churn.
+
+Aggiorna ``--updates`` documenti uno per transazione (come PUT /api/docs)
+con automerge 4 (default di FTS5) e FTS_AUTOMERGE, poi esegue merge e
+optimize; per ogni fase: latenza degli update, segmenti di documents_fts e
+p50/p99 di /api/search.
+
+Uso: python scripts/bench/maintenance.py [--docs 100000] [--updates 5000] [--repeat 20]
+"""
+
+import argparse
+import random
+import time
+from functools import partial
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+def search(q):
+    from fastapi import Response
+
+    from backend.routers.search import search
+    from backend.search_cache import search_cache
+
+    search_cache.clear()
+    params = dict(limit=50, cursor=None, snippets=True, facets=False)
+    params.update(project=None, tag=None, file_type=None)
+    return search(Response(), q, "phrase", **params, _user="admin")
+
+
+def churn(n: int, docs: int, rng: random.Random) -> dict:
+    from backend.database import write_db
+
+    texts = common.make_docs(n, seed=rng.randint(0, 1 << 30))
+
+    def update():
+        _, content, _, _ = next(texts)
+        with write_db() as conn:
+            conn.execute(
+                "UPDATE documents SET content = ? WHERE id = ?", (content, rng.randint(1, docs))
+            )
+            conn.commit()
+
+    return common.measure(update, n)
+
+
+def report(label: str, repeat: int):
+    from backend import maintenance
+    from backend.database import read_db
+
+    with read_db() as conn:
+        seg = maintenance.segments(conn, "documents_fts")
+    wal = round(maintenance.wal_size() / (1024 * 1024), 1)
+    print(f"{label}: {seg['segments']} segments in {seg['levels']} levels, WAL {wal} MiB")
+    for q in ("python", "zezezene"):
+        fn = partial(search, q)
+        fn()
+        print(f"  search {q:>10}: {common.measure(fn, repeat)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from backend import config, fts, maintenance
+    from backend.database import write_db
+
+    print(f"Seeding {args.docs} documents ...")
+    common.seed_db(args.docs)
+    maintenance.optimize()
+    report("after seeding + optimize", args.repeat)
+    rng = random.Random(7)
+    for automerge in (4, config.FTS_AUTOMERGE):
+        config.FTS_AUTOMERGE = automerge
+        with write_db() as conn:
+            fts.tune(conn, "documents_fts")
+            conn.commit()
+        latency = churn(args.updates, args.docs, rng)
+        print(f"\n{args.updates} updates, automerge={automerge}: {latency}")
+        report("after churn", args.repeat)
+        if automerge == 4:
+            maintenance.optimize()
+    for task in ("merge", "checkpoint", "optimize"):
+        started = time.perf_counter()
+        kwargs = {"truncate": True} if task == "checkpoint" else {}
+        detail = maintenance.run_task(task, **kwargs)["detail"]
+        print(f"\n{task} in {time.perf_counter() - started:.2f} s: {detail}")
+        report(f"after {task}", args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Benchmark salvataggi incrementali (PATCH /api/docs/{id}) contro PUT.
+
+Salva ``--edits`` volte un documento markdown di ``--kb`` KB cambiando una
+riga a caso, una volta con PUT del testo intero e una con PATCH del solo
+tratto cambiato (If-Match sull'ETag della risposta precedente). Misura
+latenza e byte di body inviati; poi la latenza di un PATCH che cambia solo
+version (nessuna colonna indicizzata), che non tocca l'indice FTS.
+
+Uso: python scripts/bench/patch.py [--kb 2048] [--edits 200]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kb", type=int, default=2048)
+    parser.add_argument("--edits", type=int, default=200)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from backend.database import init_db
+    from backend.main import app
+
+    init_db()
+    rng = random.Random(9)
+    words = [w for _, content, _, _ in common.make_docs(50) for w in content.split()]
+    lines = []
+    while sum(map(len, lines)) < args.kb * 1024:
+        if len(lines) % 40 == 0:
+            lines.append(f"## Section {len(lines) // 40}\n")
+        lines.append(" ".join(rng.choices(words, k=12)) + "\n")
+    headers = common.auth_header()
+
+    with TestClient(app) as client:
+        print(
+            f"{args.edits} one-line edits of a {len(''.join(lines).encode()) / 1024:.0f} KiB note"
+        )
+        for method in ("PUT", "PATCH"):
+            body = {"title": "Runbook", "content": "".join(lines)}
+            resp = client.post("/api/docs", json=body, headers=headers)
+            doc_id, etag = resp.json()["id"], None
+            etag = client.get(f"/api/docs/{doc_id}", headers=headers).headers["ETag"]
+            timings, sent = [], []
+            for _ in range(args.edits):
+                i = rng.randrange(len(lines))
+                line = " ".join(rng.choices(words, k=12)) + "\n"
+                if method == "PUT":
+                    lines[i] = line
+                    payload = json.dumps({"content": "".join(lines)})
+                else:
+                    start = sum(map(len, lines[:i]))
+                    edit = {"start": start, "end": start + len(lines[i]), "text": line}
+                    lines[i] = line
+                    payload = json.dumps({"edits": [edit]})
+                started = time.perf_counter()
+                resp = client.request(
+                    method,
+                    f"/api/docs/{doc_id}",
+                    content=payload,
+                    headers={**headers, "Content-Type": "application/json", "If-Match": etag},
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+                etag = resp.headers["ETag"]
+                sent.append(len(payload))
+            print(
+                f"  {method:5} p50 {statistics.median(timings):6.2f} ms, "
+                f"p95 {sorted(timings)[int(len(timings) * 0.95)]:6.2f} ms, "
+                f"body {statistics.mean(sent) / 1024:8.2f} KiB"
+            )
+        stats = common.measure(
+            lambda: client.patch(
+                f"/api/docs/{doc_id}",
+                json={"edits": [{"start": 0, "end": 0, "text": ""}]},
+                headers={**headers, "If-Match": "*"},
+            ),
+            50,
+        )
+        print(f"  PATCH without text changes: {stats}")
+
+
+if __name__ == "__main__":
+    main()
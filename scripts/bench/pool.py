@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark richieste/sec: connessione per richiesta vs pool di connessioni.
+
+Uso: python scripts/bench/pool.py [--docs 50000] [--requests 3000] [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+class LegacyPool:
+    """Riproduce il vecchio get_db(): connect + PRAGMA + close a ogni richiesta."""
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    reader = writer = _connect
+
+
+WORKLOADS = {
+    "get": lambda rng, max_id: f"/api/docs/{rng.randint(1, max_id)}",
+    "search": lambda rng, max_id: f"/api/search?q={rng.choice(common.COMMON_TERMS)}",
+}
+
+
+async def run(app, workload, n_requests, concurrency, max_id):
+    import httpx
+
+    rng = random.Random(7)
+    headers = common.auth_header()
+    queue = [WORKLOADS[workload](rng, max_id) for _ in range(n_requests)]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker():
+            while queue:
+                resp = await client.get(queue.pop(), headers=headers)
+                assert resp.status_code == 200, resp.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return n_requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    import backend.database as database
+    from backend.config import DB_PATH
+    from backend.main import app
+
+    print(f"Seeding {args.docs} documents in {DB_PATH} ...")
+    common.seed_db(args.docs)
+
+    pooled_get_pool = database.get_pool
+    legacy = LegacyPool(DB_PATH)
+    for workload in WORKLOADS:
+        n = args.requests if workload == "get" else args.requests // 10
+        results = {}
+        for label, factory in (("connect-per-request", lambda: legacy), ("pool", pooled_get_pool)):
+            database.get_pool = factory
+            asyncio.run(run(app, workload, 100, args.concurrency, args.docs))  # warm-up
+            results[label] = asyncio.run(run(app, workload, n, args.concurrency, args.docs))
+        speedup = results["pool"] / results["connect-per-request"]
+        print(
+            f"{workload:>8}: connect-per-request {results['connect-per-request']:8.1f} req/s"
+            f" | pool {results['pool']:8.1f} req/s | {speedup:.2f}x"
+        )
+    database.get_pool = pooled_get_pool
+    print(f"pool stats: {database.get_pool().stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Benchmark anteprime degli allegati (backend.previews).
+
+Carica ``--files`` PPTX con una miniatura incorporata e PDF di ``--pages``
+pagine, poi misura per /api/docs/{id}/preview e /preview/1: la prima
+richiesta (generazione), le successive (lette dalla cache su disco), la
+rivalidazione con If-None-Match (304) e i byte scaricati rispetto al file
+intero che il browser dovrebbe scaricare per disegnarlo da se'.
+
+Uso: python scripts/bench/previews.py [--files 50] [--pages 200]
+"""
+
+import argparse
+import io
+import random
+import statistics
+import time
+import zipfile
+
+import common
+
+
+def make_pptx(rng: random.Random, slides: int) -> bytes:
+    from PIL import Image
+
+    thumbnail = io.BytesIO()
+    Image.frombytes("RGB", (100, 67), rng.randbytes(100 * 67 * 3)).save(thumbnail, "PNG")
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("docProps/app.xml", f"<Properties><Slides>{slides}</Slides></Properties>")
+        # Miniatura ~20 KB e slide con dati poco comprimibili (immagini incorporate)
+        zf.writestr("docProps/thumbnail.png", thumbnail.getvalue())
+        for n in range(1, slides + 1):
+            zf.writestr(f"ppt/media/image{n}.png", rng.randbytes(100_000))
+    return buf.getvalue()
+
+
+def make_pdf(rng: random.Random, pages: int) -> bytes:
+    kids = " ".join(f"{n} 0 R" for n in range(3, pages + 3))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode(),
+    ]
+    for _ in range(pages):
+        # Commento di riempimento: ~10 KB per pagina come una scansione leggera
+        filler = rng.randbytes(5_000).hex()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >> % {filler}\n".encode()
+        )
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    trailer = b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+    return out + trailer % (len(objects) + 1, xref)
+
+
+def timed(client, url, headers, repeat=1):
+    samples, resp = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        resp = client.get(url, headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+    return resp, statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=200, help="pagine per PDF")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from backend import previews
+    from backend.database import init_db
+    from backend.main import app
+
+    init_db()
+    rng = random.Random(7)
+    headers = common.auth_header()
+    print(f"{args.files} PPTX + {args.files} PDF ({args.pages} pages), webp={previews.webp()}")
+    with TestClient(app) as client:
+        for kind, make in (("pptx", make_pptx), ("pdf", make_pdf)):
+            ids, size = [], 0
+            for i in range(args.files):
+                body = make(rng, args.pages if kind == "pdf" else 12)
+                size += len(body)
+                files = {"file": (f"file{i}.{kind}", io.BytesIO(body))}
+                resp = client.post("/api/docs/upload", files=files, headers=headers)
+                ids.append(resp.json()["id"])
+            cold, warm, revalidate, sent = [], [], [], 0
+            for doc_id in ids:
+                info, ms = timed(client, f"/api/docs/{doc_id}/preview", headers)
+                cold.append(ms)
+                warm.append(timed(client, f"/api/docs/{doc_id}/preview", headers, 5)[1])
+                version = info.json()["version"]
+                if info.json()["renderable"]:
+                    url = f"/api/docs/{doc_id}/preview/1?size=480&v={version}"
+                    resp, ms = timed(client, url, headers)
+                    sent += len(resp.content)
+                    etag = {**headers, "If-None-Match": resp.headers["etag"]}
+                    revalidate.append(timed(client, url, etag, 5)[1])
+            line = (
+                f"  {kind}: info cold p50 {statistics.median(cold):.2f} ms, "
+                f"cached p50 {statistics.median(warm):.2f} ms"
+            )
+            if revalidate:
+                line += f", page 304 p50 {statistics.median(revalidate):.2f} ms"
+            print(line)
+            print(
+                f"    bytes: full files {size / args.files / 1024:.0f} KiB each, "
+                f"first preview {sent / args.files / 1024:.1f} KiB each"
+            )
+        print(f"  cache: {previews.preview_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark storico dei documenti (backend.revisions).
+
+Salva ``--edits`` volte un documento markdown di ``--kb`` KB cambiando una
+riga a caso e misura: la latenza del PUT e la parte spesa a scrivere la
+revisione, i byte di storico per edit rispetto a una copia intera, e il
+tempo per ricostruire le versioni piu' lontane da uno snapshot.
+
+Uso: python scripts/bench/revisions.py [--kb 200] [--edits 300]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kb", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=300)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from backend import config, revisions
+    from backend.database import init_db, read_db
+    from backend.main import app
+
+    init_db()
+    rng = random.Random(5)
+    words = [w for _, content, _, _ in common.make_docs(50) for w in content.split()]
+    lines = []
+    while sum(map(len, lines)) < args.kb * 1024:
+        lines.append(" ".join(rng.choices(words, k=12)) + "\n")
+
+    timings: list[float] = []
+    record = revisions.record
+
+    def timed_record(*a):
+        started = time.perf_counter()
+        record(*a)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    revisions.record = timed_record
+    headers = common.auth_header()
+    with TestClient(app) as client:
+        body = {"title": "Runbook", "content": "".join(lines)}
+        doc_id = client.post("/api/docs", json=body, headers=headers).json()["id"]
+        puts = []
+        for _ in range(args.edits):
+            lines[rng.randrange(len(lines))] = " ".join(rng.choices(words, k=12)) + "\n"
+            started = time.perf_counter()
+            client.put(f"/api/docs/{doc_id}", json={"content": "".join(lines)}, headers=headers)
+            puts.append((time.perf_counter() - started) * 1000)
+        with read_db() as conn:
+            stored = conn.execute(
+                "SELECT kind, COUNT(*), SUM(length(CAST(data AS BLOB))) FROM document_revisions "
+                "GROUP BY kind"
+            ).fetchall()
+            size = len("".join(lines).encode())
+            print(f"{args.edits} one-line edits of a {size / 1024:.0f} KiB document")
+            print(
+                f"  PUT p50 {statistics.median(puts):.2f} ms, "
+                f"revision write p50 {statistics.median(timings):.3f} ms "
+                f"(max {max(timings):.2f} ms)"
+            )
+            for kind, count, total in stored:
+                print(
+                    f"  {count} {kind}: {total / 1024:.0f} KiB, "
+                    f"{total / args.edits / 1024:.2f} KiB per edit"
+                )
+            print(f"  full copies would take {size * args.edits / 1024 / 1024:.0f} MiB")
+            every = config.REVISION_SNAPSHOT_EVERY
+            for version in (args.edits, args.edits - every + 2, 1):
+                stats = common.measure(lambda: revisions.load(conn, doc_id, version), 20)
+                print(f"  load version {version}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
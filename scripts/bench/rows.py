@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark intervalli di righe di un CSV grande (backend.rows).
+
+Genera un CSV di circa ``--mb`` MB e misura: la prima richiesta a
+/api/docs/{id}/rows (costruzione dell'indice), le richieste successive
+all'inizio, a meta' e in fondo al file, e per confronto il parsing completo
+del file che farebbe un client per mostrare le stesse righe.
+
+Uso: python scripts/bench/rows.py [--mb 45] [--limit 200]
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import time
+
+import common
+
+
+def make_csv(path: str, mb: int) -> int:
+    rng = random.Random(5)
+    words = sorted({w for _, content, _, _ in common.make_docs(200) for w in content.split()})
+    rows = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "amount", "note", "created"])
+        while f.tell() < mb * 1024 * 1024:
+            note = " ".join(rng.choices(words, k=8))
+            day = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            writer.writerow([rows, rng.choice(words), round(rng.random() * 1000, 2), note, day])
+            rows += 1
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=45, help="sotto il limite di 50 MB degli upload")
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from backend.database import init_db
+    from backend.main import app
+
+    init_db()
+    path = os.path.join(common.WORKDIR, "big.csv")
+    total = make_csv(path, args.mb)
+    size = os.path.getsize(path)
+    print(f"CSV {size / 1024 / 1024:.1f} MB, {total} rows")
+
+    def full_parse():
+        with open(path, newline="") as f:
+            return list(csv.reader(f))[total // 2 + 1 : total // 2 + 1 + args.limit]  # noqa: E203
+
+    print(f"  full parse (client-side equivalent): {common.measure(full_parse, 3)}")
+
+    headers = common.auth_header()
+    with TestClient(app) as client:
+        with open(path, "rb") as f:
+            files = {"file": ("big.csv", io.BytesIO(f.read()))}
+        doc_id = client.post("/api/docs/upload", files=files, headers=headers).json()["id"]
+        url = f"/api/docs/{doc_id}/rows?limit={args.limit}"
+        started = time.perf_counter()
+        first = client.get(url, headers=headers).json()
+        print(f"  first request (index build): {(time.perf_counter() - started) * 1000:.0f} ms")
+        print(f"  columns: {[(c['name'], c['type']) for c in first['columns']]}")
+        for label, offset in (("start", 0), ("middle", total // 2), ("end", total - args.limit)):
+            stats = common.measure(
+                lambda: client.get(f"{url}&offset={offset}", headers=headers), 20
+            )
+            print(f"  {label:6} offset {offset}: {stats}")
+        stats = common.measure(
+            lambda: client.get(f"{url}&offset={total // 2}&columns=id,amount", headers=headers),
+            20,
+        )
+        print(f"  middle, 2 columns: {stats}")
+
+
+if __name__ == "__main__":
+    main()
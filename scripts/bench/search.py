@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark latenza /api/search: LIMIT 50 con snippet per riga vs pagine a cursore.
+
+I casi a cursore svuotano la search_cache a ogni chiamata; "cached" misura l'hit.
+
+Uso: python scripts/bench/search.py [--docs 100000] [--repeat 20]
+"""
+
+import argparse
+import random
+from functools import partial
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+def legacy_search(conn, term):
+    """La vecchia query: 50 righe, snippet calcolato per ognuna."""
+    return conn.execute(
+        "SELECT d.id, d.title, "
+        "snippet(documents_fts, 1, '<mark>', '</mark>', '...', 32) AS snippet, "
+        "d.project, d.tags FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid "
+        "WHERE documents_fts MATCH ? ORDER BY rank LIMIT 50",
+        (f'"{term}"',),
+    ).fetchall()
+
+
+def call(term, cached=False, **params):
+    from fastapi import Response
+
+    from backend.routers.search import search
+    from backend.search_cache import search_cache
+
+    if not cached:
+        search_cache.clear()
+
+    defaults = dict(limit=50, cursor=None, snippets=True, facets=False)
+    defaults.update(project=None, tag=None, file_type=None)
+    response = Response()
+    search(response, term, **{**defaults, **params}, _user="admin")
+    return response.headers.get("x-next-cursor")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from backend.database import read_db
+
+    print(f"Seeding {args.docs} documents ...")
+    common.seed_db(args.docs)
+    # Il vocabolario di make_docs: i primi termini sono i piu' frequenti (zipf)
+    vocab = common._vocabulary(random.Random(42))
+    terms = {"common": "python", "rare": vocab[-1]}
+
+    with read_db() as conn:
+        for label, term in terms.items():
+            hits = conn.execute(
+                "SELECT COUNT(*) FROM documents_fts WHERE documents_fts MATCH ?", (f'"{term}"',)
+            ).fetchone()[0]
+            print(f"{label} term {term!r}: {hits} matches")
+            # Cursore della quinta pagina, per misurare una pagina profonda
+            cursor = None
+            for _ in range(4):
+                cursor = call(term, cursor=cursor)
+            cases = {
+                "legacy LIMIT 50": partial(legacy_search, conn, term),
+                "page 1": partial(call, term),
+                "page 1, snippets=false": partial(call, term, snippets=False),
+                "page 5 (cursor)": partial(call, term, cursor=cursor),
+                "page 1 + facets": partial(call, term, facets=True),
+                "page 1 + facets (cached)": partial(call, term, cached=True, facets=True),
+            }
+            for name, fn in cases.items():
+                print(f"  {name:>26}: {common.measure(fn, args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()
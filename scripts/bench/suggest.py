@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Benchmark /api/search/suggest: completamenti per prefisso vs fts5vocab letto al volo.
+
+Uso: python scripts/bench/suggest.py [--docs 100000] [--repeat 200]
+"""
+
+import argparse
+import time
+from functools import partial
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+def vocab_live(conn, prefix):
+    """Document frequency calcolata da fts5vocab a ogni tasto, senza search_terms."""
+    return conn.execute(
+        "SELECT term, doc FROM documents_vocab WHERE term >= ? AND term < ? "
+        "ORDER BY doc DESC LIMIT 8",
+        (prefix, prefix + "\U0010ffff"),
+    ).fetchall()
+
+
+def call(prefix):
+    from fastapi import BackgroundTasks
+
+    from backend.routers.search import search_suggest
+
+    return search_suggest(BackgroundTasks(), prefix, limit=8, _user="admin")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    from backend.database import apply_search_terms, read_db, search_terms_diff, write_db
+
+    print(f"Seeding {args.docs} documents ...")
+    common.seed_db(args.docs)
+    with write_db() as conn:
+        started = time.perf_counter()
+        changed = apply_search_terms(conn, *search_terms_diff(conn))
+        print(f"search_terms refresh: {changed} terms in {time.perf_counter() - started:.2f} s")
+
+    with read_db() as conn:
+        for prefix in ("ka", "kal", "kalomi", "python ka"):
+            word = prefix.split()[-1]
+            print(f"prefix {prefix!r}:")
+            print(
+                f"  {'fts5vocab live':>16}: {common.measure(partial(vocab_live, conn, word), 20)}"
+            )
+            print(f"  {'suggest':>16}: {common.measure(partial(call, prefix), args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark tag: scansione della colonna ``tags`` vs indice normalizzato tags/document_tags.
+
+Uso: python scripts/bench/tags.py [--docs 100000] [--distinct 3000]
+"""
+
+import argparse
+import random
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+def spread_tags(n_distinct: int):
+    """Aggiunge una coda lunga di tag rari ai documenti del corpus."""
+    from backend.database import rebuild_tag_index, write_db
+
+    rng = random.Random(3)
+    rare = [f"topic-{i}" for i in range(n_distinct)]
+    with write_db() as conn:
+        rows = conn.execute("SELECT id, tags FROM documents").fetchall()
+        conn.executemany(
+            "UPDATE documents SET tags = ? WHERE id = ?",
+            [(",".join(filter(None, [r["tags"], rng.choice(rare)])), r["id"]) for r in rows],
+        )
+        conn.execute("DELETE FROM vault_meta WHERE key = 'tags_index'")
+        rebuild_tag_index(conn)
+        conn.commit()
+
+
+def legacy_list_tags(conn):
+    tags = set()
+    for row in conn.execute("SELECT DISTINCT tags FROM documents WHERE tags IS NOT NULL"):
+        tags.update(t.strip() for t in row["tags"].split(",") if t.strip())
+    return sorted(tags)
+
+
+def legacy_filter(conn, tag):
+    return conn.execute(
+        "SELECT id, title FROM documents "
+        "WHERE (',' || REPLACE(tags, ', ', ',') || ',') LIKE ? "
+        "ORDER BY updated_at DESC, id DESC LIMIT 51",
+        (f"%,{tag},%",),
+    ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--distinct", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from backend.database import read_db
+    from backend.routers.documents import _tag_is_dense, list_query
+
+    print(f"Seeding {args.docs} documents, {args.distinct} rare tags ...")
+    common.seed_db(args.docs)
+    spread_tags(args.distinct)
+
+    with read_db() as conn:
+        distinct = conn.execute("SELECT COUNT(*) FROM tags").fetchone()[0]
+        print(f"{distinct} distinct tags")
+        cases = {
+            "list tags (legacy scan)": lambda: legacy_list_tags(conn),
+            "list tags (tags table)": lambda: conn.execute(
+                "SELECT name, doc_count FROM tags ORDER BY name"
+            ).fetchall(),
+        }
+        for label, tag in (("common", "python"), ("rare", "topic-7")):
+            cases[f"filter {label} tag (LIKE)"] = lambda tag=tag: legacy_filter(conn, tag)
+            dense = _tag_is_dense(conn, tag, 50)
+            sql, params = list_query(50, tag=tag, dense_tag=dense)
+            cases[f"filter {label} tag (index)"] = lambda sql=sql, params=params: conn.execute(
+                sql, params
+            ).fetchall()
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            print(f"{label} tag, dense={dense}: " + " | ".join(r["detail"] for r in plan))
+        for label, fn in cases.items():
+            print(f"{label:>28}: {common.measure(fn, args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()
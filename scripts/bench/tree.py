@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark apertura del vault: tutte le righe di /api/docs vs /api/projects/tree.
+
+Uso: python scripts/bench/tree.py [--docs 100000]
+"""
+
+import argparse
+import asyncio
+import time
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+
+async def all_documents(client, headers):
+    """Come il vecchio tree.js: tutte le pagine della lista, albero costruito nel client."""
+    rows, size, cursor = 0, 0, None
+    while True:
+        params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+        resp = await client.get("/api/docs", params=params, headers=headers)
+        rows += len(resp.json())
+        size += len(resp.content)
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return rows, size
+
+
+async def tree_skeleton(client, headers):
+    """Albero con i conteggi + prima pagina degli Unsorted, come il nuovo tree.js."""
+    tree = await client.get("/api/projects/tree", headers=headers)
+    unsorted = await client.get(
+        "/api/docs", params={"recursive": "false", "limit": 1000}, headers=headers
+    )
+    return len(unsorted.json()), len(tree.content) + len(unsorted.content)
+
+
+async def expand_folder(client, headers):
+    """Apertura di una cartella: figli diretti e suoi documenti."""
+    node = await client.get(
+        "/api/projects/tree", params={"path": "work", "depth": 1}, headers=headers
+    )
+    docs = await client.get(
+        "/api/docs",
+        params={"project": "work/clients/acme", "recursive": "false", "limit": 1000},
+        headers=headers,
+    )
+    return len(docs.json()), len(node.content) + len(docs.content)
+
+
+async def run(app, strategy):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        rows, size = await strategy(client, common.auth_header())
+        return rows, size, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    args = parser.parse_args()
+
+    from backend.config import DB_PATH
+    from backend.main import app
+
+    print(f"Seeding {args.docs} documents ({DB_PATH}) ...")
+    common.seed_db(args.docs)
+
+    for label, strategy in (
+        ("all documents (/api/docs)", all_documents),
+        ("tree + unsorted page", tree_skeleton),
+        ("expand one folder", expand_folder),
+    ):
+        rows, size, elapsed = asyncio.run(run(app, strategy))
+        print(f"{label:>28}: {rows:7d} rows, {size / 1024:9.1f} KiB in {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Benchmark indice trigram: dimensione, costo in scrittura e latenza vs LIKE '%x%'.
+
+Uso: python scripts/bench/trigram.py [--docs 100000] [--repeat 10]
+"""
+
+import argparse
+import os
+import time
+from functools import partial
+
+import common  # noqa: F401  (imposta l'ambiente prima degli import backend)
+
+os.environ["SEARCH_TRIGRAM"] = "true"
+
+
+def like_scan(conn, needle):
+    """Il ripiego di oggi: LIKE su title e content, scansione di tutta la tabella."""
+    pattern = f"%{needle}%"
+    return conn.execute(
+        "SELECT id FROM documents WHERE title LIKE ? OR content LIKE ? ORDER BY id DESC LIMIT 50",
+        (pattern, pattern),
+    ).fetchall()
+
+
+def call(q, mode):
+    from fastapi import Response
+
+    from backend.routers.search import search
+    from backend.search_cache import search_cache
+
+    search_cache.clear()
+    params = dict(limit=50, cursor=None, snippets=True, facets=False)
+    params.update(project=None, tag=None, file_type=None)
+    return search(Response(), q, mode, **params, _user="admin")
+
+
+def index_sizes(conn) -> dict:
+    rows = conn.execute(
+        "SELECT CASE WHEN name LIKE 'documents_trigram%' THEN 'trigram' "
+        "WHEN name LIKE 'documents_fts%' THEN 'fts' "
+        "WHEN name LIKE 'search_terms_trigram%' THEN 'terms_trigram' "
+        "WHEN name = 'documents' THEN 'documents' END AS part, SUM(pgsize) "
+        "FROM dbstat GROUP BY part HAVING part IS NOT NULL"
+    ).fetchall()
+    return {part: f"{size / (1024 * 1024):.1f} MiB" for part, size in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    from backend.database import apply_search_terms, read_db, search_terms_diff, write_db
+
+    print(f"Seeding {args.docs} documents (trigram index on) ...")
+    started = time.perf_counter()
+    common.seed_db(args.docs)
+    print(f"  seed: {time.perf_counter() - started:.1f} s")
+    with write_db() as conn:
+        apply_search_terms(conn, *search_terms_diff(conn))
+        conn.commit()
+        # Un documento realistico, con e senza i trigger trigram (DDL annullato dal rollback)
+        title, content, _, _ = next(common.make_docs(1, seed=7))
+        insert = partial(
+            conn.execute,
+            "INSERT INTO documents (title, content) VALUES (?, ?)",
+            (title, content),
+        )
+        print(f"  INSERT, trigram on : {common.measure(insert, 200)}")
+        for trigger in ("ai", "ad", "au"):
+            conn.execute(f"DROP TRIGGER documents_trigram_{trigger}")
+        print(f"  INSERT, trigram off: {common.measure(insert, 200)}")
+        conn.rollback()
+
+    with read_db() as conn:
+        print("index size:", index_sizes(conn))
+        for needle in ("alomid", "zezezene", "brobrobro", "notinvault"):
+            print(f"substring {needle!r}:")
+            cases = {
+                "LIKE '%x%'": partial(like_scan, conn, needle),
+                "mode=substring": partial(call, needle, "substring"),
+            }
+            for name, fn in cases.items():
+                fn()  # cache calde: si misura la query, non il primo accesso al disco
+                print(f"  {name:>15}: {common.measure(fn, args.repeat)}")
+        for typo in ("kalomdie", "pyhton", "brobrobor vuzeka"):
+            print(f"fuzzy {typo!r}:")
+            for mode in ("phrase", "fuzzy"):
+                fn = partial(call, typo, mode)
+                print(f"  {mode:>15}: {len(fn())} hits, {common.measure(fn, args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()